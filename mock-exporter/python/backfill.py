@@ -0,0 +1,751 @@
+#!/usr/bin/env python3
+"""
+Historical Backfill Generator
+
+Generates weeks or months of history for the configured series in one go, so
+long-range dashboards have data right after the stack starts. It reuses the
+compiled series table and the series store value models with seeded
+per-series streams, stepping a simulated clock instead of waiting:
+
+- every sample is one scrape --step apart; between samples each family runs
+  as many updates as the live exporter would (step / average cadence), so
+  rates match what the running exporter produces;
+- synthetic label churn and the workload models (diurnal cycles, bursts,
+  incidents) follow the simulated clock, updates spread evenly over a step;
+- native histograms are written as their classic +Inf bucket, _count and
+  _sum, which every format below can carry.
+
+Series are split row-wise across --workers processes (see
+CompiledConfig.shard); each worker walks its slice family by family and
+time chunk by time chunk, holding at most --max-chunk-values values, and
+streams every chunk straight to the sink:
+
+- remote-write: snappy WriteRequests POSTed to --url (vminsert, Prometheus
+  with --web.enable-remote-write-receiver), several samples per series each
+- vm-import:    VictoriaMetrics JSON lines, POSTed gzipped to --url
+                (/api/v1/import) or written to --output
+- openmetrics:  one file per worker in --output, for
+                promtool tsdb create-blocks-from openmetrics
+
+    uv run backfill.py --start 30d --step 15s --format remote-write \\
+        --url http://localhost:8480/insert/0/prometheus/api/v1/write
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import cramjam
+import httpx
+import numpy as np
+import yaml
+
+from compiler import ConfigError, compile_config
+from exposition import escape_help, escape_label_value
+from protowire import encode_varint
+from remote_write import (
+    REMOTE_WRITE_HEADERS,
+    FamilyEncoder,
+    backoff_delay,
+    parse_labels,
+    wrap_timeseries,
+)
+from series_store import SeriesFamily, SimulatedClock
+from timeline import default_step, parse_duration
+
+logger = logging.getLogger("backfill")
+
+FORMATS = ("remote-write", "vm-import", "openmetrics")
+FILE_EXTENSIONS = {"vm-import": "jsonl", "openmetrics": "om"}
+
+# Chunk = (timestamps in ms [n], values [n, series], cumulative bucket counts
+# [n, series, buckets] for histograms)
+Chunk = Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]
+
+
+def parse_time(text: str, now: float) -> float:
+    """Parse 'now', a duration ago ('30d'), epoch seconds or an ISO date."""
+    text = text.strip()
+    if text == "now":
+        return now
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        return now - parse_duration(text)
+    except ValueError:
+        pass
+    moment = datetime.fromisoformat(text)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def label_strings(
+    family: SeriesFamily,
+    fragment: Callable[[str, str], str],
+    separator: str,
+    extra: Dict[str, str],
+) -> List[str]:
+    """Join every series' labels, extra ones included, in label name order.
+
+    Series labels win over extra labels with the same name; empty values are
+    dropped, as in remote write.
+    """
+    if family.synthetic is not None:
+        return family.synthetic.render(fragment, separator, extra).tolist()
+    strings = []
+    for values in family.label_values:
+        labels = {k: v for k, v in zip(family.labelnames, values) if v}
+        for k, v in extra.items():
+            labels.setdefault(k, v)
+        strings.append(
+            separator.join(fragment(k, v) for k, v in sorted(labels.items()))
+        )
+    return strings
+
+
+def family_chunks(
+    family: SeriesFamily,
+    clock: SimulatedClock,
+    timestamps_ms: np.ndarray,
+    updates_per_sample: int,
+    max_values: int,
+) -> Iterator[Chunk]:
+    """Run a family through the timestamps and yield its state in chunks.
+
+    Chunk buffers are reused, so consume each chunk before the next. A chunk
+    ends early before synthetic labels churn, so every chunk has one label
+    set per series.
+    """
+    rng = np.random.default_rng(0)
+    update = getattr(family, f"update_{family.type}")
+    histogram = family.type == "histogram"
+    width = len(family.bucket_labels) if histogram else 1
+    length = max(1, min(len(timestamps_ms), max_values // max(1, family.size * width)))
+    values = np.empty((length, family.size), dtype=np.float64)
+    counts = (
+        np.empty((length, family.size, width), dtype=np.float64) if histogram else None
+    )
+
+    filled = 0
+    start = 0
+    spacing = (
+        float(timestamps_ms[1] - timestamps_ms[0]) / 1000
+        if len(timestamps_ms) > 1
+        else 0.0
+    )
+    for i, timestamp in enumerate(timestamps_ms.tolist()):
+        clock.now = timestamp / 1000
+        if filled and family.synthetic is not None and family.synthetic.due(clock.now):
+            yield timestamps_ms[start:i], values[:filled], _cumulative(counts, filled)
+            filled, start = 0, i
+        for k in range(updates_per_sample, 0, -1):
+            clock.now = timestamp / 1000 - spacing * (k - 1) / updates_per_sample
+            update(rng)
+        values[filled] = family.values
+        if histogram:
+            counts[filled] = family.classic_counts()
+        filled += 1
+        if filled == length:
+            yield timestamps_ms[start : i + 1], values, _cumulative(counts, filled)
+            filled, start = 0, i + 1
+    if filled:
+        yield timestamps_ms[start:], values[:filled], _cumulative(counts, filled)
+
+
+def _cumulative(counts: Optional[np.ndarray], filled: int) -> Optional[np.ndarray]:
+    if counts is None:
+        return None
+    return np.cumsum(counts[:filled], axis=2)
+
+
+def encode_samples(values: np.ndarray, tails: np.ndarray) -> np.ndarray:
+    """Encode TimeSeries.samples for a [samples, series] value matrix.
+
+    tails holds each timestamp's encoded Sample.timestamp field, one row per
+    sample, all of one length. Returns one row of concatenated Sample fields
+    per series.
+    """
+    samples, series = values.shape
+    width = 11 + tails.shape[1]
+    encoded = np.empty((series, samples, width), dtype=np.uint8)
+    encoded[:, :, 0] = 0x12
+    encoded[:, :, 1] = width - 2
+    encoded[:, :, 2] = 0x09
+    encoded[:, :, 3:11] = (
+        np.ascontiguousarray(values.T)
+        .astype("<f8")
+        .view(np.uint8)
+        .reshape(series, samples, 8)
+    )
+    encoded[:, :, 11:] = tails
+    return encoded.reshape(series, samples * width)
+
+
+class RequestPoster:
+    """POSTs request bodies with retries and exponential backoff."""
+
+    def __init__(
+        self, url: str, headers: Dict[str, str], timeout: float, max_retries: int
+    ):
+        self.url = url
+        self.max_retries = max_retries
+        self.client = httpx.Client(timeout=timeout, headers=headers)
+        self.requests = 0
+        self.bytes_sent = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def post(self, body: bytes):
+        """Deliver one body; gives up after max_retries or on a 4xx rejection."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.client.post(self.url, content=body)
+            except httpx.HTTPError as e:
+                logger.debug(f"POST {self.url} failed: {str(e) or type(e).__name__}")
+            else:
+                if response.status_code < 300:
+                    self.requests += 1
+                    self.bytes_sent += len(body)
+                    return
+                if response.status_code != 429 and response.status_code < 500:
+                    self.rejected += 1
+                    logger.error(
+                        f"{self.url} rejected a batch with "
+                        f"{response.status_code}: {response.text[:200]}"
+                    )
+                    return
+            self.failures += 1
+            time.sleep(backoff_delay(attempt, 0.5, 30.0))
+        raise RuntimeError(f"Giving up on {self.url} after {self.max_retries} retries")
+
+    def close(self):
+        self.client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "bytes_sent": self.bytes_sent,
+            "failures": self.failures,
+            "rejected": self.rejected,
+        }
+
+
+class Sink:
+    """Receives a worker's chunks family by family."""
+
+    def __init__(self):
+        self.samples = 0
+
+    def begin_family(self, family: SeriesFamily):
+        pass
+
+    def write(self, family: SeriesFamily, chunk: Chunk):
+        raise NotImplementedError
+
+    def end_family(self, family: SeriesFamily):
+        pass
+
+    def close(self) -> Dict[str, Any]:
+        return {"samples": self.samples}
+
+
+class RemoteWriteSink(Sink):
+    """Batches chunks into snappy WriteRequests with many samples per series."""
+
+    def __init__(
+        self,
+        poster: RequestPoster,
+        labels: Dict[str, str],
+        max_series: int,
+        max_bytes: int,
+    ):
+        super().__init__()
+        self.poster = poster
+        self.labels = labels
+        self.max_series = max_series
+        self.max_bytes = max_bytes
+        self.encoder: Optional[FamilyEncoder] = None
+        self.batch: List[bytes] = []
+        self.size = 0
+
+    def begin_family(self, family: SeriesFamily):
+        self.encoder = FamilyEncoder(family, self.labels)
+
+    def _add(self, entry: bytes):
+        if self.batch and (
+            len(self.batch) >= self.max_series
+            or self.size + len(entry) > self.max_bytes
+        ):
+            self._flush()
+        self.batch.append(entry)
+        self.size += len(entry)
+
+    def _flush(self):
+        if self.batch:
+            self.poster.post(bytes(cramjam.snappy.compress_raw(b"".join(self.batch))))
+            self.batch, self.size = [], 0
+
+    def write(self, family: SeriesFamily, chunk: Chunk):
+        timestamps, values, cumulative = chunk
+        tails = [b"\x10" + encode_varint(t) for t in timestamps.tolist()]
+        if len({len(tail) for tail in tails}) > 1:
+            raise ValueError("Timestamps of one chunk must encode to the same length")
+        tail_matrix = np.frombuffer(b"".join(tails), dtype=np.uint8).reshape(
+            len(tails), -1
+        )
+        _, blobs, bucket_blobs, count_blobs = self.encoder.label_blobs()
+
+        if cumulative is None:
+            outputs = [(blobs, values)]
+        else:
+            outputs = [
+                ([series[b] for series in bucket_blobs], cumulative[:, :, b])
+                for b in range(cumulative.shape[2])
+            ]
+            outputs.append((count_blobs, cumulative[:, :, -1]))
+            outputs.append((blobs, values))
+        for series_blobs, matrix in outputs:
+            encoded = encode_samples(matrix, tail_matrix)
+            for blob, samples in zip(series_blobs, encoded):
+                self._add(wrap_timeseries(blob + samples.tobytes()))
+            self.samples += matrix.size
+
+    def close(self) -> Dict[str, Any]:
+        self._flush()
+        self.poster.close()
+        return dict(super().close(), **self.poster.stats())
+
+
+class TextSink(Sink):
+    """Buffers text output and hands it to a file or a poster in blocks."""
+
+    def __init__(
+        self, path: Optional[str], poster: Optional[RequestPoster], max_bytes: int
+    ):
+        super().__init__()
+        self.file = open(path, "w", encoding="utf-8") if path else None
+        self.path = path
+        self.poster = poster
+        self.max_bytes = max_bytes
+        self.parts: List[str] = []
+        self.size = 0
+        self.bytes_written = 0
+
+    def _emit(self, text: str):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.max_bytes:
+            self._flush()
+
+    def _flush(self):
+        if not self.parts:
+            return
+        data = "".join(self.parts)
+        self.parts, self.size = [], 0
+        self.bytes_written += len(data)
+        if self.file is not None:
+            self.file.write(data)
+        else:
+            self.poster.post(gzip.compress(data.encode("utf-8"), compresslevel=1))
+
+    def close(self) -> Dict[str, Any]:
+        self._flush()
+        stats = dict(super().close(), bytes_written=self.bytes_written)
+        if self.file is not None:
+            self.file.close()
+            stats["path"] = self.path
+        if self.poster is not None:
+            self.poster.close()
+            stats.update(self.poster.stats())
+        return stats
+
+
+class VMImportSink(TextSink):
+    """VictoriaMetrics /api/v1/import JSON lines: one line per series and chunk."""
+
+    def __init__(
+        self,
+        path: Optional[str],
+        poster: Optional[RequestPoster],
+        labels: Dict[str, str],
+        max_bytes: int,
+    ):
+        super().__init__(path, poster, max_bytes)
+        self.labels = labels
+
+    def _metrics(
+        self, family: SeriesFamily, name: str, le: Optional[str] = None
+    ) -> List[str]:
+        extra = dict(self.labels, __name__=name)
+        if le is not None:
+            extra["le"] = le
+        return label_strings(
+            family, lambda k, v: f"{json.dumps(k)}:{json.dumps(v)}", ",", extra
+        )
+
+    def write(self, family: SeriesFamily, chunk: Chunk):
+        timestamps, values, cumulative = chunk
+        if cumulative is not None:
+            cumulative = cumulative.astype(np.int64)
+        tail = f'],"timestamps":[{",".join(map(str, timestamps.tolist()))}]}}\n'
+        name = family.sample_name
+        if cumulative is None:
+            outputs = [(self._metrics(family, name), values)]
+        else:
+            outputs = [
+                (self._metrics(family, f"{name}_bucket", le), cumulative[:, :, b])
+                for b, le in enumerate(family.bucket_labels)
+            ]
+            outputs.append(
+                (self._metrics(family, f"{name}_count"), cumulative[:, :, -1])
+            )
+            outputs.append((self._metrics(family, f"{name}_sum"), values))
+        for metrics, matrix in outputs:
+            for metric, series in zip(metrics, matrix.T.tolist()):
+                values = ",".join(map(repr, series))
+                self._emit(f'{{"metric":{{{metric}}},"values":[{values}{tail}')
+            self.samples += matrix.size
+
+
+class OpenMetricsSink(TextSink):
+    """OpenMetrics text with explicit timestamps, one contiguous block per family.
+
+    OpenMetrics wants every sample of a label set together and in time order,
+    a histogram's buckets, _count and _sum of one timestamp included, while
+    chunks arrive one time slice at a time. A family's first chunk is kept as
+    one text block per series; from its second chunk on the blocks go to a
+    spill file next to the output, and end_family() writes them series by
+    series.
+    """
+
+    def __init__(self, path: str, labels: Dict[str, str], max_bytes: int):
+        super().__init__(path, None, max_bytes)
+        self.labels = labels
+        self.spill_dir = os.path.dirname(path) or "."
+        self._blocks: Optional[List[str]] = None
+        self._spill: Optional[IO[bytes]] = None
+        # Start offset of every series' block per spilled chunk, plus its end
+        self._spans: List[np.ndarray] = []
+
+    def begin_family(self, family: SeriesFamily):
+        name = family.sample_name
+        if family.type == "counter":
+            name = name[: -len("_total")]
+        self._emit(
+            f"# HELP {name} {escape_help(family.documentation)}\n"
+            f"# TYPE {name} {family.type}\n"
+        )
+
+    def _heads(
+        self, family: SeriesFamily, name: str, le: Optional[str] = None
+    ) -> List[str]:
+        extra = dict(self.labels)
+        if le is not None:
+            extra["le"] = le
+        labels = label_strings(
+            family, lambda k, v: f'{k}="{escape_label_value(v)}"', ",", extra
+        )
+        return [f"{name}{{{label_set}}} " for label_set in labels]
+
+    def _series_blocks(self, family: SeriesFamily, chunk: Chunk) -> List[str]:
+        """Every sample of a chunk as one text block per series, in time order."""
+        timestamps, values, cumulative = chunk
+        stamps = [f" {t / 1000:.3f}\n" for t in timestamps.tolist()]
+        name = family.sample_name
+        if cumulative is None:
+            self.samples += values.size
+            return [
+                "".join(
+                    f"{head}{value!r}{stamp}" for value, stamp in zip(series, stamps)
+                )
+                for head, series in zip(self._heads(family, name), values.T.tolist())
+            ]
+
+        heads = [
+            self._heads(family, f"{name}_bucket", le) for le in family.bucket_labels
+        ]
+        heads.append(self._heads(family, f"{name}_count"))
+        heads.append(self._heads(family, f"{name}_sum"))
+        points = cumulative.astype(np.int64).transpose(1, 0, 2).tolist()
+        blocks = []
+        for i, (series_points, sums) in enumerate(zip(points, values.T.tolist())):
+            *bucket_heads, count_head, sum_head = [
+                series_heads[i] for series_heads in heads
+            ]
+            parts = []
+            # One MetricPoint per timestamp: every bucket, then _count and _sum
+            for counts, total, stamp in zip(series_points, sums, stamps):
+                parts.extend(
+                    f"{head}{count}{stamp}" for head, count in zip(bucket_heads, counts)
+                )
+                parts.append(f"{count_head}{counts[-1]}{stamp}")
+                parts.append(f"{sum_head}{total!r}{stamp}")
+            blocks.append("".join(parts))
+        self.samples += cumulative.size + 2 * values.size
+        return blocks
+
+    def write(self, family: SeriesFamily, chunk: Chunk):
+        blocks = self._series_blocks(family, chunk)
+        if self._blocks is None and self._spill is None:
+            self._blocks = blocks
+            return
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(dir=self.spill_dir, suffix=".spill")
+            self._spill_blocks(self._blocks)
+            self._blocks = None
+        self._spill_blocks(blocks)
+
+    def _spill_blocks(self, blocks: List[str]):
+        encoded = [block.encode("utf-8") for block in blocks]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(block) for block in encoded], out=offsets[1:])
+        self._spans.append(offsets + self._spill.tell())
+        self._spill.write(b"".join(encoded))
+
+    def end_family(self, family: SeriesFamily):
+        if self._blocks is not None:
+            for block in self._blocks:
+                self._emit(block)
+        elif self._spill is not None:
+            self._spill.flush()
+            if self._spill.tell():
+                with mmap.mmap(
+                    self._spill.fileno(), 0, access=mmap.ACCESS_READ
+                ) as data:
+                    for i in range(len(self._spans[0]) - 1):
+                        self._emit(
+                            "".join(
+                                data[span[i] : span[i + 1]].decode("utf-8")
+                                for span in self._spans
+                            )
+                        )
+            self._spill.close()
+        self._blocks, self._spill, self._spans = None, None, []
+
+    def close(self) -> Dict[str, Any]:
+        self._emit("# EOF\n")
+        return super().close()
+
+
+def create_sink(options: Dict[str, Any], index: int) -> Sink:
+    """Build worker `index`'s sink from the CLI options."""
+    labels = parse_labels(options["labels"])
+    fmt = options["format"]
+    path = None
+    if options.get("output"):
+        path = os.path.join(
+            options["output"], f"backfill-{index}.{FILE_EXTENSIONS.get(fmt, 'bin')}"
+        )
+
+    if fmt == "remote-write":
+        poster = RequestPoster(
+            options["url"],
+            REMOTE_WRITE_HEADERS,
+            options["timeout"],
+            options["max_retries"],
+        )
+        return RemoteWriteSink(
+            poster, labels, options["max_series"], options["max_bytes"]
+        )
+    if fmt == "vm-import":
+        poster = None
+        if not path:
+            headers = {"Content-Encoding": "gzip", "Content-Type": "application/json"}
+            poster = RequestPoster(
+                options["url"], headers, options["timeout"], options["max_retries"]
+            )
+        return VMImportSink(path, poster, labels, options["max_bytes"])
+    return OpenMetricsSink(path, labels, options["max_bytes"])
+
+
+def run_worker(index: int, count: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Generate and deliver one worker's slice of every family."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    started = time.perf_counter()
+    compiled = compile_config(options["config"]).shard(index, count)
+    timestamps = np.arange(
+        options["start_ms"], options["end_ms"] + 1, options["step_ms"], dtype=np.int64
+    )
+    step = options["step_ms"] / 1000
+
+    sink = create_sink(options, index)
+    series = 0
+    for compiled_family in compiled.families:
+        clock = SimulatedClock(timestamps[0] / 1000 - step)
+        family = SeriesFamily(
+            compiled_family, options["seed"], clock, compiled.workload
+        )
+        updates = max(1, round(step / default_step(family.type)))
+        sink.begin_family(family)
+        for chunk in family_chunks(
+            family, clock, timestamps, updates, options["max_chunk_values"]
+        ):
+            sink.write(family, chunk)
+        sink.end_family(family)
+        series += family.size
+    stats = sink.close()
+    stats.update(
+        worker=index, series=series, seconds=round(time.perf_counter() - started, 3)
+    )
+    logger.info(
+        f"Worker {index}: {series} series, "
+        f"{stats['samples']} samples in {stats['seconds']}s"
+    )
+    return stats
+
+
+def _run_worker(args: Tuple[int, int, Dict[str, Any]]) -> Dict[str, Any]:
+    return run_worker(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--config",
+        default=os.getenv("CONFIG_PATH", "config.yml"),
+        help="Exporter config",
+    )
+    parser.add_argument(
+        "--format", choices=FORMATS, default="remote-write", help="Output format"
+    )
+    parser.add_argument("--url", help="Receiver URL (remote-write, vm-import)")
+    parser.add_argument(
+        "--output", help="Directory for output files (vm-import, openmetrics)"
+    )
+    parser.add_argument(
+        "--start",
+        default="7d",
+        help="Start: duration ago (30d), epoch seconds or ISO date",
+    )
+    parser.add_argument(
+        "--end",
+        default="now",
+        help="End: 'now', duration ago, epoch seconds or ISO date",
+    )
+    parser.add_argument(
+        "--step", default="15s", help="Sample interval (scrape interval to emulate)"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the per-series streams"
+    )
+    parser.add_argument(
+        "--labels",
+        default="job=mock-exporter",
+        help="Labels added unless a series has them (k=v,...)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="Worker processes"
+    )
+    parser.add_argument(
+        "--max-chunk-values",
+        type=int,
+        default=4_000_000,
+        help="Values buffered per worker",
+    )
+    parser.add_argument(
+        "--max-series",
+        type=int,
+        default=2000,
+        help="Max series per remote-write request",
+    )
+    parser.add_argument(
+        "--max-bytes",
+        type=int,
+        default=1 << 20,
+        help="Max uncompressed bytes per request",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=10,
+        help="Retries per request before giving up",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=30.0, help="Request timeout in seconds"
+    )
+    options = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    if options.format == "remote-write" and not options.url:
+        parser.error("--format remote-write needs --url")
+    if options.format == "openmetrics" and not options.output:
+        parser.error("--format openmetrics needs --output")
+    if options.format == "vm-import" and not (options.url or options.output):
+        parser.error("--format vm-import needs --url or --output")
+    if options.output:
+        os.makedirs(options.output, exist_ok=True)
+
+    try:
+        with open(options.config, "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+        series = compile_config(config).series_count()
+    except (OSError, ConfigError) as e:
+        logger.error(f"Cannot load config {options.config}: {e}")
+        sys.exit(1)
+
+    now = time.time()
+    step_ms = int(parse_duration(options.step) * 1000)
+    end_ms = int(parse_time(options.end, now) * 1000)
+    start_ms = int(parse_time(options.start, now) * 1000)
+    start_ms -= start_ms % step_ms
+    if step_ms <= 0 or start_ms >= end_ms:
+        parser.error("--start must be before --end and --step positive")
+
+    worker_options = dict(
+        vars(options), config=config, start_ms=start_ms, end_ms=end_ms, step_ms=step_ms
+    )
+    points = (end_ms - start_ms) // step_ms + 1
+    count = max(1, options.workers)
+    logger.info(
+        f"Backfilling {series} series x {points} points every {options.step} "
+        f"as {options.format} with {count} workers"
+    )
+
+    started = time.perf_counter()
+    jobs = [(index, count, worker_options) for index in range(count)]
+    if count == 1:
+        results = [_run_worker(jobs[0])]
+    else:
+        with multiprocessing.get_context("spawn").Pool(count) as pool:
+            results = list(pool.imap_unordered(_run_worker, jobs))
+    elapsed = time.perf_counter() - started
+
+    samples = sum(result["samples"] for result in results)
+    logger.info(
+        f"Done: {samples} samples in {elapsed:.1f}s "
+        f"({samples / elapsed:,.0f} samples/s)"
+    )
+    print(
+        json.dumps(
+            {
+                "samples": samples,
+                "seconds": round(elapsed, 3),
+                "workers": sorted(results, key=lambda r: r["worker"]),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,848 @@
+#!/usr/bin/env python3
+"""
+Exporter Benchmark Harness
+
+Runs entirely locally and writes machine-readable JSON, so regressions can be
+caught by diffing runs and the Python exporter can be compared with the Go one.
+
+For every requested cardinality a synthetic config is generated (50% counter,
+30% gauge, 20% histogram series) and measured in a fresh subprocess, so memory
+figures and module-level state never leak between sizes:
+
+- compile:   config compile time
+- state:     series store build time and resident bytes per series
+- updates:   updater tick time and series updated per second, per metric type
+- render:    cold and cached exposition render time, peak allocations,
+             generate_latest() on the same store for reference, gzip/zstd time,
+             OpenMetrics and protobuf render time
+- scrape:    /metrics latency p50/p90/p99 and throughput under N concurrent
+             scrapers through an in-process ASGI client, with the updaters
+             running as in production
+
+With --workload the generated families are driven by the correlated workload
+models (see workload.py), scoped per instance, to compare their tick cost
+with the independent noise.
+
+With --url only the scrape load runs, against any live exporter (e.g. the Go
+exporter on :2113), producing the same "scrape" section for comparison.
+
+With --fleet the load is a scrape fleet instead: each step runs that many
+scrapers, each scraping every --interval seconds at its own offset like a
+Prometheus scrape pool, over real keep-alive HTTP connections. Unless --url
+is given, the exporter runs as `python main.py` in a subprocess, serving the
+config of the first --sizes entry, once per --profiles entry (SERVE_PROFILE,
+see serving.py). Every step reports throughput, latency percentiles of the
+successful scrapes and the 503s; the "sustained" section is the largest step
+whose p99 stays within --p99 with at most 1% of scrapes failed or shed.
+Spawned exporters also report the CPU seconds they used per step, and
+--evaluation picks their EXPORTER_EVALUATION (see lazy.py); a step of 0
+scrapers measures the idle cost.
+
+With --startup the exporter is only started: per size, on a config listing
+every series as its own entry (what slows startup down is parsing those),
+once with an empty compiled config cache and once with the snapshot the
+first start left behind (see config_cache.py). Each start reports the
+seconds until /healthz answered and until it reported ready, with the
+exporter's own breakdown (read, parse, compile, cache write, register).
+
+    uv run benchmark.py --sizes 1k,100k,1m --scrapers 8 --output bench.json
+    uv run benchmark.py --url http://localhost:2113/metrics --output go.json
+    uv run benchmark.py --fleet 100,500,1000,2000 --sizes 10k --scrape-seconds 30
+    uv run benchmark.py --fleet 0,10,100 --sizes 100k --profiles tuned --evaluation lazy
+    uv run benchmark.py --startup --sizes 10k,100k,300k --output startup.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+import numpy as np
+import yaml
+
+logger = logging.getLogger("benchmark")
+
+SCHEMA_VERSION = 1
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+TYPE_SHARES = (("counter", 0.5), ("gauge", 0.3), ("histogram", 0.2))
+PATHS_PER_INSTANCE = 10
+FAMILY_NAMES = {
+    "counter": "bench_requests_total",
+    "gauge": "bench_memory_bytes",
+    "histogram": "bench_request_duration_seconds",
+}
+FAMILY_VALUES = {"counter": 10, "gauge": 512e6, "histogram": 0.25}
+# Share of failed or shed scrapes a fleet step may have and still count as sustained
+FLEET_MAX_FAILED = 0.01
+
+
+def parse_size(text: str) -> int:
+    """Parse '1000', '100k' or '1m' into a series count."""
+    text = text.strip().lower()
+    if text and text[-1] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def generate_config(series: int, workload: bool = False) -> Dict[str, Any]:
+    """Synthetic config with about `series` series split across metric types."""
+    entries = []
+    for metric_type, share in TYPE_SHARES:
+        instances = max(1, round(series * share / PATHS_PER_INSTANCE))
+        entries.append(
+            {
+                "name": FAMILY_NAMES[metric_type],
+                "type": metric_type,
+                "value": FAMILY_VALUES[metric_type],
+                "labels": {"job": "benchmark"},
+                "dimensions": {
+                    "instance": instances,
+                    "path": {
+                        "values": PATHS_PER_INSTANCE,
+                        "prefix": "/api/v1/resource-",
+                    },
+                },
+            }
+        )
+    config: Dict[str, Any] = {"synthetic_metrics": entries}
+    if workload:
+        config["workload"] = {"scope": ["instance"]}
+    return config
+
+
+def generate_listed_config(series: int) -> Dict[str, Any]:
+    """generate_config's series listed one entry each, like a generated config."""
+    entries = []
+    for metric_type, share in TYPE_SHARES:
+        for i in range(max(1, round(series * share))):
+            entries.append(
+                {
+                    "name": FAMILY_NAMES[metric_type],
+                    "type": metric_type,
+                    "value": FAMILY_VALUES[metric_type],
+                    "labels": {
+                        "job": "benchmark",
+                        "instance": f"instance-{i // PATHS_PER_INSTANCE + 1}",
+                        "path": f"/api/v1/resource-{i % PATHS_PER_INSTANCE + 1}",
+                    },
+                }
+            )
+    return {"app_metrics": entries}
+
+
+def timed(func: Callable[[], Any]) -> float:
+    """Wall time of one call, in seconds."""
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def latency_summary(
+    latencies: List[float], elapsed: float, byte_count: int
+) -> Dict[str, Any]:
+    """Percentiles and throughput of a scrape run."""
+    if not latencies:
+        return {"requests": 0}
+    values = np.array(latencies)
+    return {
+        "requests": len(latencies),
+        "requests_per_second": round(len(latencies) / elapsed, 2),
+        "bytes_per_second": round(byte_count / elapsed, 1),
+        "p50_seconds": round(float(np.percentile(values, 50)), 6),
+        "p90_seconds": round(float(np.percentile(values, 90)), 6),
+        "p99_seconds": round(float(np.percentile(values, 99)), 6),
+        "max_seconds": round(float(values.max()), 6),
+    }
+
+
+async def scrape_load(
+    client: httpx.AsyncClient,
+    url: str,
+    scrapers: int,
+    duration: float,
+    encoding: str,
+) -> Dict[str, Any]:
+    """Run `scrapers` concurrent scrape loops for `duration` seconds."""
+    latencies: List[float] = []
+    byte_count = 0
+    errors = 0
+    headers = {"Accept-Encoding": encoding}
+    deadline = time.perf_counter() + duration
+
+    async def scraper():
+        nonlocal byte_count, errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await client.get(url, headers=headers)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+            byte_count += response.num_bytes_downloaded
+
+    started = time.perf_counter()
+    await asyncio.gather(*(scraper() for _ in range(scrapers)))
+    summary = latency_summary(latencies, time.perf_counter() - started, byte_count)
+    summary.update(scrapers=scrapers, encoding=encoding, errors=errors)
+    return summary
+
+
+class ScrapeConnection:
+    """One fleet scraper's keep-alive HTTP/1.1 connection, GET only.
+
+    Deliberately minimal: with hundreds of scrapers on the same machine,
+    httpx would spend more CPU per scrape than the exporter does serving it
+    and the load generator, not the exporter, would set the latencies.
+    """
+
+    def __init__(self, url: str, encoding: str):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 80
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.request = (
+            f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+            f"Accept-Encoding: {encoding}\r\n\r\n"
+        ).encode("latin-1")
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def get(self) -> Tuple[int, int]:
+        """(status, body bytes) of one scrape."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        try:
+            self.writer.write(self.request)
+            head = await self.reader.readuntil(b"\r\n\r\n")
+            lines = head.split(b"\r\n")
+            status = int(lines[0].split(b" ", 2)[1])
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(b":")
+                headers[name.strip().lower()] = value.strip().lower()
+            size = 0
+            if headers.get(b"transfer-encoding") == b"chunked":
+                while True:
+                    chunk = int(
+                        (await self.reader.readuntil(b"\r\n")).split(b";")[0], 16
+                    )
+                    await self.reader.readexactly(chunk + 2)
+                    size += chunk
+                    if not chunk:
+                        break
+            else:
+                size = int(headers.get(b"content-length", b"0"))
+                await self.reader.readexactly(size)
+        except BaseException:
+            self.close()
+            raise
+        if headers.get(b"connection") == b"close":
+            self.close()
+        return status, size
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def fleet_load(
+    url: str, scrapers: int, interval: float, duration: float, encoding: str
+) -> Dict[str, Any]:
+    """`scrapers` loops scraping every `interval` s, staggered, for `duration` s."""
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    byte_count = 0
+    errors = 0
+    started = time.perf_counter()
+    deadline = started + duration
+
+    async def scraper(offset: float):
+        nonlocal byte_count, errors
+        connection = ScrapeConnection(url, encoding)
+        due = started + offset
+        while due < deadline:
+            await asyncio.sleep(max(0.0, due - time.perf_counter()))
+            begun = time.perf_counter()
+            try:
+                # Like a scrape timeout of one interval
+                status, size = await asyncio.wait_for(connection.get(), interval)
+            except (
+                OSError,
+                ValueError,
+                asyncio.TimeoutError,
+                asyncio.IncompleteReadError,
+            ):
+                errors += 1
+            else:
+                statuses[status] += 1
+                if status == 200:
+                    latencies.append(time.perf_counter() - begun)
+                    byte_count += size
+            # As in Prometheus, a scrape overrunning its interval skips the missed ones
+            due += interval
+            while due < time.perf_counter():
+                due += interval
+        connection.close()
+
+    await asyncio.gather(*(scraper(interval * i / scrapers) for i in range(scrapers)))
+    await asyncio.sleep(max(0.0, deadline - time.perf_counter()))
+    summary = latency_summary(latencies, time.perf_counter() - started, byte_count)
+    attempts = sum(statuses.values()) + errors
+    failed = attempts - len(latencies)
+    summary.update(
+        scrapers=scrapers,
+        offered_per_second=round(scrapers / interval, 2),
+        attempts=attempts,
+        failed=failed,
+        failed_ratio=round(failed / max(1, attempts), 4),
+        statuses={str(code): count for code, count in sorted(statuses.items())},
+        errors=errors,
+    )
+    return summary
+
+
+def sustained(
+    steps: List[Dict[str, Any]], p99_target: float
+) -> Optional[Dict[str, Any]]:
+    """The largest fleet step within the p99 target and failure budget."""
+    passing = [
+        step
+        for step in steps
+        if step.get("requests")
+        and step["p99_seconds"] <= p99_target
+        and step["failed_ratio"] <= FLEET_MAX_FAILED
+    ]
+    if not passing:
+        return None
+    best = max(passing, key=lambda step: step["requests_per_second"])
+    return {
+        "scrapers": best["scrapers"],
+        "scrapes_per_second": best["requests_per_second"],
+        "p99_seconds": best["p99_seconds"],
+        "p99_target_seconds": p99_target,
+    }
+
+
+def process_cpu_seconds(pid: int) -> Optional[float]:
+    """User plus system CPU seconds of a process so far; None off Linux."""
+    try:
+        with open(f"/proc/{pid}/stat", "r", encoding="ascii") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def run_fleet(
+    url: str, options: argparse.Namespace, pid: Optional[int] = None
+) -> Dict[str, Any]:
+    """Every fleet step against one /metrics URL, with pid's CPU time per step."""
+    steps = []
+    for scrapers in (int(text) for text in options.fleet.split(",")):
+        cpu = process_cpu_seconds(pid) if pid is not None else None
+        started = time.perf_counter()
+        step = await fleet_load(
+            url, scrapers, options.interval, options.scrape_seconds, options.encoding
+        )
+        if cpu is not None:
+            step["cpu_seconds"] = round(process_cpu_seconds(pid) - cpu, 3)
+            step["cpu_utilization"] = round(
+                step["cpu_seconds"] / (time.perf_counter() - started), 4
+            )
+        logger.info(
+            f"  {scrapers} scrapers: {step.get('requests_per_second', 0)} scrapes/s, "
+            f"p99 {step.get('p99_seconds', 'n/a')}, "
+            f"failed {step['failed']}/{step['attempts']}"
+            + (
+                f", cpu {step['cpu_utilization']:.1%}"
+                if "cpu_utilization" in step
+                else ""
+            )
+        )
+        steps.append(step)
+    return {"steps": steps, "sustained": sustained(steps, options.p99)}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def exporter_process(
+    config_path: str,
+    profile: str,
+    evaluation: str = "ticks",
+    env: Optional[Dict[str, str]] = None,
+    timeout: float = 120,
+) -> Iterator[Tuple[str, int, Dict[str, Any]]]:
+    """Run main.py with a config, serving profile and evaluation until it is ready.
+
+    Yields its /metrics URL, its pid and how its startup went: seconds from
+    spawning it until /healthz answered and until it reported ready, and the
+    startup section of /healthz.
+    """
+    port = _free_port()
+    env = dict(
+        os.environ,
+        CONFIG_PATH=config_path,
+        HOST="127.0.0.1",
+        PORT=str(port),
+        LOG_LEVEL="warning",
+        SERVE_PROFILE=profile,
+        EXPORTER_EVALUATION=evaluation,
+        **(env or {}),
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryFile() as log:
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "main.py"], cwd=here, env=env, stdout=log, stderr=log
+        )
+        try:
+            startup: Dict[str, Any] = {}
+            deadline = time.monotonic() + timeout
+            while True:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    log.seek(0)
+                    raise RuntimeError(
+                        "Exporter did not start:\n"
+                        + log.read()[-2000:].decode(errors="replace")
+                    )
+                try:
+                    health = httpx.get(
+                        f"http://127.0.0.1:{port}/healthz", timeout=1
+                    ).json()
+                except httpx.HTTPError:
+                    health = None
+                if health is not None:
+                    startup.setdefault(
+                        "listening_seconds", round(time.perf_counter() - started, 3)
+                    )
+                    if health["ready"]:
+                        startup["ready_seconds"] = round(
+                            time.perf_counter() - started, 3
+                        )
+                        startup.update(health["startup"])
+                        break
+                time.sleep(0.05)
+            yield f"http://127.0.0.1:{port}/metrics", process.pid, startup
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def run_fleets(options: argparse.Namespace) -> Dict[str, Any]:
+    """The fleet load test against a spawned exporter, once per serving profile."""
+    series = parse_size(options.sizes.split(",")[0])
+    with tempfile.NamedTemporaryFile("w", suffix=".yml", delete=False) as f:
+        yaml.safe_dump(generate_config(series, options.workload), f)
+    report: Dict[str, Any] = {
+        "series": series,
+        "interval_seconds": options.interval,
+        "evaluation": options.evaluation,
+        "profiles": {},
+    }
+    try:
+        for profile in options.profiles.split(","):
+            logger.info(
+                f"Fleet against {series} series, {profile} serving profile, "
+                f"{options.evaluation} evaluation..."
+            )
+            with exporter_process(f.name, profile, options.evaluation) as (url, pid, _):
+                report["profiles"][profile] = asyncio.run(run_fleet(url, options, pid))
+    finally:
+        os.unlink(f.name)
+    return report
+
+
+def bench_updates(store, min_seconds: float) -> Dict[str, Any]:
+    """Tick every family repeatedly; report per-type tick time and throughput."""
+    results = {}
+    for family in store.families.values():
+        update = getattr(family, f"update_{family.type}")
+        ticks = 0
+        started = time.perf_counter()
+        while ticks < 3 or time.perf_counter() - started < min_seconds:
+            update(store.rng)
+            ticks += 1
+        elapsed = time.perf_counter() - started
+        results[family.type] = {
+            "series": family.size,
+            "ticks": ticks,
+            "tick_seconds": round(elapsed / ticks, 6),
+            "series_updates_per_second": round(family.size * ticks / elapsed, 1),
+        }
+    return results
+
+
+def bench_render(store, generate_latest_max: int) -> Dict[str, Any]:
+    """Exposition render time and allocations, plus generate_latest for reference."""
+    from prometheus_client import CollectorRegistry, generate_latest
+
+    from exposition import ExpositionCache
+
+    def dirty():
+        for family in store.families.values():
+            family.version += 1
+
+    cache = ExpositionCache(store, registry=CollectorRegistry())
+    first = timed(cache.render)
+    dirty()
+    cold = timed(cache.render)
+    cached = timed(cache.render)
+
+    dirty()
+    tracemalloc.start()
+    snapshot = cache.render()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results: Dict[str, Any] = {
+        "first_render_seconds": round(first, 6),
+        "render_seconds": round(cold, 6),
+        "cached_render_seconds": round(cached, 6),
+        "render_peak_alloc_bytes": peak,
+        "body_bytes": len(snapshot.body),
+        "samples": snapshot.body.count(b"\n") - snapshot.body.count(b"\n#"),
+    }
+    for encoding in ("gzip", "zstd"):
+        try:
+            seconds = timed(lambda: snapshot.encoded(encoding))
+        except ValueError:
+            continue
+        results[f"{encoding}_seconds"] = round(seconds, 6)
+        results[f"{encoding}_bytes"] = len(snapshot.encoded(encoding))
+
+    for fmt in ("openmetrics", "protobuf"):
+        dirty()
+        results[f"{fmt}_render_seconds"] = round(timed(lambda: cache.render(fmt)), 6)
+        results[f"{fmt}_body_bytes"] = len(cache.render(fmt).body)
+
+    if store.series_count() <= generate_latest_max:
+        registry = CollectorRegistry()
+        registry.register(store)
+        results["generate_latest_seconds"] = round(
+            timed(lambda: generate_latest(registry)), 6
+        )
+    return results
+
+
+async def bench_scrape(config_path: str, options: argparse.Namespace) -> Dict[str, Any]:
+    """Scrape /metrics of an in-process exporter while its updaters run."""
+    os.environ["CONFIG_PATH"] = config_path
+    import main
+
+    await main.startup_event()
+    await main.starting
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://exporter"
+        ) as client:
+            await client.get("/metrics")
+            return await scrape_load(
+                client,
+                "/metrics",
+                options.scrapers,
+                options.scrape_seconds,
+                options.encoding,
+            )
+    finally:
+        await main.shutdown_event()
+
+
+def run_size(series: int, options: argparse.Namespace) -> Dict[str, Any]:
+    """Measure one cardinality; runs inside a dedicated subprocess."""
+    from compiler import compile_config
+    from series_store import SeriesStore
+
+    config = generate_config(series, options.workload)
+    result: Dict[str, Any] = {"requested_series": series}
+
+    started = time.perf_counter()
+    compiled = compile_config(config)
+    result["compile_seconds"] = round(time.perf_counter() - started, 6)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    store = SeriesStore(workload=compiled.workload)
+    for family in compiled.families:
+        store.add_family(family)
+    result["build_seconds"] = round(time.perf_counter() - started, 6)
+    state_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result["series"] = store.series_count()
+    result["state_bytes_per_series"] = round(state_bytes / max(1, result["series"]), 2)
+
+    result["updates"] = bench_updates(store, options.update_seconds)
+    result["render"] = bench_render(store, options.generate_latest_max)
+    del store
+
+    if options.scrape_seconds > 0:
+        with tempfile.NamedTemporaryFile("w", suffix=".yml", delete=False) as f:
+            yaml.safe_dump(config, f)
+        try:
+            result["scrape"] = asyncio.run(bench_scrape(f.name, options))
+        finally:
+            os.unlink(f.name)
+
+    result["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return result
+
+
+def environment() -> Dict[str, Any]:
+    """Where the numbers were measured."""
+    return {
+        "implementation": "python",
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_sizes(options: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Run every size in its own subprocess and collect the results."""
+    results = []
+    for text in options.sizes.split(","):
+        series = parse_size(text)
+        logger.info(f"Benchmarking {series} series...")
+        command = [sys.executable, os.path.abspath(__file__), "--worker", str(series)]
+        command += [
+            "--scrapers",
+            str(options.scrapers),
+            "--scrape-seconds",
+            str(options.scrape_seconds),
+            "--update-seconds",
+            str(options.update_seconds),
+            "--encoding",
+            options.encoding,
+            "--generate-latest-max",
+            str(options.generate_latest_max),
+        ]
+        if options.workload:
+            command.append("--workload")
+        completed = subprocess.run(
+            command,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+        )
+        if completed.returncode != 0:
+            logger.error(f"Size {series} failed:\n{completed.stderr[-2000:]}")
+            results.append(
+                {"requested_series": series, "error": completed.stderr[-500:]}
+            )
+            continue
+        result = json.loads(completed.stdout)
+        logger.info(
+            f"  {result['series']} series: "
+            f"render {result['render']['render_seconds']:.3f}s, "
+            f"scrape p99 {result.get('scrape', {}).get('p99_seconds', 'n/a')}"
+        )
+        results.append(result)
+    return results
+
+
+def run_startup(options: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Start the exporter on a listed config per size, cold and then cached."""
+    results = []
+    for text in options.sizes.split(","):
+        series = parse_size(text)
+        with tempfile.TemporaryDirectory() as directory:
+            config_path = os.path.join(directory, "config.yml")
+            with open(config_path, "w", encoding="utf-8") as f:
+                yaml.dump(
+                    generate_listed_config(series),
+                    f,
+                    Dumper=getattr(yaml, "CSafeDumper", yaml.SafeDumper),
+                )
+            result: Dict[str, Any] = {
+                "series": series,
+                "config_bytes": os.path.getsize(config_path),
+            }
+            env = {"CONFIG_CACHE_DIR": os.path.join(directory, "cache")}
+            for run in ("cold", "cached"):
+                logger.info(
+                    f"Starting on {series} listed series, {run} config cache..."
+                )
+                with exporter_process(
+                    config_path, "tuned", env=env, timeout=options.startup_timeout
+                ) as (_, _, startup):
+                    result[run] = startup
+            logger.info(
+                f"  {series} series: "
+                f"ready after {result['cold']['ready_seconds']}s cold, "
+                f"{result['cached']['ready_seconds']}s cached"
+            )
+            results.append(result)
+    return results
+
+
+async def run_url(options: argparse.Namespace) -> Dict[str, Any]:
+    """Scrape load against a live exporter."""
+    async with httpx.AsyncClient(timeout=60) as client:
+        await client.get(options.url)
+        return await scrape_load(
+            client,
+            options.url,
+            options.scrapers,
+            options.scrape_seconds,
+            options.encoding,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--sizes",
+        default="1k,100k,1m",
+        help="Comma-separated series counts (k/m suffixes)",
+    )
+    parser.add_argument("--scrapers", type=int, default=8, help="Concurrent scrapers")
+    parser.add_argument(
+        "--scrape-seconds",
+        type=float,
+        default=10.0,
+        help="Scrape load duration; 0 skips it",
+    )
+    parser.add_argument(
+        "--update-seconds",
+        type=float,
+        default=1.0,
+        help="Minimum time ticking each family",
+    )
+    parser.add_argument(
+        "--encoding", default="gzip", help="Accept-Encoding sent by the scrapers"
+    )
+    parser.add_argument(
+        "--generate-latest-max",
+        type=int,
+        default=100_000,
+        help="Skip the generate_latest() reference above this many series",
+    )
+    parser.add_argument(
+        "--workload",
+        action="store_true",
+        help="Drive the families with the workload models",
+    )
+    parser.add_argument(
+        "--url", help="Only run the scrape load against this live /metrics URL"
+    )
+    parser.add_argument(
+        "--fleet",
+        help="Comma-separated scraper counts: run the fleet load test instead",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=5.0,
+        help="Scrape interval of every fleet scraper",
+    )
+    parser.add_argument(
+        "--p99", type=float, default=0.25, help="Fleet p99 latency target, in seconds"
+    )
+    parser.add_argument(
+        "--profiles",
+        default="tuned,default",
+        help="Serving profiles of the spawned exporter in fleet runs",
+    )
+    parser.add_argument(
+        "--evaluation",
+        default="ticks",
+        choices=("ticks", "lazy"),
+        help="EXPORTER_EVALUATION of the spawned exporter in fleet runs",
+    )
+    parser.add_argument(
+        "--startup",
+        action="store_true",
+        help=(
+            "Measure exporter start time on a listed config per --sizes entry, "
+            "cold and cached"
+        ),
+    )
+    parser.add_argument(
+        "--startup-timeout",
+        type=float,
+        default=3600,
+        help="Longest a --startup run may take",
+    )
+    parser.add_argument("--output", help="Write JSON here instead of stdout")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    # One line per request would load the scrapers more than the exporter
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if options.worker is not None:
+        # Keep the exporter's own startup logging out of the measurements
+        logging.getLogger().setLevel(logging.WARNING)
+        json.dump(run_size(options.worker, options), sys.stdout)
+        return
+
+    report: Dict[str, Any] = {
+        "schema": SCHEMA_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "environment": environment(),
+    }
+    if options.startup:
+        report["startup"] = run_startup(options)
+    elif options.fleet and options.url:
+        report["environment"]["implementation"] = "external"
+        report["target"] = options.url
+        report["fleet"] = {
+            "interval_seconds": options.interval,
+            **asyncio.run(run_fleet(options.url, options)),
+        }
+    elif options.fleet:
+        report["fleet"] = run_fleets(options)
+    elif options.url:
+        report["environment"]["implementation"] = "external"
+        report["target"] = options.url
+        report["scrape"] = asyncio.run(run_url(options))
+    else:
+        report["results"] = run_sizes(options)
+
+    output = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        logger.info(f"Wrote {options.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
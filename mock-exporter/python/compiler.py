@@ -0,0 +1,919 @@
+"""
+Config Compiler
+
+Turns the raw config.yml dict into an immutable, precompiled series table in
+one pass. Every metric section shares the same steps - group entries into
+families by (name, type), take the union of label names, resolve each series'
+label values in family label order, pick the buckets and precompute the gauge
+clamp rules - and all names are validated here, once. Every entry of a family
+has to set all of its labels, and no two entries may share a label set. The updaters and the
+exposition/remote-write paths only ever see the compiled objects.
+
+Entries of the synthetic_metrics section are not listed series but label
+dimensions with cardinalities; they compile to a family holding only the
+dimension values; the series are expanded lazily (see synthetic.py).
+Two compiled configs can be compared family by family (ConfigDiff), which is
+what a hot reload uses to touch only the families that changed.
+
+Histogram entries may set a `rate` (observations per second, drawn in
+batches from a lognormal distribution around `value` with shape `sigma`) and
+`native: true` for exponential native buckets (see native_histogram.py),
+whose bounds are fixed here for the whole family so every shard and
+timeline agrees on them.
+
+The optional `workload` section compiles to a CompiledWorkload (the shared
+load, latency and error signals, see workload.py), and every family records
+the value model it is bound to, so a reload notices model changes like any
+other parameter.
+"""
+
+import math
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from native_histogram import DEFAULT_SCHEMA, MAX_SCHEMA, MIN_SCHEMA, native_bounds
+
+# Metric sections and the metric types each one registers
+METRIC_SECTIONS = {
+    "http_metrics": ("histogram", "counter"),
+    "node_metrics": ("histogram", "counter", "gauge"),
+    "app_metrics": ("histogram", "counter", "gauge"),
+    "probe_metrics": ("histogram", "counter", "gauge"),
+    "slo_metrics": ("gauge", "counter"),
+}
+
+DEFAULT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10)
+SECTION_BUCKETS = {
+    "probe_metrics": (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+}
+
+METRIC_NAME_RE = re.compile(r"^[a-zA-Z_:][a-zA-Z0-9_:]*$")
+LABEL_NAME_RE = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+RANGE_RE = re.compile(r"^\s*(\d+)\s*\.\.\s*(\d+)\s*$")
+
+# Batched histogram observations: lognormal shape, and the rate of entries
+# without one in a family where others set it
+DEFAULT_SIGMA = 0.5
+DEFAULT_RATE = 1.0
+# Native bucket ranges cover the lognormal out to this many sigmas
+NATIVE_TAIL_SIGMAS = 4.5
+
+SYNTHETIC_TYPES = ("histogram", "counter", "gauge")
+DIMENSION_DISTRIBUTIONS = ("product", "zipf")
+
+# Value models (see workload.py) and the metric types each one drives
+WORKLOAD_MODELS = {
+    "noise": ("counter", "gauge", "histogram"),
+    "traffic": ("counter", "histogram"),
+    "errors": ("counter", "histogram"),
+    "latency": ("histogram",),
+    "utilization": ("counter", "gauge"),
+    "budget": ("gauge",),
+    "constant": ("gauge",),
+}
+# Model of families the workload section does not name
+DEFAULT_MODELS = {"counter": "traffic", "histogram": "latency", "gauge": "utilization"}
+DEFAULT_WORKLOAD_SCOPE = ("cluster", "service")
+DURATION_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*$")
+DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+class ConfigError(ValueError):
+    """Raised when config.yml cannot be compiled."""
+
+
+def clamp_bounds(name: str, bases: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the (lower, upper) clamp arrays for the gauge series of a family."""
+    if "memory" in name or "disk" in name:
+        return np.zeros_like(bases), bases * 1.5
+    if "cpu" in name:
+        return np.zeros_like(bases), np.full_like(bases, 100.0)
+    return np.full_like(bases, -np.inf), np.full_like(bases, np.inf)
+
+
+def native_range(
+    bases: np.ndarray, rates: Optional[np.ndarray], sigmas: np.ndarray
+) -> Tuple[float, float]:
+    """Smallest and largest observation the value model of a family produces."""
+    positive = bases > 0
+    if not positive.any():
+        return 1.0, 1.0
+    if rates is None:
+        # One observation of base * U(0.8, 1.2) per update
+        return 0.8 * float(bases[positive].min()), 1.2 * float(bases[positive].max())
+    logs = np.log(bases[positive])
+    spread = NATIVE_TAIL_SIGMAS * sigmas[positive]
+    return float(np.exp((logs - spread).min())), float(np.exp((logs + spread).max()))
+
+
+def _readonly(values: Sequence[float]) -> np.ndarray:
+    if isinstance(values, np.ndarray) and not values.flags.writeable:
+        return values
+    array = np.array(values, dtype=np.float64)
+    array.flags.writeable = False
+    return array
+
+
+class CompiledDimension:
+    """One label dimension of a synthetic family.
+
+    "product" dimensions are crossed with each other to enumerate the series;
+    a "zipf" dimension instead assigns each series one of its values with
+    probability proportional to 1 / rank ** exponent. A non-zero
+    churn_interval replaces every value once per interval, staggered evenly.
+    """
+
+    __slots__ = ("name", "values", "distribution", "exponent", "churn_interval")
+
+    def __init__(
+        self,
+        name: str,
+        values: Tuple[str, ...],
+        distribution: str = "product",
+        exponent: float = 1.0,
+        churn_interval: float = 0.0,
+    ):
+        set_ = object.__setattr__
+        set_(self, "name", name)
+        set_(self, "values", values)
+        set_(self, "distribution", distribution)
+        set_(self, "exponent", exponent)
+        set_(self, "churn_interval", churn_interval)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def _fields(self) -> tuple:
+        return (
+            self.name,
+            self.values,
+            self.distribution,
+            self.exponent,
+            self.churn_interval,
+        )
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, CompiledDimension) and self._fields() == other._fields()
+        )
+
+    def __hash__(self) -> int:
+        return hash(self._fields())
+
+    @property
+    def cardinality(self) -> int:
+        return len(self.values)
+
+
+class CompiledWorkload:
+    """Immutable workload section: the signals correlated models share.
+
+    Bursts and incidents are scheduled per scope (the values of the scope
+    labels); diurnal cycles follow the UTC offset of each series' timezone
+    label value. models maps metric names to (model, elasticity).
+    """
+
+    __slots__ = (
+        "seed",
+        "scope",
+        "timezone_label",
+        "utc_offsets",
+        "diurnal_amplitude",
+        "peak_hour",
+        "burst_rate",
+        "burst_duration",
+        "burst_factor",
+        "incident_rate",
+        "incident_duration",
+        "latency_factor",
+        "saturation",
+        "error_elasticity",
+        "error_series",
+        "budget_burn",
+        "budget_window",
+        "models",
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def _fields(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CompiledWorkload) and self._fields() == other._fields()
+
+    def __hash__(self) -> int:
+        return hash(self._fields())
+
+    def model_for(self, name: str, metric_type: str) -> Tuple[str, float]:
+        """(model, elasticity) of a family."""
+        for metric, model in self.models:
+            if metric == name:
+                return model
+        return DEFAULT_MODELS[metric_type], 1.0
+
+
+class CompiledFamily:
+    """Immutable definition of one metric family and all of its series."""
+
+    __slots__ = (
+        "key",
+        "name",
+        "type",
+        "documentation",
+        "labelnames",
+        "label_values",
+        "bases",
+        "lower",
+        "upper",
+        "buckets",
+        "rates",
+        "sigmas",
+        "native_schema",
+        "dimensions",
+        "offset",
+        "size",
+        "model",
+        "elasticity",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        metric_type: str,
+        labelnames: Tuple[str, ...],
+        label_values: Tuple[Tuple[str, ...], ...],
+        bases: Sequence[float],
+        buckets: Optional[Tuple[float, ...]] = None,
+        dimensions: Tuple[CompiledDimension, ...] = (),
+        offset: int = 0,
+        rates: Optional[Sequence[float]] = None,
+        sigmas: Optional[Sequence[float]] = None,
+        native_schema: Optional[int] = None,
+        model: str = "noise",
+        elasticity: float = 1.0,
+    ):
+        set_ = object.__setattr__
+        set_(self, "key", f"{name}_{metric_type}")
+        set_(self, "name", name)
+        set_(self, "type", metric_type)
+        set_(self, "documentation", f"{metric_type.capitalize()} for {name}")
+        set_(self, "labelnames", labelnames)
+        set_(self, "label_values", label_values)
+        set_(self, "bases", _readonly(bases))
+        set_(self, "buckets", buckets)
+        set_(self, "dimensions", dimensions)
+        # Row of the full family this one starts at (non-zero for shards)
+        set_(self, "offset", offset)
+        size = len(self.bases)
+        set_(self, "size", size)
+        # Histograms only: observations per second per series (None for one
+        # observation per update), lognormal shapes and the native schema
+        set_(self, "rates", None if rates is None else _readonly(rates))
+        if sigmas is None:
+            sigmas = np.broadcast_to(np.float64(DEFAULT_SIGMA), (size,))
+        set_(self, "sigmas", _readonly(sigmas))
+        set_(self, "native_schema", native_schema)
+        # Value model (see workload.py) and its load elasticity
+        set_(self, "model", model)
+        set_(self, "elasticity", elasticity)
+
+        if metric_type != "gauge":
+            lower, upper = np.float64(-np.inf), np.float64(np.inf)
+        elif dimensions:
+            # Synthetic series share one base value, so one clamp rule
+            lower, upper = (bound[0] for bound in clamp_bounds(name, self.bases[:1]))
+        else:
+            lower, upper = clamp_bounds(name, self.bases)
+        set_(self, "lower", _readonly(np.broadcast_to(lower, (size,))))
+        set_(self, "upper", _readonly(np.broadcast_to(upper, (size,))))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    @property
+    def synthetic(self) -> bool:
+        return bool(self.dimensions)
+
+    def same_series(self, other: "CompiledFamily") -> bool:
+        """Whether other has exactly these series, row for row."""
+        return (
+            self.key == other.key
+            and self.labelnames == other.labelnames
+            and self.buckets == other.buckets
+            and self.native_schema == other.native_schema
+            and self.offset == other.offset
+            and self.size == other.size
+            and self.dimensions == other.dimensions
+            and self.label_values == other.label_values
+        )
+
+    def same_model(self, other: "CompiledFamily") -> bool:
+        """Whether other has these series and generates them identically."""
+        return (
+            self.same_series(other)
+            and self.documentation == other.documentation
+            and np.array_equal(self.bases, other.bases)
+            and np.array_equal(self.lower, other.lower)
+            and np.array_equal(self.upper, other.upper)
+            and np.array_equal(self.sigmas, other.sigmas)
+            and (self.rates is None) == (other.rates is None)
+            and (self.rates is None or np.array_equal(self.rates, other.rates))
+            and self.model == other.model
+            and self.elasticity == other.elasticity
+        )
+
+    def slice(self, start: int, stop: int) -> "CompiledFamily":
+        """The same family restricted to rows [start, stop)."""
+        return CompiledFamily(
+            self.name,
+            self.type,
+            self.labelnames,
+            None if self.synthetic else self.label_values[start:stop],
+            self.bases[start:stop],
+            self.buckets,
+            self.dimensions,
+            self.offset + start,
+            None if self.rates is None else self.rates[start:stop],
+            self.sigmas[start:stop],
+            self.native_schema,
+            self.model,
+            self.elasticity,
+        )
+
+
+class CompiledConfig:
+    """The compiled series table: info label sets, metric families and workload."""
+
+    __slots__ = ("info_metrics", "families", "workload")
+
+    def __init__(
+        self,
+        info_metrics: Tuple[Tuple[str, Dict[str, str]], ...],
+        families: Tuple[CompiledFamily, ...],
+        workload: Optional[CompiledWorkload] = None,
+    ):
+        object.__setattr__(self, "info_metrics", info_metrics)
+        object.__setattr__(self, "families", families)
+        object.__setattr__(self, "workload", workload)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def series_count(self) -> int:
+        return sum(family.size for family in self.families)
+
+    def shard(self, index: int, count: int) -> "CompiledConfig":
+        """Rows of every family owned by one of count shards.
+
+        Each family is split into count contiguous row ranges, so concatenating
+        the shards' output family by family restores the original order.
+        Families with no rows in this shard are left out, and so are the info
+        metrics, which the process serving the shards registers itself.
+        """
+        families = []
+        for family in self.families:
+            start = family.size * index // count
+            stop = family.size * (index + 1) // count
+            if stop > start:
+                families.append(family.slice(start, stop))
+        return CompiledConfig((), tuple(families), self.workload)
+
+
+class ConfigDiff:
+    """Family-level difference between two compiled configs.
+
+    unchanged families keep their state objects; updated ones have the same
+    series with new parameters (base values, clamps, help text, model);
+    reshaped ones gained or lost series, so their state is carried over per
+    series. A changed workload section rebinds every family's model.
+    """
+
+    __slots__ = (
+        "unchanged",
+        "updated",
+        "reshaped",
+        "added",
+        "removed",
+        "info_changed",
+        "workload_changed",
+    )
+
+    def __init__(self, old: CompiledConfig, new: CompiledConfig):
+        old_families = {family.key: family for family in old.families}
+        new_keys = set()
+        unchanged, updated, reshaped, added = [], [], [], []
+        for family in new.families:
+            new_keys.add(family.key)
+            previous = old_families.get(family.key)
+            if previous is None:
+                added.append(family.key)
+            elif previous.same_model(family):
+                unchanged.append(family.key)
+            elif previous.same_series(family):
+                updated.append(family.key)
+            else:
+                reshaped.append(family.key)
+        self.unchanged = tuple(unchanged)
+        self.updated = tuple(updated)
+        self.reshaped = tuple(reshaped)
+        self.added = tuple(added)
+        self.removed = tuple(key for key in old_families if key not in new_keys)
+        self.info_changed = old.info_metrics != new.info_metrics
+        self.workload_changed = old.workload != new.workload
+
+    @property
+    def changed(self) -> bool:
+        return bool(
+            self.updated
+            or self.reshaped
+            or self.added
+            or self.removed
+            or self.info_changed
+            or self.workload_changed
+        )
+
+    def counts(self) -> Dict[str, int]:
+        return {
+            "unchanged": len(self.unchanged),
+            "updated": len(self.updated),
+            "reshaped": len(self.reshaped),
+            "added": len(self.added),
+            "removed": len(self.removed),
+        }
+
+
+def _validate_labels(labels: Dict[str, Any], where: str):
+    for label in labels:
+        if not isinstance(label, str) or not LABEL_NAME_RE.match(label):
+            raise ConfigError(f"{where}: invalid label name {label!r}")
+        if label.startswith("__"):
+            raise ConfigError(f"{where}: label name {label!r} is reserved")
+
+
+def _family_label_values(
+    name: str,
+    labelnames: Tuple[str, ...],
+    entries: List[Dict[str, Any]],
+    origins: List[str],
+) -> Tuple[Tuple[str, ...], ...]:
+    """Label values of every entry of a family, one series per entry.
+
+    Every entry must set every label the family declares, and no two entries
+    may share a label set: each would otherwise update the same series.
+    """
+    label_values = []
+    seen: Dict[Tuple[str, ...], str] = {}
+    for entry, where in zip(entries, origins):
+        labels = entry.get("labels") or {}
+        missing = [label for label in labelnames if label not in labels]
+        if missing:
+            raise ConfigError(
+                f"{where}: {name} is missing label(s) {', '.join(missing)} "
+                f"set by other entries"
+            )
+        values = tuple(str(labels[label]) for label in labelnames)
+        if values in seen:
+            raise ConfigError(f"{where}: {name} repeats the labels of {seen[values]}")
+        seen[values] = where
+        label_values.append(values)
+    return tuple(label_values)
+
+
+def _parse_duration(value: Any, where: str) -> float:
+    """Seconds of a duration given as a number or text like "90s", "30d"."""
+    match = DURATION_RE.match(str(value))
+    if match is None:
+        raise ConfigError(f"{where}: invalid duration {value!r}")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+def _workload_group(section: Dict[str, Any], name: str, where: str) -> Dict[str, Any]:
+    group = section.get(name) or {}
+    if not isinstance(group, dict):
+        raise ConfigError(f"{where}.{name} must be a mapping")
+    return group
+
+
+def _workload_number(
+    group: Dict[str, Any], key: str, default: float, where: str, minimum: float = 0.0
+) -> float:
+    try:
+        value = float(group.get(key, default))
+    except (TypeError, ValueError):
+        raise ConfigError(f"{where}.{key} must be a number") from None
+    if value < minimum:
+        raise ConfigError(f"{where}.{key} must be >= {minimum:g}")
+    return value
+
+
+def _compile_workload(section: Any) -> CompiledWorkload:
+    """Validate the workload section into a CompiledWorkload."""
+    where = "workload"
+    if not isinstance(section, dict):
+        raise ConfigError(f"{where} must be a mapping")
+    unknown = set(section) - {
+        "seed",
+        "scope",
+        "timezone_label",
+        "utc_offsets",
+        "diurnal",
+        "bursts",
+        "incidents",
+        "saturation",
+        "error_elasticity",
+        "error_series",
+        "budget",
+        "models",
+    }
+    if unknown:
+        raise ConfigError(f"{where}: unknown options {sorted(unknown)}")
+
+    seed = section.get("seed")
+    if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int)):
+        raise ConfigError(f"{where}.seed must be an integer")
+    scope = section.get("scope", DEFAULT_WORKLOAD_SCOPE)
+    if isinstance(scope, str):
+        scope = [scope]
+    timezone_label = section.get("timezone_label", scope[0] if scope else "cluster")
+    _validate_labels(
+        {label: None for label in list(scope) + [timezone_label]}, f"{where}.scope"
+    )
+    try:
+        utc_offsets = tuple(
+            sorted(
+                (str(k), float(v))
+                for k, v in (section.get("utc_offsets") or {}).items()
+            )
+        )
+    except (AttributeError, TypeError, ValueError):
+        raise ConfigError(
+            f"{where}.utc_offsets must map label values to hours"
+        ) from None
+
+    diurnal = _workload_group(section, "diurnal", where)
+    bursts = _workload_group(section, "bursts", where)
+    incidents = _workload_group(section, "incidents", where)
+    budget = _workload_group(section, "budget", where)
+    amplitude = _workload_number(diurnal, "amplitude", 0.4, f"{where}.diurnal")
+    if amplitude >= 1:
+        raise ConfigError(f"{where}.diurnal.amplitude must be < 1")
+
+    error_series = []
+    for label, pattern in (section.get("error_series") or {}).items():
+        _validate_labels({label: None}, f"{where}.error_series")
+        try:
+            re.compile(str(pattern))
+        except re.error as e:
+            raise ConfigError(
+                f"{where}.error_series.{label}: invalid pattern ({e})"
+            ) from None
+        error_series.append((label, str(pattern)))
+
+    models = []
+    for metric, spec in (section.get("models") or {}).items():
+        spec = spec if isinstance(spec, dict) else {"model": spec}
+        model = spec.get("model")
+        if model not in WORKLOAD_MODELS:
+            raise ConfigError(f"{where}.models.{metric}: unknown model {model!r}")
+        models.append(
+            (
+                str(metric),
+                (
+                    model,
+                    _workload_number(
+                        spec, "elasticity", 1.0, f"{where}.models.{metric}", -10.0
+                    ),
+                ),
+            )
+        )
+
+    return CompiledWorkload(
+        seed=seed,
+        scope=tuple(scope),
+        timezone_label=timezone_label,
+        utc_offsets=utc_offsets,
+        diurnal_amplitude=amplitude,
+        peak_hour=_workload_number(diurnal, "peak_hour", 14.0, f"{where}.diurnal") % 24,
+        burst_rate=_workload_number(bursts, "per_hour", 1.0, f"{where}.bursts"),
+        burst_duration=_parse_duration(
+            bursts.get("duration", "3m"), f"{where}.bursts.duration"
+        )
+        or 1.0,
+        burst_factor=_workload_number(bursts, "factor", 1.8, f"{where}.bursts", 1.0),
+        incident_rate=_workload_number(incidents, "per_day", 2.0, f"{where}.incidents"),
+        incident_duration=_parse_duration(
+            incidents.get("duration", "20m"), f"{where}.incidents.duration"
+        )
+        or 1.0,
+        latency_factor=_workload_number(
+            incidents, "latency_factor", 4.0, f"{where}.incidents", 1.0
+        ),
+        saturation=_workload_number(section, "saturation", 0.5, where),
+        error_elasticity=_workload_number(section, "error_elasticity", 2.0, where),
+        error_series=tuple(error_series),
+        budget_burn=_workload_number(budget, "burn", 0.9, f"{where}.budget"),
+        budget_window=_parse_duration(
+            budget.get("window", "30d"), f"{where}.budget.window"
+        )
+        or 1.0,
+        models=tuple(models),
+    )
+
+
+def _family_model(
+    workload: Optional[CompiledWorkload], name: str, metric_type: str, where: str
+) -> Dict[str, Any]:
+    """Model keyword arguments of a family; noise when there is no workload."""
+    if workload is None:
+        return {}
+    model, elasticity = workload.model_for(name, metric_type)
+    if metric_type not in WORKLOAD_MODELS[model]:
+        raise ConfigError(f"{where}: model {model!r} cannot drive {metric_type} {name}")
+    return {"model": model, "elasticity": elasticity}
+
+
+def _histogram_options(
+    entry: Dict[str, Any], where: str
+) -> Tuple[Optional[float], float, Optional[int]]:
+    """Validate the rate, sigma and native options of a histogram entry.
+
+    Returns (rate or None, sigma, native schema or None).
+    """
+    try:
+        rate = None if entry.get("rate") is None else float(entry["rate"])
+        sigma = float(entry.get("sigma", DEFAULT_SIGMA))
+        schema = int(entry.get("schema", DEFAULT_SCHEMA))
+    except (TypeError, ValueError) as e:
+        raise ConfigError(f"{where}: invalid histogram option ({e})") from None
+    if rate is not None and rate < 0:
+        raise ConfigError(f"{where}: rate must be >= 0")
+    if sigma <= 0:
+        raise ConfigError(f"{where}: sigma must be > 0")
+    if not MIN_SCHEMA <= schema <= MAX_SCHEMA:
+        raise ConfigError(
+            f"{where}: schema must be between {MIN_SCHEMA} and {MAX_SCHEMA}"
+        )
+    return rate, sigma, schema if entry.get("native") else None
+
+
+def _histogram_family(
+    name: str,
+    labelnames: Tuple[str, ...],
+    label_values: Optional[Tuple[Tuple[str, ...], ...]],
+    bases: np.ndarray,
+    buckets: Tuple[float, ...],
+    options: List[Tuple[Optional[float], float, Optional[int]]],
+    native_schema: Optional[int],
+    dimensions: Tuple[CompiledDimension, ...] = (),
+    model: Optional[Dict[str, Any]] = None,
+) -> CompiledFamily:
+    """Build a histogram family from per-series (rate, sigma, schema) options."""
+    rates = None
+    if any(rate is not None for rate, _, _ in options):
+        rates = np.array(
+            [DEFAULT_RATE if rate is None else rate for rate, _, _ in options]
+        )
+    sigmas = np.array([sigma for _, sigma, _ in options])
+    if len(options) == 1:
+        # Synthetic families: one option set for every series
+        sigmas = np.broadcast_to(sigmas[0], bases.shape)
+        rates = None if rates is None else np.broadcast_to(rates[0], bases.shape)
+    if native_schema is not None:
+        buckets = native_bounds(*native_range(bases, rates, sigmas), native_schema)
+    return CompiledFamily(
+        name,
+        "histogram",
+        labelnames,
+        label_values,
+        bases,
+        buckets,
+        dimensions,
+        rates=rates,
+        sigmas=sigmas,
+        native_schema=native_schema,
+        **(model or {}),
+    )
+
+
+def _compile_dimension(name: str, spec: Any, where: str) -> CompiledDimension:
+    """Compile one dimensions entry: N, "a..b", a list of values or a mapping."""
+    options = spec if isinstance(spec, dict) else {"values": spec}
+    unknown = set(options) - {
+        "values",
+        "prefix",
+        "distribution",
+        "exponent",
+        "churn_interval",
+    }
+    if unknown:
+        raise ConfigError(f"{where}: unknown dimension options {sorted(unknown)}")
+
+    values = options.get("values")
+    prefix = str(options.get("prefix", f"{name}-"))
+    if isinstance(values, bool) or values is None:
+        raise ConfigError(f"{where}: dimension {name} needs values")
+    if isinstance(values, int):
+        values = f"1..{values}"
+    if isinstance(values, str) and RANGE_RE.match(values):
+        start, stop = (int(bound) for bound in RANGE_RE.match(values).groups())
+        values = tuple(f"{prefix}{i}" for i in range(start, stop + 1))
+    elif isinstance(values, (list, tuple)):
+        values = tuple(str(value) for value in values)
+    else:
+        values = (str(values),)
+    if not values or "" in values:
+        raise ConfigError(f"{where}: dimension {name} has no or empty values")
+    if len(set(values)) != len(values):
+        raise ConfigError(f"{where}: dimension {name} has duplicate values")
+
+    distribution = options.get("distribution", "product")
+    if distribution not in DIMENSION_DISTRIBUTIONS:
+        raise ConfigError(
+            f"{where}: dimension {name} has unknown distribution {distribution!r}"
+        )
+    try:
+        exponent = float(options.get("exponent", 1.0))
+        churn_interval = float(options.get("churn_interval", 0))
+    except (TypeError, ValueError) as e:
+        raise ConfigError(f"{where}: dimension {name}: {e}") from None
+    if exponent <= 0 or churn_interval < 0:
+        raise ConfigError(
+            f"{where}: dimension {name} needs exponent > 0 and churn_interval >= 0"
+        )
+    return CompiledDimension(name, values, distribution, exponent, churn_interval)
+
+
+def _compile_synthetic(
+    entry: Dict[str, Any], where: str, workload: Optional[CompiledWorkload] = None
+) -> CompiledFamily:
+    """Compile one synthetic_metrics entry into a lazily expanded family."""
+    name, metric_type = entry["name"], entry["type"]
+    labels = entry.get("labels") or {}
+    dimension_specs = entry.get("dimensions") or {}
+    if not isinstance(dimension_specs, dict) or not dimension_specs:
+        raise ConfigError(
+            f"{where}: synthetic metric {name} needs a dimensions mapping"
+        )
+    if set(labels) & set(dimension_specs):
+        raise ConfigError(f"{where}: labels and dimensions overlap")
+    _validate_labels(labels, where)
+    _validate_labels(dimension_specs, where)
+
+    # Static labels are single-valued dimensions
+    dimensions = [
+        CompiledDimension(label, (str(value),))
+        for label, value in labels.items()
+        if str(value)
+    ]
+    dimensions += [
+        _compile_dimension(label, spec, where)
+        for label, spec in dimension_specs.items()
+    ]
+    if metric_type == "histogram" and any(d.name == "le" for d in dimensions):
+        raise ConfigError(f"{where}: histogram {name} cannot use the 'le' label")
+    dimensions.sort(key=lambda d: d.name)
+
+    size = math.prod(d.cardinality for d in dimensions if d.distribution == "product")
+
+    labelnames = tuple(d.name for d in dimensions)
+    bases = np.broadcast_to(np.float64(entry["value"]), (size,))
+    model = _family_model(workload, name, metric_type, where)
+    if metric_type == "histogram":
+        buckets = tuple(float(b) for b in entry.get("buckets") or DEFAULT_BUCKETS)
+        options = _histogram_options(entry, where)
+        return _histogram_family(
+            name,
+            labelnames,
+            None,
+            bases,
+            buckets,
+            [options],
+            options[2],
+            tuple(dimensions),
+            model,
+        )
+    return CompiledFamily(
+        name, metric_type, labelnames, None, bases, None, tuple(dimensions), **model
+    )
+
+
+def compile_config(config: Dict[str, Any]) -> CompiledConfig:
+    """Compile a loaded config.yml into a CompiledConfig."""
+    config = config or {}
+    workload = (
+        None
+        if config.get("workload") is None
+        else _compile_workload(config["workload"])
+    )
+
+    info_metrics = []
+    for i, label_set in enumerate(config.get("label_metrics") or []):
+        _validate_labels(label_set, f"label_metrics[{i}]")
+        info_metrics.append(
+            (f"mock_tag_info_{i}", {str(k): str(v) for k, v in label_set.items()})
+        )
+
+    # Group entries of every section into families by (name, type)
+    groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    # Where each grouped entry came from, for errors about the family as a whole
+    group_origins: Dict[Tuple[str, str], List[str]] = {}
+    group_buckets: Dict[Tuple[str, str], Tuple[float, ...]] = {}
+    group_options: Dict[
+        Tuple[str, str], List[Tuple[Optional[float], float, Optional[int]]]
+    ] = {}
+    types_by_name: Dict[str, str] = {}
+    for section, allowed_types in METRIC_SECTIONS.items():
+        for i, entry in enumerate(config.get(section) or []):
+            where = f"{section}[{i}]"
+            try:
+                name, metric_type = entry["name"], entry["type"]
+                float(entry["value"])
+            except (KeyError, TypeError, ValueError) as e:
+                raise ConfigError(f"{where}: missing or invalid field ({e})") from None
+            if metric_type not in allowed_types:
+                continue
+            if not METRIC_NAME_RE.match(name):
+                raise ConfigError(f"{where}: invalid metric name {name!r}")
+            if types_by_name.setdefault(name, metric_type) != metric_type:
+                raise ConfigError(
+                    f"{where}: {name} is declared as both "
+                    f"{types_by_name[name]} and {metric_type}"
+                )
+            labels = entry.get("labels") or {}
+            _validate_labels(labels, where)
+            if metric_type == "histogram" and "le" in labels:
+                raise ConfigError(
+                    f"{where}: histogram {name} cannot use the 'le' label"
+                )
+
+            key = (name, metric_type)
+            if key not in groups:
+                groups[key] = []
+                group_origins[key] = []
+                if metric_type == "histogram":
+                    buckets = entry.get("buckets") or SECTION_BUCKETS.get(
+                        section, DEFAULT_BUCKETS
+                    )
+                    group_buckets[key] = tuple(float(b) for b in buckets)
+                    group_options[key] = []
+            groups[key].append(entry)
+            group_origins[key].append(where)
+            if metric_type == "histogram":
+                group_options[key].append(_histogram_options(entry, where))
+
+    synthetic = []
+    for i, entry in enumerate(config.get("synthetic_metrics") or []):
+        where = f"synthetic_metrics[{i}]"
+        try:
+            name, metric_type = entry["name"], entry["type"]
+            float(entry["value"])
+        except (KeyError, TypeError, ValueError) as e:
+            raise ConfigError(f"{where}: missing or invalid field ({e})") from None
+        if metric_type not in SYNTHETIC_TYPES:
+            raise ConfigError(f"{where}: unsupported metric type {metric_type!r}")
+        if not METRIC_NAME_RE.match(name):
+            raise ConfigError(f"{where}: invalid metric name {name!r}")
+        if name in types_by_name:
+            raise ConfigError(f"{where}: {name} is already declared")
+        types_by_name[name] = metric_type
+        synthetic.append(_compile_synthetic(entry, where, workload))
+
+    families = []
+    for (name, metric_type), entries in groups.items():
+        labelnames = tuple(
+            sorted({label for entry in entries for label in entry.get("labels") or {}})
+        )
+        label_values = _family_label_values(
+            name, labelnames, entries, group_origins[(name, metric_type)]
+        )
+        bases = [float(entry["value"]) for entry in entries]
+        model = _family_model(workload, name, metric_type, f"workload.models.{name}")
+        if metric_type == "histogram":
+            options = group_options[(name, metric_type)]
+            # Like the buckets, the first entry decides whether the family is native
+            families.append(
+                _histogram_family(
+                    name,
+                    labelnames,
+                    label_values,
+                    np.array(bases),
+                    group_buckets[(name, metric_type)],
+                    options,
+                    options[0][2],
+                    model=model,
+                )
+            )
+            continue
+        families.append(
+            CompiledFamily(name, metric_type, labelnames, label_values, bases, **model)
+        )
+
+    return CompiledConfig(tuple(info_metrics), tuple(families + synthetic), workload)
@@ -0,0 +1,317 @@
+"""
+Compiled Config Cache
+
+A generated config.yml of hundreds of thousands of series takes minutes to
+parse with PyYAML, far longer than compiling or registering it. The compiled
+series table (see compiler.py) is therefore written once per config content
+to CONFIG_CACHE_DIR and mapped back on later starts and reloads, skipping
+both the YAML parse and the compile:
+
+    [magic "MXC1"][index length u32][index JSON][padding][arrays...]
+
+A snapshot is named after the SHA-256 of the config file bytes together with
+the compiler sources, so editing the config or upgrading the exporter misses
+the cache instead of serving a stale table. The index holds the info metrics,
+the workload section and per family its scalar fields, the distinct values of
+each label and the byte offsets (from the start of the arrays) of:
+
+- bases, rates, sigmas: float64 [size], or a single value in the index when
+  every series shares it (synthetic families)
+- labels: uint32 [size, labels] - the value index of every series per label
+
+Arrays are 64-byte aligned and used in place from the read-only map; a hit
+costs reading the index and rebuilding the label value tuples. Snapshots are
+written atomically, and only the CONFIG_CACHE_KEEP most recently used stay.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import struct
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from compiler import CompiledConfig, CompiledDimension, CompiledFamily, CompiledWorkload
+
+logger = logging.getLogger(__name__)
+
+CACHE_MAGIC = b"MXC1"
+CACHE_HEADER = struct.Struct("<4sI")
+CACHE_SUFFIX = ".mxc"
+ARRAY_ALIGNMENT = 64
+# Modules whose code decides what a config compiles to
+COMPILER_SOURCES = ("compiler.py", "native_histogram.py")
+
+
+class CacheError(ValueError):
+    """A cache snapshot is unreadable or was written by another format."""
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+
+
+def _tuples(value: Any) -> Any:
+    """JSON lists back to the (nested) tuples the compiled objects hold."""
+    if isinstance(value, list):
+        return tuple(_tuples(item) for item in value)
+    return value
+
+
+def compiler_fingerprint() -> bytes:
+    """SHA-256 of the compiler sources, part of every cache key."""
+    digest = hashlib.sha256(CACHE_MAGIC)
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in COMPILER_SOURCES:
+        with open(os.path.join(here, name), "rb") as f:
+            digest.update(f.read())
+    return digest.digest()
+
+
+def encode_labels(
+    labelnames: Tuple[str, ...], label_values
+) -> Tuple[List[List[str]], np.ndarray]:
+    """(distinct values per label, uint32 value index of every series per label)."""
+    columns: List[List[str]] = []
+    codes = np.empty((len(label_values), len(labelnames)), dtype=np.uint32)
+    for d in range(len(labelnames)):
+        lookup: Dict[str, int] = {}
+        codes[:, d] = [
+            lookup.setdefault(values[d], len(lookup)) for values in label_values
+        ]
+        columns.append(list(lookup))
+    return columns, codes
+
+
+def decode_labels(
+    columns: List[List[str]], codes: np.ndarray
+) -> Tuple[Tuple[str, ...], ...]:
+    """The label value tuples of encode_labels."""
+    if not columns:
+        return ((),) * len(codes)
+    decoded = [
+        np.array(values, dtype=object)[codes[:, d]].tolist()
+        for d, values in enumerate(columns)
+    ]
+    return tuple(zip(*decoded))
+
+
+def write_snapshot(path: str, compiled: CompiledConfig):
+    """Atomically write a compiled config to a snapshot file."""
+    arrays: List[Tuple[int, np.ndarray]] = []
+    end = 0
+
+    def put(array: np.ndarray) -> Dict[str, Any]:
+        nonlocal end
+        if array.ndim == 1 and array.strides == (0,) and len(array):
+            # A broadcast value: one number instead of a copy per series
+            return {"fill": float(array[0])}
+        arrays.append((end, np.ascontiguousarray(array)))
+        offset, end = end, _align(end + array.nbytes)
+        return {"offset": offset}
+
+    families = []
+    for family in compiled.families:
+        entry: Dict[str, Any] = {
+            "name": family.name,
+            "type": family.type,
+            "labelnames": family.labelnames,
+            "size": family.size,
+            "buckets": family.buckets,
+            "dimensions": [
+                [d.name, d.values, d.distribution, d.exponent, d.churn_interval]
+                for d in family.dimensions
+            ],
+            "offset": family.offset,
+            "native_schema": family.native_schema,
+            "model": family.model,
+            "elasticity": family.elasticity,
+            "bases": put(family.bases),
+            "rates": None if family.rates is None else put(family.rates),
+            "sigmas": put(family.sigmas),
+        }
+        if not family.synthetic:
+            entry["label_values"], codes = encode_labels(
+                family.labelnames, family.label_values
+            )
+            entry["labels"] = put(codes)
+        families.append(entry)
+
+    workload = compiled.workload
+    index = {
+        "info_metrics": compiled.info_metrics,
+        "workload": (
+            None
+            if workload is None
+            else {name: getattr(workload, name) for name in workload.__slots__}
+        ),
+        "families": families,
+    }
+    index_bytes = json.dumps(index).encode("utf-8")
+    data_start = _align(CACHE_HEADER.size + len(index_bytes))
+
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path) or ".")
+    try:
+        # Readable by shard workers and later starts under another user
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, "wb") as f:
+            f.write(CACHE_HEADER.pack(CACHE_MAGIC, len(index_bytes)))
+            f.write(index_bytes)
+            for offset, array in arrays:
+                f.seek(data_start + offset)
+                f.write(array.tobytes())
+            f.truncate(data_start + end)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_snapshot(path: str) -> CompiledConfig:
+    """Map a snapshot file back into a CompiledConfig; raises CacheError."""
+    try:
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, index_size = CACHE_HEADER.unpack_from(data, 0)
+        if magic != CACHE_MAGIC:
+            raise CacheError(f"{path} is not a compiled config snapshot")
+        index = json.loads(
+            bytes(data[CACHE_HEADER.size : CACHE_HEADER.size + index_size])
+        )
+    except (OSError, struct.error, ValueError) as e:
+        if isinstance(e, CacheError):
+            raise
+        raise CacheError(f"Cannot read {path}: {e}") from e
+    data_start = _align(CACHE_HEADER.size + index_size)
+
+    def get(
+        entry: Dict[str, Any], shape: Tuple[int, ...], dtype: str = "float64"
+    ) -> np.ndarray:
+        if "fill" in entry:
+            return np.broadcast_to(np.float64(entry["fill"]), shape)
+        start = data_start + entry["offset"]
+        stop = start + int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if stop > len(data):
+            raise CacheError(f"{path} is truncated")
+        return np.asarray(data[start:stop]).view(dtype).reshape(shape)
+
+    families = []
+    for entry in index["families"]:
+        size = entry["size"]
+        label_values = None
+        if "labels" in entry:
+            codes = get(entry["labels"], (size, len(entry["labelnames"])), "uint32")
+            label_values = decode_labels(entry["label_values"], codes)
+        families.append(
+            CompiledFamily(
+                entry["name"],
+                entry["type"],
+                tuple(entry["labelnames"]),
+                label_values,
+                get(entry["bases"], (size,)),
+                _tuples(entry["buckets"]),
+                tuple(
+                    CompiledDimension(*_tuples(dimension))
+                    for dimension in entry["dimensions"]
+                ),
+                entry["offset"],
+                None if entry["rates"] is None else get(entry["rates"], (size,)),
+                get(entry["sigmas"], (size,)),
+                entry["native_schema"],
+                entry["model"],
+                entry["elasticity"],
+            )
+        )
+    workload = index["workload"]
+    return CompiledConfig(
+        tuple((name, labels) for name, labels in index["info_metrics"]),
+        tuple(families),
+        (
+            None
+            if workload is None
+            else CompiledWorkload(
+                **{name: _tuples(value) for name, value in workload.items()}
+            )
+        ),
+    )
+
+
+class ConfigCache:
+    """Compiled config snapshots in a directory, keyed by config content."""
+
+    def __init__(self, directory: str, keep: int = 4):
+        self.directory = directory
+        self.keep = keep
+        self.fingerprint = compiler_fingerprint()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def key(self, data: bytes) -> str:
+        """Cache key of the raw config file bytes."""
+        return hashlib.sha256(self.fingerprint + data).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{CACHE_SUFFIX}")
+
+    def load(self, key: str) -> Optional[CompiledConfig]:
+        """The cached compiled config of a key, None on a miss."""
+        path = self.path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            compiled = read_snapshot(path)
+        except (CacheError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable config cache {path}: {e}")
+            self.errors += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            # Recently used snapshots survive pruning
+            os.utime(path)
+        except OSError:
+            pass
+        return compiled
+
+    def store(self, key: str, compiled: CompiledConfig):
+        """Save a compiled config under its key; a failure only costs the next start."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            write_snapshot(self.path(key), compiled)
+            self._prune()
+        except OSError as e:
+            logger.warning(f"Cannot write config cache to {self.directory}: {e}")
+            self.errors += 1
+
+    def _prune(self):
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if name.endswith(CACHE_SUFFIX):
+                path = os.path.join(self.directory, name)
+                snapshots.append((os.stat(path).st_mtime, path))
+        snapshots.sort(reverse=True)
+        for _, path in snapshots[self.keep :]:
+            os.unlink(path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+        }
+
+
+def create_config_cache() -> Optional[ConfigCache]:
+    """Build the cache from CONFIG_CACHE_DIR and CONFIG_CACHE_KEEP; None if disabled."""
+    directory = os.getenv(
+        "CONFIG_CACHE_DIR",
+        os.path.join(tempfile.gettempdir(), "mock-exporter-config-cache"),
+    )
+    if not directory:
+        return None
+    return ConfigCache(directory, keep=max(1, int(os.getenv("CONFIG_CACHE_KEEP", "4"))))
@@ -0,0 +1,949 @@
+"""
+Cached Prometheus Text Exposition
+
+Renders the series store straight from its NumPy arrays into the Prometheus
+text format (0.0.4) and keeps one pre-serialized block per metric family.
+Every updater tick bumps its family's version; a scrape only re-renders the
+families whose version changed since the previous render and joins the cached
+blocks with the output of the regular prometheus_client REGISTRY (info metrics
+and process collectors). With scrape-time evaluation (see lazy.py) there are
+no ticks: a render first advances the families to the current step, and only
+the rows it renders are evaluated.
+
+Scrapes arriving while a render is in flight await the same render instead of
+starting their own, and renders of different formats take turns, so at most
+one full render runs at a time however many scrapers connect. Each rendered
+body is wrapped in a Snapshot that carries an ETag and caches its gzip/zstd
+encodings, so scrapers negotiating the same Accept-Encoding compress a
+snapshot only once. A snapshot (and its ETag) lasts until a family it shows
+changes; the registry output in it is refreshed along with the next one. Large snapshots are streamed in chunks straight from the
+cached family blocks instead of being joined into one body (Snapshot.stream).
+
+/metrics negotiates its format on the Accept header (negotiate_format) and
+serves any of three from the same family state, each cached per family the
+same way:
+
+- text:        Prometheus text format 0.0.4
+- openmetrics: OpenMetrics 1.0 text, adding _created samples and an exemplar
+               on every histogram bucket that has observations
+- protobuf:    delimited io.prometheus.client.MetricFamily messages, with
+               created timestamps and exemplars; the only scrape format that
+               carries native histograms (see native_histogram.py)
+
+Filtered views (`/metrics?region=...`, match[] selectors, see label_index.py)
+get their own cache per view, kept for the MAX_VIEWS most recent ones, which
+renders only the rows the view selects from each family and the registry
+samples it matches.
+
+A family block is its header (HELP/TYPE lines, or the MetricFamily name,
+help and type fields) followed by its samples, so blocks rendered by several
+shard workers can be stitched under one header (see sharding.py).
+"""
+
+import asyncio
+import gzip
+import math
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from prometheus_client import REGISTRY, CollectorRegistry, generate_latest
+from prometheus_client.metrics_core import Metric
+from prometheus_client.openmetrics.exposition import (
+    generate_latest as generate_openmetrics,
+)
+
+from instrumentation import BODY_BYTES, COMPRESS_DURATION, RENDER_DURATION
+from label_index import View
+from native_histogram import encode_row, exposition_histogram
+from protowire import (
+    encode_varint,
+    field_bytes,
+    field_double,
+    field_string,
+    field_varint,
+)
+from series_store import SeriesFamily, SeriesStore
+from synthetic import splitmix64
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+GZIP_LEVEL = int(os.getenv("METRICS_GZIP_LEVEL", "5"))
+ZSTD_LEVEL = int(os.getenv("METRICS_ZSTD_LEVEL", "3"))
+
+# Snapshots at least this large are streamed in chunks instead of sent whole
+STREAM_THRESHOLD = int(os.getenv("METRICS_STREAM_THRESHOLD", str(8 << 20)))
+STREAM_CHUNK_BYTES = int(os.getenv("METRICS_STREAM_CHUNK_BYTES", str(256 << 10)))
+
+# Filtered views whose caches are kept (see label_index.py)
+MAX_VIEWS = int(os.getenv("METRICS_MAX_VIEWS", "32"))
+
+# Preferred order when the client accepts several encodings with equal q
+SUPPORTED_ENCODINGS = (
+    ["zstd", "gzip", "identity"] if zstandard else ["gzip", "identity"]
+)
+
+# Histogram bucket exemplars in the OpenMetrics and protobuf formats
+EXEMPLARS = os.getenv("METRICS_EXEMPLARS", "true").lower() not in ("0", "false", "no")
+
+PROTOBUF_MEDIA_TYPE = "application/vnd.google.protobuf"
+CONTENT_TYPES = {
+    "text": "text/plain; version=0.0.4; charset=utf-8",
+    "openmetrics": "application/openmetrics-text; version=1.0.0; charset=utf-8",
+    "protobuf": (
+        f"{PROTOBUF_MEDIA_TYPE}; proto=io.prometheus.client.MetricFamily; "
+        "encoding=delimited"
+    ),
+}
+# Preferred order when the client accepts several formats with equal q:
+# cheapest for the scraper to parse first
+FORMAT_PREFERENCE = ("protobuf", "openmetrics", "text")
+OPENMETRICS_EOF = b"# EOF\n"
+
+# io.prometheus.client.MetricType
+PROTO_TYPES = {"counter": 0, "gauge": 1, "summary": 2, "unknown": 3, "histogram": 4}
+
+
+def escape_label_value(value: str) -> str:
+    """Escape a label value for the text exposition format."""
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def escape_help(text: str) -> str:
+    """Escape HELP text for the text exposition format."""
+    return text.replace("\\", r"\\").replace("\n", r"\n")
+
+
+def format_value(value: float) -> str:
+    """Format a sample value the way Prometheus parsers expect."""
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(value)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> str:
+    """Pick the response encoding from an Accept-Encoding header."""
+    if not accept_encoding:
+        return "identity"
+
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[token] = q
+
+    best, best_q = "identity", weights.get("identity", weights.get("*", 0.001))
+    for encoding in SUPPORTED_ENCODINGS:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > 0 and q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _media_format(media_type: str, params: Dict[str, str]) -> Optional[str]:
+    """The exposition format an Accept entry names, if any."""
+    if media_type == PROTOBUF_MEDIA_TYPE:
+        if (
+            params.get("proto") == "io.prometheus.client.MetricFamily"
+            and params.get("encoding") == "delimited"
+        ):
+            return "protobuf"
+        return None
+    if media_type == "application/openmetrics-text":
+        return (
+            "openmetrics"
+            if params.get("version", "1.0.0") in ("1.0.0", "0.0.1")
+            else None
+        )
+    if media_type == "text/plain":
+        return "text" if params.get("version", "0.0.4") == "0.0.4" else None
+    return None
+
+
+def negotiate_format(
+    accept: Optional[str], formats: Sequence[str] = FORMAT_PREFERENCE
+) -> str:
+    """Pick the exposition format from an Accept header.
+
+    The highest q among the formats offered wins, ties going to the cheaper
+    format to parse. Anything unrecognized, including */*, gets text, as
+    Prometheus clients do.
+    """
+    if not accept:
+        return "text"
+    weights: Dict[str, float] = {}
+    for part in accept.split(","):
+        media_type, *raw_params = part.split(";")
+        params = {}
+        for param in raw_params:
+            name, _, value = param.partition("=")
+            params[name.strip().lower()] = value.strip().strip('"')
+        fmt = _media_format(media_type.strip().lower(), params)
+        if fmt is None or fmt not in formats:
+            continue
+        try:
+            q = float(params.get("q", 1.0))
+        except ValueError:
+            q = 0.0
+        weights[fmt] = max(q, weights.get(fmt, 0.0))
+
+    best, best_q = "text", 0.0
+    for fmt in FORMAT_PREFERENCE:
+        q = weights.get(fmt, 0.0)
+        if q > best_q:
+            best, best_q = fmt, q
+    return best
+
+
+def label_pair(name: str, value: str) -> bytes:
+    """Encode one Metric.label (io.prometheus.client.LabelPair)."""
+    return field_bytes(1, field_string(1, name) + field_string(2, value))
+
+
+def metric_family_header(name: str, documentation: str, metric_type: str) -> bytes:
+    """Encode the name, help and type fields of a MetricFamily."""
+    return (
+        field_string(1, name)
+        + field_string(2, documentation)
+        + field_varint(3, PROTO_TYPES[metric_type])
+    )
+
+
+def metric_family_proto(
+    name: str, documentation: str, metric_type: str, metrics: Iterable[bytes]
+) -> bytes:
+    """Encode a length-delimited MetricFamily from encoded Metric bodies."""
+    body = metric_family_header(name, documentation, metric_type) + b"".join(
+        field_bytes(4, metric) for metric in metrics
+    )
+    return encode_varint(len(body)) + body
+
+
+def timestamp_proto(seconds: float) -> bytes:
+    """Encode a google.protobuf.Timestamp."""
+    whole = math.floor(seconds)
+    return field_varint(1, whole) + field_varint(2, int((seconds - whole) * 1e9))
+
+
+def _registry_family_proto(metric) -> bytes:
+    """Encode one prometheus_client metric family as protobuf MetricFamilies."""
+    if metric.type == "counter":
+        metrics = [
+            b"".join(label_pair(*pair) for pair in sorted(sample.labels.items()))
+            + field_bytes(3, field_double(1, sample.value))
+            for sample in metric.samples
+            if sample.name.endswith("_total")
+        ]
+        return metric_family_proto(
+            f"{metric.name}_total", metric.documentation, "counter", metrics
+        )
+
+    if metric.type in ("histogram", "summary"):
+        series: Dict[tuple, Dict] = {}
+        for sample in metric.samples:
+            labels = {
+                k: v for k, v in sample.labels.items() if k not in ("le", "quantile")
+            }
+            entry = series.setdefault(
+                tuple(sorted(labels.items())), {"points": [], "count": 0, "sum": 0.0}
+            )
+            suffix = sample.name[len(metric.name) :]
+            if suffix == "_bucket":
+                entry["points"].append((float(sample.labels["le"]), sample.value))
+            elif suffix == "" and "quantile" in sample.labels:
+                entry["points"].append((float(sample.labels["quantile"]), sample.value))
+            elif suffix in ("_count", "_sum"):
+                entry[suffix[1:]] = sample.value
+        metrics = []
+        for labels, entry in series.items():
+            body = field_varint(1, int(entry["count"])) + field_double(2, entry["sum"])
+            if metric.type == "histogram":
+                # The +Inf bucket is implied by the count
+                body += b"".join(
+                    field_bytes(3, field_varint(1, int(count)) + field_double(2, bound))
+                    for bound, count in entry["points"]
+                    if bound != math.inf
+                )
+                field = 7
+            else:
+                body += b"".join(
+                    field_bytes(3, field_double(1, quantile) + field_double(2, value))
+                    for quantile, value in entry["points"]
+                )
+                field = 4
+            metrics.append(
+                b"".join(label_pair(*pair) for pair in labels)
+                + field_bytes(field, body)
+            )
+        return metric_family_proto(
+            metric.name, metric.documentation, metric.type, metrics
+        )
+
+    # Gauges, info, state sets and untyped metrics: one family per sample name
+    untyped = metric.type == "unknown"
+    by_name: Dict[str, List[bytes]] = {}
+    for sample in metric.samples:
+        value = field_bytes(5 if untyped else 2, field_double(1, sample.value))
+        labels = b"".join(label_pair(*pair) for pair in sorted(sample.labels.items()))
+        by_name.setdefault(sample.name, []).append(labels + value)
+    return b"".join(
+        metric_family_proto(
+            name, metric.documentation, "unknown" if untyped else "gauge", metrics
+        )
+        for name, metrics in by_name.items()
+    )
+
+
+def registry_protobuf(registry: CollectorRegistry) -> bytes:
+    """Delimited protobuf exposition of a prometheus_client registry."""
+    return b"".join(_registry_family_proto(metric) for metric in registry.collect())
+
+
+def render_registry(registry: CollectorRegistry, fmt: str) -> bytes:
+    """Exposition of a prometheus_client registry in one format, without # EOF."""
+    if fmt == "protobuf":
+        return registry_protobuf(registry)
+    if fmt == "openmetrics":
+        body = generate_openmetrics(registry)
+        return body[: -len(OPENMETRICS_EOF)] if body.endswith(OPENMETRICS_EOF) else body
+    return generate_latest(registry)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class Snapshot:
+    """An immutable rendered body plus its cached compressed encodings.
+
+    The body is kept as the blocks it was rendered from (the family blocks
+    the renderers cache anyway) and only joined into one bytes object when a
+    small response needs it. Snapshots of at least STREAM_THRESHOLD bytes are
+    streamed instead: chunks() walks the blocks without copying the body, and
+    stream() compresses it chunk by chunk once, sharing the compressed chunks
+    between every reader.
+    """
+
+    __slots__ = ("parts", "size", "tag", "_body", "_encoded", "_streams", "_lock")
+
+    def __init__(self, parts: Sequence[bytes], tag: str):
+        self.parts = tuple(parts)
+        self.size = sum(len(part) for part in self.parts)
+        self.tag = tag
+        self._body: Optional[bytes] = None
+        self._encoded: Dict[str, bytes] = {}
+        self._streams: Dict[str, EncodedStream] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def body(self) -> bytes:
+        """The whole identity body, joined on first use."""
+        if self._body is None:
+            with self._lock:
+                if self._body is None:
+                    self._body = b"".join(self.parts)
+        return self._body
+
+    @property
+    def streamed(self) -> bool:
+        """Whether responses should stream this snapshot instead of sending one body."""
+        return self.size >= STREAM_THRESHOLD
+
+    def etag(self, encoding: str = "identity") -> str:
+        """Strong ETag for one representation of this snapshot."""
+        if encoding == "identity":
+            return f'"{self.tag}"'
+        return f'"{self.tag}-{encoding}"'
+
+    def encoded(self, encoding: str) -> bytes:
+        """Return the body in the given encoding, compressing at most once."""
+        if encoding == "identity":
+            return self.body
+        data = self._encoded.get(encoding)
+        if data is not None:
+            return data
+        body = self.body
+        with self._lock:
+            data = self._encoded.get(encoding)
+            if data is None:
+                started = time.perf_counter()
+                if encoding == "gzip":
+                    data = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+                elif encoding == "zstd" and zstandard is not None:
+                    data = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+                else:
+                    raise ValueError(f"Unsupported encoding: {encoding}")
+                COMPRESS_DURATION.labels(encoding=encoding).observe(
+                    time.perf_counter() - started
+                )
+                BODY_BYTES.labels(encoding=encoding).set(len(data))
+                self._encoded[encoding] = data
+        return data
+
+    async def encoded_async(self, encoding: str) -> bytes:
+        """Like encoded(), but joins and compresses in a worker thread."""
+        if encoding == "identity" and self._body is not None:
+            return self._body
+        if encoding in self._encoded:
+            return self._encoded[encoding]
+        return await asyncio.to_thread(self.encoded, encoding)
+
+    def chunks(self, chunk_size: int = STREAM_CHUNK_BYTES) -> Iterator[bytes]:
+        """The identity body in chunks of chunk_size bytes (the last one shorter).
+
+        Small blocks are coalesced and large ones sliced, so at most one
+        chunk is copied at a time.
+        """
+        pending: List[memoryview] = []
+        pending_size = 0
+        for part in self.parts:
+            view = memoryview(part)
+            while len(view):
+                piece = view[: chunk_size - pending_size]
+                view = view[len(piece) :]
+                pending.append(piece)
+                pending_size += len(piece)
+                if pending_size == chunk_size:
+                    yield b"".join(pending)
+                    pending, pending_size = [], 0
+        if pending:
+            yield b"".join(pending)
+
+    def stream(self, encoding: str) -> Iterator[bytes]:
+        """The body in the given encoding as a sequence of chunks."""
+        if encoding == "identity":
+            return self.chunks()
+        with self._lock:
+            stream = self._streams.get(encoding)
+            if stream is None:
+                stream = self._streams[encoding] = EncodedStream(self, encoding)
+        return iter(stream)
+
+
+class EncodedStream:
+    """A snapshot compressed chunk by chunk, at most once, for any number of readers.
+
+    Whichever reader first needs a chunk that does not exist yet compresses
+    the next input chunk; readers behind it replay the chunks already made.
+    Only the compressed chunks are kept, so a slow reader pins a fraction of
+    the body size, not a copy of it.
+    """
+
+    def __init__(self, snapshot: Snapshot, encoding: str):
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        elif encoding == "zstd" and zstandard is not None:
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+        self.encoding = encoding
+        self.chunks: List[bytes] = []
+        self.done = False
+        self._source = snapshot.chunks()
+        self._size = 0
+        self._seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _advance(self, index: int) -> bool:
+        """Compress until chunk index exists or the input ends; whether it exists."""
+        with self._lock:
+            while len(self.chunks) <= index and not self.done:
+                started = time.perf_counter()
+                chunk = next(self._source, None)
+                if chunk is None:
+                    data = self._compressor.flush()
+                    self.done = True
+                else:
+                    data = self._compressor.compress(chunk)
+                self._seconds += time.perf_counter() - started
+                if data:
+                    self.chunks.append(data)
+                    self._size += len(data)
+            if self.done and self._source is not None:
+                self._source = None
+                COMPRESS_DURATION.labels(encoding=self.encoding).observe(self._seconds)
+                BODY_BYTES.labels(encoding=self.encoding).set(self._size)
+        return index < len(self.chunks)
+
+    def __iter__(self) -> Iterator[bytes]:
+        index = 0
+        while index < len(self.chunks) or self._advance(index):
+            yield self.chunks[index]
+            index += 1
+
+
+class FamilyRenderer:
+    """Pre-computed headers and label encodings and the last rendered block
+    per format for one family, or for the rows of it a filtered view selects."""
+
+    def __init__(self, family: SeriesFamily, rows: Optional[np.ndarray] = None):
+        self.family = family
+        # Sorted rows to render, None for all
+        self.rows = rows
+        self.sample_name = family.sample_name
+        # format -> (family version, block)
+        self.blocks: Dict[str, Tuple[int, bytes]] = {}
+        # Static label encodings of listed families, built on first use
+        self._label_sets: Optional[List[str]] = None
+        self._label_pairs: Optional[List[bytes]] = None
+        self._exemplar_values: Optional[np.ndarray] = None
+
+        name, documentation, metric_type = (
+            self.sample_name,
+            family.documentation,
+            family.type,
+        )
+        # OpenMetrics names counter families without the _total suffix
+        family_name = name[: -len("_total")] if metric_type == "counter" else name
+        self.headers = {
+            "text": (
+                f"# HELP {name} {escape_help(documentation)}\n"
+                f"# TYPE {name} {metric_type}\n"
+            ).encode("utf-8"),
+            "openmetrics": (
+                f"# TYPE {family_name} {metric_type}\n"
+                f"# HELP {family_name} {escape_label_value(documentation)}\n"
+            ).encode("utf-8"),
+            "protobuf": metric_family_header(
+                family.name if metric_type == "histogram" else name,
+                documentation,
+                metric_type,
+            ),
+        }
+
+    def render(self, fmt: str = "text") -> bytes:
+        """Render the family in one format if its version moved since the last render.
+
+        Protobuf blocks are MetricFamily bodies without the length prefix.
+        Renders run off the event loop, so they work on a copy of the state
+        taken between two updates (SeriesFamily.read).
+        """
+        cached = self.blocks.get(fmt)
+        if cached is not None and cached[0] == self.family.version:
+            return cached[1]
+        version, values, counts = self.family.read(self.rows)
+        if fmt == "protobuf":
+            body = self._protobuf_body(values, counts)
+        else:
+            lines = self._text_lines(values, counts, fmt == "openmetrics")
+            body = "".join(lines).encode("utf-8")
+        block = self.headers[fmt] + body
+        self.blocks[fmt] = (version, block)
+        return block
+
+    def _take(self, array: np.ndarray) -> np.ndarray:
+        return array if self.rows is None else array[self.rows]
+
+    def _label_values(self) -> Iterable:
+        label_values = self.family.label_values
+        if self.rows is None:
+            return label_values
+        return (label_values[i] for i in self.rows.tolist())
+
+    def _label_strings(self) -> List[str]:
+        family = self.family
+        if family.synthetic is not None:
+            return family.synthetic.render(
+                lambda label, value: f'{label}="{escape_label_value(value)}"',
+                ",",
+                rows=self.rows,
+            ).tolist()
+        if self._label_sets is None:
+            self._label_sets = [
+                ",".join(
+                    f'{label}="{escape_label_value(value)}"'
+                    for label, value in sorted(zip(family.labelnames, values))
+                )
+                for values in self._label_values()
+            ]
+        return self._label_sets
+
+    def _label_encodings(self) -> List[bytes]:
+        family = self.family
+        if family.synthetic is not None:
+            return family.synthetic.render(label_pair, b"", rows=self.rows).tolist()
+        if self._label_pairs is None:
+            self._label_pairs = [
+                b"".join(
+                    label_pair(*pair) for pair in sorted(zip(family.labelnames, values))
+                )
+                for values in self._label_values()
+            ]
+        return self._label_pairs
+
+    def _exemplars(
+        self, counts: np.ndarray
+    ) -> Optional[Tuple[List[List[int]], List[List[float]]]]:
+        """(trace ids, values) per series and bucket, or None without exemplars.
+
+        Trace ids hash the series, bucket and bucket count, so an exemplar
+        changes exactly when its bucket receives observations. Values are the
+        bucket's mean observation for batched families, its midpoint otherwise.
+        """
+        family = self.family
+        if not EXEMPLARS or family.native_schema is not None:
+            return None
+        if self._exemplar_values is None:
+            if family.batched:
+                self._exemplar_values = self._take(family._table(family.bucket_means))
+            else:
+                upper = family.bucket_bounds
+                lower = np.concatenate(([0.0], upper[:-1]))
+                values = np.where(
+                    np.isinf(upper), np.maximum(lower, 1.0) * 1.5, (lower + upper) / 2
+                )
+                self._exemplar_values = np.broadcast_to(values, counts.shape)
+        rows = np.arange(family.size) if self.rows is None else self.rows
+        rows = rows.astype(np.uint64) + np.uint64(family.compiled.offset)
+        z = rows[:, None] * np.uint64(0xD1B54A32D192ED03)
+        z = z + np.arange(counts.shape[1], dtype=np.uint64) * np.uint64(
+            0x9E3779B97F4A7C15
+        )
+        z ^= counts.astype(np.uint64) + np.uint64(
+            zlib.crc32(family.compiled.key.encode("utf-8"))
+        )
+        return splitmix64(z).tolist(), self._exemplar_values.tolist()
+
+    def _text_lines(
+        self, values: np.ndarray, counts: Optional[np.ndarray], openmetrics: bool
+    ) -> List[str]:
+        family = self.family
+        name = self.sample_name
+        label_sets = self._label_strings()
+        values = values.tolist()
+        created = f" {format_value(family.created)}\n"
+        lines = []
+        if openmetrics and family.type == "counter":
+            # OpenMetrics keeps each series' samples together
+            created_name = f"{name[: -len('_total')]}_created"
+            for labels, value in zip(label_sets, values):
+                lines.append(f"{name}{{{labels}}} {format_value(value)}\n")
+                lines.append(f"{created_name}{{{labels}}}{created}")
+            return lines
+        if family.type != "histogram":
+            for labels, value in zip(label_sets, values):
+                lines.append(f"{name}{{{labels}}} {format_value(value)}\n")
+            return lines
+
+        le_values = family.bucket_labels
+        counts = family.classic_counts(counts)
+        cumulative = counts.cumsum(axis=1).tolist()
+        exemplars = self._exemplars(counts) if openmetrics else None
+        for i, (labels, row, total) in enumerate(zip(label_sets, cumulative, values)):
+            prefix = f"{labels}," if labels else ""
+            previous = 0.0
+            for b, (le, count) in enumerate(zip(le_values, row)):
+                line = f'{name}_bucket{{{prefix}le="{le}"}} {count!r}'
+                if exemplars is not None and count > previous:
+                    trace_ids, exemplar_values = exemplars
+                    trace_id = trace_ids[i][b]
+                    line += (
+                        f' # {{trace_id="{trace_id:016x}"}} {exemplar_values[i][b]!r}'
+                    )
+                lines.append(line + "\n")
+                previous = count
+            lines.append(f"{name}_count{{{labels}}} {row[-1]!r}\n")
+            lines.append(f"{name}_sum{{{labels}}} {format_value(total)}\n")
+            if openmetrics:
+                lines.append(f"{name}_created{{{labels}}}{created}")
+        return lines
+
+    def _protobuf_body(self, values: np.ndarray, counts: Optional[np.ndarray]) -> bytes:
+        family = self.family
+        label_pairs = self._label_encodings()
+        values = values.tolist()
+        created = timestamp_proto(family.created)
+        if family.type == "histogram":
+            metrics = self._histogram_metrics(label_pairs, counts, values, created)
+        elif family.type == "counter":
+            tail = field_bytes(3, created)
+            metrics = [
+                labels + field_bytes(3, field_double(1, value) + tail)
+                for labels, value in zip(label_pairs, values)
+            ]
+        else:
+            metrics = [
+                labels + field_bytes(2, field_double(1, value))
+                for labels, value in zip(label_pairs, values)
+            ]
+        return b"".join(field_bytes(4, metric) for metric in metrics)
+
+    def _histogram_metrics(
+        self,
+        label_pairs: List[bytes],
+        counts: np.ndarray,
+        totals: List[float],
+        created: bytes,
+    ) -> List[bytes]:
+        family = self.family
+        counts = counts.astype(np.int64)
+        created = field_bytes(15, created)
+        if family.native_schema is not None:
+            schema, first = family.native_schema, family.native_first
+            return [
+                labels
+                + field_bytes(
+                    7,
+                    exposition_histogram(encode_row(row, first), total, schema)
+                    + created,
+                )
+                for labels, row, total in zip(label_pairs, counts.tolist(), totals)
+            ]
+
+        # Classic buckets; the +Inf bucket is implied by the count
+        bounds = [
+            field_double(2, bound) for bound in family.bucket_bounds[:-1].tolist()
+        ]
+        exemplars = self._exemplars(counts)
+        metrics = []
+        for i, (labels, row, total) in enumerate(
+            zip(label_pairs, counts.cumsum(axis=1).tolist(), totals)
+        ):
+            buckets = []
+            previous = 0
+            for b, (count, bound) in enumerate(zip(row, bounds)):
+                bucket = field_varint(1, count) + bound
+                if exemplars is not None and count > previous:
+                    trace_ids, exemplar_values = exemplars
+                    bucket += field_bytes(
+                        3,
+                        label_pair("trace_id", f"{trace_ids[i][b]:016x}")
+                        + field_double(2, exemplar_values[i][b]),
+                    )
+                buckets.append(field_bytes(3, bucket))
+                previous = count
+            body = field_varint(1, row[-1]) + field_double(2, total) + b"".join(buckets)
+            metrics.append(labels + field_bytes(7, body + created))
+        return metrics
+
+
+class FilteredRegistry:
+    """The samples of a prometheus_client registry that a view selects."""
+
+    def __init__(self, registry: CollectorRegistry, view: View):
+        self.registry = registry
+        self.view = view
+
+    def collect(self) -> Iterable[Metric]:
+        for metric in self.registry.collect():
+            samples = [
+                sample
+                for sample in metric.samples
+                if self.view.matches((metric.name, sample.name), sample.labels)
+            ]
+            if samples:
+                filtered = Metric(
+                    metric.name, metric.documentation, metric.type, metric.unit
+                )
+                filtered.samples = samples
+                yield filtered
+
+
+class ExpositionCache:
+    """Serves /metrics bodies from per-family cached blocks, per format.
+
+    With a view, only the series the view selects: the rows of each family
+    come from its label index and are re-selected only when the family is
+    replaced or its labels churn, and only those rows are rendered. Filtered
+    caches are created by filtered() and share their parent's render lock.
+    """
+
+    formats = FORMAT_PREFERENCE
+
+    def __init__(
+        self,
+        store: SeriesStore,
+        registry: CollectorRegistry = REGISTRY,
+        registry_ttl: float = 1.0,
+        view: Optional[View] = None,
+    ):
+        self.store = store
+        self.registry = registry
+        self.registry_ttl = registry_ttl
+        self.view = view
+        self.renderers: Dict[str, FamilyRenderer] = {}
+        self.renders = 0
+        self.shared_renders = 0
+        self._collector = registry if view is None else FilteredRegistry(registry, view)
+        # family key -> (family, label version, selected rows)
+        self._selections: Dict[str, tuple] = {}
+        self._views: "OrderedDict[str, ExpositionCache]" = OrderedDict()
+        self._views_lock = threading.Lock()
+
+        self._snapshots: Dict[str, Snapshot] = {}
+        self._snapshot_keys: Dict[str, tuple] = {}
+        self._generation = 0
+        self._instance = os.urandom(4).hex()
+        # format -> (rendered at, registry block)
+        self._registry_blocks: Dict[str, tuple] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def renderer(
+        self, key: str, family: SeriesFamily, rows: Optional[np.ndarray] = None
+    ) -> FamilyRenderer:
+        """The renderer of a family (or of some of its rows), kept across renders."""
+        renderer = self.renderers.get(key)
+        if (
+            renderer is None
+            or renderer.family is not family
+            or renderer.rows is not rows
+        ):
+            renderer = FamilyRenderer(family, rows)
+            self.renderers[key] = renderer
+        return renderer
+
+    def _rows(self, key: str, family: SeriesFamily) -> Optional[np.ndarray]:
+        if self.view is None:
+            return None
+        label_version = family.synthetic.version if family.synthetic is not None else 0
+        cached = self._selections.get(key)
+        if cached is None or cached[0] is not family or cached[1] != label_version:
+            cached = self._selections[key] = (
+                family,
+                label_version,
+                self.view.rows(family.index),
+            )
+        return cached[2]
+
+    def selected_families(self) -> List[Tuple[str, SeriesFamily, Optional[np.ndarray]]]:
+        """(key, family, rows) of every family in the view; rows None for all."""
+        selected = []
+        for key, family in self.store.families.items():
+            rows = self._rows(key, family)
+            if rows is None or len(rows):
+                selected.append((key, family, rows))
+        return selected
+
+    def prune(self):
+        """Forget renderers and selections of families no longer in the store."""
+        families = self.store.families
+        for stale in self.renderers.keys() - families.keys():
+            del self.renderers[stale]
+        for stale in self._selections.keys() - families.keys():
+            del self._selections[stale]
+
+    def filtered(self, view: View) -> "ExpositionCache":
+        """The cache serving a filtered view; the MAX_VIEWS most recent are kept."""
+        with self._views_lock:
+            cache = self._views.get(view.key)
+            if cache is None:
+                cache = self._views[view.key] = self._view_cache(view)
+                while len(self._views) > MAX_VIEWS:
+                    self._views.popitem(last=False)
+            else:
+                self._views.move_to_end(view.key)
+        return cache
+
+    def _view_cache(self, view: View) -> "ExpositionCache":
+        cache = ExpositionCache(self.store, self.registry, self.registry_ttl, view)
+        # One full render at a time across all views
+        cache._lock = self._lock
+        return cache
+
+    def render(self, fmt: str = "text") -> Snapshot:
+        """Return the current snapshot, re-rendering only dirty families."""
+        with self._lock:
+            previous = self._snapshots.get(fmt)
+            started = time.perf_counter()
+            snapshot = self._render(fmt)
+            if snapshot is not previous:
+                RENDER_DURATION.observe(time.perf_counter() - started)
+                if self.view is None:
+                    BODY_BYTES.labels(encoding="identity").set(snapshot.size)
+            return snapshot
+
+    def _registry_block(self, fmt: str) -> tuple:
+        """(rendered at, block) of the registry metrics, renewed every registry_ttl."""
+        now = time.monotonic()
+        cached = self._registry_blocks.get(fmt)
+        if cached is None or now - cached[0] >= self.registry_ttl:
+            cached = self._registry_blocks[fmt] = (
+                now,
+                render_registry(self._collector, fmt),
+            )
+        return cached
+
+    def _cached(self, fmt: str, key: tuple) -> Optional[Snapshot]:
+        if self._snapshot_keys.get(fmt) == key:
+            return self._snapshots[fmt]
+        return None
+
+    def _publish(self, fmt: str, parts: List[bytes], key: tuple) -> Snapshot:
+        self._generation += 1
+        snapshot = self._snapshots[fmt] = Snapshot(
+            parts, f"{self._instance}-{self._generation}"
+        )
+        self._snapshot_keys[fmt] = key
+        self.renders += 1
+        return snapshot
+
+    def _render(self, fmt: str) -> Snapshot:
+        # Lazily evaluated families move on when scraped, not on a tick
+        self.store.advance()
+
+        # Keyed on the mock families only: the registry block (process and GC
+        # metrics) changes on every collect and would renew the ETag each time
+        selected = self.selected_families()
+        key = tuple((id(family), family.version) for _, family, _ in selected)
+        cached = self._cached(fmt, key)
+        if cached is not None:
+            return cached
+
+        _, registry_block = self._registry_block(fmt)
+        blocks = [registry_block]
+        for family_key, family, rows in selected:
+            block = self.renderer(family_key, family, rows).render(fmt)
+            if fmt == "protobuf":
+                block = encode_varint(len(block)) + block
+            blocks.append(block)
+        if fmt == "openmetrics":
+            blocks.append(OPENMETRICS_EOF)
+        self.prune()
+        return self._publish(fmt, blocks, key)
+
+    async def get(self, fmt: str = "text") -> Snapshot:
+        """Render off the event loop, sharing one render between concurrent scrapes."""
+        inflight = self._inflight.get(fmt)
+        if inflight is not None:
+            self.shared_renders += 1
+            return await asyncio.shield(inflight)
+
+        inflight = self._inflight[fmt] = asyncio.ensure_future(
+            asyncio.to_thread(self.render, fmt)
+        )
+        try:
+            return await asyncio.shield(inflight)
+        finally:
+            del self._inflight[fmt]
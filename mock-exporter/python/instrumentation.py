@@ -0,0 +1,242 @@
+"""
+Exporter Self-Instrumentation
+
+Metrics about the exporter's own cost, registered on SELF_REGISTRY instead of
+the default REGISTRY so they never mix with the mock data on /metrics. They
+are served on /internal/metrics and cover each stage a scrape depends on:
+
+- generation: time per updater tick per metric family, updater scheduler lag
+- rendering:  /metrics snapshot render time, compression time, body size
+- serving:    event-loop lag, scrape latency and status, bytes sent,
+              concurrent, queued and rejected scrapes
+- pushing:    bytes sent per remote-write endpoint
+- reloading:  config reloads per result and their duration
+- starting:   time spent in each startup phase until the exporter was ready
+- sharding:   shard workers restarted after dying, hanging or disconnecting
+
+With these, a slow scrape seen by vmagent can be attributed to the exporter
+(render or loop lag) or to the network (fast scrape_duration here).
+
+In multi-process mode the generation histograms live in the shard workers;
+each worker reports their raw state with every render and the front process
+re-exposes them with a shard label.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, HistogramMetricFamily
+
+SELF_REGISTRY = CollectorRegistry()
+
+# Sub-millisecond to multi-second: ticks and renders span both
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+UPDATE_DURATION = Histogram(
+    "mock_exporter_update_duration_seconds",
+    "Time spent in one updater tick, per metric family",
+    ["family"],
+    buckets=LATENCY_BUCKETS,
+    registry=SELF_REGISTRY,
+)
+SCHEDULER_LAG = Histogram(
+    "mock_exporter_scheduler_lag_seconds",
+    "How late the updater scheduler started a batch compared to its deadline",
+    buckets=LATENCY_BUCKETS,
+    registry=SELF_REGISTRY,
+)
+EVENT_LOOP_LAG = Histogram(
+    "mock_exporter_event_loop_lag_seconds",
+    "How late the serving event loop ran a callback that was due",
+    buckets=LATENCY_BUCKETS,
+    registry=SELF_REGISTRY,
+)
+RENDER_DURATION = Histogram(
+    "mock_exporter_render_duration_seconds",
+    "Time to build a new /metrics snapshot",
+    buckets=LATENCY_BUCKETS,
+    registry=SELF_REGISTRY,
+)
+COMPRESS_DURATION = Histogram(
+    "mock_exporter_compress_duration_seconds",
+    "Time to compress a /metrics snapshot, per encoding",
+    ["encoding"],
+    buckets=LATENCY_BUCKETS,
+    registry=SELF_REGISTRY,
+)
+BODY_BYTES = Gauge(
+    "mock_exporter_metrics_body_bytes",
+    "Size of the latest /metrics snapshot, per encoding",
+    ["encoding"],
+    registry=SELF_REGISTRY,
+)
+SCRAPE_DURATION = Histogram(
+    "mock_exporter_scrape_duration_seconds",
+    "Time to serve a /metrics request",
+    buckets=LATENCY_BUCKETS,
+    registry=SELF_REGISTRY,
+)
+SCRAPES = Counter(
+    "mock_exporter_scrapes",
+    "/metrics requests served, per status code",
+    ["code"],
+    registry=SELF_REGISTRY,
+)
+SCRAPE_BYTES = Counter(
+    "mock_exporter_scrape_response_bytes",
+    "Body bytes sent in /metrics responses, per encoding",
+    ["encoding"],
+    registry=SELF_REGISTRY,
+)
+SCRAPES_IN_FLIGHT = Gauge(
+    "mock_exporter_scrapes_in_flight",
+    "/metrics requests currently being served",
+    registry=SELF_REGISTRY,
+)
+SCRAPES_QUEUED = Gauge(
+    "mock_exporter_scrapes_queued",
+    "/metrics requests waiting for a serving slot",
+    registry=SELF_REGISTRY,
+)
+SCRAPES_REJECTED = Counter(
+    "mock_exporter_scrapes_rejected",
+    "/metrics requests answered with 503 because the exporter was overloaded, "
+    "per reason",
+    ["reason"],
+    registry=SELF_REGISTRY,
+)
+CONFIG_RELOADS = Counter(
+    "mock_exporter_config_reloads",
+    "Config reload attempts, per result",
+    ["result"],
+    registry=SELF_REGISTRY,
+)
+RELOAD_DURATION = Histogram(
+    "mock_exporter_config_reload_duration_seconds",
+    "Time to compile, diff and apply a reloaded config",
+    buckets=LATENCY_BUCKETS,
+    registry=SELF_REGISTRY,
+)
+STARTUP_DURATION = Gauge(
+    "mock_exporter_startup_seconds",
+    "Time spent in each startup phase, and in total until ready",
+    ["phase"],
+    registry=SELF_REGISTRY,
+)
+SHARD_RESTARTS = Counter(
+    "mock_exporter_shard_restarts",
+    "Shard workers restarted by the front process, per reason",
+    ["reason"],
+    registry=SELF_REGISTRY,
+)
+
+
+# Histograms filled by the process that runs the updaters, with their labels
+WORKER_HISTOGRAMS = ((UPDATE_DURATION, ("family",)), (SCHEDULER_LAG, ()))
+
+
+def observe_job(name: str, seconds: float):
+    """Scheduler job observer: record one updater tick."""
+    UPDATE_DURATION.labels(family=name).observe(seconds)
+
+
+def observe_lag(seconds: float):
+    """Scheduler lag observer: record how late a batch started."""
+    SCHEDULER_LAG.observe(seconds)
+
+
+def histogram_states() -> (
+    Dict[str, List[Tuple[List[str], List[Tuple[str, float]], float]]]
+):
+    """Raw state of the worker histograms: (label values, buckets, sum) per series."""
+    states = {}
+    for histogram, labelnames in WORKER_HISTOGRAMS:
+        series: Dict[Tuple[str, ...], Tuple[List[Tuple[str, float]], List[float]]] = {}
+        for metric in histogram.collect():
+            for sample in metric.samples:
+                key = tuple(sample.labels[label] for label in labelnames)
+                buckets, total = series.setdefault(key, ([], [0.0]))
+                if sample.name.endswith("_bucket"):
+                    buckets.append((sample.labels["le"], sample.value))
+                elif sample.name.endswith("_sum"):
+                    total[0] = sample.value
+            states[metric.name] = [
+                (list(key), buckets, total[0])
+                for key, (buckets, total) in series.items()
+            ]
+    return states
+
+
+class ShardHistogramCollector:
+    """Re-exposes the worker histograms reported by shard workers.
+
+    provider returns (shard index, histogram_states()) pairs; every series
+    gets a shard label.
+    """
+
+    def __init__(self, provider: Callable[[], Iterable[Tuple[int, Dict[str, Any]]]]):
+        self.provider = provider
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        reports = list(self.provider())
+        for histogram, labelnames in WORKER_HISTOGRAMS:
+            described = histogram.describe()[0]
+            family = HistogramMetricFamily(
+                described.name,
+                described.documentation,
+                labels=list(labelnames) + ["shard"],
+            )
+            for shard, states in reports:
+                for label_values, buckets, total in states.get(described.name, []):
+                    family.add_metric(list(label_values) + [str(shard)], buckets, total)
+            yield family
+
+
+class RemoteWriteCollector:
+    """Exposes remote-write delivery counters from a stats provider.
+
+    provider returns the "endpoints" stats lists to aggregate (one per
+    process in multi-process mode); bytes are summed per URL.
+    """
+
+    def __init__(self, provider: Callable[[], Iterable[List[Dict[str, Any]]]]):
+        self.provider = provider
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        totals: Dict[str, int] = {}
+        for endpoints in self.provider():
+            for endpoint in endpoints:
+                totals[endpoint["url"]] = (
+                    totals.get(endpoint["url"], 0) + endpoint["bytes_sent"]
+                )
+        family = CounterMetricFamily(
+            "mock_exporter_remote_write_bytes_sent",
+            "Compressed request bytes delivered, per remote-write endpoint",
+            labels=["url"],
+        )
+        for url, sent in totals.items():
+            family.add_metric([url], sent)
+        yield family
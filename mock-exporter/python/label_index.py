@@ -0,0 +1,318 @@
+"""
+Label Index and Filtered Views
+
+Lets one exporter serve a different slice of its series to each scraper, e.g.
+one vmagent per region, instead of every scraper ingesting everything and
+relabeling. A View is what a filtered /metrics request asks for:
+
+- `?region=us-east-1&service=api`: label equality, ANDed (a label given
+  several times matches any of its values);
+- `?match[]={region="us-east-1",status=~"5.."}`: Prometheus series selectors
+  (`=`, `!=`, `=~`, `!~`, optional metric name), ORed as in federation; plain
+  label parameters are ANDed into every selector;
+- `/metrics/region/us-east-1`: the path form of a single equality.
+
+Every family gets a LabelIndex when it is registered: for listed families a
+posting list (sorted row array) per label value, built on the first filtered
+scrape that needs it so registering a huge config stays cheap, for synthetic
+families the dimension value tables, whose row codes are already in memory
+(see synthetic.py). A selector is answered per family from the index - union of
+the postings of the values that match, intersected across matchers - so the
+rows of a view are found without looking at series that cannot match, and
+the exposition renders only those rows (see exposition.py).
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from synthetic import SyntheticLabels
+
+SELECTOR_NAME_RE = re.compile(r"[a-zA-Z_:][a-zA-Z0-9_:]*")
+SELECTOR_LABEL_RE = re.compile(r"[a-zA-Z_][a-zA-Z0-9_]*")
+MATCH_OPS = ("=~", "!~", "!=", "=")
+# The /metrics query parameter carrying series selectors
+MATCH_PARAM = "match[]"
+
+_ESCAPES = {"n": "\n", "t": "\t", "\\": "\\", '"': '"', "'": "'", "`": "`"}
+
+
+class SelectorError(ValueError):
+    """A filter or series selector that cannot be parsed."""
+
+
+class Matcher:
+    """One label matcher of a series selector."""
+
+    __slots__ = ("name", "op", "value", "regex")
+
+    def __init__(self, name: str, op: str, value: str):
+        if op not in MATCH_OPS:
+            raise SelectorError(f"Unknown match operator {op!r}")
+        self.name = name
+        self.op = op
+        self.value = value
+        self.regex = None
+        if op in ("=~", "!~"):
+            try:
+                self.regex = re.compile(value)
+            except re.error as e:
+                raise SelectorError(
+                    f"Invalid regex {value!r} for {name}: {e}"
+                ) from None
+
+    def matches(self, value: str) -> bool:
+        """Whether a label value (empty when the label is absent) matches."""
+        if self.op == "=":
+            return value == self.value
+        if self.op == "!=":
+            return value != self.value
+        matched = self.regex.fullmatch(value) is not None
+        return matched if self.op == "=~" else not matched
+
+    def __str__(self) -> str:
+        escaped = (
+            self.value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        )
+        return f'{self.name}{self.op}"{escaped}"'
+
+
+Selector = Tuple[Matcher, ...]
+
+
+def _quoted(text: str, pos: int) -> Tuple[str, int]:
+    """Parse the quoted string starting at text[pos]; returns (value, end)."""
+    quote = text[pos]
+    if quote not in "\"'`":
+        raise SelectorError(f"Expected a quoted value at {pos} in {text!r}")
+    chars: List[str] = []
+    pos += 1
+    while pos < len(text):
+        char = text[pos]
+        if char == quote:
+            return "".join(chars), pos + 1
+        if char == "\\" and quote != "`" and pos + 1 < len(text):
+            pos += 1
+            chars.append(_ESCAPES.get(text[pos], "\\" + text[pos]))
+        else:
+            chars.append(char)
+        pos += 1
+    raise SelectorError(f"Unterminated string in {text!r}")
+
+
+def parse_selector(text: str) -> Selector:
+    """Parse a series selector such as `http_requests_total{region="us-east-1"}`."""
+    try:
+        return _parse_selector(text.strip())
+    except IndexError:
+        raise SelectorError(f"Incomplete selector {text!r}") from None
+
+
+def _parse_selector(text: str) -> Selector:
+    matchers: List[Matcher] = []
+    name = SELECTOR_NAME_RE.match(text)
+    pos = 0
+    if name:
+        matchers.append(Matcher("__name__", "=", name.group()))
+        pos = name.end()
+    if pos < len(text):
+        if text[pos] != "{" or not text.endswith("}"):
+            raise SelectorError(f"Invalid selector {text!r}")
+        pos += 1
+        while True:
+            while pos < len(text) and text[pos] in " \t,":
+                pos += 1
+            if text[pos] == "}":
+                if pos != len(text) - 1:
+                    raise SelectorError(f"Invalid selector {text!r}")
+                break
+            label = SELECTOR_LABEL_RE.match(text, pos)
+            if not label:
+                raise SelectorError(f"Expected a label name at {pos} in {text!r}")
+            pos = label.end()
+            while text[pos] == " ":
+                pos += 1
+            op = next((op for op in MATCH_OPS if text.startswith(op, pos)), None)
+            if op is None:
+                raise SelectorError(f"Expected a match operator at {pos} in {text!r}")
+            pos += len(op)
+            while text[pos] == " ":
+                pos += 1
+            value, pos = _quoted(text, pos)
+            matchers.append(Matcher(label.group(), op, value))
+    return tuple(matchers)
+
+
+def format_selector(selector: Selector) -> str:
+    """Canonical text of a selector, which parse_selector reads back."""
+    return "{" + ",".join(str(matcher) for matcher in selector) + "}"
+
+
+class View:
+    """The series one filtered scrape returns: a union of selectors."""
+
+    __slots__ = ("selectors", "key")
+
+    def __init__(self, selectors: Iterable[Selector]):
+        canonical = {}
+        for selector in selectors:
+            selector = tuple(sorted(selector, key=lambda m: (m.name, m.op, m.value)))
+            if all(matcher.matches("") for matcher in selector):
+                # As in Prometheus: such a selector would select everything
+                raise SelectorError(
+                    f"Selector {format_selector(selector)} needs a matcher "
+                    "that does not match the empty string"
+                )
+            canonical[format_selector(selector)] = selector
+        if not canonical:
+            raise SelectorError("A view needs at least one selector")
+        # Sorted canonical selectors, one per line; identifies the view
+        self.key = "\n".join(sorted(canonical))
+        self.selectors: Tuple[Selector, ...] = tuple(
+            canonical[key] for key in sorted(canonical)
+        )
+
+    @classmethod
+    def from_query(cls, params: Sequence[Tuple[str, str]]) -> Optional["View"]:
+        """The view of /metrics query parameters, None when they do not filter."""
+        selectors: List[Selector] = []
+        values: Dict[str, List[str]] = {}
+        for name, value in params:
+            if name == MATCH_PARAM:
+                selectors.append(parse_selector(value))
+            elif SELECTOR_LABEL_RE.fullmatch(name):
+                values.setdefault(name, []).append(value)
+            else:
+                raise SelectorError(f"Invalid label name {name!r}")
+        if not selectors and not values:
+            return None
+
+        filters = []
+        for name, options in values.items():
+            if len(options) == 1:
+                filters.append(Matcher(name, "=", options[0]))
+            else:
+                filters.append(
+                    Matcher(
+                        name, "=~", "|".join(re.escape(option) for option in options)
+                    )
+                )
+        return cls(selector + tuple(filters) for selector in selectors or [()])
+
+    @classmethod
+    def from_key(cls, key: str) -> "View":
+        """Rebuild a view from its key (how the front passes views to shard workers)."""
+        return cls(parse_selector(line) for line in key.split("\n"))
+
+    def matches(self, names: Sequence[str], labels: Dict[str, str]) -> bool:
+        """Whether a sample with any of these names and these labels is in the view."""
+        return any(
+            _matches_sample(selector, names, labels) for selector in self.selectors
+        )
+
+    def rows(self, index: "LabelIndex") -> Optional[np.ndarray]:
+        """Sorted rows of a family in the view; None for all of them."""
+        selected: Optional[np.ndarray] = np.empty(0, dtype=np.intp)
+        for selector in self.selectors:
+            rows = index.select(selector)
+            if rows is None:
+                return None
+            selected = np.union1d(selected, rows)
+        return selected
+
+
+def _matches_sample(
+    selector: Selector, names: Sequence[str], labels: Dict[str, str]
+) -> bool:
+    for matcher in selector:
+        if matcher.name == "__name__":
+            if not any(matcher.matches(name) for name in names):
+                return False
+        elif not matcher.matches(labels.get(matcher.name, "")):
+            return False
+    return True
+
+
+class LabelIndex:
+    """Rows of one family per label value, built on the first selection."""
+
+    def __init__(self, names: Sequence[str], labelnames: Sequence[str], label_values):
+        # Every sample name the family exposes, for __name__ matchers
+        self.names = tuple(names)
+        self.labelnames = tuple(labelnames)
+        # Synthetic families are answered from their dimension value tables
+        self.synthetic = (
+            label_values if isinstance(label_values, SyntheticLabels) else None
+        )
+        self.label_values = label_values
+        self._postings: Optional[Dict[str, Dict[str, np.ndarray]]] = None
+
+    @property
+    def postings(self) -> Dict[str, Dict[str, np.ndarray]]:
+        """Sorted rows per label name and value (empty for synthetic families)."""
+        if self._postings is None:
+            rows: Dict[str, Dict[str, List[int]]] = {}
+            if self.synthetic is None:
+                rows = {name: {} for name in self.labelnames}
+                for i, values in enumerate(self.label_values):
+                    for name, value in zip(self.labelnames, values):
+                        rows[name].setdefault(value, []).append(i)
+            self._postings = {
+                name: {
+                    value: np.array(ids, dtype=np.intp)
+                    for value, ids in by_value.items()
+                }
+                for name, by_value in rows.items()
+            }
+        return self._postings
+
+    def _matching(self, matcher: Matcher) -> Optional[np.ndarray]:
+        """Rows one matcher selects; None for all rows."""
+        if matcher.name == "__name__":
+            return (
+                None
+                if any(matcher.matches(name) for name in self.names)
+                else np.empty(0, dtype=np.intp)
+            )
+        if matcher.name not in self.labelnames:
+            # An absent label matches as the empty string
+            return None if matcher.matches("") else np.empty(0, dtype=np.intp)
+
+        if self.synthetic is not None:
+            d = self.labelnames.index(matcher.name)
+            dimension = self.synthetic.dimensions[d]
+            codes = [
+                k
+                for k in range(dimension.cardinality)
+                if matcher.matches(self.synthetic.value(d, k))
+            ]
+            if len(codes) == dimension.cardinality:
+                return None
+            if not codes:
+                return np.empty(0, dtype=np.intp)
+            return np.flatnonzero(np.isin(self.synthetic.column(d), codes))
+
+        postings = self.postings[matcher.name]
+        matched = [rows for value, rows in postings.items() if matcher.matches(value)]
+        if len(matched) == len(postings):
+            return None
+        if not matched:
+            return np.empty(0, dtype=np.intp)
+        return np.sort(np.concatenate(matched)) if len(matched) > 1 else matched[0]
+
+    def select(self, selector: Selector) -> Optional[np.ndarray]:
+        """Sorted rows matching every matcher of a selector; None for all rows."""
+        selected: Optional[np.ndarray] = None
+        for matcher in selector:
+            rows = self._matching(matcher)
+            if rows is None:
+                continue
+            selected = (
+                rows
+                if selected is None
+                else np.intersect1d(selected, rows, assume_unique=True)
+            )
+            if not len(selected):
+                break
+        return selected
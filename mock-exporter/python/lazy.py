@@ -0,0 +1,228 @@
+"""
+Scrape-Time Evaluation
+
+With EXPORTER_EVALUATION=lazy no updater ticks: every series is a function of
+time and its seeded stream, evaluated only when a scrape or push asks for it
+and only for the rows it returns. An idle exporter does no work at all, and
+the cost follows scrape volume instead of series count x tick rate.
+
+Time is quantized to EXPORTER_LAZY_RESOLUTION seconds; a family's version
+moves once per step, so scrapes within one step share the cached render (see
+exposition.py). Over elapsed seconds L since the family's anchor:
+
+- counter:   carry + r x max(0, L + J x (n(t) - n(anchor))), with r the mean
+             rate of the tick updater (base x 0.1 per 2 s)
+- histogram: every bucket counts like a counter at rate x probability of the
+             bucket, floored, and the sum adds the bucket's mean observation
+             per count; batched families use their lognormal bucket tables,
+             the others a uniform U(0.8, 1.2) x base table at one
+             observation per update, L = elapsed seconds
+- gauge:     the value model's level at t (Model.gauge_at), from noise in
+             [-1, 1], clipped to the gauge's bounds; noise gauges drift up
+             by the tick updater's mean step per update, carry + base x
+             0.05 x U, with U its mean updates since the anchor
+
+n(t) is per-series (per-bucket) noise in [0, 1]: uniforms of the series'
+stream at knots NOISE_PERIOD seconds apart, linearly interpolated. Its slope
+is at most 1 / NOISE_PERIOD, and J keeps J / NOISE_PERIOD below the lowest
+rate, so counters jitter around their mean rate but never decrease. With a
+workload, L is the model's closed-form integral of its rate multiplier (see
+workload.py): the error signal, bursts and incidents do not show in the
+counts, nor latency in the observed values.
+
+Series whose churning labels turned over since the anchor start over at the
+time their labels appeared, from 0 (from their base for gauges). A config
+reload anchors changed families at the reload, carrying the values of the
+surviving series. Values are pure functions of (seed, config, anchor, t), so
+they are reproducible across processes and shards with the same seed.
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+from synthetic import splitmix64, unit_floats
+
+# Seconds between the noise knots of a series
+NOISE_PERIOD = 10.0
+# Jitter of counters, as a fraction of the most it can be while they stay monotone
+JITTER = 0.5
+
+_ROW_KEY = np.uint64(0xD1B54A32D192ED03)
+_KNOT_KEY = np.uint64(0x9E3779B97F4A7C15)
+
+
+def knot_uniforms(rows: np.ndarray, key: int, knots: np.ndarray) -> np.ndarray:
+    """U[0, 1) of stream rows at integer knots (broadcast against each other)."""
+    z = splitmix64(np.atleast_1d(knots).astype(np.uint64) * _KNOT_KEY ^ np.uint64(key))
+    z = z ^ rows * _ROW_KEY
+    return unit_floats(splitmix64(z))
+
+
+def noise(rows: np.ndarray, key: int, t) -> np.ndarray:
+    """Continuous per-row noise in [0, 1] at time t (a scalar or one time per row)."""
+    position = np.divide(t, NOISE_PERIOD)
+    knot = np.floor(position)
+    first = knot_uniforms(rows, key, knot)
+    second = knot_uniforms(rows, key, knot + 1)
+    return first + (second - first) * (position - knot)
+
+
+def uniform_table(
+    bases: np.ndarray, bounds: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """Bucket probabilities and means of U(0.8, 1.2) x base observations.
+
+    One table row per distinct base, with the table row of every series
+    (None when they all share the first), like lognormal_buckets.
+    """
+    params, rows = np.unique(bases, return_inverse=True)
+    low, high = (params * 0.8)[:, None], (params * 1.2)[:, None]
+    lower = np.concatenate(([-np.inf], bounds[:-1]))
+    start = np.maximum(low, lower)
+    stop = np.minimum(high, bounds)
+    width = high - low
+    probabilities = np.divide(
+        np.maximum(stop - start, 0.0),
+        width,
+        out=np.zeros((len(params), len(bounds))),
+        where=width > 0,
+    )
+    means = np.where(probabilities > 0, (start + stop) / 2, 0.0)
+    # A zero base always observes 0, in the first bucket that holds it
+    for i in np.flatnonzero(width[:, 0] <= 0):
+        b = int(np.searchsorted(bounds, params[i], side="left"))
+        probabilities[i, b], means[i, b] = 1.0, params[i]
+    return probabilities, means, None if len(params) == 1 else rows.reshape(-1)
+
+
+class LazyState:
+    """Closed-form state of one seeded family, evaluated at scrape time.
+
+    rates are the mean counts per second of every series (observations for
+    histograms, updates for gauges).
+    """
+
+    def __init__(
+        self, family, rates: Optional[np.ndarray], resolution: float, anchor: float
+    ):
+        self.family = family
+        self.resolution = resolution
+        # Evaluation starts here, from the carried values
+        self.anchor = anchor
+        self.carry = family.values.copy()
+        self.carry_counts = (
+            family.bucket_counts.copy() if family.type == "histogram" else None
+        )
+        # Time of the evaluation step last advanced to, None before the first
+        self.at: Optional[float] = None
+
+        self.key = family.stream
+        self.stream_rows = family.stream_rows
+        self.rates = rates
+        # Seconds of jitter: the most that keeps counts monotone, scaled down
+        self.jitter = JITTER * NOISE_PERIOD * family.model.min_rate()
+
+        if family.type == "histogram":
+            if family.batched:
+                self.probabilities, self.means = (
+                    family.bucket_probabilities,
+                    family.bucket_means,
+                )
+                self.table_rows = family.table_rows
+            else:
+                self.probabilities, self.means, self.table_rows = uniform_table(
+                    np.asarray(family.bases, dtype=np.float64), family.bucket_bounds
+                )
+
+    def step(self, now: float) -> float:
+        """The evaluation time of the step now falls in."""
+        return (now // self.resolution) * self.resolution
+
+    def _table(self, table: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        if self.table_rows is None:
+            return table[:1]
+        return table[self.table_rows if rows is None else self.table_rows[rows]]
+
+    def _take(self, array: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        return array if rows is None else array[rows]
+
+    def evaluate(
+        self, now: float, rows: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """(values, bucket counts) of every series, or of rows, at now.
+
+        Bucket counts are None for counters and gauges.
+        """
+        family = self.family
+        carry = self._take(self.carry, rows).copy()
+        counts = (
+            None
+            if self.carry_counts is None
+            else self._take(self.carry_counts, rows).copy()
+        )
+        start = self.anchor
+        if family.synthetic is not None:
+            born = family.synthetic.born(rows)
+            if born is not None:
+                restarted = born > self.anchor
+                start = np.maximum(self.anchor, born)
+                if restarted.any():
+                    if family.type == "gauge":
+                        carry[restarted] = self._take(family.bases, rows)[restarted]
+                    else:
+                        carry[restarted] = 0.0
+                    if counts is not None:
+                        counts[restarted] = 0.0
+        stream_rows = self._take(self.stream_rows, rows)
+        elapsed = np.maximum(0.0, np.subtract(now, start))
+
+        if family.type == "gauge":
+            bases = self._take(family.bases, rows)
+            drift = noise(stream_rows, self.key, now) * 2.0 - 1.0
+            updates = elapsed * self._take(self.rates, rows)
+            values = family.model.gauge_at(
+                carry, bases, drift, elapsed, updates, now, rows
+            )
+            return (
+                np.clip(
+                    values,
+                    self._take(family.lower, rows),
+                    self._take(family.upper, rows),
+                ),
+                None,
+            )
+
+        integral = None
+        # Unbatched histograms observe once per update, whatever the load
+        if family.type == "counter" or family.batched:
+            integral = family.model.rate_integral(start, now, rows)
+        if integral is None:
+            integral = elapsed
+        rates = self._take(self.rates, rows)
+        if family.type == "counter":
+            jitter = noise(stream_rows, self.key, now) - noise(
+                stream_rows, self.key, start
+            )
+            carry += rates * np.maximum(0.0, integral + self.jitter * jitter)
+            return carry, None
+
+        # One noise stream per (series, bucket)
+        width = counts.shape[1]
+        bucket_rows = stream_rows[:, None] * np.uint64(width) + np.arange(
+            width, dtype=np.uint64
+        )
+        jitter = noise(bucket_rows, self.key, now) - noise(
+            bucket_rows, self.key, np.asarray(start)[..., None]
+        )
+        expected = np.maximum(
+            0.0, np.asarray(integral)[..., None] + self.jitter * jitter
+        )
+        expected *= rates[:, None]
+        expected *= self._table(self.probabilities, rows)
+        hits = np.floor(expected)
+        counts += hits
+        carry += np.einsum(
+            "ij,ij->i", hits, np.broadcast_to(self._table(self.means, rows), hits.shape)
+        )
+        return carry, counts
@@ -6,31 +6,93 @@ Generates production-like metrics following Prometheus naming conventions:
 - HTTP Service Metrics (RED method: Rate, Errors, Duration)
 - Node/System Metrics (USE method: Utilization, Saturation, Errors)
 - Application Business Metrics
+- Synthetic high-cardinality families with label churn, for load testing
 
-Supports both counter and gauge metrics with realistic value simulation.
+Supports counter, gauge and histogram metrics with realistic value simulation;
+histograms can draw batches of lognormal observations at a configured rate
+and use native (exponential) buckets, served over the protobuf scrape format.
+Series state lives in NumPy arrays (see series_store.py) and is updated in
+vectorized steps. With EXPORTER_SHARDS > 1 the series are split across worker
+processes and /metrics stitches their output (see sharding.py).
+EXPORTER_SEED makes every series' values reproducible, and EXPORTER_TIMELINE
+replays values precomputed by timeline.py instead of generating them.
+EXPORTER_EVALUATION=lazy drops the updaters and evaluates series in closed
+form when they are scraped (see lazy.py).
+SIGHUP, POST /-/reload or a config file change (CONFIG_WATCH_INTERVAL) reload
+the config in place, keeping the state of every unchanged series.
+Compiled configs are cached as memory-mapped snapshots keyed by the config
+file's hash (see config_cache.py), and the server listens while the exporter
+loads and registers in the background; /healthz says when it is ready.
+The server runs tuned for many concurrent scrapers by default: keep-alive,
+capped connections and scrapes, and 503 with Retry-After under overload
+(see serving.py).
 """
 
 import asyncio
+import functools
 import logging
 import os
-import random
 import signal
 import sys
 import time
-from typing import Dict, List, Any, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-import yaml
-from fastapi import FastAPI
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
 from prometheus_client import (
-    Counter,
-    Gauge,
-    Histogram,
-    Info,
-    generate_latest,
     CONTENT_TYPE_LATEST,
     REGISTRY,
+    Info,
+    generate_latest,
 )
-import uvicorn
+from starlette.concurrency import iterate_in_threadpool
+
+from compiler import CompiledConfig, ConfigDiff, ConfigError, compile_config
+from config_cache import create_config_cache
+from exposition import (
+    CONTENT_TYPES,
+    ExpositionCache,
+    etag_matches,
+    negotiate_encoding,
+    negotiate_format,
+)
+from instrumentation import (
+    CONFIG_RELOADS,
+    RELOAD_DURATION,
+    SCRAPE_BYTES,
+    SCRAPE_DURATION,
+    SCRAPES,
+    SCRAPES_IN_FLIGHT,
+    SELF_REGISTRY,
+    STARTUP_DURATION,
+    WORKER_HISTOGRAMS,
+    RemoteWriteCollector,
+    ShardHistogramCollector,
+    histogram_states,
+    observe_job,
+    observe_lag,
+)
+from label_index import SelectorError, View
+from scheduler import TickScheduler
+from series_store import UPDATE_INTERVALS, SeriesStore
+from serving import (
+    LoopLagProbe,
+    ScrapeAdmission,
+    access_log_quieted,
+    create_admission,
+    quiet_access_log,
+    serve_profile,
+    server_stack,
+    uvicorn_options,
+)
+from sharding import ShardedExposition, ShardPool, ShardPublisher, ShardUnavailable
+from timeline import Timeline, TimelineError, TimelineTrack
 
 # Configure logging
 logging.basicConfig(
@@ -44,53 +106,168 @@ metrics_registry: Dict[str, Any] = {}
 
 
 class MockExporter:
-    """Mock metrics exporter that generates realistic production-like metrics."""
+    """Mock metrics exporter that generates realistic production-like metrics.
 
-    def __init__(self, config_path: str = "config.yml"):
+    Runs in one of three roles: standalone (the default), the front process
+    of a sharded exporter (shards > 1: spawns the workers and serves their
+    stitched output), or a shard worker (shard=(index, count): generates and
+    pushes only its slice of the series).
+
+    Values come from a shared random generator by default, from per-series
+    seeded streams with seed, or from a precomputed timeline file. With
+    lazy_resolution they are evaluated at scrape time instead of ticked.
+    """
+
+    def __init__(
+        self,
+        config_path: str = "config.yml",
+        shards: int = 1,
+        shard: Optional[Tuple[int, int]] = None,
+        seed: Optional[int] = None,
+        timeline_path: Optional[str] = None,
+        lazy_resolution: Optional[float] = None,
+    ):
         self.config_path = config_path
-        self.config = self._load_config()
+        self.config_cache = create_config_cache()
+        # Where the compiled config came from at startup and what it took
+        self.config_stats: Dict[str, Any] = {}
+        self.compiled = self._load_compiled()
+        self.shard = shard
         self.running = True
         self.tasks: List[asyncio.Task] = []
+        self.shard_pool: Optional[ShardPool] = None
+        self.remote_write = None
+        self.info_metrics: Dict[str, Info] = {}
+        self.last_reload: Optional[Dict[str, Any]] = None
+        self._reload_lock = asyncio.Lock()
 
-    def _load_config(self) -> Dict[str, Any]:
-        """Load configuration from YAML file."""
-        try:
-            with open(self.config_path, "r", encoding="utf-8") as f:
-                config = yaml.safe_load(f)
-            logger.info(f"Loaded config from {self.config_path}")
-            return config
-        except Exception as e:
-            logger.error(f"Failed to load config: {e}")
+        if shard is not None:
+            self.compiled = self.compiled.shard(*shard)
+
+        self.timeline: Optional[Timeline] = None
+        self.timeline_tracks: Dict[str, TimelineTrack] = {}
+        if timeline_path:
+            self._load_timeline(timeline_path)
+            seed = self.timeline.seed
+        self.lazy_resolution = lazy_resolution
+        if lazy_resolution is not None:
+            if self.timeline is not None:
+                logger.error("EXPORTER_EVALUATION=lazy cannot replay EXPORTER_TIMELINE")
+                sys.exit(1)
+            if seed is None:
+                # Scrape-time values come from seeded streams
+                seed = int.from_bytes(os.urandom(4), "little")
+        self.seed = seed
+        self.scheduler = TickScheduler(seed=seed)
+        self.store = SeriesStore(seed, self.compiled.workload, lazy_resolution)
+
+        if shard is not None:
+            self.remote_write = self._create_remote_writer(
+                wal_subdir=f"shard-{shard[0]}"
+            )
+        elif shards > 1:
+            self.shard_pool = ShardPool(shards, run_shard_worker)
+        else:
+            self.remote_write = self._create_remote_writer()
+        if lazy_resolution is not None and self._remote_write_durable():
+            logger.error(
+                "EXPORTER_EVALUATION=lazy has no ticks to append to REMOTE_WRITE_WAL_DIR"
+            )
             sys.exit(1)
 
-    def _random_delta(self, base_value: float, variation: float = 0.1) -> float:
-        """Generate random delta around base value."""
-        return base_value * (1 + random.uniform(-variation, variation))
+        if self.shard_pool is not None:
+            self.exposition = ShardedExposition(self.shard_pool, self.compiled.families)
+        else:
+            self.exposition = ExpositionCache(self.store)
 
-    def _create_histogram(self, name: str, labels: Dict[str, str], buckets: List[float]) -> Histogram:
-        """Create histogram metric with custom buckets."""
-        return Histogram(
-            name,
-            f"Histogram for {name}",
-            labelnames=list(labels.keys()),
-            buckets=buckets,
-        )
+        self.scheduler.add_job_observer(observe_job)
+        self.scheduler.add_lag_observer(observe_lag)
 
-    def _create_counter(self, name: str, labels: Dict[str, str]) -> Counter:
-        """Create counter metric."""
-        return Counter(
-            name,
-            f"Counter for {name}",
-            labelnames=list(labels.keys()),
+    def _parse_config(self, data: bytes) -> Dict[str, Any]:
+        """Parse the YAML config; raises ConfigError if it is malformed.
+
+        yaml is only imported once the compiled config cache misses, and
+        parses with libyaml when PyYAML was built with it.
+        """
+        import yaml
+
+        try:
+            return yaml.load(data, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+        except yaml.YAMLError as e:
+            raise ConfigError(f"malformed YAML: {e}") from None
+
+    def _compile_file(self) -> Tuple[CompiledConfig, Dict[str, Any]]:
+        """Read and compile the config file, through the compiled config cache.
+
+        Returns the compiled config and whether the cache hit, with the
+        seconds of every step. Raises OSError or ConfigError.
+        """
+        seconds: Dict[str, float] = {}
+        started = time.perf_counter()
+
+        def lap(step: str):
+            nonlocal started
+            now = time.perf_counter()
+            seconds[step] = round(now - started, 6)
+            started = now
+
+        with open(self.config_path, "rb") as f:
+            data = f.read()
+        stats: Dict[str, Any] = {"bytes": len(data), "cache": "disabled"}
+        compiled = None
+        if self.config_cache is not None:
+            key = self.config_cache.key(data)
+            compiled = self.config_cache.load(key)
+            stats.update(cache="miss" if compiled is None else "hit", key=key[:16])
+        lap("read")
+        if compiled is None:
+            config = self._parse_config(data)
+            lap("parse")
+            compiled = compile_config(config)
+            lap("compile")
+            if self.config_cache is not None:
+                self.config_cache.store(key, compiled)
+                lap("cache_write")
+        stats["seconds"] = seconds
+        return compiled, stats
+
+    def _load_compiled(self) -> CompiledConfig:
+        """Compile the config file, or map it from the cache; exits if that fails."""
+        try:
+            compiled, self.config_stats = self._compile_file()
+        except OSError as e:
+            logger.error(f"Failed to load config: {e}")
+            sys.exit(1)
+        except ConfigError as e:
+            logger.error(f"Invalid config {self.config_path}: {e}")
+            sys.exit(1)
+        source = (
+            "compiled config cache" if self.config_stats["cache"] == "hit" else "YAML"
+        )
+        logger.info(
+            f"Loaded {len(compiled.families)} metric families ({compiled.series_count()} series) "
+            f"from {self.config_path} via {source} in {sum(self.config_stats['seconds'].values()):.3f}s"
         )
+        return compiled
 
-    def _create_gauge(self, name: str, labels: Dict[str, str]) -> Gauge:
-        """Create gauge metric."""
-        return Gauge(
-            name,
-            f"Gauge for {name}",
-            labelnames=list(labels.keys()),
+    def _load_timeline(self, path: str):
+        """Map a timeline file and check it covers every compiled family."""
+        try:
+            self.timeline = Timeline(path)
+            self.timeline_tracks = self._timeline_tracks(self.compiled)
+        except TimelineError as e:
+            logger.error(f"Invalid timeline: {e}")
+            sys.exit(1)
+        frames = max(
+            (track.frames for track in self.timeline_tracks.values()), default=0
         )
+        logger.info(
+            f"Replaying {path} (seed {self.timeline.seed}, up to {frames} frames per family)"
+        )
+
+    def _timeline_tracks(self, compiled: CompiledConfig) -> Dict[str, TimelineTrack]:
+        """Timeline frames of every compiled family; raises TimelineError."""
+        return {family.key: self.timeline.track(family) for family in compiled.families}
 
     def _create_info(self, name: str, labels: Dict[str, str]) -> Info:
         """Create info metric."""
@@ -101,438 +278,716 @@ class MockExporter:
 
     def _register_label_metrics(self):
         """Register info-style metrics from label_metrics config."""
-        for i, label_set in enumerate(self.config.get("label_metrics", [])):
-            info_metric = self._create_info(f"mock_tag_info_{i}", label_set)
-            info_metric.info(label_set)
-
-    def _register_http_metrics(self):
-        """Register HTTP service metrics (RED method)."""
-        # Group metrics by name and type to avoid duplicates
-        metric_groups = {}
-        
-        for metric_config in self.config.get("http_metrics", []):
-            name = metric_config["name"]
-            metric_type = metric_config["type"]
-            group_key = f"{name}_{metric_type}"
-            
-            if group_key not in metric_groups:
-                metric_groups[group_key] = []
-            metric_groups[group_key].append(metric_config)
-        
-        # Create metrics for each group
-        for group_key, configs in metric_groups.items():
-            # Use first config to create the metric
-            first_config = configs[0]
-            name = first_config["name"]
-            metric_type = first_config["type"]
-            
-            if metric_type == "histogram":
-                # Get all unique label names from all configs
-                all_label_names = set()
-                for config in configs:
-                    all_label_names.update(config["labels"].keys())
-                
-                buckets = first_config.get("buckets", [0.1, 0.5, 1, 2.5, 5, 10])
-                metric = Histogram(
-                    name,
-                    f"Histogram for {name}",
-                    labelnames=list(all_label_names),
-                    buckets=buckets,
-                )
-            elif metric_type == "counter":
-                # Get all unique label names from all configs
-                all_label_names = set()
-                for config in configs:
-                    all_label_names.update(config["labels"].keys())
-                
-                metric = Counter(
-                    name,
-                    f"Counter for {name}",
-                    labelnames=list(all_label_names),
-                )
-            else:
-                continue
-            
-            # Store all configs for this metric
-            metrics_registry[group_key] = {
-                "metric": metric,
-                "type": metric_type,
-                "configs": configs,
-            }
+        for name, labels in self.compiled.info_metrics:
+            info_metric = self._create_info(name, labels)
+            info_metric.info(labels)
+            self.info_metrics[name] = info_metric
 
-    def _register_node_metrics(self):
-        """Register node/system metrics (USE method)."""
-        # Group metrics by name and type to avoid duplicates
-        metric_groups = {}
-        
-        for metric_config in self.config.get("node_metrics", []):
-            name = metric_config["name"]
-            metric_type = metric_config["type"]
-            group_key = f"{name}_{metric_type}"
-            
-            if group_key not in metric_groups:
-                metric_groups[group_key] = []
-            metric_groups[group_key].append(metric_config)
-        
-        # Create metrics for each group
-        for group_key, configs in metric_groups.items():
-            # Use first config to create the metric
-            first_config = configs[0]
-            name = first_config["name"]
-            metric_type = first_config["type"]
-            
-            if metric_type == "histogram":
-                # Get all unique label names from all configs
-                all_label_names = set()
-                for config in configs:
-                    all_label_names.update(config["labels"].keys())
-                
-                buckets = first_config.get("buckets", [0.1, 0.5, 1, 2.5, 5, 10])
-                metric = Histogram(
-                    name,
-                    f"Histogram for {name}",
-                    labelnames=list(all_label_names),
-                    buckets=buckets,
-                )
-            elif metric_type == "counter":
-                # Get all unique label names from all configs
-                all_label_names = set()
-                for config in configs:
-                    all_label_names.update(config["labels"].keys())
-                
-                metric = Counter(
-                    name,
-                    f"Counter for {name}",
-                    labelnames=list(all_label_names),
-                )
-            elif metric_type == "gauge":
-                # Get all unique label names from all configs
-                all_label_names = set()
-                for config in configs:
-                    all_label_names.update(config["labels"].keys())
-                
-                metric = Gauge(
-                    name,
-                    f"Gauge for {name}",
-                    labelnames=list(all_label_names),
-                )
-            else:
-                continue
-            
-            # Store all configs for this metric
-            metrics_registry[group_key] = {
-                "metric": metric,
-                "type": metric_type,
-                "configs": configs,
-            }
+    def _unregister_label_metrics(self):
+        """Remove the info metrics, e.g. before registering reloaded ones."""
+        for info_metric in self.info_metrics.values():
+            REGISTRY.unregister(info_metric)
+        self.info_metrics = {}
 
-    def _register_app_metrics(self):
-        """Register application business metrics."""
-        # Group metrics by name and type to avoid duplicates
-        metric_groups = {}
-        
-        for metric_config in self.config.get("app_metrics", []):
-            name = metric_config["name"]
-            metric_type = metric_config["type"]
-            group_key = f"{name}_{metric_type}"
-            
-            if group_key not in metric_groups:
-                metric_groups[group_key] = []
-            metric_groups[group_key].append(metric_config)
-        
-        # Create metrics for each group
-        for group_key, configs in metric_groups.items():
-            # Use first config to create the metric
-            first_config = configs[0]
-            name = first_config["name"]
-            metric_type = first_config["type"]
-            
-            if metric_type == "histogram":
-                # Get all unique label names from all configs
-                all_label_names = set()
-                for config in configs:
-                    all_label_names.update(config["labels"].keys())
-                
-                buckets = first_config.get("buckets", [0.1, 0.5, 1, 2.5, 5, 10])
-                metric = Histogram(
-                    name,
-                    f"Histogram for {name}",
-                    labelnames=list(all_label_names),
-                    buckets=buckets,
-                )
-            elif metric_type == "counter":
-                # Get all unique label names from all configs
-                all_label_names = set()
-                for config in configs:
-                    all_label_names.update(config["labels"].keys())
-                
-                metric = Counter(
-                    name,
-                    f"Counter for {name}",
-                    labelnames=list(all_label_names),
-                )
-            elif metric_type == "gauge":
-                # Get all unique label names from all configs
-                all_label_names = set()
-                for config in configs:
-                    all_label_names.update(config["labels"].keys())
-                
-                metric = Gauge(
-                    name,
-                    f"Gauge for {name}",
-                    labelnames=list(all_label_names),
-                )
-            else:
-                continue
-            
-            # Store all configs for this metric
-            metrics_registry[group_key] = {
-                "metric": metric,
-                "type": metric_type,
-                "configs": configs,
+    def _register_series_metrics(self):
+        """Create state arrays for every compiled metric family."""
+        for compiled in self.compiled.families:
+            family = self.store.add_family(compiled)
+            family.timeline = self.timeline_tracks.get(compiled.key)
+            metrics_registry[compiled.key] = {
+                "metric": family,
+                "type": compiled.type,
             }
 
-    def _register_probe_metrics(self):
-        """Register cross-region probe metrics."""
-        metric_groups = {}
-        for metric_config in self.config.get("probe_metrics", []):
-            name = metric_config["name"]
-            metric_type = metric_config["type"]
-            group_key = f"{name}_{metric_type}"
-            if group_key not in metric_groups:
-                metric_groups[group_key] = []
-            metric_groups[group_key].append(metric_config)
-        
-        for group_key, configs in metric_groups.items():
-            first_config = configs[0]
-            name = first_config["name"]
-            metric_type = first_config["type"]
-            
-            all_label_names = set()
-            for config in configs:
-                all_label_names.update(config["labels"].keys())
-            
-            if metric_type == "histogram":
-                buckets = first_config.get("buckets", [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0])
-                metric = Histogram(
-                    name,
-                    f"Histogram for {name}",
-                    labelnames=list(all_label_names),
-                    buckets=buckets,
-                )
-            elif metric_type == "counter":
-                metric = Counter(
-                    name,
-                    f"Counter for {name}",
-                    labelnames=list(all_label_names),
-                )
-            elif metric_type == "gauge":
-                metric = Gauge(
-                    name,
-                    f"Gauge for {name}",
-                    labelnames=list(all_label_names),
-                )
-            else:
-                continue
-            
-            # Store all configs for this metric
-            metrics_registry[group_key] = {
-                "metric": metric,
-                "type": metric_type,
-                "configs": configs,
-            }
+    def _update_histogram_metric(self, metric_info: Dict[str, Any]):
+        """Observe one value, or one batch at the configured rate, per histogram series."""
+        metric_info["metric"].update_histogram(self.store.rng)
 
-    def _register_slo_metrics(self):
-        """Register SLO/SLI metrics."""
-        metric_groups = {}
-        for metric_config in self.config.get("slo_metrics", []):
-            name = metric_config["name"]
-            metric_type = metric_config["type"]
-            group_key = f"{name}_{metric_type}"
-            if group_key not in metric_groups:
-                metric_groups[group_key] = []
-            metric_groups[group_key].append(metric_config)
-        
-        for group_key, configs in metric_groups.items():
-            first_config = configs[0]
-            name = first_config["name"]
-            metric_type = first_config["type"]
-            
-            all_label_names = set()
-            for config in configs:
-                all_label_names.update(config["labels"].keys())
-            
-            if metric_type == "gauge":
-                metric = Gauge(
-                    name,
-                    f"Gauge for {name}",
-                    labelnames=list(all_label_names),
-                )
-            elif metric_type == "counter":
-                metric = Counter(
-                    name,
-                    f"Counter for {name}",
-                    labelnames=list(all_label_names),
-                )
-            else:
-                continue
-            
-            # Store all configs for this metric
-            metrics_registry[group_key] = {
-                "metric": metric,
-                "type": metric_type,
-                "configs": configs,
-            }
+    def _update_counter_metric(self, metric_info: Dict[str, Any]):
+        """Apply realistic increments to every counter series."""
+        metric_info["metric"].update_counter(self.store.rng)
 
-    async def _update_histogram_metric(self, metric_info: Dict[str, Any]):
-        """Update histogram metric with realistic values."""
-        metric = metric_info["metric"]
-        configs = metric_info["configs"]
+    def _update_gauge_metric(self, metric_info: Dict[str, Any]):
+        """Step every gauge series with its value model, within its clamp bounds."""
+        metric_info["metric"].update_gauge(self.store.rng)
 
-        while self.running:
-            # Update each config
-            for config in configs:
-                base_value = config["value"]
-                labels = config["labels"]
-                
-                # Generate realistic value with some variation
-                value = self._random_delta(base_value, 0.2)
-                
-                # For histograms, we observe the value
-                metric.labels(**labels).observe(value)
-            
-            await asyncio.sleep(random.uniform(2, 5))
-
-    async def _update_counter_metric(self, metric_info: Dict[str, Any]):
-        """Update counter metric with realistic increments."""
-        metric = metric_info["metric"]
-        configs = metric_info["configs"]
+    def _replay_metric(self, metric_info: Dict[str, Any]):
+        """Step every series to its next precomputed timeline frame."""
+        metric_info["metric"].replay()
 
-        while self.running:
-            # Update each config
-            for config in configs:
-                base_value = config["value"]
-                labels = config["labels"]
-                
-                # Generate realistic increment
-                increment = self._random_delta(base_value * 0.1, 0.5)
-                metric.labels(**labels).inc(increment)
-            
-            await asyncio.sleep(random.uniform(1, 3))
-
-    async def _update_gauge_metric(self, metric_info: Dict[str, Any]):
-        """Update gauge metric with realistic values."""
-        metric = metric_info["metric"]
-        configs = metric_info["configs"]
-
-        # Initialize current values for each config
-        current_values = {}
-        for config in configs:
-            current_values[hash(str(sorted(config["labels"].items())))] = config["value"]
+    def _schedule_updater(self, group_key: str, metric_info: Dict[str, Any]):
+        """Schedule the updater of one metric family, starting right away."""
+        metric_type = metric_info["type"]
+        if metric_type not in UPDATE_INTERVALS or self.lazy_resolution is not None:
+            return
 
-        while self.running:
-            # Update each config
-            for config in configs:
-                base_value = config["value"]
-                labels = config["labels"]
-                config_key = hash(str(sorted(labels.items())))
-                
-                # Generate realistic value with some drift
-                delta = self._random_delta(base_value * 0.05, 0.3)
-                current_values[config_key] += delta
-                
-                # Keep values within reasonable bounds
-                if "memory" in metric._name or "disk" in metric._name:
-                    current_values[config_key] = max(0, min(current_values[config_key], base_value * 1.5))
-                elif "cpu" in metric._name:
-                    current_values[config_key] = max(0, min(current_values[config_key], 100))
-                
-                metric.labels(**labels).set(current_values[config_key])
-            
-            await asyncio.sleep(random.uniform(2, 4))
+        track = metric_info["metric"].timeline
+        if track is not None:
+            # Frames were recorded at a fixed step
+            update = self._replay_metric
+            min_interval = max_interval = track.step
+        else:
+            update = getattr(self, f"_update_{metric_type}_metric")
+            min_interval, max_interval = UPDATE_INTERVALS[metric_type]
+        # The job looks the family up in metric_info on every run, so a
+        # reload can swap it without rescheduling
+        self.scheduler.add_job(
+            group_key,
+            functools.partial(update, metric_info),
+            min_interval,
+            max_interval,
+            delay=0,
+        )
 
     async def _start_metric_updaters(self):
-        """Start background tasks to update metrics."""
-        for metric_info in metrics_registry.values():
-            if metric_info["type"] == "histogram":
-                task = asyncio.create_task(self._update_histogram_metric(metric_info))
-            elif metric_info["type"] == "counter":
-                task = asyncio.create_task(self._update_counter_metric(metric_info))
-            elif metric_info["type"] == "gauge":
-                task = asyncio.create_task(self._update_gauge_metric(metric_info))
+        """Schedule metric updaters and start the single scheduler task."""
+        for group_key, metric_info in metrics_registry.items():
+            self._schedule_updater(group_key, metric_info)
+
+        self.tasks.append(asyncio.create_task(self.scheduler.run()))
+
+    async def reload(self) -> Dict[str, Any]:
+        """Re-read the config and apply only what changed.
+
+        A config that fails to load, compile or match the timeline is
+        rejected and the running series set stays as it is.
+        """
+        async with self._reload_lock:
+            started = time.perf_counter()
+            try:
+                compiled, config_stats = self._compile_file()
+                if self.shard is not None:
+                    compiled = compiled.shard(*self.shard)
+                tracks = (
+                    self._timeline_tracks(compiled) if self.timeline is not None else {}
+                )
+            except (OSError, ConfigError, TimelineError) as e:
+                CONFIG_RELOADS.labels(result="failure").inc()
+                logger.error(f"Config reload rejected, keeping the running config: {e}")
+                self.last_reload = {
+                    "status": "error",
+                    "error": str(e),
+                    "time": time.time(),
+                }
+                return self.last_reload
+
+            diff = ConfigDiff(self.compiled, compiled)
+            if diff.info_changed and self.shard is None:
+                self._unregister_label_metrics()
+            self.compiled = compiled
+            if diff.info_changed and self.shard is None:
+                self._register_label_metrics()
+
+            if self.shard_pool is not None:
+                self.exposition.keys[:] = [family.key for family in compiled.families]
+                replies = await asyncio.to_thread(self.shard_pool.command, "reload")
+                series = {"kept": 0, "added": 0, "removed": 0}
+                for reply in replies:
+                    for name, count in reply.get("series", {}).items():
+                        series[name] += count
             else:
+                series = self._apply_reload(compiled, diff, tracks)
+
+            elapsed = time.perf_counter() - started
+            RELOAD_DURATION.observe(elapsed)
+            CONFIG_RELOADS.labels(result="success").inc()
+            self.last_reload = {
+                "status": "ok",
+                "time": time.time(),
+                "seconds": round(elapsed, 6),
+                "families": diff.counts(),
+                "series": series,
+                "config": config_stats,
+            }
+            if self.shard is None:
+                logger.info(
+                    f"Reloaded {self.config_path} in {elapsed:.3f}s: "
+                    f"families {diff.counts()}, series {series}"
+                )
+            return self.last_reload
+
+    def _apply_reload(
+        self,
+        compiled: CompiledConfig,
+        diff: ConfigDiff,
+        tracks: Dict[str, TimelineTrack],
+    ) -> Dict[str, int]:
+        """Swap the changed families into the store and the updater schedule."""
+        series = self.store.reload(compiled.families, diff.unchanged, compiled.workload)
+        for key in diff.removed:
+            metrics_registry.pop(key, None)
+            self.scheduler.remove_job(key)
+        unchanged = set(diff.unchanged)
+        for family in compiled.families:
+            if family.key in unchanged:
                 continue
-            
-            self.tasks.append(task)
+            state = self.store.families[family.key]
+            state.timeline = tracks.get(family.key)
+            metric_info = metrics_registry.get(family.key)
+            if metric_info is None:
+                metric_info = metrics_registry[family.key] = {
+                    "metric": state,
+                    "type": family.type,
+                }
+                self._schedule_updater(family.key, metric_info)
+            else:
+                metric_info["metric"] = state
+        self.timeline_tracks = tracks
+        return series
+
+    async def watch_config(self, interval: float):
+        """Reload whenever the config file's size or modification time changes."""
+
+        def signature():
+            try:
+                stat = os.stat(self.config_path)
+            except OSError:
+                return None
+            return (stat.st_mtime_ns, stat.st_size)
+
+        last = signature()
+        while self.running:
+            await asyncio.sleep(interval)
+            current = signature()
+            if current is not None and current != last:
+                last = current
+                logger.info(f"{self.config_path} changed, reloading")
+                await self.reload()
 
     def register_metrics(self):
         """Register all metrics from configuration."""
         logger.info("Registering metrics...")
-        self._register_label_metrics()
-        self._register_http_metrics()
-        self._register_node_metrics()
-        self._register_app_metrics()
-        self._register_probe_metrics()
-        self._register_slo_metrics()
-        logger.info(f"Registered {len(metrics_registry)} metrics")
+        # Shard workers leave info metrics to the front process
+        if self.shard is None:
+            self._register_label_metrics()
+        if self.shard_pool is not None:
+            return
+        self._register_series_metrics()
+        logger.info(
+            f"Registered {len(metrics_registry)} metrics "
+            f"({self.store.series_count()} series)"
+        )
+
+    def _register_self_metrics(self):
+        """Add the process-dependent collectors to the self-instrumentation registry."""
+        self.self_collectors = [RemoteWriteCollector(self._remote_write_endpoints)]
+        if self.shard_pool is not None:
+            # Updaters run in the workers; expose what they report instead
+            for histogram, _ in WORKER_HISTOGRAMS:
+                SELF_REGISTRY.unregister(histogram)
+            self.self_collectors.append(
+                ShardHistogramCollector(self.shard_pool.histograms)
+            )
+        for collector in self.self_collectors:
+            SELF_REGISTRY.register(collector)
+
+    def _unregister_self_metrics(self):
+        for collector in self.self_collectors:
+            SELF_REGISTRY.unregister(collector)
+        if self.shard_pool is not None:
+            for histogram, _ in WORKER_HISTOGRAMS:
+                SELF_REGISTRY.register(histogram)
+
+    def _create_remote_writer(self, wal_subdir: Optional[str] = None):
+        """The remote-write pusher of REMOTE_WRITE_URL, None when it is unset.
+
+        remote_write is only imported when there is somewhere to push:
+        httpx and cramjam are among the slowest imports of a start.
+        """
+        if not os.getenv("REMOTE_WRITE_URL", "").replace(",", "").strip():
+            return None
+        from remote_write import create_remote_writer
+
+        return create_remote_writer(self.store, wal_subdir=wal_subdir)
+
+    def _remote_write_durable(self) -> bool:
+        """Whether remote write goes through a write-ahead queue."""
+        if self.remote_write is None:
+            return False
+        from remote_write import DurableRemoteWriter
+
+        return isinstance(self.remote_write, DurableRemoteWriter)
+
+    def _remote_write_endpoints(self) -> List[List[Dict[str, Any]]]:
+        """Remote-write endpoint stats of this process or of every shard worker."""
+        if self.shard_pool is not None:
+            reports = [stats.get("remote_write") for stats in self.shard_pool.stats()]
+        else:
+            reports = [self.remote_write.stats() if self.remote_write else None]
+        return [report["endpoints"] for report in reports if report]
 
     async def start(self):
         """Start the metrics exporter."""
         logger.info("Starting mock metrics exporter...")
-        self.register_metrics()
+        if self.shard is None:
+            self._register_self_metrics()
+        # Off the event loop, so /healthz keeps answering while a huge config registers
+        await asyncio.to_thread(self.register_metrics)
+        if self.shard_pool is not None:
+            self.shard_pool.start()
+            await asyncio.to_thread(self.shard_pool.wait_ready)
+            logger.info("Mock metrics exporter started successfully")
+            return
+        if self._remote_write_durable():
+            self.remote_write.attach(self.scheduler)
         await self._start_metric_updaters()
+        if self.remote_write:
+            self.tasks.append(asyncio.create_task(self.remote_write.run()))
         logger.info("Mock metrics exporter started successfully")
 
     async def stop(self):
         """Stop the metrics exporter."""
         logger.info("Stopping mock metrics exporter...")
         self.running = False
-        
+        self.scheduler.stop()
+
         # Cancel all running tasks
         for task in self.tasks:
             task.cancel()
-        
+
         # Wait for tasks to complete
         await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.remote_write:
+            await self.remote_write.stop()
+        if self.shard_pool is not None:
+            await asyncio.to_thread(self.shard_pool.stop)
+        if self.shard is None:
+            self._unregister_self_metrics()
+            # Leave the registries as they were, so the app can start again
+            # in the same process (tests, embedding servers)
+            self._unregister_label_metrics()
+        metrics_registry.clear()
         logger.info("Mock metrics exporter stopped")
 
     def get_metrics_count(self) -> int:
         """Get the number of registered metrics."""
+        if self.shard_pool is not None:
+            return len(self.compiled.families)
         return len(metrics_registry)
 
+    def get_series_stats(self) -> Dict[str, int]:
+        """Get the live series count and the series replaced by churn."""
+        if self.shard_pool is not None:
+            shards = self.shard_pool.stats()
+            return {
+                "count": sum(
+                    stats.get("series", {}).get("count", 0) for stats in shards
+                ),
+                "churned": sum(
+                    stats.get("series", {}).get("churned", 0) for stats in shards
+                ),
+            }
+        return {
+            "count": self.store.series_count(),
+            "churned": self.store.churned_series(),
+        }
+
+    def start_config_watch(self, interval: float):
+        """Poll the config file every interval seconds and reload on change."""
+        self.tasks.append(asyncio.create_task(self.watch_config(interval)))
+        logger.info(f"Watching {self.config_path} for changes every {interval}s")
+
+    def get_generation_stats(self) -> Dict[str, Any]:
+        """Get how series values are produced."""
+        if self.timeline is not None:
+            mode = "timeline"
+        elif self.seed is not None:
+            mode = "seeded"
+        else:
+            mode = "random"
+        models: Dict[str, int] = {}
+        for family in self.compiled.families:
+            models[family.model] = models.get(family.model, 0) + 1
+        return {
+            "mode": mode,
+            "evaluation": "ticks" if self.lazy_resolution is None else "lazy",
+            "lazy_resolution": self.lazy_resolution,
+            "seed": self.seed,
+            "timeline": self.timeline.path if self.timeline is not None else None,
+            "workload": self.compiled.workload is not None,
+            "models": models,
+        }
+
+    def get_scheduler_stats(self) -> Dict[str, Any]:
+        """Get tick counters and lag from the updater scheduler."""
+        return self.scheduler.stats()
+
+    def get_worker_stats(self) -> Dict[str, Any]:
+        """Get the stats a shard worker reports with every render."""
+        return {
+            "series": self.get_series_stats(),
+            "scheduler": self.get_scheduler_stats(),
+            "remote_write": self.remote_write.stats() if self.remote_write else None,
+            "histograms": histogram_states(),
+        }
+
+
+async def _serve_shard(index: int, count: int, connection, snapshot_path: str):
+    """Generate one shard and render it whenever the front process asks."""
+    worker = MockExporter(
+        os.getenv("CONFIG_PATH", "config.yml"),
+        shard=(index, count),
+        seed=_env_seed(),
+        timeline_path=os.getenv("EXPORTER_TIMELINE"),
+        lazy_resolution=_env_lazy_resolution(),
+    )
+    await worker.start()
+    publisher = ShardPublisher(worker.store, snapshot_path)
+    try:
+        connection.send("ready")
+        while True:
+            request = await asyncio.to_thread(connection.recv)
+            if request == "stop":
+                break
+            if request == "reload":
+                connection.send(await worker.reload())
+                continue
+            # "render <format> [<view key>]"
+            _, fmt, view_key = (request.split(" ", 2) + ["", ""])[:3]
+            view = View.from_key(view_key) if view_key else None
+            sequence = await asyncio.to_thread(publisher.publish, fmt or "text", view)
+            connection.send(dict(worker.get_worker_stats(), sequence=sequence))
+    except EOFError:
+        logger.warning(f"Shard {index}: front process went away")
+    finally:
+        await worker.stop()
+
+
+def run_shard_worker(index: int, count: int, connection, snapshot_path: str):
+    """Entry point of a shard worker process."""
+    # The front process owns shutdown and forwards reloads
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    asyncio.run(_serve_shard(index, count, connection, snapshot_path))
+
+
+def _env_seed() -> Optional[int]:
+    """EXPORTER_SEED as an integer, None when unset."""
+    seed = os.getenv("EXPORTER_SEED")
+    if not seed:
+        return None
+    try:
+        return int(seed)
+    except ValueError:
+        logger.error(f"EXPORTER_SEED must be an integer, got {seed!r}")
+        sys.exit(1)
+
+
+def _env_lazy_resolution() -> Optional[float]:
+    """EXPORTER_LAZY_RESOLUTION under EXPORTER_EVALUATION=lazy, None for ticks."""
+    evaluation = os.getenv("EXPORTER_EVALUATION", "ticks")
+    if evaluation == "ticks":
+        return None
+    if evaluation != "lazy":
+        logger.error(f"EXPORTER_EVALUATION must be ticks or lazy, got {evaluation!r}")
+        sys.exit(1)
+    resolution = float(os.getenv("EXPORTER_LAZY_RESOLUTION", "5"))
+    if resolution <= 0:
+        logger.error(f"EXPORTER_LAZY_RESOLUTION must be positive, got {resolution}")
+        sys.exit(1)
+    return resolution
+
+
+class StartupProgress:
+    """The startup phase the process is in, for the readiness fields of /healthz.
+
+    The server listens as soon as the app has started; the exporter loads its
+    config ("loading") and registers its families ("registering") in the
+    background, and is "ready" once /metrics serves every series.
+    """
+
+    def __init__(self):
+        self.phase = "listening"
+        self.seconds: Dict[str, float] = {}
+        self.started = time.perf_counter()
+        self._entered = self.started
+
+    @property
+    def ready(self) -> bool:
+        return self.phase == "ready"
+
+    def enter(self, phase: str):
+        """Finish the current phase and record how long it took."""
+        now = time.perf_counter()
+        if self.phase != "listening":
+            self.seconds[self.phase] = round(now - self._entered, 6)
+            STARTUP_DURATION.labels(phase=self.phase).set(self.seconds[self.phase])
+        if phase == "ready":
+            self.seconds["total"] = round(now - self.started, 6)
+            STARTUP_DURATION.labels(phase="total").set(self.seconds["total"])
+        self.phase = phase
+        self._entered = now
+
+    def stats(self) -> Dict[str, Any]:
+        return {"phase": self.phase, "seconds": dict(self.seconds)}
+
 
 # FastAPI app for serving metrics
 app = FastAPI(title="Mock Metrics Exporter", version="0.1.0")
 exporter: Optional[MockExporter] = None
+loop_lag = LoopLagProbe()
+admission: Optional[ScrapeAdmission] = None
+startup = StartupProgress()
+# Loads and starts the exporter behind the listening server; done once ready
+starting: Optional[asyncio.Task] = None
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize the exporter on startup."""
+    """Start serving right away and bring the exporter up in the background."""
+    global admission, starting, startup
+    if access_log_quieted():
+        quiet_access_log()
+    loop_lag.start()
+    admission = create_admission(loop_lag)
+    startup = StartupProgress()
+    starting = asyncio.create_task(_start_exporter())
+
+
+async def _start_exporter():
+    """Load the config, register every family and start the exporter.
+
+    The exporter is only published (and /metrics served) once it is fully
+    registered. A config that fails to load ends the process, as it did
+    before the server listened early.
+    """
     global exporter
-    exporter = MockExporter()
-    await exporter.start()
+    try:
+        startup.enter("loading")
+        # Reading, parsing and compiling run off the event loop so /healthz answers
+        started = await asyncio.to_thread(
+            MockExporter,
+            os.getenv("CONFIG_PATH", "config.yml"),
+            shards=int(os.getenv("EXPORTER_SHARDS", "1")),
+            seed=_env_seed(),
+            timeline_path=os.getenv("EXPORTER_TIMELINE"),
+            lazy_resolution=_env_lazy_resolution(),
+        )
+        startup.enter("registering")
+        await started.start()
+    except SystemExit as e:
+        # sys.exit() from the loading thread: stop the server the same way
+        startup.enter("failed")
+        os._exit(e.code if isinstance(e.code, int) else 1)
+    except Exception:
+        startup.enter("failed")
+        logger.exception("Exporter failed to start")
+        os._exit(1)
+    exporter = started
+
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGHUP, lambda: asyncio.ensure_future(exporter.reload())
+        )
+    except (RuntimeError, NotImplementedError, ValueError, AttributeError) as e:
+        # Off the main thread (an embedding server, TestClient) or on Windows;
+        # POST /-/reload and CONFIG_WATCH_INTERVAL still reload
+        logger.warning(f"SIGHUP reload unavailable, use POST /-/reload instead: {e}")
+    watch_interval = float(os.getenv("CONFIG_WATCH_INTERVAL", "0"))
+    if watch_interval > 0:
+        exporter.start_config_watch(watch_interval)
+    startup.enter("ready")
+    logger.info(
+        f"Ready to serve after {startup.seconds['total']:.3f}s ({startup.seconds})"
+    )
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown."""
     global exporter
+    await loop_lag.stop()
+    if starting is not None and not starting.done():
+        starting.cancel()
+        try:
+            await starting
+        except asyncio.CancelledError:
+            pass
     if exporter:
         await exporter.stop()
+        exporter = None
 
 
 @app.get("/metrics")
-async def metrics():
-    """Prometheus metrics endpoint."""
-    from fastapi.responses import Response
-    return Response(content=generate_latest(REGISTRY), media_type="text/plain; version=0.0.4; charset=utf-8")
+async def metrics(request: Request):
+    """Prometheus metrics endpoint with compression and ETag support.
+
+    Label parameters (`?region=us-east-1`) and match[] selectors return a
+    filtered view instead of every series.
+    """
+    try:
+        view = View.from_query(request.query_params.multi_items())
+    except SelectorError as e:
+        return PlainTextResponse(str(e), status_code=400)
+    return await _metrics(request, view)
+
+
+@app.get("/metrics/{label}/{value}")
+async def filtered_metrics(request: Request, label: str, value: str):
+    """The view of /metrics?<label>=<value>, for scrapers that cannot set parameters."""
+    try:
+        view = View.from_query([(label, value)] + request.query_params.multi_items())
+    except SelectorError as e:
+        return PlainTextResponse(str(e), status_code=400)
+    return await _metrics(request, view)
+
+
+async def _metrics(request: Request, view: Optional[View]) -> Response:
+    started = time.perf_counter()
+    if admission:
+        rejected = await admission.acquire()
+        if rejected:
+            SCRAPES.labels(code="503").inc()
+            return admission.overloaded(rejected)
+    SCRAPES_IN_FLIGHT.inc()
+    try:
+        response = await _serve_metrics(request, view)
+    except BaseException:
+        _release_scrape()
+        raise
+    SCRAPES.labels(code=str(response.status_code)).inc()
+    encoding = response.headers.get("content-encoding", "identity")
+    if isinstance(response, StreamingResponse):
+        # Accounted for once the last chunk is sent
+        response.body_iterator = _tracked_stream(
+            response.body_iterator, encoding, started
+        )
+    else:
+        _scrape_finished(encoding, len(response.body), started)
+    return response
+
+
+def _scrape_finished(encoding: str, sent: int, started: float):
+    SCRAPE_BYTES.labels(encoding=encoding).inc(sent)
+    SCRAPE_DURATION.observe(time.perf_counter() - started)
+    _release_scrape()
+
+
+def _release_scrape():
+    SCRAPES_IN_FLIGHT.dec()
+    if admission:
+        admission.release()
+
+
+async def _tracked_stream(
+    chunks: AsyncIterator[bytes], encoding: str, started: float
+) -> AsyncIterator[bytes]:
+    sent = 0
+    try:
+        async for chunk in chunks:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        _scrape_finished(encoding, sent, started)
+
+
+async def _serve_metrics(request: Request, view: Optional[View]) -> Response:
+    if not exporter:
+        # Listening, but not every family is registered yet
+        return PlainTextResponse(
+            f"Exporter starting ({startup.phase}), retry in 1s\n",
+            status_code=503,
+            headers={"Retry-After": "1"},
+        )
+
+    exposition = (
+        exporter.exposition if view is None else exporter.exposition.filtered(view)
+    )
+    fmt = negotiate_format(request.headers.get("accept"), exposition.formats)
+    media_type = CONTENT_TYPES[fmt]
+    try:
+        snapshot = await exposition.get(fmt)
+    except ShardUnavailable as e:
+        # Serving the other shards alone would look like disappearing series
+        return PlainTextResponse(
+            f"Exporter degraded ({e}), retry in 1s\n",
+            status_code=503,
+            headers={"Retry-After": "1"},
+        )
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    headers = {"ETag": snapshot.etag(encoding), "Vary": "Accept, Accept-Encoding"}
+
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    if snapshot.streamed:
+        # Chunks are produced (and compressed) in a worker thread one at a
+        # time, each only after the previous one was handed to the transport,
+        # so a slow scraper holds back its own stream instead of buffering it
+        return StreamingResponse(
+            iterate_in_threadpool(snapshot.stream(encoding)),
+            media_type=media_type,
+            headers=headers,
+        )
+    content = await snapshot.encoded_async(encoding)
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+@app.post("/-/reload")
+async def reload_config():
+    """Reload the config in place (like SIGHUP) and report the diff."""
+    if not exporter:
+        return Response(status_code=503)
+    result = await exporter.reload()
+    if result["status"] != "ok":
+        return JSONResponse(result, status_code=400)
+    return result
+
+
+@app.get("/internal/metrics")
+async def internal_metrics():
+    """The exporter's own metrics, kept apart from the mock data."""
+    return Response(
+        content=generate_latest(SELF_REGISTRY), media_type=CONTENT_TYPE_LATEST
+    )
 
 
 @app.get("/healthz")
 async def health():
-    """Health check endpoint."""
-    return {"status": "ok", "metrics_count": exporter.get_metrics_count() if exporter else 0}
+    """Health check endpoint.
+
+    Answers as soon as the server listens; "ready" turns true once every
+    family is registered and /metrics serves them all, and turns false
+    again while a shard worker is being restarted.
+    """
+    ready = startup.ready
+    if ready and exporter.shard_pool is not None:
+        # Also restarts dead workers when nothing is scraping
+        ready = await asyncio.to_thread(exporter.shard_pool.refresh)
+    return {
+        "status": ("ok" if ready else "degraded") if startup.ready else "starting",
+        "ready": ready,
+        "startup": dict(
+            startup.stats(), config=exporter.config_stats if exporter else None
+        ),
+        "metrics_count": exporter.get_metrics_count() if exporter else 0,
+        "series": exporter.get_series_stats() if exporter else {},
+        "generation": exporter.get_generation_stats() if exporter else {},
+        "reload": exporter.last_reload if exporter else None,
+        "scheduler": exporter.get_scheduler_stats() if exporter else {},
+        "shards": (
+            exporter.shard_pool.stats() if exporter and exporter.shard_pool else None
+        ),
+        "remote_write": (
+            exporter.remote_write.stats()
+            if exporter and exporter.remote_write
+            else None
+        ),
+        "serving": _serving_stats(),
+    }
+
+
+def _serving_stats() -> Dict[str, Any]:
+    stats: Dict[str, Any] = {"profile": serve_profile()}
+    stats.update(
+        server_stack(os.getenv("SERVE_LOOP", "auto"), os.getenv("SERVE_HTTP", "auto"))
+    )
+    stats["admission"] = admission.stats() if admission else None
+    stats["loop_lag_seconds"] = round(loop_lag.last, 6)
+    stats["max_loop_lag_seconds"] = round(loop_lag.max, 6)
+    return stats
 
 
 @app.get("/")
@@ -543,7 +998,10 @@ async def root():
         "version": "0.1.0",
         "endpoints": {
             "metrics": "/metrics",
+            "filtered_metrics": "/metrics/{label}/{value}",
+            "internal_metrics": "/internal/metrics",
             "health": "/healthz",
+            "reload": "/-/reload",
         },
         "metrics_count": exporter.get_metrics_count() if exporter else 0,
     }
@@ -560,21 +1018,30 @@ def main():
     # Set up signal handlers
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
-    
+
     # Get configuration from environment
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", "2112"))
     log_level = os.getenv("LOG_LEVEL", "info")
-    
-    logger.info(f"Starting server on {host}:{port}")
-    
+
+    try:
+        options = uvicorn_options()
+    except ValueError as e:
+        logger.error(f"Invalid serving settings: {e}")
+        sys.exit(1)
+    stack = server_stack(options["loop"], options["http"])
+    logger.info(
+        f"Starting server on {host}:{port} ({serve_profile()} profile, "
+        f"{stack['loop']} loop, {stack['http']} HTTP)"
+    )
+
     # Run the server
     uvicorn.run(
         "main:app",
         host=host,
         port=port,
         log_level=log_level,
-        access_log=True,
+        **options,
     )
 
 
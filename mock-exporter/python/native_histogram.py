@@ -0,0 +1,124 @@
+"""
+Native Histogram Buckets
+
+Prometheus native histograms replace the configured `le` boundaries with
+exponential buckets: at schema s, bucket i covers (2^((i-1)/2^s), 2^(i/2^s)],
+each one 2^(2^-s) times as wide as the previous, and only buckets that
+received observations are transmitted. One series carries the whole
+distribution, where a classic histogram needs one series per bucket plus
+_count and _sum.
+
+Native families keep their counts in the same dense (series x bucket) matrix
+as classic ones, so the update path is shared. The compiled bounds are the
+zero bucket threshold followed by the upper bounds of every native bucket the
+family's value model can reach (see native_bounds); the state appends +Inf,
+which folds the rare overflow into one more native bucket. Column 0 is the
+zero bucket and column c the native bucket first_index + c - 1.
+
+The encoders turn one matrix row into the span/delta layout shared by the
+remote-write (prompb.Histogram) and scrape (io.prometheus.client.Histogram)
+messages.
+"""
+
+import math
+from typing import List, Sequence, Tuple
+
+from protowire import (
+    field_bytes,
+    field_double,
+    field_packed_sint,
+    field_sint,
+    field_varint,
+)
+
+DEFAULT_SCHEMA = 3
+MIN_SCHEMA, MAX_SCHEMA = -4, 8
+# client_golang's default zero bucket width
+ZERO_THRESHOLD = 2.0**-128
+
+# Encoded row: (count, zero bucket count, spans as (offset, length), deltas)
+NativeRow = Tuple[int, int, List[Tuple[int, int]], List[int]]
+
+
+def bucket_index(value: float, schema: int) -> int:
+    """Index of the native bucket holding a positive value."""
+    return math.ceil(math.log2(value) * 2.0**schema)
+
+
+def native_bounds(low: float, high: float, schema: int) -> Tuple[float, ...]:
+    """Zero threshold, then the upper bounds of the native buckets in [low, high]."""
+    low = max(low, ZERO_THRESHOLD * 2)
+    first, last = bucket_index(low, schema), bucket_index(max(high, low), schema)
+    scale = 2.0**-schema
+    return (ZERO_THRESHOLD,) + tuple(2.0 ** (i * scale) for i in range(first, last + 1))
+
+
+def first_index(bounds: Sequence[float], schema: int) -> int:
+    """Native index of the column after the zero bucket in compiled bounds."""
+    return round(math.log2(bounds[1]) * 2.0**schema)
+
+
+def encode_row(row: Sequence[int], first: int) -> NativeRow:
+    """Spans and count deltas of the populated buckets of one matrix row.
+
+    Deltas run across span boundaries, each relative to the previous
+    populated bucket, as both protobuf formats expect.
+    """
+    spans: List[List[int]] = []
+    deltas: List[int] = []
+    previous = 0
+    end = 0  # index after the last bucket of the previous span
+    for column, count in enumerate(row[1:]):
+        if not count:
+            continue
+        index = first + column
+        if spans and index == end:
+            spans[-1][1] += 1
+        else:
+            spans.append([index - end if spans else index, 1])
+        end = index + 1
+        deltas.append(count - previous)
+        previous = count
+    return sum(row), row[0], [tuple(span) for span in spans], deltas
+
+
+def _spans(field: int, spans: List[Tuple[int, int]]) -> bytes:
+    return b"".join(
+        field_bytes(field, field_sint(1, offset) + field_varint(2, length))
+        for offset, length in spans
+    )
+
+
+def remote_write_histogram(
+    row: NativeRow, total: float, schema: int, timestamp_ms: int
+) -> bytes:
+    """Body of a prompb.Histogram (TimeSeries.histograms) for one series."""
+    count, zero_count, spans, deltas = row
+    body = (
+        field_varint(1, count)
+        + field_double(3, total)
+        + field_sint(4, schema)
+        + field_double(5, ZERO_THRESHOLD)
+        + field_varint(6, zero_count)
+        + _spans(11, spans)
+    )
+    if deltas:
+        body += field_packed_sint(12, deltas)
+    return body + field_varint(15, timestamp_ms)
+
+
+def exposition_histogram(row: NativeRow, total: float, schema: int) -> bytes:
+    """Body of an io.prometheus.client.Histogram for one series."""
+    count, zero_count, spans, deltas = row
+    # client_golang marks an empty native histogram with a no-op span
+    body = (
+        field_varint(1, count)
+        + field_double(2, total)
+        + field_sint(5, schema)
+        + field_double(6, ZERO_THRESHOLD)
+        + field_varint(7, zero_count)
+        + _spans(12, spans or [(0, 0)])
+    )
+    if deltas:
+        body += field_packed_sint(13, deltas)
+    return body
@@ -0,0 +1,120 @@
+"""
+Minimal Protobuf Wire Encoding
+
+Just enough of the protobuf wire format to build Prometheus remote-write
+and scrape (io.prometheus.client) messages by hand, without generated classes
+or the protobuf runtime. Label sets are static, so callers encode them once
+and splice the cached bytes into every request.
+"""
+
+import struct
+from typing import Iterator, List, Tuple
+
+WIRE_VARINT = 0
+WIRE_I64 = 1
+WIRE_LEN = 2
+
+_pack_double = struct.Struct("<d").pack
+
+
+def encode_varint(value: int) -> bytes:
+    """Encode a non-negative integer as a base-128 varint."""
+    if value < 0x80:
+        return bytes((value,))
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def encode_signed_varint(value: int) -> bytes:
+    """Encode an int64 field value (two's complement for negatives)."""
+    if value < 0:
+        value += 1 << 64
+    return encode_varint(value)
+
+
+def zigzag(value: int) -> int:
+    """Map a signed integer onto the unsigned sint32/sint64 encoding."""
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def tag(field: int, wire_type: int) -> bytes:
+    """Encode a field key."""
+    return encode_varint((field << 3) | wire_type)
+
+
+def field_bytes(field: int, data: bytes) -> bytes:
+    """Encode a length-delimited field (string, bytes or sub-message)."""
+    return tag(field, WIRE_LEN) + encode_varint(len(data)) + data
+
+
+def field_string(field: int, value: str) -> bytes:
+    """Encode a string field."""
+    return field_bytes(field, value.encode("utf-8"))
+
+
+def field_double(field: int, value: float) -> bytes:
+    """Encode a double field."""
+    return tag(field, WIRE_I64) + _pack_double(value)
+
+
+def field_varint(field: int, value: int) -> bytes:
+    """Encode an int64/uint64 field."""
+    return tag(field, WIRE_VARINT) + encode_signed_varint(value)
+
+
+def field_sint(field: int, value: int) -> bytes:
+    """Encode a sint32/sint64 (zigzag) field."""
+    return tag(field, WIRE_VARINT) + encode_varint(zigzag(value))
+
+
+def field_packed_sint(field: int, values: List[int]) -> bytes:
+    """Encode a packed repeated sint64 field."""
+    return field_bytes(
+        field, b"".join(encode_varint(zigzag(value)) for value in values)
+    )
+
+
+def decode_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """Decode a varint at pos; returns (value, new_pos)."""
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def iter_fields(data: bytes) -> Iterator[Tuple[int, int, object]]:
+    """Iterate (field, wire_type, value) over a message; used for verification."""
+    pos = 0
+    end = len(data)
+    while pos < end:
+        key, pos = decode_varint(data, pos)
+        field, wire_type = key >> 3, key & 0x07
+        if wire_type == WIRE_VARINT:
+            value, pos = decode_varint(data, pos)
+        elif wire_type == WIRE_I64:
+            value = struct.unpack_from("<d", data, pos)[0]
+            pos += 8
+        elif wire_type == WIRE_LEN:
+            length, pos = decode_varint(data, pos)
+            value = data[pos : pos + length]
+            pos += length
+        else:
+            raise ValueError(f"Unsupported wire type {wire_type}")
+        yield field, wire_type, value
+
+
+def encode_labels(labels: List[Tuple[str, str]]) -> bytes:
+    """Encode prompb.Label entries (field 1 of TimeSeries), sorted by name."""
+    return b"".join(
+        field_bytes(1, field_string(1, name) + field_string(2, value))
+        for name, value in sorted(labels)
+    )
@@ -0,0 +1,936 @@
+"""
+Prometheus Remote-Write Sender
+
+Pushes the series store directly to a remote-write endpoint (vminsert
+/insert/0/prometheus/api/v1/write, Prometheus /api/v1/write, ...) without a
+scrape-then-forward hop. WriteRequest protobufs are built by hand from the
+store arrays: each series' label set is encoded once and cached (synthetic
+families instead join per-value label encodings on every push, so they hold
+no per-series bytes), so a push only appends the sample bytes per series,
+splits the result into batches by series count and size, snappy-compresses
+each batch and POSTs it over a pooled keep-alive HTTP client. Native
+histogram families are sent as one series per histogram carrying a
+prompb.Histogram instead of per-bucket samples.
+
+Two modes are available:
+
+- RemoteWriteSender pushes a snapshot of the whole store every interval and
+  retries a failed request a few times before giving up on it. Families join
+  the push once their updater has ticked.
+- DurableRemoteWriter appends each tick's samples to an on-disk write-ahead
+  queue (see wal.py) and drains it with exponential backoff, so nothing
+  generated while a receiver is down is lost.
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import cramjam
+import httpx
+
+from native_histogram import encode_row, remote_write_histogram
+from protowire import encode_labels, encode_varint, field_bytes, field_string
+from series_store import SeriesFamily, SeriesStore
+from wal import WriteAheadQueue
+
+logger = logging.getLogger(__name__)
+
+_pack_double = struct.Struct("<d").pack
+
+REMOTE_WRITE_HEADERS = {
+    "Content-Encoding": "snappy",
+    "Content-Type": "application/x-protobuf",
+    "User-Agent": "mock-exporter-python/0.1.0",
+    "X-Prometheus-Remote-Write-Version": "0.1.0",
+}
+
+# Entries ShardedEndpoint.route() offers per hold of the shard set lock
+ROUTE_CHUNK = 4096
+
+
+def parse_labels(spec: str) -> Dict[str, str]:
+    """Parse 'k1=v1,k2=v2' into a label dict."""
+    labels = {}
+    for part in spec.split(","):
+        name, sep, value = part.partition("=")
+        if sep and name.strip():
+            labels[name.strip()] = value.strip()
+    return labels
+
+
+def sample_bytes(value: float, timestamp_tail: bytes) -> bytes:
+    """Encode TimeSeries.samples (field 2) holding one prompb.Sample."""
+    body = b"\x09" + _pack_double(value) + timestamp_tail
+    return b"\x12" + encode_varint(len(body)) + body
+
+
+def histogram_bytes(body: bytes) -> bytes:
+    """Encode TimeSeries.histograms (field 4) holding one prompb.Histogram."""
+    return b"\x22" + encode_varint(len(body)) + body
+
+
+def wrap_timeseries(body: bytes) -> bytes:
+    """Wrap a TimeSeries body as WriteRequest.timeseries (field 1)."""
+    return b"\x0a" + encode_varint(len(body)) + body
+
+
+class FamilyEncoder:
+    """Cached label encodings for every output series of one family."""
+
+    def __init__(self, family: SeriesFamily, external_labels: Dict[str, str]):
+        self.family = family
+        self.external_labels = external_labels
+        name = family.sample_name
+
+        self.blobs: List[bytes] = []
+        self.bucket_blobs: List[List[bytes]] = []
+        self.count_blobs: List[bytes] = []
+        # Plain __name__ label sets, which native histograms are sent under
+        self.name_blobs: List[bytes] = []
+        # Stable per-series hash used to pick a shard; all outputs of a
+        # histogram series share it
+        self.hashes: List[int] = []
+        if family.synthetic is not None:
+            return
+        for values in family.label_values:
+            labels = {k: v for k, v in zip(family.labelnames, values) if v}
+            for k, v in external_labels.items():
+                labels.setdefault(k, v)
+            pairs = list(labels.items())
+            name_blob = encode_labels(pairs + [("__name__", name)])
+            self.hashes.append(zlib.crc32(name_blob))
+            if family.type == "histogram" and family.native_schema is not None:
+                self.name_blobs.append(name_blob)
+
+            if family.type == "histogram":
+                self.bucket_blobs.append(
+                    [
+                        encode_labels(
+                            pairs + [("__name__", f"{name}_bucket"), ("le", le)]
+                        )
+                        for le in family.bucket_labels
+                    ]
+                )
+                self.count_blobs.append(
+                    encode_labels(pairs + [("__name__", f"{name}_count")])
+                )
+                self.blobs.append(encode_labels(pairs + [("__name__", f"{name}_sum")]))
+            else:
+                self.blobs.append(encode_labels(pairs + [("__name__", name)]))
+
+    def series_count(self) -> int:
+        """Number of remote-write series this family produces."""
+        if self.family.type == "histogram" and self.family.native_schema is not None:
+            return self.family.size
+        if self.family.type == "histogram":
+            return self.family.size * (len(self.family.bucket_labels) + 2)
+        return self.family.size
+
+    def _synthetic_blobs(self, name: str, le: Optional[str] = None) -> List[bytes]:
+        """Encode every synthetic series' labels with one __name__ (and le)."""
+        extra = dict(self.external_labels)
+        extra["__name__"] = name
+        if le is not None:
+            extra["le"] = le
+        return self.family.synthetic.render(
+            lambda label, value: field_bytes(
+                1, field_string(1, label) + field_string(2, value)
+            ),
+            b"",
+            extra,
+        ).tolist()
+
+    def label_blobs(self):
+        """Return (hashes, blobs, bucket blobs, count blobs) for one push.
+
+        Histogram blobs are the _sum series; bucket blobs hold one list per
+        series in bucket order.
+        """
+        family = self.family
+        if family.synthetic is None:
+            return self.hashes, self.blobs, self.bucket_blobs, self.count_blobs
+
+        name = family.sample_name
+        if family.type != "histogram":
+            blobs = self._synthetic_blobs(name)
+            return list(map(zlib.crc32, blobs)), blobs, None, None
+        hashes = list(map(zlib.crc32, self._synthetic_blobs(name)))
+        bucket_blobs = list(
+            zip(
+                *(
+                    self._synthetic_blobs(f"{name}_bucket", le)
+                    for le in family.bucket_labels
+                )
+            )
+        )
+        count_blobs = self._synthetic_blobs(f"{name}_count")
+        return hashes, self._synthetic_blobs(f"{name}_sum"), bucket_blobs, count_blobs
+
+    def native_blobs(self) -> Tuple[List[int], List[bytes]]:
+        """Return (hashes, plain-name label blobs) of a native histogram family."""
+        if self.family.synthetic is None:
+            return self.hashes, self.name_blobs
+        blobs = self._synthetic_blobs(self.family.sample_name)
+        return list(map(zlib.crc32, blobs)), blobs
+
+    def encode_native(self, timestamp_ms: int) -> Iterator[Tuple[int, bytes]]:
+        """Yield one native histogram timeseries entry per series."""
+        family = self.family
+        schema, first = family.native_schema, family.native_first
+        hashes, blobs = self.native_blobs()
+        _, values, counts = family.read()
+        rows = counts.astype("int64").tolist()
+        for series_hash, blob, row, total in zip(hashes, blobs, rows, values.tolist()):
+            histogram = remote_write_histogram(
+                encode_row(row, first), total, schema, timestamp_ms
+            )
+            yield series_hash, wrap_timeseries(blob + histogram_bytes(histogram))
+
+    def encode(self, timestamp_tail: bytes) -> Iterator[Tuple[int, bytes]]:
+        """Yield (series hash, WriteRequest.timeseries entry) per output series."""
+        family = self.family
+        # Encoding runs off the event loop, next to the updaters
+        _, values, counts = family.read()
+        values = values.tolist()
+        hashes, blobs, bucket_blobs, count_blobs = self.label_blobs()
+        if family.type != "histogram":
+            for series_hash, blob, value in zip(hashes, blobs, values):
+                yield series_hash, wrap_timeseries(
+                    blob + sample_bytes(value, timestamp_tail)
+                )
+            return
+
+        cumulative = family.classic_counts(counts).cumsum(axis=1).tolist()
+        for i, counts in enumerate(cumulative):
+            series_hash = hashes[i]
+            for blob, count in zip(bucket_blobs[i], counts):
+                yield series_hash, wrap_timeseries(
+                    blob + sample_bytes(count, timestamp_tail)
+                )
+            yield series_hash, wrap_timeseries(
+                count_blobs[i] + sample_bytes(counts[-1], timestamp_tail)
+            )
+            yield series_hash, wrap_timeseries(
+                blobs[i] + sample_bytes(values[i], timestamp_tail)
+            )
+
+
+class WriteRequestBuilder:
+    """Turns the series store into size-bounded WriteRequest batches."""
+
+    def __init__(
+        self,
+        store: SeriesStore,
+        external_labels: Optional[Dict[str, str]] = None,
+        max_series: int = 2000,
+        max_bytes: int = 1 << 20,
+    ):
+        self.store = store
+        self.external_labels = external_labels or {}
+        self.max_series = max_series
+        self.max_bytes = max_bytes
+        self.encoders: Dict[str, FamilyEncoder] = {}
+
+    def _encoder(self, key: str, family: SeriesFamily) -> FamilyEncoder:
+        encoder = self.encoders.get(key)
+        if encoder is None or encoder.family is not family:
+            encoder = FamilyEncoder(family, self.external_labels)
+            self.encoders[key] = encoder
+        return encoder
+
+    def iter_timeseries(
+        self, timestamp_ms: int, keys: Optional[Iterable[str]] = None
+    ) -> Iterator[Tuple[int, bytes]]:
+        """Yield (series hash, encoded timeseries entry) for one timestamp.
+
+        Covers every family, or only the families named in keys.
+        """
+        tail = b"\x10" + encode_varint(timestamp_ms)
+        families = self.store.families
+        for key in list(families) if keys is None else keys:
+            family = families.get(key)
+            if family is None:
+                continue
+            encoder = self._encoder(key, family)
+            if family.type == "histogram" and family.native_schema is not None:
+                yield from encoder.encode_native(timestamp_ms)
+            else:
+                yield from encoder.encode(tail)
+
+    def build(
+        self, timestamp_ms: int, keys: Optional[Iterable[str]] = None
+    ) -> List[Tuple[bytes, int]]:
+        """Return (uncompressed WriteRequest, series count) batches."""
+        batches = []
+        batch: List[bytes] = []
+        size = 0
+        for _, entry in self.iter_timeseries(timestamp_ms, keys):
+            if batch and (
+                len(batch) >= self.max_series or size + len(entry) > self.max_bytes
+            ):
+                batches.append((b"".join(batch), len(batch)))
+                batch, size = [], 0
+            batch.append(entry)
+            size += len(entry)
+        if batch:
+            batches.append((b"".join(batch), len(batch)))
+        return batches
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def endpoint_id(url: str) -> str:
+    """Filesystem-safe identifier for an endpoint URL."""
+    parsed = urlsplit(url)
+    readable = re.sub(r"[^A-Za-z0-9]+", "_", f"{parsed.netloc}{parsed.path}").strip("_")
+    digest = hashlib.sha1(url.encode("utf-8")).hexdigest()[:8]
+    return f"{readable[:48]}-{digest}"
+
+
+class RemoteWriteClient:
+    """Pooled keep-alive HTTP client for one remote-write URL."""
+
+    OK = "ok"
+    REJECTED = "rejected"
+    RETRY = "retry"
+
+    def __init__(self, url: str, concurrency: int = 4, timeout: float = 30.0):
+        self.url = url
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.client: Optional[httpx.AsyncClient] = None
+
+        self.requests = 0
+        self.samples_sent = 0
+        self.bytes_sent = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def _client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.concurrency,
+                    max_keepalive_connections=self.concurrency,
+                ),
+                headers=REMOTE_WRITE_HEADERS,
+            )
+        return self.client
+
+    async def post(self, body: bytes, series: int) -> str:
+        """POST one snappy-compressed WriteRequest; returns OK, REJECTED or RETRY."""
+        try:
+            response = await self._client().post(self.url, content=body)
+        except httpx.HTTPError as e:
+            self.failures += 1
+            logger.debug(
+                f"Remote write to {self.url} failed: {str(e) or type(e).__name__}"
+            )
+            return self.RETRY
+
+        if response.status_code < 300:
+            self.requests += 1
+            self.samples_sent += series
+            self.bytes_sent += len(body)
+            return self.OK
+        if response.status_code == 429 or response.status_code >= 500:
+            self.failures += 1
+            logger.debug(f"Remote write to {self.url} returned {response.status_code}")
+            return self.RETRY
+
+        self.rejected += 1
+        logger.error(
+            f"Remote write to {self.url} rejected with {response.status_code}: "
+            f"{response.text[:200]}"
+        )
+        return self.REJECTED
+
+    async def close(self):
+        """Close pooled connections."""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return delivery counters."""
+        return {
+            "url": self.url,
+            "requests": self.requests,
+            "samples_sent": self.samples_sent,
+            "bytes_sent": self.bytes_sent,
+            "failures": self.failures,
+            "rejected": self.rejected,
+        }
+
+
+class Shard:
+    """One sender with its own bounded buffer and connection."""
+
+    def __init__(self, endpoint: "ShardedEndpoint", index: int):
+        self.endpoint = endpoint
+        self.index = index
+        self.buffer: deque = deque()
+        self.client = RemoteWriteClient(
+            endpoint.url, concurrency=1, timeout=endpoint.timeout
+        )
+        self.wakeup = asyncio.Event()
+        self.closing = False
+        self.task: Optional[asyncio.Task] = None
+
+    def offer(self, entry: bytes) -> bool:
+        """Buffer an entry; returns False (and drops it) when the shard is full."""
+        if len(self.buffer) >= self.endpoint.capacity:
+            return False
+        self.buffer.append(entry)
+        return True
+
+    def _take_batch(self) -> List[bytes]:
+        endpoint = self.endpoint
+        batch: List[bytes] = []
+        size = 0
+        buffer = self.buffer
+        while buffer and len(batch) < endpoint.max_series:
+            if batch and size + len(buffer[0]) > endpoint.max_bytes:
+                break
+            entry = buffer.popleft()
+            batch.append(entry)
+            size += len(entry)
+        return batch
+
+    async def run(self, ready: Optional[asyncio.Event] = None):
+        """Send buffered entries until closed and empty.
+
+        When ready is given, wait for it first: a new shard set must not send
+        before the shards it replaces have flushed, or per-series order breaks.
+        """
+        if ready is not None:
+            await ready.wait()
+        endpoint = self.endpoint
+        while True:
+            if not self.buffer:
+                if self.closing:
+                    break
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            batch = self._take_batch()
+            body = bytes(cramjam.snappy.compress_raw(b"".join(batch)))
+            for attempt in range(endpoint.max_retries + 1):
+                started = time.monotonic()
+                result = await self.client.post(body, len(batch))
+                endpoint.send_seconds += time.monotonic() - started
+                if result == RemoteWriteClient.OK:
+                    endpoint.samples_out += len(batch)
+                    endpoint.bytes_sent += len(body)
+                    break
+                if result == RemoteWriteClient.REJECTED:
+                    with endpoint.lock:
+                        endpoint.dropped += len(batch)
+                    break
+                endpoint.failed_sends += 1
+                if attempt < endpoint.max_retries:
+                    await asyncio.sleep(
+                        backoff_delay(attempt, 0.5, endpoint.backoff_max)
+                    )
+            else:
+                with endpoint.lock:
+                    endpoint.dropped += len(batch)
+                logger.warning(
+                    f"Remote write to {endpoint.url} (shard {self.index}) dropped "
+                    f"{len(batch)} series after {endpoint.max_retries} retries"
+                )
+        await self.client.close()
+
+    def start(self, ready: Optional[asyncio.Event] = None):
+        self.task = asyncio.create_task(self.run(ready))
+
+    def close(self):
+        """Finish sending what is buffered, then exit."""
+        self.closing = True
+        self.wakeup.set()
+
+
+class ShardedEndpoint:
+    """Parallel shards for one remote-write URL with automatic resharding.
+
+    Series are assigned to shards by a hash of their labels, so each series
+    is always sent by one shard and its samples stay in order. Shard buffers
+    are bounded; a full buffer drops new entries rather than blocking the
+    producer, so a slow endpoint never delays the others.
+
+    Every reshard_interval the desired shard count is estimated from the
+    observed send time per sample, the incoming sample rate and the current
+    backlog (the same idea as Prometheus' queue manager) and applied when it
+    differs by more than 30% from the current count.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        min_shards: int = 1,
+        max_shards: int = 16,
+        capacity: int = 10000,
+        max_series: int = 2000,
+        max_bytes: int = 1 << 20,
+        timeout: float = 30.0,
+        max_retries: int = 3,
+        backoff_max: float = 10.0,
+        reshard_interval: float = 10.0,
+    ):
+        self.url = url
+        self.min_shards = max(1, min_shards)
+        self.max_shards = max(self.min_shards, max_shards)
+        self.capacity = capacity
+        self.max_series = max_series
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_max = backoff_max
+        self.reshard_interval = reshard_interval
+        self.shards: List[Shard] = []
+        self.retiring: List[Shard] = []
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # Guards the shard set and the drop counter: route() runs in worker
+        # threads while reshard() swaps the set on the event loop
+        self.lock = threading.Lock()
+
+        self.samples_in = 0
+        self.samples_out = 0
+        self.bytes_sent = 0
+        self.dropped = 0
+        self.failed_sends = 0
+        self.send_seconds = 0.0
+        self.reshards = 0
+        self.desired_shards = float(self.min_shards)
+        self._last_eval: Optional[Tuple[float, int, int, float, int]] = None
+        self._reshard_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the initial shards and the resharding loop."""
+        self.loop = asyncio.get_running_loop()
+        self.shards = [Shard(self, i) for i in range(self.min_shards)]
+        for shard in self.shards:
+            shard.start()
+        self._reshard_task = asyncio.create_task(self._reshard_loop())
+
+    def route(self, entries: List[Tuple[int, bytes]]):
+        """Distribute entries across shards; safe to call from a worker thread.
+
+        The shard set is read under the lock for every ROUTE_CHUNK entries,
+        so nothing is offered to a shard that reshard() has already closed,
+        and a reshard waits for one chunk at most.
+        """
+        offered = set()
+        for start in range(0, len(entries), ROUTE_CHUNK):
+            chunk = entries[start : start + ROUTE_CHUNK]
+            dropped = 0
+            with self.lock:
+                shards = self.shards
+                count = len(shards)
+                for series_hash, entry in chunk:
+                    if not shards[series_hash % count].offer(entry):
+                        dropped += 1
+                self.samples_in += len(chunk)
+                self.dropped += dropped
+            offered.update(shards)
+        if self.loop is not None:
+            for shard in offered:
+                self.loop.call_soon_threadsafe(shard.wakeup.set)
+
+    def pending(self) -> int:
+        """Entries buffered across live and retiring shards."""
+        return sum(len(shard.buffer) for shard in self.shards + self.retiring)
+
+    def _desired_shards(self) -> Optional[float]:
+        now = time.monotonic()
+        current = (
+            now,
+            self.samples_in,
+            self.samples_out,
+            self.send_seconds,
+            self.failed_sends,
+        )
+        previous, self._last_eval = self._last_eval, current
+        if previous is None:
+            return None
+
+        elapsed = now - previous[0]
+        samples_in = current[1] - previous[1]
+        samples_out = current[2] - previous[2]
+        send_seconds = current[3] - previous[3]
+        failures = current[4] - previous[4]
+        if elapsed <= 0 or samples_out <= 0:
+            # Nothing delivered: the endpoint is down or idle, more shards won't help
+            return None if failures else float(self.min_shards)
+
+        time_per_sample = send_seconds / samples_out
+        backlog_rate = self.pending() / self.reshard_interval
+        return time_per_sample * (samples_in / elapsed + backlog_rate)
+
+    async def _reshard_loop(self):
+        while True:
+            await asyncio.sleep(self.reshard_interval)
+            desired = self._desired_shards()
+            if desired is None:
+                continue
+            self.desired_shards = desired
+            target = min(self.max_shards, max(self.min_shards, math.ceil(desired)))
+            current = len(self.shards)
+            if target != current and abs(target - current) / current > 0.3:
+                self.reshard(target)
+
+    def reshard(self, count: int):
+        """Replace the shard set; new shards send once the old ones have flushed."""
+        logger.info(
+            f"Resharding remote write to {self.url}: "
+            f"{len(self.shards)} -> {count} shards"
+        )
+        ready = asyncio.Event()
+        shards = [Shard(self, i) for i in range(count)]
+        with self.lock:
+            old, self.shards = self.shards, shards
+            # Closed shards still send what they hold, and get nothing more
+            for shard in old:
+                shard.close()
+        for shard in shards:
+            shard.start(ready)
+        self.retiring = old
+        self.reshards += 1
+
+        async def release():
+            await asyncio.gather(*(shard.task for shard in old), return_exceptions=True)
+            self.retiring = []
+            ready.set()
+
+        asyncio.create_task(release())
+
+    async def stop(self):
+        """Stop resharding and close every shard without waiting for the backlog."""
+        if self._reshard_task is not None:
+            self._reshard_task.cancel()
+        for shard in self.shards + self.retiring:
+            if shard.task is not None:
+                shard.task.cancel()
+        await asyncio.gather(
+            *(shard.task for shard in self.shards + self.retiring if shard.task),
+            return_exceptions=True,
+        )
+        for shard in self.shards + self.retiring:
+            await shard.client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return per-endpoint counters for health reporting."""
+        return {
+            "url": self.url,
+            "shards": len(self.shards),
+            "desired_shards": round(self.desired_shards, 2),
+            "reshards": self.reshards,
+            "pending": self.pending(),
+            "samples_in": self.samples_in,
+            "samples_out": self.samples_out,
+            "dropped": self.dropped,
+            "failed_sends": self.failed_sends,
+            "bytes_sent": self.bytes_sent,
+        }
+
+
+class RemoteWriteSender:
+    """Periodically pushes the full series store to one or more endpoints.
+
+    Each push encodes the store once and fans the entries out to every
+    endpoint's shards, so endpoints progress independently.
+    """
+
+    def __init__(
+        self,
+        store: SeriesStore,
+        urls: List[str],
+        interval: float = 5.0,
+        external_labels: Optional[Dict[str, str]] = None,
+        **endpoint_options: Any,
+    ):
+        self.interval = interval
+        self.builder = WriteRequestBuilder(store, external_labels)
+        self.endpoints = [ShardedEndpoint(url, **endpoint_options) for url in urls]
+        self.running = False
+
+        self.pushes = 0
+        self.last_push_seconds = 0.0
+
+    def _route(self, timestamp_ms: int):
+        store = self.builder.store
+        # Lazily evaluated families are computed for the push
+        store.settle(timestamp_ms / 1000)
+        # A family that has not ticked yet only holds its initial zeros (or
+        # bases), which would go out as real samples at this timestamp
+        keys = [
+            key
+            for key, family in store.families.items()
+            if family.updates or family.lazy is not None
+        ]
+        entries = list(self.builder.iter_timeseries(timestamp_ms, keys))
+        for endpoint in self.endpoints:
+            endpoint.route(entries)
+
+    async def push(self):
+        """Encode the current store state and hand it to every endpoint."""
+        started = time.monotonic()
+        await asyncio.to_thread(self._route, int(time.time() * 1000))
+        self.pushes += 1
+        self.last_push_seconds = time.monotonic() - started
+
+    async def run(self):
+        """Push every interval until stop() is called."""
+        self.running = True
+        for endpoint in self.endpoints:
+            endpoint.start()
+        urls = ", ".join(endpoint.url for endpoint in self.endpoints)
+        logger.info(f"Remote write enabled: pushing to {urls} every {self.interval}s")
+        while self.running:
+            started = time.monotonic()
+            try:
+                await self.push()
+            except Exception as e:
+                logger.error(f"Remote write push failed: {e}")
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    async def stop(self):
+        """Stop pushing and close every shard."""
+        self.running = False
+        await asyncio.gather(*(endpoint.stop() for endpoint in self.endpoints))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return push counters for health reporting."""
+        return {
+            "pushes": self.pushes,
+            "last_push_seconds": round(self.last_push_seconds, 6),
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints],
+        }
+
+
+class QueueDrain:
+    """Delivers one endpoint's share of the write-ahead queue in order."""
+
+    def __init__(
+        self,
+        queue: WriteAheadQueue,
+        url: str,
+        timeout: float,
+        backoff_base: float,
+        backoff_max: float,
+    ):
+        self.queue = queue
+        self.url = url
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.client = RemoteWriteClient(url, concurrency=1, timeout=timeout)
+        self.consumer = endpoint_id(url)
+        self.queue.add_consumer(self.consumer)
+        self.appended = asyncio.Event()
+        self.retries = 0
+        self.backoff_seconds = 0.0
+
+    async def run(self):
+        attempt = 0
+        while True:
+            record = self.queue.read(self.consumer)
+            if record is None:
+                self.appended.clear()
+                try:
+                    await asyncio.wait_for(self.appended.wait(), 1.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            payload, series, position = record
+            result = await self.client.post(payload, series)
+            if result == RemoteWriteClient.RETRY:
+                self.retries += 1
+                self.backoff_seconds = backoff_delay(
+                    attempt, self.backoff_base, self.backoff_max
+                )
+                attempt += 1
+                await asyncio.sleep(self.backoff_seconds)
+                continue
+
+            attempt = 0
+            self.backoff_seconds = 0.0
+            self.queue.commit(self.consumer, position)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.client.stats()
+        stats.update(
+            retries=self.retries,
+            backoff_seconds=round(self.backoff_seconds, 3),
+            pending_bytes=self.queue.pending_bytes(self.consumer),
+        )
+        return stats
+
+
+class DurableRemoteWriter:
+    """Queues every tick's samples on disk and drains them to remote-write URLs.
+
+    After each scheduler batch, the families whose version moved are encoded
+    with the tick timestamp and appended to the write-ahead queue as ready to
+    send, snappy-compressed requests. Each endpoint has its own cursor and
+    drain task that delivers records in order, backing off exponentially with
+    jitter while its receiver is unavailable; undelivered records survive
+    restarts and are replayed on startup.
+    """
+
+    def __init__(
+        self,
+        store: SeriesStore,
+        urls: List[str],
+        wal_dir: str,
+        external_labels: Optional[Dict[str, str]] = None,
+        max_series: int = 2000,
+        max_bytes: int = 1 << 20,
+        timeout: float = 30.0,
+        segment_bytes: int = 16 << 20,
+        queue_bytes: int = 512 << 20,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+    ):
+        self.store = store
+        self.builder = WriteRequestBuilder(
+            store, external_labels, max_series, max_bytes
+        )
+        self.queue = WriteAheadQueue(wal_dir, segment_bytes, queue_bytes)
+        self.drains = [
+            QueueDrain(self.queue, url, timeout, backoff_base, backoff_max)
+            for url in urls
+        ]
+        self.running = False
+
+        self._versions: Dict[str, int] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="wal-append"
+        )
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def attach(self, scheduler):
+        """Append samples after every scheduler batch."""
+        scheduler.add_batch_hook(self.on_tick)
+
+    def on_tick(self):
+        """Queue the families updated by the batch that just ran."""
+        dirty = []
+        for key, family in self.store.families.items():
+            # Families that have not ticked yet hold no samples to queue
+            if family.updates and self._versions.get(key) != family.version:
+                self._versions[key] = family.version
+                dirty.append(key)
+        if dirty:
+            self._executor.submit(self._append, dirty, int(time.time() * 1000))
+
+    def _append(self, keys: List[str], timestamp_ms: int):
+        try:
+            for payload, series in self.builder.build(timestamp_ms, keys):
+                self.queue.append(bytes(cramjam.snappy.compress_raw(payload)), series)
+        except Exception as e:
+            logger.error(f"Failed to append samples to write-ahead queue: {e}")
+            return
+        if self._loop is not None:
+            for drain in self.drains:
+                self._loop.call_soon_threadsafe(drain.appended.set)
+
+    async def run(self):
+        """Deliver queued records to every endpoint until cancelled."""
+        self.running = True
+        self._loop = asyncio.get_running_loop()
+        urls = ", ".join(drain.url for drain in self.drains)
+        logger.info(f"Remote write enabled: draining write-ahead queue to {urls}")
+        await asyncio.gather(*(drain.run() for drain in self.drains))
+
+    async def stop(self):
+        """Finish pending appends, close connections and the queue."""
+        self.running = False
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        for drain in self.drains:
+            await drain.client.close()
+        self.queue.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return delivery and queue counters for health reporting."""
+        return {
+            "queued_records": self.queue.appended,
+            "dropped_records": self.queue.dropped_records,
+            "endpoints": [drain.stats() for drain in self.drains],
+        }
+
+
+def create_remote_writer(store: SeriesStore, wal_subdir: Optional[str] = None):
+    """Build the remote-write pusher from REMOTE_WRITE_* environment variables.
+
+    REMOTE_WRITE_URL takes a comma-separated list of endpoints. Returns None
+    when it is unset, a DurableRemoteWriter when REMOTE_WRITE_WAL_DIR is set,
+    and a sharded periodic RemoteWriteSender otherwise. wal_subdir gives each
+    exporter worker process its own queue below REMOTE_WRITE_WAL_DIR.
+    """
+    urls = [
+        url.strip()
+        for url in os.getenv("REMOTE_WRITE_URL", "").split(",")
+        if url.strip()
+    ]
+    if not urls:
+        return None
+
+    external_labels = parse_labels(
+        os.getenv("REMOTE_WRITE_LABELS", "job=mock-exporter-python")
+    )
+    max_series = int(os.getenv("REMOTE_WRITE_MAX_SERIES", "2000"))
+    max_bytes = int(os.getenv("REMOTE_WRITE_MAX_BYTES", str(1 << 20)))
+    timeout = float(os.getenv("REMOTE_WRITE_TIMEOUT", "30"))
+    backoff_max = float(os.getenv("REMOTE_WRITE_BACKOFF_MAX", "30"))
+
+    wal_dir = os.getenv("REMOTE_WRITE_WAL_DIR")
+    if wal_dir:
+        if wal_subdir:
+            wal_dir = os.path.join(wal_dir, wal_subdir)
+        return DurableRemoteWriter(
+            store,
+            urls,
+            wal_dir,
+            external_labels=external_labels,
+            max_series=max_series,
+            max_bytes=max_bytes,
+            timeout=timeout,
+            segment_bytes=int(
+                os.getenv("REMOTE_WRITE_WAL_SEGMENT_BYTES", str(16 << 20))
+            ),
+            queue_bytes=int(os.getenv("REMOTE_WRITE_WAL_MAX_BYTES", str(512 << 20))),
+            backoff_max=backoff_max,
+        )
+
+    return RemoteWriteSender(
+        store,
+        urls,
+        interval=float(os.getenv("REMOTE_WRITE_INTERVAL", "5")),
+        external_labels=external_labels,
+        min_shards=int(os.getenv("REMOTE_WRITE_MIN_SHARDS", "1")),
+        max_shards=int(os.getenv("REMOTE_WRITE_MAX_SHARDS", "16")),
+        capacity=int(os.getenv("REMOTE_WRITE_SHARD_CAPACITY", "10000")),
+        max_series=max_series,
+        max_bytes=max_bytes,
+        timeout=timeout,
+        backoff_max=backoff_max,
+    )
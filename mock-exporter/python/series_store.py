@@ -0,0 +1,809 @@
+"""
+Array-backed Series State Store
+
+Keeps the state of every mock series in contiguous NumPy arrays, one set per
+metric family, so each updater tick is a handful of vectorized operations
+instead of a Python loop over label dicts:
+
+- counter:   values += base * 0.1 * U(0.5, 1.5)
+- gauge:     values += base * 0.05 * U(0.7, 1.3), clipped to [lower, upper]
+- histogram: one observation of base * U(0.8, 1.2) per series, binned with
+             searchsorted into a (series x bucket) count matrix; or, for
+             families with a `rate`, rate x OBSERVATION_WINDOW lognormal
+             observations per series, drawn straight as Poisson bucket counts
+             from precomputed bucket probabilities, so a tick costs the same
+             at 1 or 10,000 observations per second
+
+Every update bumps the family's version so the exposition cache (see
+exposition.py) knows which families need re-rendering. Updates mutate the
+arrays under the family's lock, and readers off the event loop (renders,
+remote-write encoding) copy them with read() under the same lock, so they
+never see a histogram's buckets and sum from different updates, or a gauge
+before its clamp. Synthetic families (see synthetic.py) first advance their
+churning label values and restart the state of every series whose labels
+changed. The store is also a
+prometheus_client custom collector for callers that want generate_latest().
+
+By default all families draw from one shared generator, so values depend on
+the order in which updaters happen to run. A seeded store instead gives every
+series its own counter-based stream: the uniform for series row r at update
+n is a hash of (seed, family, r, n). Runs with the same seed and config then
+produce the same values per update regardless of scheduling or sharding, and
+any update can be computed directly - which is what timeline.py precomputes.
+
+A config reload swaps in a new family set (SeriesStore.reload): unchanged
+families are kept as they are, and changed ones carry the state of every
+series whose label set survived over to their new rows, so counters of
+untouched series never reset. Histograms whose buckets changed restart empty.
+
+With a workload section each family is bound to a value model (see
+workload.py) that scales the increments, observation counts and observed
+values above, or steps gauges itself, from load, latency and error signals
+shared across families. Histograms with a rate look up bucket tables of the
+latency-shifted distribution, cached per LATENCY_STEP of log latency.
+
+A store created with a lazy resolution never ticks: its families evaluate
+their series in closed form when sampled (see lazy.py), advancing once per
+resolution step, and settle() writes that state into the arrays for callers
+that read them directly, such as remote write.
+"""
+
+import math
+import threading
+import time
+import zlib
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+from prometheus_client.core import (
+    CounterMetricFamily,
+    GaugeMetricFamily,
+    HistogramMetricFamily,
+)
+from prometheus_client.utils import floatToGoString
+
+from compiler import DEFAULT_BUCKETS, CompiledFamily, CompiledWorkload
+from label_index import LabelIndex
+from lazy import LazyState
+from native_histogram import first_index
+from synthetic import SyntheticLabels, splitmix64, unit_floats
+from workload import Model, bind_model
+
+# Update cadence (min, max seconds) per metric type
+UPDATE_INTERVALS = {
+    "histogram": (2, 5),
+    "counter": (1, 3),
+    "gauge": (2, 4),
+}
+
+# Seconds of observations one batched histogram update represents: the mean
+# update interval, so the configured rate holds on average
+OBSERVATION_WINDOW = sum(UPDATE_INTERVALS["histogram"]) / 2
+# Poisson means from which draws use the normal approximation
+POISSON_NORMAL_MIN = 30.0
+# Resolution (in log latency) of the cached latency-shifted bucket tables
+LATENCY_STEP = 0.02
+
+_GOLDEN = 0x9E3779B97F4A7C15
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+
+def mix64(value: int) -> int:
+    """splitmix64 of one integer."""
+    value = (value + _GOLDEN) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+def stream_key(seed: int, family_key: str) -> int:
+    """Key of a family's per-series streams under a store seed."""
+    return mix64((seed & _MASK64) ^ (zlib.crc32(family_key.encode("utf-8")) << 32))
+
+
+def stream_uniforms(rows: np.ndarray, key: int, update: int) -> np.ndarray:
+    """U[0, 1) for every series row at one update of a seeded stream."""
+    z = rows.astype(np.uint64) * np.uint64(0xD1B54A32D192ED03)
+    z += np.uint64(mix64(key ^ mix64(update)))
+    return unit_floats(splitmix64(z))
+
+
+def poisson_draws(
+    means: np.ndarray, first: np.ndarray, second: np.ndarray
+) -> np.ndarray:
+    """Poisson variates for an array of means from two U[0, 1) arrays.
+
+    Small means invert the CDF (a few vectorized passes over the draws still
+    undecided); large ones use the normal approximation via Box-Muller.
+    """
+    draws = np.zeros(means.shape, dtype=np.int64)
+    flat = draws.reshape(-1)
+    means, first, second = means.reshape(-1), first.reshape(-1), second.reshape(-1)
+
+    large = np.flatnonzero(means >= POISSON_NORMAL_MIN)
+    if large.size:
+        mean = means[large]
+        normal = np.sqrt(-2.0 * np.log1p(-first[large])) * np.cos(
+            2 * np.pi * second[large]
+        )
+        flat[large] = np.maximum(0.0, np.floor(mean + np.sqrt(mean) * normal + 0.5))
+
+    index = np.flatnonzero((means > 0) & (means < POISSON_NORMAL_MIN))
+    mean, u = means[index], first[index]
+    probability = np.exp(-mean)
+    cdf = probability.copy()
+    k = 0
+    while index.size and k < 4 * POISSON_NORMAL_MIN:
+        pending = u >= cdf
+        index, mean, u = index[pending], mean[pending], u[pending]
+        probability, cdf = probability[pending], cdf[pending]
+        k += 1
+        flat[index] = k
+        probability *= mean / k
+        cdf += probability
+    return draws
+
+
+def _normal_cdf(x: np.ndarray) -> np.ndarray:
+    return 0.5 * np.vectorize(math.erfc, otypes=[np.float64])(x / -math.sqrt(2))
+
+
+def lognormal_params(
+    bases: np.ndarray, sigmas: np.ndarray
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Distinct (base, sigma) pairs of a family, and the pair of every series.
+
+    The rows are None when all series share the first pair.
+    """
+    params, rows = np.unique(
+        np.stack([bases, sigmas], axis=1), axis=0, return_inverse=True
+    )
+    return params, None if len(params) == 1 else rows.reshape(-1)
+
+
+def lognormal_table(
+    params: np.ndarray, bounds: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Bucket probabilities and mean observation per bucket of lognormal series.
+
+    Observations have median base and shape sigma, one table row per
+    (base, sigma) row of params; bounds are the ascending upper bucket bounds
+    ending in +Inf. Series with a non-positive base always observe 0.
+    """
+    base, sigma = params[:, :1], params[:, 1:]
+    positive = base > 0
+    mu = np.log(np.where(positive, base, 1.0))
+    log_bounds = np.full(bounds.shape, -np.inf)
+    np.log(bounds, out=log_bounds, where=bounds > 0)
+    z = (log_bounds - mu) / sigma
+    # E[X; X <= b] = exp(mu + sigma^2 / 2) * Phi(z - sigma)
+    partial = np.exp(mu + sigma**2 / 2) * _normal_cdf(z - sigma)
+    probabilities = np.diff(_normal_cdf(z), axis=1, prepend=0.0)
+    mass = np.diff(partial, axis=1, prepend=0.0)
+    means = np.divide(
+        mass, probabilities, out=np.zeros_like(mass), where=probabilities > 0
+    )
+
+    zero = ~positive[:, 0]
+    if zero.any():
+        probabilities[zero] = 0.0
+        means[zero] = 0.0
+        probabilities[zero, np.searchsorted(bounds, 0.0)] = 1.0
+    return probabilities, means
+
+
+def lognormal_buckets(
+    bases: np.ndarray, sigmas: np.ndarray, bounds: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """lognormal_table of a family's series, with the table row of every series."""
+    params, rows = lognormal_params(bases, sigmas)
+    return lognormal_table(params, bounds) + (rows,)
+
+
+class SimulatedClock:
+    """Stands in for time.time() while history or timelines are generated."""
+
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _no_rows() -> Tuple[np.ndarray, np.ndarray]:
+    return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+
+def _match_synthetic(
+    old: SyntheticLabels, new: SyntheticLabels
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Match synthetic rows by a mixed-radix key of their label value ids."""
+    old_keys = np.zeros(old.size, dtype=np.int64)
+    new_keys = np.zeros(new.size, dtype=np.int64)
+    combinations = 1
+    for d, (old_dimension, new_dimension) in enumerate(
+        zip(old.dimensions, new.dimensions)
+    ):
+        ids: Dict[str, int] = {}
+        old_ids = np.array(
+            [
+                ids.setdefault(old.value(d, k), len(ids))
+                for k in range(old_dimension.cardinality)
+            ]
+        )
+        new_ids = np.array(
+            [
+                ids.setdefault(new.value(d, k), len(ids))
+                for k in range(new_dimension.cardinality)
+            ]
+        )
+        combinations *= len(ids)
+        if combinations >= 1 << 62:
+            return _no_rows()
+        old_keys = old_keys * len(ids) + old_ids[old.column(d)]
+        new_keys = new_keys * len(ids) + new_ids[new.column(d)]
+    _, old_rows, new_rows = np.intersect1d(
+        old_keys, new_keys, assume_unique=True, return_indices=True
+    )
+    return old_rows, new_rows
+
+
+def match_rows(
+    old: "SeriesFamily", new: "SeriesFamily"
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Rows of old and new that hold the same label set, as two aligned arrays."""
+    if old.labelnames != new.labelnames:
+        return _no_rows()
+    if old.synthetic is not None and new.synthetic is not None:
+        return _match_synthetic(old.synthetic, new.synthetic)
+    rows = {tuple(labels): i for i, labels in enumerate(new.label_values)}
+    old_rows, new_rows = [], []
+    for i, labels in enumerate(old.label_values):
+        j = rows.get(tuple(labels))
+        if j is not None:
+            old_rows.append(i)
+            new_rows.append(j)
+    return np.array(old_rows, dtype=np.intp), np.array(new_rows, dtype=np.intp)
+
+
+class SeriesFamily:
+    """Mutable state arrays for all series of one compiled metric family."""
+
+    def __init__(
+        self,
+        compiled: CompiledFamily,
+        seed: Optional[int] = None,
+        clock: Callable[[], float] = time.time,
+        workload: Optional[CompiledWorkload] = None,
+    ):
+        self.compiled = compiled
+        self.name = compiled.name
+        self.type = compiled.type
+        self.documentation = compiled.documentation
+        self.labelnames = compiled.labelnames
+        self.size = compiled.size
+        # Wall clock for label churn; backfills substitute simulated time
+        self.clock = clock
+        # Lazily expanded labels for synthetic families, None otherwise
+        self.synthetic: Optional[SyntheticLabels] = None
+        if compiled.synthetic:
+            self.synthetic = SyntheticLabels(compiled, clock())
+            self.label_values = self.synthetic
+        else:
+            self.label_values = compiled.label_values
+        # Exposed sample name; counters always end in _total
+        if self.type == "counter" and not self.name.endswith("_total"):
+            self.sample_name = f"{self.name}_total"
+        else:
+            self.sample_name = self.name
+        # Label postings for filtered views (see label_index.py)
+        names = {self.name, self.sample_name}
+        if self.type == "histogram":
+            names.update(
+                f"{self.name}_{suffix}" for suffix in ("bucket", "count", "sum")
+            )
+        self.index = LabelIndex(sorted(names), self.labelnames, self.label_values)
+        self.created = clock()
+        self.version = 0
+        # Held while updates mutate the state arrays; see read()
+        self.lock = threading.Lock()
+        # Updates applied so far; indexes seeded streams and timeline frames
+        self.updates = 0
+        # Clock reading of the last update, for models that integrate over time
+        self.updated_at: Optional[float] = None
+        # Per-series stream key when seeded, None to use the shared generator
+        self.seed = seed
+        self.stream: Optional[int] = None
+        if seed is not None:
+            self.stream = stream_key(seed, compiled.key)
+            # Global rows, so a shard draws the same values as a single process
+            self.stream_rows = np.arange(
+                compiled.offset, compiled.offset + self.size, dtype=np.uint64
+            )
+        # Precomputed frames replayed instead of generating (see timeline.py)
+        self.timeline = None
+        # Closed-form state evaluated at scrape time (see lazy.py), None when ticking
+        self.lazy: Optional[LazyState] = None
+
+        # Shared, read-only arrays from the compiled table
+        self.bases = compiled.bases
+        self.lower = compiled.lower
+        self.upper = compiled.upper
+
+        if self.type == "gauge":
+            self.values = self.bases.copy()
+        else:
+            # Counter totals, or observation sums for histograms
+            self.values = np.zeros(self.size, dtype=np.float64)
+
+        if self.type == "histogram":
+            bounds = sorted(compiled.buckets or DEFAULT_BUCKETS)
+            if bounds[-1] != np.inf:
+                bounds.append(np.inf)
+            self.bucket_bounds = np.array(bounds, dtype=np.float64)
+            self.bucket_labels = [floatToGoString(b) for b in bounds]
+            self.bucket_counts = np.zeros((self.size, len(bounds)), dtype=np.float64)
+            self.rows = np.arange(self.size)
+
+            # Native families expose only +Inf in classic formats
+            self.native_schema = compiled.native_schema
+            if self.native_schema is not None:
+                self.native_first = first_index(bounds, self.native_schema)
+                self.bucket_labels = ["+Inf"]
+
+            # Batched families draw rate x window observations per update
+            self.batched = compiled.rates is not None
+            if self.batched:
+                self.table_params, self.table_rows = lognormal_params(
+                    self.bases, compiled.sigmas
+                )
+                self.bucket_probabilities, self.bucket_means = lognormal_table(
+                    self.table_params, self.bucket_bounds
+                )
+                self.observations = compiled.rates[:, None] * OBSERVATION_WINDOW
+                # Bucket tables with the median shifted by k x LATENCY_STEP in log
+                self.latency_tables: Dict[int, Tuple[np.ndarray, np.ndarray]] = {
+                    0: (self.bucket_probabilities, self.bucket_means)
+                }
+
+        self.bind(workload)
+
+    def bind(self, workload: Optional[CompiledWorkload]):
+        """Bind the family's value model to a (reloaded) workload section."""
+        self.workload = workload
+        self.model: Model = bind_model(
+            self.compiled, self.label_values, workload, self.seed
+        )
+
+    def _elapsed(self, now: float) -> float:
+        """Seconds since the previous update (the mean cadence for the first)."""
+        if self.updated_at is None:
+            return sum(UPDATE_INTERVALS[self.type]) / 2
+        return max(0.0, now - self.updated_at)
+
+    def _churn(self):
+        """Restart the state of synthetic series whose labels just churned."""
+        with self.lock:
+            rows = self.synthetic.advance(self.clock())
+            if rows is None:
+                return
+            if self.type == "gauge":
+                self.values[rows] = self.bases[rows]
+            else:
+                self.values[rows] = 0.0
+            if self.type == "histogram":
+                self.bucket_counts[rows] = 0.0
+
+    def adopt(self, old: "SeriesFamily") -> int:
+        """Take over the state of every series shared with old; returns how many.
+
+        A histogram whose buckets changed starts over empty, as after a
+        restart: its observations cannot be re-binned, and keeping _sum alone
+        would leave it inconsistent with _count.
+        """
+        self.updates = old.updates
+        self.updated_at = old.updated_at
+        self.version = old.version + 1
+        if self.type == "histogram" and not (
+            self.native_schema == old.native_schema
+            and np.array_equal(self.bucket_bounds, old.bucket_bounds)
+        ):
+            return 0
+        self.created = old.created
+        if self.compiled.same_series(old.compiled):
+            # Only parameters changed: keep the state arrays themselves
+            self.values = old.values
+            if self.type == "histogram":
+                self.bucket_counts = old.bucket_counts
+            if old.synthetic is not None:
+                self.synthetic = self.label_values = old.synthetic
+                self.index = old.index
+            return self.size
+
+        old_rows, new_rows = match_rows(old, self)
+        self.values[new_rows] = old.values[old_rows]
+        if self.type == "histogram":
+            self.bucket_counts[new_rows] = old.bucket_counts[old_rows]
+        return len(new_rows)
+
+    def evaluate_lazily(self, resolution: float, anchor: float):
+        """Evaluate in closed form from now on, starting from the state at anchor."""
+        if self.stream is None:
+            raise ValueError("Scrape-time evaluation needs a seeded store")
+        if self.type == "counter":
+            # The tick updater's mean increment per second
+            rates = self.bases * (0.1 / (sum(UPDATE_INTERVALS["counter"]) / 2))
+        elif self.type == "histogram":
+            if self.batched:
+                rates = np.asarray(self.compiled.rates, dtype=np.float64)
+            else:
+                rates = np.full(self.size, 1.0 / OBSERVATION_WINDOW)
+        else:
+            # The tick updater's mean updates per second
+            rates = np.full(self.size, 1.0 / (sum(UPDATE_INTERVALS["gauge"]) / 2))
+        self.lazy = LazyState(self, rates, resolution, anchor)
+
+    def advance(self, now: float):
+        """Move a lazily evaluated family to the resolution step now falls in."""
+        at = self.lazy.step(now)
+        if self.lazy.at is not None and at <= self.lazy.at:
+            # Values never step back, even if the wall clock does
+            return
+        with self.lock:
+            if self.synthetic is not None:
+                self.synthetic.advance(at)
+            self.lazy.at = at
+            self.version += 1
+
+    def settle(self, now: float):
+        """Write the lazy state of the current step into the state arrays."""
+        self.advance(now)
+        values, counts = self.lazy.evaluate(self.lazy.at)
+        with self.lock:
+            self.values = values
+            if counts is not None:
+                self.bucket_counts = counts
+
+    def sample(
+        self, rows: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """(values, bucket counts) of every series or of rows.
+
+        Counts are None unless the family is a histogram. Lazily evaluated
+        families are evaluated for those rows only, at the step they were
+        last advanced to.
+        """
+        if self.lazy is not None:
+            at = self.lazy.at
+            return self.lazy.evaluate(self.clock() if at is None else at, rows)
+        counts = self.bucket_counts if self.type == "histogram" else None
+        if rows is None:
+            return self.values, counts
+        return self.values[rows], None if counts is None else counts[rows]
+
+    def read(
+        self, rows: Optional[np.ndarray] = None
+    ) -> Tuple[int, np.ndarray, Optional[np.ndarray]]:
+        """(version, values, bucket counts) of sample(), copied from one update.
+
+        For readers off the event loop: the arrays are copied under the lock
+        the updates hold, so the loop waits for a copy at most.
+        """
+        with self.lock:
+            values, counts = self.sample(rows)
+            if rows is None and self.lazy is None:
+                values = values.copy()
+                counts = None if counts is None else counts.copy()
+            return self.version, values, counts
+
+    def _uniform(self, rng: np.random.Generator, low: float, high: float) -> np.ndarray:
+        """One U(low, high) draw per series for the current update."""
+        if self.stream is None:
+            return rng.uniform(low, high, self.size)
+        draws = stream_uniforms(self.stream_rows, self.stream, self.updates)
+        draws *= high - low
+        draws += low
+        return draws
+
+    def _updated(self, now: float):
+        self.updated_at = now
+        self.updates += 1
+        self.version += 1
+
+    def update_counter(self, rng: np.random.Generator):
+        """Accumulate one random increment, scaled by the model, into every counter."""
+        if self.synthetic is not None:
+            self._churn()
+        now = self.clock()
+        increments = self._uniform(rng, 0.5, 1.5)
+        increments *= self.bases
+        increments *= 0.1
+        rates = self.model.rates(now)
+        if rates is not None:
+            increments *= rates
+        with self.lock:
+            self.values += increments
+            self._updated(now)
+
+    def update_gauge(self, rng: np.random.Generator):
+        """Step every gauge with its model and apply its clamp bounds."""
+        if self.synthetic is not None:
+            self._churn()
+        now = self.clock()
+        draws = self._uniform(rng, 0.7, 1.3)
+        with self.lock:
+            self.model.gauge(self.values, self.bases, draws, self._elapsed(now), now)
+            np.clip(self.values, self.lower, self.upper, out=self.values)
+            self._updated(now)
+
+    def _table(self, table: np.ndarray) -> np.ndarray:
+        return table if self.table_rows is None else table[self.table_rows]
+
+    def _latency_table(self, step: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Bucket tables with every median scaled by exp(step x LATENCY_STEP)."""
+        tables = self.latency_tables.get(step)
+        if tables is None:
+            params = self.table_params.copy()
+            params[:, 0] *= math.exp(step * LATENCY_STEP)
+            tables = self.latency_tables[step] = lognormal_table(
+                params, self.bucket_bounds
+            )
+        return tables
+
+    def _bucket_tables(
+        self, levels: Optional[np.ndarray]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Per-series (probabilities, means) at the model's per-scope latency levels."""
+        if levels is None:
+            return self._table(self.bucket_probabilities), self._table(
+                self.bucket_means
+            )
+        steps, scopes = np.unique(
+            np.rint(np.log(levels) / LATENCY_STEP).astype(np.int64), return_inverse=True
+        )
+        tables = [self._latency_table(int(step)) for step in steps.tolist()]
+        probabilities = np.stack([table[0] for table in tables])
+        means = np.stack([table[1] for table in tables])
+        ids = self.model.scopes.ids
+        if ids is None:
+            return self._table(probabilities[scopes[0]]), self._table(means[scopes[0]])
+        scopes = scopes[ids]
+        rows = 0 if self.table_rows is None else self.table_rows
+        return probabilities[scopes, rows], means[scopes, rows]
+
+    def _observe_batch(self, rng: np.random.Generator, now: float) -> np.ndarray:
+        """Fold one window of lognormal observations per series into its buckets."""
+        probabilities, means = self._bucket_tables(self.model.levels(now))
+        expected = self.observations * probabilities
+        rates = self.model.rates(now)
+        if rates is not None:
+            expected *= rates if np.ndim(rates) == 0 else rates[:, None]
+        if self.stream is None:
+            hits = rng.poisson(expected)
+        else:
+            # Two uniforms per (series, bucket), from the series' own stream
+            width = self.bucket_counts.shape[1]
+            counters = self.stream_rows[:, None] * np.uint64(2 * width)
+            counters = counters + np.arange(0, 2 * width, 2, dtype=np.uint64)
+            hits = poisson_draws(
+                expected,
+                stream_uniforms(counters, self.stream, self.updates),
+                stream_uniforms(counters + np.uint64(1), self.stream, self.updates),
+            )
+        sums = np.einsum("ij,ij->i", hits, means)
+        with self.lock:
+            self.bucket_counts += hits
+            self.values += sums
+            self._updated(now)
+        return hits
+
+    def update_histogram(self, rng: np.random.Generator) -> np.ndarray:
+        """Observe values for every series and fold them into the bucket counts.
+
+        Returns the bucket index each series' observation fell into, or for
+        batched families the (series x bucket) matrix of new observations.
+        """
+        if self.synthetic is not None:
+            self._churn()
+        now = self.clock()
+        if self.batched:
+            return self._observe_batch(rng, now)
+        observations = self._uniform(rng, 0.8, 1.2)
+        observations *= self.bases
+        levels = self.model.levels(now)
+        if levels is not None:
+            observations *= self.model.scopes.per_series(levels)
+        buckets = np.searchsorted(self.bucket_bounds, observations, side="left")
+        with self.lock:
+            self.bucket_counts[self.rows, buckets] += 1
+            self.values += observations
+            self._updated(now)
+        return buckets
+
+    def replay(self):
+        """Step to the next frame of the attached timeline.
+
+        Values become a read-only view of the mapped frame; histograms only
+        add each series' recorded bucket hit (or hit counts, when batched).
+        When the timeline wraps, state restarts from its first frame, which
+        looks like an exporter restart.
+        Churning labels keep turning over on wall-clock time, but their series
+        continue with the timeline's values.
+        """
+        frame = self.updates % self.timeline.frames
+        with self.lock:
+            if frame == 0 and self.type == "histogram":
+                self.bucket_counts[:] = 0.0
+            self.values = self.timeline.values[frame]
+            if self.type == "histogram":
+                hits = self.timeline.buckets[frame]
+                if hits.ndim == 2:
+                    self.bucket_counts += hits
+                else:
+                    self.bucket_counts[self.rows, hits] += 1
+            if self.synthetic is not None:
+                self.synthetic.advance(self.clock())
+            self.updates += 1
+            self.version += 1
+
+    def classic_counts(self, counts: Optional[np.ndarray] = None) -> np.ndarray:
+        """Per-series counts of the buckets in bucket_labels (not cumulative).
+
+        Of the state's bucket counts, or of counts from sample(). A native
+        histogram has no classic buckets; text formats and plain remote-write
+        samples show it as its +Inf bucket, _count and _sum.
+        """
+        counts = self.bucket_counts if counts is None else counts
+        if self.native_schema is None:
+            return counts
+        return counts.sum(axis=1, keepdims=True)
+
+    def collect(self):
+        """Build the prometheus_client metric family for this state."""
+        values, counts = self.sample()
+        if self.type == "counter":
+            family = CounterMetricFamily(
+                self.name, self.documentation, labels=self.labelnames
+            )
+            for labels, value in zip(self.label_values, values.tolist()):
+                family.add_metric(labels, value)
+        elif self.type == "gauge":
+            family = GaugeMetricFamily(
+                self.name, self.documentation, labels=self.labelnames
+            )
+            for labels, value in zip(self.label_values, values.tolist()):
+                family.add_metric(labels, value)
+        else:
+            family = HistogramMetricFamily(
+                self.name, self.documentation, labels=self.labelnames
+            )
+            cumulative = np.cumsum(self.classic_counts(counts), axis=1).tolist()
+            for labels, counts, total in zip(
+                self.label_values, cumulative, values.tolist()
+            ):
+                family.add_metric(labels, list(zip(self.bucket_labels, counts)), total)
+        return family
+
+
+class SeriesStore:
+    """Collection of series families.
+
+    Unseeded, they share one random generator; with a seed every series gets
+    its own reproducible stream. Families are bound to the store's workload.
+    With lazy_resolution (seconds, seeded stores only) families are
+    evaluated at scrape time instead of updated by ticks.
+    """
+
+    def __init__(
+        self,
+        seed: Optional[int] = None,
+        workload: Optional[CompiledWorkload] = None,
+        lazy_resolution: Optional[float] = None,
+    ):
+        if lazy_resolution is not None and seed is None:
+            raise ValueError("Scrape-time evaluation needs a seed")
+        self.seed = seed
+        self.workload = workload
+        self.lazy_resolution = lazy_resolution
+        self.rng = np.random.default_rng(seed)
+        self.families: Dict[str, SeriesFamily] = {}
+
+    def add_family(self, compiled: CompiledFamily) -> SeriesFamily:
+        """Create the state arrays for a compiled metric family."""
+        family = SeriesFamily(compiled, self.seed, workload=self.workload)
+        if self.lazy_resolution is not None:
+            family.evaluate_lazily(self.lazy_resolution, family.created)
+        self.families[compiled.key] = family
+        return family
+
+    def advance(self, now: Optional[float] = None):
+        """Move lazily evaluated families to the current step (no-op when ticking)."""
+        if self.lazy_resolution is None:
+            return
+        now = time.time() if now is None else now
+        for family in list(self.families.values()):
+            family.advance(now)
+
+    def settle(self, now: Optional[float] = None):
+        """Write the current step of lazily evaluated families into their arrays."""
+        if self.lazy_resolution is None:
+            return
+        now = time.time() if now is None else now
+        for family in list(self.families.values()):
+            family.settle(now)
+
+    def reload(
+        self,
+        families: Sequence[CompiledFamily],
+        unchanged: Iterable[str],
+        workload: Optional[CompiledWorkload] = None,
+    ) -> Dict[str, int]:
+        """Swap in a new family set, keeping the state of surviving series.
+
+        Families named in unchanged are reused as they are (rebound if the
+        workload changed), so the cost is proportional to the changed
+        families only. The dict is replaced, not mutated, so a render running
+        concurrently sees either set whole. Returns the number of series
+        kept, added and removed.
+
+        Lazily evaluated families that change or are rebound restart their
+        evaluation at the current step from the values they had there.
+        """
+        rebind = workload != self.workload
+        self.workload = workload
+        unchanged = set(unchanged)
+        current = self.families
+        reloaded: Dict[str, SeriesFamily] = {}
+        kept = 0
+        now = time.time()
+        for compiled in families:
+            old = current.get(compiled.key)
+            if (
+                old is not None
+                and old.lazy is not None
+                and (rebind or compiled.key not in unchanged)
+            ):
+                old.settle(now)
+            if compiled.key in unchanged:
+                if rebind:
+                    old.bind(workload)
+                    if old.lazy is not None:
+                        old.evaluate_lazily(old.lazy.resolution, old.lazy.at)
+                reloaded[compiled.key] = old
+                kept += old.size
+                continue
+            family = SeriesFamily(compiled, self.seed, workload=workload)
+            if old is not None:
+                kept += family.adopt(old)
+            if self.lazy_resolution is not None:
+                family.evaluate_lazily(
+                    self.lazy_resolution, now if old is None else old.lazy.at
+                )
+            reloaded[compiled.key] = family
+        self.families = reloaded
+        return {
+            "kept": kept,
+            "added": sum(family.size for family in reloaded.values()) - kept,
+            "removed": sum(family.size for family in current.values()) - kept,
+        }
+
+    def series_count(self) -> int:
+        """Total number of series across all families."""
+        return sum(family.size for family in self.families.values())
+
+    def churned_series(self) -> int:
+        """Series replaced by label churn since startup."""
+        return sum(
+            family.synthetic.churned_series
+            for family in self.families.values()
+            if family.synthetic is not None
+        )
+
+    def describe(self) -> Iterable:
+        # Skip the collect() call prometheus_client makes on registration
+        return []
+
+    def collect(self) -> Iterable:
+        """Yield every family for the prometheus_client registry."""
+        for family in self.families.values():
+            yield family.collect()
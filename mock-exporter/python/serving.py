@@ -0,0 +1,280 @@
+"""
+Tuned Serving for Many Scrapers
+
+How one exporter process stays responsive when hundreds of scrapers hit
+/metrics every few seconds. SERVE_PROFILE=tuned (the default) applies:
+
+- event loop and HTTP parser: uvloop and httptools when installed (they come
+  with uvicorn[standard]), asyncio and h11 otherwise;
+- keep-alive: idle connections are kept SERVE_KEEPALIVE_TIMEOUT seconds,
+  longer than a scrape interval, so each scraper reuses one connection
+  instead of reconnecting for every scrape;
+- connection cap: beyond SERVE_MAX_CONNECTIONS open connections uvicorn
+  answers new requests with a bare 503 (its limit_concurrency);
+- access log: /metrics requests are not logged unless METRICS_ACCESS_LOG is
+  set, the other endpoints still are;
+- scrape admission: at most METRICS_MAX_INFLIGHT scrapes are served at once
+  and up to METRICS_MAX_QUEUED more wait up to METRICS_QUEUE_TIMEOUT seconds
+  for a slot. Anything beyond that, and every scrape while the event loop
+  lags by more than METRICS_MAX_LOOP_LAG seconds, is answered right away with
+  503 and Retry-After: METRICS_RETRY_AFTER. A rejection costs microseconds,
+  so overload sheds scrapes instead of building up loop lag that would delay
+  every scrape and the updaters with them.
+
+SERVE_PROFILE=default keeps uvicorn's defaults: every request is logged and
+nothing is capped. uvicorn speaks HTTP/1.1 only; Prometheus and vmagent
+scrape plain-HTTP targets over HTTP/1.1 anyway, and keep-alive is what saves
+them a connection per scrape.
+"""
+
+import asyncio
+import importlib.util
+import logging
+import os
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from fastapi.responses import PlainTextResponse
+
+from instrumentation import EVENT_LOOP_LAG, SCRAPES_QUEUED, SCRAPES_REJECTED
+
+PROFILES = ("tuned", "default")
+# How often the loop lag probe wakes up
+LAG_PROBE_INTERVAL = 0.1
+# Paths whose requests the tuned access log skips
+QUIET_PATHS = ("/metrics",)
+
+
+def serve_profile() -> str:
+    """SERVE_PROFILE, validated."""
+    profile = os.getenv("SERVE_PROFILE", "tuned")
+    if profile not in PROFILES:
+        raise ValueError(
+            f"SERVE_PROFILE must be one of {', '.join(PROFILES)}, got {profile!r}"
+        )
+    return profile
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def server_stack(loop: str = "auto", http: str = "auto") -> Dict[str, str]:
+    """The event loop and HTTP implementation uvicorn picks for these settings."""
+    if loop == "auto":
+        loop = "uvloop" if _installed("uvloop") else "asyncio"
+    if http == "auto":
+        http = "httptools" if _installed("httptools") else "h11"
+    return {"loop": loop, "http": http}
+
+
+def uvicorn_options() -> Dict[str, Any]:
+    """uvicorn.run() settings of the SERVE_* environment variables."""
+    options: Dict[str, Any] = {
+        "loop": os.getenv("SERVE_LOOP", "auto"),
+        "http": os.getenv("SERVE_HTTP", "auto"),
+        "access_log": True,
+    }
+    if serve_profile() == "tuned":
+        max_connections = int(os.getenv("SERVE_MAX_CONNECTIONS", "2048"))
+        options["limit_concurrency"] = max_connections or None
+        options["timeout_keep_alive"] = int(os.getenv("SERVE_KEEPALIVE_TIMEOUT", "75"))
+        options["backlog"] = int(os.getenv("SERVE_BACKLOG", "2048"))
+    return options
+
+
+class QuietPathsFilter(logging.Filter):
+    """Drops uvicorn access log records of the given path prefixes."""
+
+    def __init__(self, paths=QUIET_PATHS):
+        super().__init__()
+        self.paths = tuple(paths)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # uvicorn.access args: (client, method, path with query, version, status)
+        args = record.args
+        if not isinstance(args, tuple) or len(args) < 3:
+            return True
+        path = str(args[2]).split("?", 1)[0]
+        return not any(
+            path == prefix or path.startswith(prefix + "/") for prefix in self.paths
+        )
+
+
+def quiet_access_log():
+    """Stop logging /metrics requests on uvicorn's access logger, once."""
+    access = logging.getLogger("uvicorn.access")
+    if not any(isinstance(f, QuietPathsFilter) for f in access.filters):
+        access.addFilter(QuietPathsFilter())
+
+
+class LoopLagProbe:
+    """Measures how late the event loop runs a callback that is due now.
+
+    lag() also counts the time the next probe is overdue, so a loop that is
+    blocked right now reads as lagging before the probe itself gets to run.
+    Every probe is recorded in EVENT_LOOP_LAG.
+    """
+
+    def __init__(self, interval: float = LAG_PROBE_INTERVAL):
+        self.interval = interval
+        self.last = 0.0
+        self.max = 0.0
+        self._due: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._due = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, loop.time() - self._due)
+            self.max = max(self.max, self.last)
+            EVENT_LOOP_LAG.observe(self.last)
+
+    def lag(self) -> float:
+        if self._due is None:
+            return self.last
+        return max(self.last, asyncio.get_running_loop().time() - self._due)
+
+
+class ScrapeAdmission:
+    """Caps concurrent /metrics scrapes and sheds the excess with 503.
+
+    acquire() admits a scrape (None) or says why it was rejected; every
+    admitted scrape must release() its slot once its response is sent. Slots
+    are handed to queued scrapes in arrival order.
+    """
+
+    def __init__(
+        self,
+        max_inflight: int = 64,
+        max_queued: int = 256,
+        queue_timeout: float = 1.0,
+        max_loop_lag: float = 0.5,
+        retry_after: int = 1,
+        probe: Optional[LoopLagProbe] = None,
+    ):
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.max_loop_lag = max_loop_lag
+        self.retry_after = retry_after
+        self.probe = probe
+        self.inflight = 0
+        self.admitted = 0
+        self.queued_total = 0
+        self.rejected: Dict[str, int] = {
+            "loop_lag": 0,
+            "queue_full": 0,
+            "queue_timeout": 0,
+        }
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> Optional[str]:
+        if (
+            self.max_loop_lag > 0
+            and self.probe is not None
+            and self.probe.lag() > self.max_loop_lag
+        ):
+            return self._reject("loop_lag")
+        if self.inflight < self.max_inflight and not self._waiters:
+            self.inflight += 1
+            self.admitted += 1
+            return None
+        if len(self._waiters) >= self.max_queued:
+            return self._reject("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued_total += 1
+        SCRAPES_QUEUED.inc()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            return self._reject("queue_timeout")
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # Handed a slot just as the scrape was cancelled
+                self.release()
+            raise
+        finally:
+            SCRAPES_QUEUED.dec()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+        # release() passed its slot on without freeing it
+        self.admitted += 1
+        return None
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.inflight -= 1
+
+    def _reject(self, reason: str) -> str:
+        self.rejected[reason] += 1
+        SCRAPES_REJECTED.labels(reason=reason).inc()
+        return reason
+
+    def overloaded(self, reason: str) -> PlainTextResponse:
+        """The 503 answering a rejected scrape."""
+        return PlainTextResponse(
+            f"Exporter overloaded ({reason}), retry in {self.retry_after}s\n",
+            status_code=503,
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_inflight": self.max_inflight,
+            "max_queued": self.max_queued,
+            "inflight": self.inflight,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "queued_total": self.queued_total,
+            "rejected": dict(self.rejected),
+        }
+
+
+def create_admission(probe: Optional[LoopLagProbe]) -> Optional[ScrapeAdmission]:
+    """Build scrape admission from METRICS_* environment variables.
+
+    Returns None under SERVE_PROFILE=default or with METRICS_MAX_INFLIGHT=0.
+    """
+    if serve_profile() != "tuned":
+        return None
+    max_inflight = int(os.getenv("METRICS_MAX_INFLIGHT", "64"))
+    if max_inflight <= 0:
+        return None
+    return ScrapeAdmission(
+        max_inflight=max_inflight,
+        max_queued=int(os.getenv("METRICS_MAX_QUEUED", "256")),
+        queue_timeout=float(os.getenv("METRICS_QUEUE_TIMEOUT", "1")),
+        max_loop_lag=float(os.getenv("METRICS_MAX_LOOP_LAG", "0.5")),
+        retry_after=int(os.getenv("METRICS_RETRY_AFTER", "1")),
+        probe=probe,
+    )
+
+
+def access_log_quieted() -> bool:
+    """Whether /metrics requests are left out of the access log."""
+    if serve_profile() != "tuned":
+        return False
+    return os.getenv("METRICS_ACCESS_LOG", "false").lower() in ("0", "false", "no")
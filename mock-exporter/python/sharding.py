@@ -0,0 +1,480 @@
+"""
+Multi-Process Sharded Exporter
+
+Spreads series generation and rendering over several worker processes so one
+container can use every core. The compiled series table is split row-wise
+(see CompiledConfig.shard): every worker owns a contiguous slice of each
+family, runs its own updaters and remote-write pusher, and renders its slice.
+
+A scrape of the front process asks all workers to render at once, in the
+negotiated format. Each worker publishes its per-family blocks into a snapshot
+file per format on tmpfs (/dev/shm), replaced atomically, and the front maps
+those files and stitches the blocks family by family - one header, then every
+shard's samples in shard order - without parsing anything. Protobuf families
+get their length prefix after stitching, since it covers every shard's
+metrics:
+
+    [magic "MXS1"][sequence u64][index length u32][index JSON][blocks...]
+
+The index lists (family key, header length, block length) in block order.
+A worker only bumps its sequence when something it owns changed, so the front
+can keep serving (and 304-ing) the same stitched snapshot until one does.
+Filtered views are rendered the same way: the front passes the view key
+with the render request, and each worker answers it from its own label
+indexes into a snapshot file per format and view.
+The same pipe carries config reloads: the front forwards them to every worker,
+which re-shards the new config and applies its own diff.
+
+A worker says "ready" once its series are registered. One that dies, closes
+its pipe or misses the render timeout is restarted on a new pipe, and scrapes
+are answered with 503 (and /healthz reports not ready) until it is back.
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from prometheus_client import REGISTRY, CollectorRegistry
+
+from compiler import CompiledFamily
+from exposition import (
+    FORMAT_PREFERENCE,
+    MAX_VIEWS,
+    OPENMETRICS_EOF,
+    ExpositionCache,
+    Snapshot,
+)
+from instrumentation import SHARD_RESTARTS
+from label_index import View
+from protowire import encode_varint
+from series_store import SeriesStore
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"MXS1"
+SNAPSHOT_HEADER = struct.Struct("<4sQI")
+
+
+# Snapshots kept per worker: every format of the full exposition and of the
+# views the front still caches
+MAX_SNAPSHOTS = (MAX_VIEWS + 1) * len(FORMAT_PREFERENCE)
+
+
+def snapshot_file(path: str, fmt: str, view: Optional[View] = None) -> str:
+    """A worker's snapshot file of one exposition format (and view)."""
+    if view is None:
+        return f"{path}.{fmt}"
+    return f"{path}.{fmt}.{hashlib.sha1(view.key.encode('utf-8')).hexdigest()[:16]}"
+
+
+def write_shard_snapshot(
+    path: str, sequence: int, blocks: Sequence[Tuple[str, int, bytes]]
+):
+    """Atomically replace a shard snapshot file with new family blocks."""
+    index = json.dumps(
+        [[key, header_size, len(block)] for key, header_size, block in blocks]
+    )
+    index_bytes = index.encode("utf-8")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, sequence, len(index_bytes)))
+        f.write(index_bytes)
+        for _, _, block in blocks:
+            f.write(block)
+    os.replace(tmp_path, path)
+
+
+class ShardSnapshot:
+    """A mapped shard snapshot file and views of its family blocks."""
+
+    def __init__(self, path: str, epoch: int = 0):
+        # Restarts of the worker that wrote it: sequences start over on restart
+        self.epoch = epoch
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.sequence, index_size = SNAPSHOT_HEADER.unpack_from(self.mm, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a shard snapshot")
+        offset = SNAPSHOT_HEADER.size
+        index = json.loads(self.mm[offset : offset + index_size])
+        offset += index_size
+
+        view = memoryview(self.mm)
+        # family key -> (header, sample lines)
+        self.blocks: Dict[str, Tuple[memoryview, memoryview]] = {}
+        for key, header_size, size in index:
+            self.blocks[key] = (
+                view[offset : offset + header_size],
+                view[offset + header_size : offset + size],
+            )
+            offset += size
+
+
+class ShardPublisher:
+    """Worker side: renders the local store and publishes it for the front."""
+
+    def __init__(self, store: SeriesStore, path: str):
+        self.store = store
+        self.path = path
+        self.sequence = 0
+        # Renders family blocks; its filtered caches serve the views
+        self.cache = ExpositionCache(store, registry=CollectorRegistry())
+        # snapshot file -> (family versions, sequence) of its last publish
+        self._published: "OrderedDict[str, Tuple[tuple, int]]" = OrderedDict()
+
+    def publish(self, fmt: str = "text", view: Optional[View] = None) -> int:
+        """Render changed families and replace the format's (and view's) snapshot."""
+        cache = self.cache if view is None else self.cache.filtered(view)
+        self.store.advance()
+        selected = cache.selected_families()
+        versions = tuple((id(family), family.version) for _, family, _ in selected)
+        path = snapshot_file(self.path, fmt, view)
+        published = self._published.get(path)
+        if published is None or published[0] != versions:
+            self.sequence += 1
+            blocks = []
+            for key, family, rows in selected:
+                renderer = cache.renderer(key, family, rows)
+                block = renderer.render(fmt)
+                blocks.append((key, len(renderer.headers[fmt]), block))
+            cache.prune()
+            write_shard_snapshot(path, self.sequence, blocks)
+            published = self._published[path] = (versions, self.sequence)
+        self._published.move_to_end(path)
+        while len(self._published) > MAX_SNAPSHOTS:
+            stale, _ = self._published.popitem(last=False)
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+        return published[1]
+
+
+class ShardUnavailable(RuntimeError):
+    """A shard worker is starting or being restarted, so its series are missing."""
+
+
+class ShardPool:
+    """Front side: spawns the shard workers and collects their renders.
+
+    A worker that exits, closes its pipe or does not answer within
+    render_timeout is restarted on a fresh pipe, so a late reply can never be
+    taken for the answer to a later request. Until the new worker reports
+    ready, render() raises ShardUnavailable instead of serving a partial
+    exposition.
+    """
+
+    def __init__(
+        self,
+        count: int,
+        target: Callable[[int, int, Any, str], None],
+        render_timeout: float = 30.0,
+        restart_delay: float = 1.0,
+    ):
+        self.count = count
+        self.target = target
+        self.render_timeout = render_timeout
+        self.restart_delay = restart_delay
+        shm = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        self.directory = tempfile.mkdtemp(prefix="mock-exporter-shards-", dir=shm)
+        self.processes: List[Optional[multiprocessing.process.BaseProcess]] = [
+            None
+        ] * count
+        self.connections: List[Any] = [None] * count
+        # "starting" until a worker sends "ready" after registering its series
+        self.states: List[str] = ["stopped"] * count
+        self.restarts: List[int] = [0] * count
+        # Workers that were starting during a reload and may have read the old config
+        self.stale: List[bool] = [False] * count
+        self.spawned: List[float] = [0.0] * count
+        # snapshot file name -> mapped snapshot per shard
+        self.snapshots: "OrderedDict[str, List[Optional[ShardSnapshot]]]" = (
+            OrderedDict()
+        )
+        self.worker_stats: List[Dict[str, Any]] = [{} for _ in range(count)]
+        self.worker_histograms: List[Dict[str, Any]] = [{} for _ in range(count)]
+        self._lock = threading.Lock()
+
+    def snapshot_path(self, index: int) -> str:
+        return os.path.join(self.directory, f"shard-{index}.snap")
+
+    def start(self):
+        """Spawn one worker process per shard."""
+        for index in range(self.count):
+            self._spawn(index)
+        logger.info(
+            f"Started {self.count} shard workers, snapshots in {self.directory}"
+        )
+
+    def wait_ready(self, poll_interval: float = 0.05):
+        """Block until every worker has registered its series; raise if one exits."""
+        while True:
+            with self._lock:
+                for index in range(self.count):
+                    process = self.processes[index]
+                    if not process.is_alive():
+                        raise RuntimeError(
+                            f"Shard {index} exited with code {process.exitcode} "
+                            "while starting"
+                        )
+                    self._poll_ready(index)
+                if all(state == "ready" for state in self.states):
+                    return
+            time.sleep(poll_interval)
+
+    def _spawn(self, index: int):
+        context = multiprocessing.get_context("spawn")
+        parent, child = context.Pipe()
+        process = context.Process(
+            target=self.target,
+            args=(index, self.count, child, self.snapshot_path(index)),
+            name=f"mock-exporter-shard-{index}",
+            daemon=True,
+        )
+        process.start()
+        child.close()
+        self.processes[index] = process
+        self.connections[index] = parent
+        self.states[index] = "starting"
+        self.spawned[index] = time.monotonic()
+        # The new worker numbers its snapshots from scratch
+        for snapshots in self.snapshots.values():
+            snapshots[index] = None
+        self.worker_stats[index] = {}
+        self.worker_histograms[index] = {}
+
+    def _restart(self, index: int, reason: str, detail: str):
+        """Replace a failed worker, discarding its pipe and anything still in it."""
+        logger.warning(f"Restarting shard {index} ({reason}): {detail}")
+        SHARD_RESTARTS.labels(reason=reason).inc()
+        self.restarts[index] += 1
+        self.connections[index].close()
+        process = self.processes[index]
+        if process.is_alive():
+            process.terminate()
+            # A hung or stopped worker may never get to handle SIGTERM
+            process.join(timeout=1)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        self._spawn(index)
+
+    def _poll_ready(self, index: int):
+        """Take a starting worker's ready message if it has arrived."""
+        connection = self.connections[index]
+        if self.states[index] != "starting" or not connection.poll(0):
+            return
+        message = connection.recv()
+        if message != "ready":
+            raise RuntimeError(f"Shard {index} sent {message!r} instead of ready")
+        self.states[index] = "ready"
+        if self.stale[index]:
+            self.stale[index] = False
+            self._exchange("reload", [index])
+
+    def _refresh(self) -> List[int]:
+        """Restart dead workers and take ready messages; returns shards not ready."""
+        unavailable = []
+        for index in range(self.count):
+            process = self.processes[index]
+            if not process.is_alive():
+                if time.monotonic() - self.spawned[index] >= self.restart_delay:
+                    self._restart(index, "exited", f"exit code {process.exitcode}")
+            else:
+                try:
+                    self._poll_ready(index)
+                except (EOFError, OSError) as e:
+                    self._restart(index, "disconnected", str(e) or type(e).__name__)
+            if self.states[index] != "ready":
+                unavailable.append(index)
+        return unavailable
+
+    def refresh(self) -> bool:
+        """Recover failed workers unless an exchange runs; whether all are ready."""
+        if self._lock.acquire(blocking=False):
+            try:
+                self._refresh()
+            finally:
+                self._lock.release()
+        return self.ready()
+
+    def ready(self) -> bool:
+        """Whether every worker is alive and serving its series."""
+        return all(
+            state == "ready" and process is not None and process.is_alive()
+            for state, process in zip(self.states, self.processes)
+        )
+
+    def _exchange(
+        self, request: str, indexes: Sequence[int]
+    ) -> Dict[int, Dict[str, Any]]:
+        """Send a request to some workers and collect every reply that arrives.
+
+        All replies are read even when one worker fails, and a failed worker
+        is restarted, so no pipe is left holding an unread reply.
+        """
+        failed: Dict[int, Tuple[str, str]] = {}
+        for index in indexes:
+            try:
+                self.connections[index].send(request)
+            except OSError as e:
+                failed[index] = ("disconnected", str(e) or type(e).__name__)
+        replies = {}
+        deadline = time.monotonic() + self.render_timeout
+        for index in indexes:
+            if index in failed:
+                continue
+            connection = self.connections[index]
+            try:
+                if not connection.poll(max(0.0, deadline - time.monotonic())):
+                    failed[index] = (
+                        "timeout",
+                        f"no answer to {request!r} within {self.render_timeout}s",
+                    )
+                    continue
+                replies[index] = connection.recv()
+            except (EOFError, OSError) as e:
+                failed[index] = ("disconnected", str(e) or type(e).__name__)
+        for index, (reason, detail) in failed.items():
+            self._restart(index, reason, detail)
+        return replies
+
+    def command(self, request: str) -> List[Dict[str, Any]]:
+        """Send a request (e.g. "reload") to every ready worker and collect the replies.
+
+        A worker that is still starting may have read the config before a
+        reload; it is sent the reload as soon as it is ready.
+        """
+        with self._lock:
+            ready = [
+                index for index in range(self.count) if index not in self._refresh()
+            ]
+            if request == "reload":
+                for index in range(self.count):
+                    if index not in ready:
+                        self.stale[index] = True
+            return list(self._exchange(request, ready).values())
+
+    def render(
+        self, fmt: str = "text", view: Optional[View] = None
+    ) -> List[ShardSnapshot]:
+        """Have every worker render at once and map the snapshots that changed."""
+        request = f"render {fmt}" if view is None else f"render {fmt} {view.key}"
+        name = snapshot_file("", fmt, view)
+        with self._lock:
+            unavailable = self._refresh()
+            if unavailable:
+                raise ShardUnavailable(f"Shards {unavailable} are not ready")
+            snapshots = self.snapshots.setdefault(name, [None] * self.count)
+            self.snapshots.move_to_end(name)
+            while len(self.snapshots) > MAX_SNAPSHOTS:
+                self.snapshots.popitem(last=False)
+            replies = self._exchange(request, range(self.count))
+            if len(replies) < self.count:
+                missing = sorted(set(range(self.count)) - set(replies))
+                raise ShardUnavailable(f"Shards {missing} failed and are restarting")
+            for index, reply in replies.items():
+                self.worker_histograms[index] = reply.pop("histograms", {})
+                self.worker_stats[index] = reply
+                current = snapshots[index]
+                if current is None or current.sequence != reply["sequence"]:
+                    path = snapshot_file(self.snapshot_path(index), fmt, view)
+                    snapshots[index] = ShardSnapshot(path, self.restarts[index])
+            return list(snapshots)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Last stats reported by each worker, plus whether it is alive and ready."""
+        return [
+            dict(
+                self.worker_stats[index],
+                shard=index,
+                pid=process.pid if process is not None else None,
+                alive=process is not None and process.is_alive(),
+                state=self.states[index],
+                restarts=self.restarts[index],
+            )
+            for index, process in enumerate(self.processes)
+        ]
+
+    def histograms(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """Last self-instrumentation histogram states reported by each worker."""
+        return list(enumerate(self.worker_histograms))
+
+    def stop(self):
+        """Stop the workers and remove their snapshot files."""
+        for connection in self.connections:
+            try:
+                connection.send("stop")
+            except (AttributeError, OSError):
+                pass
+        for process in self.processes:
+            if process is None:
+                continue
+            process.join(timeout=10)
+            if process.is_alive():
+                logger.warning(f"Terminating unresponsive {process.name}")
+                process.terminate()
+        self.states = ["stopped"] * self.count
+        self.snapshots.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class ShardedExposition(ExpositionCache):
+    """Serves /metrics by stitching the shard workers' family blocks."""
+
+    formats = FORMAT_PREFERENCE
+
+    def __init__(
+        self,
+        pool: ShardPool,
+        families: Sequence[CompiledFamily],
+        registry: CollectorRegistry = REGISTRY,
+        registry_ttl: float = 1.0,
+        view: Optional[View] = None,
+    ):
+        super().__init__(SeriesStore(), registry, registry_ttl, view)
+        self.pool = pool
+        # Family order of the stitched output; updated in place on reload
+        self.keys = [family.key for family in families]
+
+    def _view_cache(self, view: View) -> "ShardedExposition":
+        cache = ShardedExposition(self.pool, (), self.registry, self.registry_ttl, view)
+        cache.keys = self.keys
+        cache._lock = self._lock
+        return cache
+
+    def _render(self, fmt: str) -> Snapshot:
+        snapshots = self.pool.render(fmt, self.view)
+        # Keyed on the shards' family blocks only, as in ExpositionCache
+        key = tuple((snapshot.epoch, snapshot.sequence) for snapshot in snapshots)
+        cached = self._cached(fmt, key)
+        if cached is not None:
+            return cached
+
+        _, registry_block = self._registry_block(fmt)
+        parts = [registry_block]
+        for family_key in self.keys:
+            family_parts = []
+            for snapshot in snapshots:
+                block = snapshot.blocks.get(family_key)
+                if block is None:
+                    continue
+                if not family_parts:
+                    family_parts.append(block[0])
+                family_parts.append(block[1])
+            if fmt == "protobuf" and family_parts:
+                parts.append(encode_varint(sum(len(part) for part in family_parts)))
+            parts.extend(family_parts)
+        if fmt == "openmetrics":
+            parts.append(OPENMETRICS_EOF)
+        return self._publish(fmt, parts, key)
@@ -0,0 +1,256 @@
+"""
+Synthetic Series Expansion
+
+Expands a synthetic family (see compiler.py) into its series without keeping
+a label dict, tuple or string per series in Python. Series i is identified by
+its row in the state arrays; its value for each dimension is derived on demand:
+
+- product dimensions: mixed-radix digits of i, so the family enumerates the
+  cartesian product of their values;
+- zipf dimensions: a per-series value index drawn once from a Zipf
+  distribution with a counter-based hash of the row, seeded from the family
+  and dimension name, so the same config yields the same series after a
+  restart or in any shard (4 bytes per series);
+- churning dimensions: every value carries a generation suffix
+  ("pod-7-2d1a4f"); value k moves to the next generation at
+  (t + k * interval / cardinality) // interval, so the values turn over
+  evenly spread in time and the family churns size / interval series per
+  second. Rows whose labels changed are reported so their state can restart
+  from zero, exactly like a brand-new series.
+
+Renderers turn a family into one label fragment per dimension value and join
+fragments per series with vectorized object-array concatenation, so the
+per-series cost is a few transient strings during a render or push, not
+resident memory.
+"""
+
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from compiler import CompiledDimension, CompiledFamily
+
+_MASK53 = np.uint64((1 << 53) - 1)
+
+
+def splitmix64(z: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer over a uint64 array (modified in place)."""
+    z += np.uint64(0x9E3779B97F4A7C15)
+    z ^= z >> np.uint64(30)
+    z *= np.uint64(0xBF58476D1CE4E5B9)
+    z ^= z >> np.uint64(27)
+    z *= np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    return z
+
+
+def unit_floats(z: np.ndarray) -> np.ndarray:
+    """Map uint64 hashes to U[0, 1) using their top 53 bits."""
+    return ((z >> np.uint64(11)) & _MASK53).astype(np.float64) * (1.0 / (1 << 53))
+
+
+def row_uniforms(rows: np.ndarray, seed: int) -> np.ndarray:
+    """Deterministic U[0, 1) per row (splitmix64 of seed and row)."""
+    z = rows.astype(np.uint64) + np.uint64((seed << 32) & 0xFFFFFFFFFFFFFFFF)
+    return unit_floats(splitmix64(z))
+
+
+def format_generation(generation: int) -> str:
+    """Short, stable suffix for a churn generation."""
+    return format(generation, "x")
+
+
+class SyntheticLabels:
+    """Lazily expanded label values for all series of a synthetic family.
+
+    Behaves like the tuple of label-value tuples a static family has
+    (len, indexing, iteration), but generates each tuple on access.
+    """
+
+    def __init__(self, compiled: CompiledFamily, now: Optional[float] = None):
+        self.labelnames = compiled.labelnames
+        self.dimensions: Tuple[CompiledDimension, ...] = compiled.dimensions
+        self.size = compiled.size
+        self.offset = compiled.offset
+        self.version = 0
+        self.churned_series = 0
+
+        # Stride of each product dimension in the mixed-radix row index
+        self.strides: List[int] = []
+        stride = 1
+        for dimension in reversed(self.dimensions):
+            if dimension.distribution == "product":
+                self.strides.insert(0, stride)
+                stride *= dimension.cardinality
+            else:
+                self.strides.insert(0, 0)
+
+        self.assigned: Dict[int, np.ndarray] = {}
+        for d, dimension in enumerate(self.dimensions):
+            if dimension.distribution == "zipf":
+                self.assigned[d] = self._zipf_column(compiled.key, dimension)
+
+        now = time.time() if now is None else now
+        self.generations: Dict[int, np.ndarray] = {
+            d: self._generations(dimension, now)
+            for d, dimension in enumerate(self.dimensions)
+            if dimension.churn_interval > 0
+        }
+
+    def _zipf_column(self, key: str, dimension: CompiledDimension) -> np.ndarray:
+        seed = zlib.crc32(f"{key}/{dimension.name}".encode("utf-8"))
+        weights = (
+            np.arange(1, dimension.cardinality + 1, dtype=np.float64)
+            ** -dimension.exponent
+        )
+        cdf = np.cumsum(weights)
+        cdf /= cdf[-1]
+        column = np.searchsorted(cdf, row_uniforms(self._rows(), seed), side="right")
+        np.minimum(column, dimension.cardinality - 1, out=column)
+        return column.astype(np.uint32)
+
+    @staticmethod
+    def _generations(dimension: CompiledDimension, now: float) -> np.ndarray:
+        interval = dimension.churn_interval
+        phases = np.arange(dimension.cardinality, dtype=np.float64) * (
+            interval / dimension.cardinality
+        )
+        return ((now + phases) // interval).astype(np.int64)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _rows(self) -> np.ndarray:
+        return np.arange(self.offset, self.offset + self.size, dtype=np.intp)
+
+    def column(self, d: int, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Value index of dimension d for every series, or for the given rows."""
+        if d in self.assigned:
+            return self.assigned[d] if rows is None else self.assigned[d][rows]
+        dimension = self.dimensions[d]
+        size = self.size if rows is None else len(rows)
+        if dimension.cardinality == 1:
+            return np.zeros(size, dtype=np.intp)
+        rows = self._rows() if rows is None else rows + self.offset
+        return (rows // self.strides[d]) % dimension.cardinality
+
+    def value(self, d: int, k: int) -> str:
+        """Current value k of dimension d, including its churn generation."""
+        value = self.dimensions[d].values[k]
+        generations = self.generations.get(d)
+        if generations is None:
+            return value
+        return f"{value}-{format_generation(int(generations[k]))}"
+
+    def __getitem__(self, i: int) -> Tuple[str, ...]:
+        if i < 0:
+            i += self.size
+        if not 0 <= i < self.size:
+            raise IndexError(i)
+        values = []
+        for d, dimension in enumerate(self.dimensions):
+            if d in self.assigned:
+                k = int(self.assigned[d][i])
+            else:
+                k = ((self.offset + i) // self.strides[d]) % dimension.cardinality
+            values.append(self.value(d, k))
+        return tuple(values)
+
+    def __iter__(self) -> Iterator[Tuple[str, ...]]:
+        for i in range(self.size):
+            yield self[i]
+
+    def born(self, rows: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """When the current label set of every series (or of rows) appeared.
+
+        Value k of a churning dimension entered its current generation g at
+        g * interval - k * interval / cardinality; a series was born when the
+        last of its churning values did. None without churning dimensions.
+        """
+        born = None
+        for d, generations in self.generations.items():
+            dimension = self.dimensions[d]
+            interval = dimension.churn_interval
+            phases = np.arange(dimension.cardinality, dtype=np.float64) * (
+                interval / dimension.cardinality
+            )
+            starts = (generations * interval - phases)[self.column(d, rows)]
+            born = starts if born is None else np.maximum(born, starts)
+        return born
+
+    def due(self, now: float) -> bool:
+        """Whether any churning value moves to a new generation at `now`."""
+        return any(
+            not np.array_equal(self._generations(self.dimensions[d], now), generations)
+            for d, generations in self.generations.items()
+        )
+
+    def advance(self, now: Optional[float] = None) -> Optional[np.ndarray]:
+        """Move churning values to their current generation.
+
+        Returns the rows whose label set changed, or None if nothing churned.
+        """
+        if not self.generations:
+            return None
+        now = time.time() if now is None else now
+        changed = None
+        for d, generations in self.generations.items():
+            current = self._generations(self.dimensions[d], now)
+            moved = np.flatnonzero(current != generations)
+            if not len(moved):
+                continue
+            self.generations[d] = current
+            mask = np.isin(self.column(d), moved)
+            changed = mask if changed is None else changed | mask
+        if changed is None:
+            return None
+        rows = np.flatnonzero(changed)
+        self.churned_series += len(rows)
+        self.version += 1
+        return rows
+
+    def render(
+        self,
+        fragment: Callable[[str, str], Any],
+        separator: Any,
+        extra: Optional[Dict[str, str]] = None,
+        rows: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Render every series' label set (or those of rows) into one object array.
+
+        fragment(name, value) renders a single label; it is called once per
+        dimension value, not per series. Labels appear in name order, and the
+        constant extra labels are merged in unless a dimension has the same
+        name.
+        """
+        parts: List[Tuple[str, Any]] = []
+        for d, dimension in enumerate(self.dimensions):
+            fragments = np.empty(dimension.cardinality, dtype=object)
+            fragments[:] = [
+                fragment(dimension.name, self.value(d, k))
+                for k in range(dimension.cardinality)
+            ]
+            if dimension.cardinality == 1:
+                parts.append((dimension.name, fragments[0]))
+            else:
+                parts.append((dimension.name, fragments[self.column(d, rows)]))
+        for name, value in (extra or {}).items():
+            if name not in self.labelnames:
+                parts.append((name, fragment(name, value)))
+        parts.sort(key=lambda part: part[0])
+
+        joined: Any = None
+        for _, part in parts:
+            if joined is None:
+                joined = part
+            elif separator:
+                joined = joined + separator + part
+            else:
+                joined = joined + part
+        if not isinstance(joined, np.ndarray):
+            joined = np.full(
+                self.size if rows is None else len(rows), joined, dtype=object
+            )
+        return joined
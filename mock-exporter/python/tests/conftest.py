@@ -0,0 +1,90 @@
+"""Shared fixtures: a small config and the app served in-process."""
+
+import contextlib
+import time
+
+import pytest
+import yaml
+
+BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5]
+
+SMALL_CONFIG = {
+    "label_metrics": [{"app": "web-frontend", "region": "us-east-1"}],
+    "http_metrics": [
+        {
+            "name": "http_requests_total",
+            "type": "counter",
+            "value": 100,
+            "labels": {"service": "web", "status_code": "200", "region": region},
+        }
+        for region in ("us-east-1", "eu-west-1")
+    ]
+    + [
+        {
+            "name": "http_request_duration_seconds",
+            "type": "histogram",
+            "value": 0.2,
+            "labels": {"service": "web", "region": region},
+            "buckets": BUCKETS,
+        }
+        for region in ("us-east-1", "eu-west-1")
+    ],
+    "node_metrics": [
+        {
+            "name": "node_memory_usage_percent",
+            "type": "gauge",
+            "value": 60,
+            "labels": {"instance": f"node-{i}", "region": "us-east-1"},
+        }
+        for i in range(3)
+    ],
+}
+
+
+def write_config(path, config=None) -> str:
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(SMALL_CONFIG if config is None else config, f)
+    return str(path)
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    return write_config(tmp_path / "config.yml")
+
+
+def wait_until(condition, timeout: float = 10.0, interval: float = 0.02):
+    """Poll condition() until it returns something truthy; fails on timeout."""
+    deadline = time.monotonic() + timeout
+    while True:
+        result = condition()
+        if result:
+            return result
+        if time.monotonic() > deadline:
+            pytest.fail(f"timed out after {timeout}s waiting for {condition}")
+        time.sleep(interval)
+
+
+@pytest.fixture
+def serve(monkeypatch, tmp_path, config_path):
+    """Start the app in-process with the given environment, once it is ready.
+
+    Used as a context manager: `with serve(EXPORTER_SEED="1") as client:`.
+    The config defaults to SMALL_CONFIG and the config cache to tmp_path;
+    ready=False hands the client over while the exporter is still starting.
+    """
+    from fastapi.testclient import TestClient
+
+    import main
+
+    @contextlib.contextmanager
+    def start(ready: bool = True, **env):
+        env.setdefault("CONFIG_PATH", config_path)
+        env.setdefault("CONFIG_CACHE_DIR", str(tmp_path / "cache"))
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        with TestClient(main.app) as client:
+            if ready:
+                wait_until(lambda: client.get("/healthz").json()["ready"])
+            yield client
+
+    return start
@@ -0,0 +1,160 @@
+"""Tests for the historical backfill generator's OpenMetrics output (backfill.py)."""
+
+import glob
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+from conftest import write_config
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(__file__))
+# A multiple of STEP: --start is aligned down to the step
+START = 1_699_999_995
+STEP = 15
+POINTS = 41
+
+
+@pytest.fixture(scope="module")
+def backfill_files(tmp_path_factory):
+    """Two workers' OpenMetrics files of SMALL_CONFIG, spilled in small chunks."""
+    directory = tmp_path_factory.mktemp("backfill")
+    config = write_config(directory / "config.yml")
+    output = directory / "out"
+    subprocess.run(
+        [
+            sys.executable,
+            "backfill.py",
+            "--config",
+            config,
+            "--format",
+            "openmetrics",
+            "--output",
+            str(output),
+            "--start",
+            str(START),
+            "--end",
+            str(START + (POINTS - 1) * STEP),
+            "--step",
+            f"{STEP}s",
+            "--workers",
+            "2",
+            "--seed",
+            "3",
+            # A few timestamps per chunk, so families spill to disk
+            "--max-chunk-values",
+            "20",
+        ],
+        cwd=PACKAGE_DIR,
+        check=True,
+        capture_output=True,
+    )
+    paths = sorted(glob.glob(str(output / "backfill-*.om")))
+    assert len(paths) == 2
+    texts = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            texts.append(f.read())
+    return texts
+
+
+SAMPLE_RE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)\{(.*)\} (\S+) (\S+)$")
+LABEL_RE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text: str):
+    """{family: (type, [(sample name, labels, value, timestamp)])} of one file.
+
+    prometheus_client's OpenMetrics parser drops every histogram sample after
+    a series' first timestamp but the first bucket, so lines are parsed here.
+    """
+    lines = text.split("\n")
+    assert lines[-2:] == ["# EOF", ""]
+    families = {}
+    family = None
+    for line in lines[:-2]:
+        if line.startswith("# HELP "):
+            family = families.setdefault(line.split(" ")[2], [None, []])
+        elif line.startswith("# TYPE "):
+            _, _, name, metric_type = line.split(" ")
+            assert families[name] is family and family[0] is None
+            family[0] = metric_type
+        else:
+            match = SAMPLE_RE.match(line)
+            assert match, line
+            name, labels, value, timestamp = match.groups()
+            family[1].append(
+                (name, dict(LABEL_RE.findall(labels)), float(value), float(timestamp))
+            )
+    return families
+
+
+def series_of(name: str, labels: dict):
+    """A sample's series: its family's sample name and labels apart from le."""
+    for suffix in ("_bucket", "_count", "_sum"):
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+    return name, tuple(sorted((k, v) for k, v in labels.items() if k != "le"))
+
+
+def test_files_end_in_eof_after_every_family(backfill_files):
+    families = {}
+    for text in backfill_files:
+        for name, (metric_type, samples) in parse(text).items():
+            assert metric_type in ("counter", "gauge", "histogram")
+            families.setdefault(name, set()).update(
+                series_of(*sample[:2]) for sample in samples
+            )
+    assert {name: len(series) for name, series in families.items()} == {
+        "http_requests": 2,
+        "http_request_duration_seconds": 2,
+        "node_memory_usage_percent": 3,
+    }
+    assert all(
+        dict(labels)["job"] == "mock-exporter"
+        for series in families.values()
+        for _, labels in series
+    )
+
+
+def test_samples_are_series_major_with_rising_timestamps(backfill_files):
+    expected = [float(START + i * STEP) for i in range(POINTS)]
+    for text in backfill_files:
+        finished = set()
+        current = None
+        stamps = {}
+        for _, (metric_type, samples) in parse(text).items():
+            for name, labels, _, timestamp in samples:
+                series = series_of(name, labels)
+                if series != current:
+                    assert series not in finished, f"{series} is split up"
+                    finished.add(current)
+                    current = series
+                key = name, tuple(sorted(labels.items()))
+                stamps.setdefault(key, []).append(timestamp)
+        assert stamps
+        for key, series_stamps in stamps.items():
+            assert series_stamps == expected, key
+
+
+def test_histogram_points_are_whole_and_nothing_decreases(backfill_files):
+    for text in backfill_files:
+        for _, (metric_type, samples) in parse(text).items():
+            if metric_type == "gauge":
+                continue
+            values = {}
+            points = {}
+            for name, labels, value, timestamp in samples:
+                key = name, tuple(sorted(labels.items()))
+                values.setdefault(key, []).append(value)
+                point = series_of(name, labels), timestamp
+                points.setdefault(point, []).append((name, labels.get("le"), value))
+            for key, series_values in values.items():
+                assert series_values == sorted(series_values), key
+            if metric_type != "histogram":
+                continue
+            for point, point_samples in points.items():
+                *buckets, (_, _, count), (sum_name, _, _) = point_samples
+                assert [le for _, le, _ in buckets][-1] == "+Inf", point
+                assert buckets[-1][2] == count and sum_name.endswith("_sum")
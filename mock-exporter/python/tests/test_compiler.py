@@ -0,0 +1,49 @@
+"""Tests for the config compiler (compiler.py)."""
+
+import copy
+
+import pytest
+from conftest import SMALL_CONFIG
+
+from compiler import ConfigError, compile_config
+
+
+def family(compiled, key):
+    (found,) = [f for f in compiled.families if f.key == key]
+    return found
+
+
+def test_small_config_compiles_one_series_per_entry():
+    compiled = compile_config(SMALL_CONFIG)
+    counters = family(compiled, "http_requests_total_counter")
+    assert counters.labelnames == ("region", "service", "status_code")
+    assert counters.label_values == (
+        ("us-east-1", "web", "200"),
+        ("eu-west-1", "web", "200"),
+    )
+    assert sum(f.size for f in compiled.families) == 7
+
+
+def test_entries_sharing_a_label_set_are_rejected():
+    config = copy.deepcopy(SMALL_CONFIG)
+    repeated = copy.deepcopy(config["node_metrics"][1])
+    repeated["value"] = 80
+    config["node_metrics"].append(repeated)
+    with pytest.raises(ConfigError, match=r"node_metrics\[3\].*node_metrics\[1\]"):
+        compile_config(config)
+
+
+def test_entries_missing_a_family_label_are_rejected():
+    config = copy.deepcopy(SMALL_CONFIG)
+    del config["http_metrics"][1]["labels"]["status_code"]
+    with pytest.raises(ConfigError, match=r"http_metrics\[1\].*status_code"):
+        compile_config(config)
+
+
+def test_label_values_are_compiled_as_strings():
+    config = copy.deepcopy(SMALL_CONFIG)
+    for i, entry in enumerate(config["node_metrics"]):
+        entry["labels"]["instance"] = i
+    compiled = compile_config(config)
+    gauges = family(compiled, "node_memory_usage_percent_gauge")
+    assert [values[0] for values in gauges.label_values] == ["0", "1", "2"]
@@ -0,0 +1,167 @@
+"""Tests for compiled config snapshots and the cache around them (config_cache.py)."""
+
+import os
+
+import numpy as np
+import pytest
+import yaml
+
+from compiler import compile_config
+from config_cache import (
+    CacheError,
+    ConfigCache,
+    create_config_cache,
+    decode_labels,
+    encode_labels,
+    read_snapshot,
+    write_snapshot,
+)
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config.yml")
+
+SYNTHETIC = {
+    "synthetic_metrics": [
+        {
+            "name": "synthetic_http_requests_total",
+            "type": "counter",
+            "value": 10,
+            "labels": {"job": "synthetic"},
+            "dimensions": {
+                "instance": "1..20",
+                "path": {"values": 5, "distribution": "zipf", "exponent": 1.1},
+                "pod": {"values": 3, "churn_interval": 600},
+            },
+        },
+        {
+            "name": "synthetic_request_duration_seconds",
+            "type": "histogram",
+            "value": 0.25,
+            "native": True,
+            "dimensions": {"region": ["us-east-1", "eu-west-1"]},
+        },
+    ]
+}
+
+
+@pytest.fixture(scope="module")
+def compiled():
+    with open(CONFIG_PATH, encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    config["synthetic_metrics"] = SYNTHETIC["synthetic_metrics"]
+    return compile_config(config)
+
+
+def assert_same_config(loaded, compiled):
+    assert loaded.info_metrics == compiled.info_metrics
+    assert loaded.workload == compiled.workload
+    assert [family.key for family in loaded.families] == [
+        family.key for family in compiled.families
+    ]
+    for family, original in zip(loaded.families, compiled.families):
+        assert family.same_model(original), family.key
+
+
+def test_labels_round_trip():
+    label_values = (("a", "x"), ("b", "x"), ("a", "y"))
+    columns, codes = encode_labels(("first", "second"), label_values)
+    assert columns == [["a", "b"], ["x", "y"]]
+    assert codes.dtype == np.uint32
+    assert decode_labels(columns, codes) == label_values
+    assert decode_labels([], np.empty((2, 0), dtype=np.uint32)) == ((), ())
+
+
+def test_snapshot_round_trip(tmp_path, compiled):
+    path = str(tmp_path / "config.mxc")
+    write_snapshot(path, compiled)
+    loaded = read_snapshot(path)
+    assert_same_config(loaded, compiled)
+    assert any(family.synthetic for family in loaded.families)
+    assert any(family.native_schema is not None for family in loaded.families)
+
+
+def test_snapshot_arrays_are_mapped_read_only(tmp_path, compiled):
+    path = str(tmp_path / "config.mxc")
+    write_snapshot(path, compiled)
+    family = next(f for f in read_snapshot(path).families if not f.synthetic)
+    with pytest.raises(ValueError):
+        family.bases[0] = 1.0
+
+
+def test_snapshot_of_an_empty_config(tmp_path):
+    path = str(tmp_path / "empty.mxc")
+    write_snapshot(path, compile_config({}))
+    loaded = read_snapshot(path)
+    assert (
+        loaded.families == () and loaded.info_metrics == () and loaded.workload is None
+    )
+
+
+def test_read_snapshot_rejects_other_files(tmp_path, compiled):
+    path = tmp_path / "other.mxc"
+    path.write_bytes(b"not a snapshot at all")
+    with pytest.raises(CacheError):
+        read_snapshot(str(path))
+
+    write_snapshot(str(path), compiled)
+    data = path.read_bytes()
+    path.write_bytes(data[: len(data) // 2])
+    with pytest.raises(CacheError):
+        read_snapshot(str(path))
+
+
+def test_cache_misses_then_hits(tmp_path, compiled):
+    cache = ConfigCache(str(tmp_path / "cache"))
+    key = cache.key(b"config bytes")
+    assert cache.load(key) is None
+    cache.store(key, compiled)
+    assert_same_config(cache.load(key), compiled)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert oct(os.stat(cache.path(key)).st_mode & 0o777) == oct(0o644)
+
+
+def test_cache_key_covers_the_config_and_the_compiler(tmp_path, monkeypatch):
+    cache = ConfigCache(str(tmp_path))
+    assert cache.key(b"a") != cache.key(b"b")
+    monkeypatch.setattr(cache, "fingerprint", b"another compiler")
+    assert ConfigCache(str(tmp_path)).key(b"a") != cache.key(b"a")
+
+
+def test_cache_ignores_unreadable_snapshots(tmp_path):
+    cache = ConfigCache(str(tmp_path))
+    key = cache.key(b"config")
+    with open(cache.path(key), "wb") as f:
+        f.write(b"garbage")
+    assert cache.load(key) is None
+    assert cache.stats()["errors"] == 1
+
+
+def test_cache_keeps_the_most_recently_used_snapshots(tmp_path):
+    cache = ConfigCache(str(tmp_path), keep=2)
+    empty = compile_config({})
+    keys = [cache.key(bytes([i])) for i in range(3)]
+    for i, key in enumerate(keys[:2]):
+        cache.store(key, empty)
+        os.utime(cache.path(key), (1000 + i, 1000 + i))
+    # Using the oldest snapshot makes the other one the pruning candidate
+    assert cache.load(keys[0]) is not None
+    cache.store(keys[2], empty)
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        os.path.basename(cache.path(key)) for key in (keys[0], keys[2])
+    )
+
+
+def test_cache_store_failures_are_only_logged(tmp_path, compiled):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    cache = ConfigCache(str(blocker / "cache"))
+    cache.store(cache.key(b"x"), compiled)
+    assert cache.stats()["errors"] == 1
+
+
+def test_create_config_cache_from_the_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv("CONFIG_CACHE_DIR", "")
+    assert create_config_cache() is None
+    monkeypatch.setenv("CONFIG_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("CONFIG_CACHE_KEEP", "0")
+    cache = create_config_cache()
+    assert cache.directory == str(tmp_path) and cache.keep == 1
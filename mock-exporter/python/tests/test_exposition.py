@@ -0,0 +1,345 @@
+"""Tests for the cached exposition renderer (exposition.py)."""
+
+import gzip
+import threading
+import time
+
+import pytest
+import zstandard
+from conftest import SMALL_CONFIG
+from prometheus_client import CollectorRegistry, generate_latest
+from prometheus_client.openmetrics.parser import (
+    text_string_to_metric_families as openmetrics_families,
+)
+from prometheus_client.parser import text_string_to_metric_families
+
+import exposition
+import main
+from compiler import compile_config
+from exposition import (
+    CONTENT_TYPES,
+    PROTO_TYPES,
+    SUPPORTED_ENCODINGS,
+    ExpositionCache,
+    FamilyRenderer,
+    negotiate_format,
+)
+from protowire import decode_varint, iter_fields
+from series_store import SeriesStore
+
+
+def parse(text: str):
+    """{family name: (type, help, sorted samples)}, without _created samples."""
+    return {
+        family.name: (
+            family.type,
+            family.documentation,
+            sorted(
+                (sample.name, tuple(sorted(sample.labels.items())), sample.value)
+                for sample in family.samples
+                if not sample.name.endswith("_created")
+            ),
+        )
+        for family in text_string_to_metric_families(text)
+    }
+
+
+def reference(store: SeriesStore):
+    """The store as prometheus_client itself exposes it."""
+    registry = CollectorRegistry()
+    registry.register(store)
+    return parse(generate_latest(registry).decode())
+
+
+def small_store(ticks: int = 3) -> SeriesStore:
+    store = SeriesStore(seed=1)
+    for compiled in compile_config(SMALL_CONFIG).families:
+        family = store.add_family(compiled)
+        for _ in range(ticks):
+            getattr(family, f"update_{family.type}")(store.rng)
+    return store
+
+
+def test_text_matches_generate_latest():
+    store = small_store()
+    cache = ExpositionCache(store, registry=CollectorRegistry())
+    parsed = parse(cache.render("text").body.decode())
+    assert parsed == reference(store)
+    assert set(parsed) == {
+        "http_requests",
+        "http_request_duration_seconds",
+        "node_memory_usage_percent",
+    }
+
+
+def test_metrics_endpoint_matches_generate_latest(serve):
+    with serve() as client:
+        store = main.exporter.store
+
+        def versions():
+            return [family.version for family in store.families.values()]
+
+        # Retried if an updater ticks between the scrape and the reference
+        for _ in range(20):
+            before = versions()
+            response = client.get("/metrics")
+            expected = reference(store)
+            if versions() == before:
+                break
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        parsed = parse(response.text)
+        assert {name: parsed[name] for name in expected} == expected
+        # The registry block around them (label metrics, process) parses too
+        assert "mock_tag_info_0_info" in parsed
+        assert "python_gc_objects_collected" in parsed
+
+
+def histogram_store(series: int) -> SeriesStore:
+    config = {
+        "http_metrics": [
+            {
+                "name": "request_seconds",
+                "type": "histogram",
+                "value": 0.2,
+                "labels": {"instance": f"i{i}"},
+                "buckets": [0.1, 0.2, 0.5],
+            }
+            for i in range(series)
+        ]
+    }
+    store = SeriesStore(seed=5)
+    for compiled in compile_config(config).families:
+        store.add_family(compiled)
+    return store
+
+
+def test_renders_never_mix_two_updates():
+    store = histogram_store(3000)
+    (family,) = store.families.values()
+    # Observations made so far -> _sum of every series after them
+    sums = {0: {values[0]: 0.0 for values in family.label_values}}
+    done = threading.Event()
+
+    def update():
+        for _ in range(100):
+            family.update_histogram(store.rng)
+            sums[int(family.updates)] = dict(
+                zip((v[0] for v in family.label_values), family.values.tolist())
+            )
+        done.set()
+
+    updater = threading.Thread(target=update)
+    updater.start()
+    renders = []
+    while not done.is_set():
+        renders.append(FamilyRenderer(family).render("text").decode())
+    updater.join()
+
+    assert len(renders) > 1
+    for text in renders:
+        (parsed,) = text_string_to_metric_families(text)
+        counts = {
+            s.labels["instance"]: s.value
+            for s in parsed.samples
+            if s.name == "request_seconds_count"
+        }
+        # Every series observes once per update, so one update shows everywhere
+        (observed,) = set(counts.values())
+        assert {
+            s.labels["instance"]: s.value
+            for s in parsed.samples
+            if s.name == "request_seconds_sum"
+        } == sums[int(observed)]
+
+
+def test_etag_only_moves_with_the_families():
+    store = small_store()
+    # A registry block renewed on every render must not renew the snapshot
+    cache = ExpositionCache(store, registry_ttl=0)
+    first = cache.render("text")
+    assert cache.render("text").etag() == first.etag()
+
+    family = store.families["http_requests_total_counter"]
+    family.update_counter(store.rng)
+    assert cache.render("text").etag() != first.etag()
+
+
+def test_unchanged_metrics_answer_304(serve):
+    with serve() as client:
+        # No ticks from here on
+        client.portal.call(main.exporter.scheduler.stop)
+        first = client.get("/metrics", headers={"Accept-Encoding": "gzip"})
+        assert first.status_code == 200
+        # Past the registry block's TTL: process metrics have moved on
+        time.sleep(1.1)
+        again = client.get(
+            "/metrics",
+            headers={"Accept-Encoding": "gzip", "If-None-Match": first.headers["etag"]},
+        )
+        assert again.status_code == 304
+        assert again.headers["etag"] == first.headers["etag"]
+        assert again.content == b""
+
+
+PROMETHEUS_ACCEPT = (
+    "application/vnd.google.protobuf;proto=io.prometheus.client.MetricFamily;"
+    "encoding=delimited;q=0.7,text/plain;version=0.0.4;q=0.3,*/*;q=0.2"
+)
+OPENMETRICS_ACCEPT = (
+    "application/openmetrics-text;version=1.0.0;q=0.5,"
+    "text/plain;version=0.0.4;q=0.4,*/*;q=0.1"
+)
+
+
+@pytest.mark.parametrize(
+    "accept, expected",
+    [
+        (None, "text"),
+        ("", "text"),
+        ("*/*", "text"),
+        ("text/plain", "text"),
+        (PROMETHEUS_ACCEPT, "protobuf"),
+        (OPENMETRICS_ACCEPT, "openmetrics"),
+        ("application/openmetrics-text; version=0.0.1", "openmetrics"),
+        # The highest q wins, whatever the order
+        ("text/plain;q=0.9,application/openmetrics-text;q=0.5", "text"),
+        ("application/openmetrics-text;q=0.2,text/plain;q=0.1", "openmetrics"),
+        # Equal q goes to the cheaper format to parse
+        (
+            "text/plain,application/openmetrics-text,"
+            "application/vnd.google.protobuf;"
+            "proto=io.prometheus.client.MetricFamily;encoding=delimited",
+            "protobuf",
+        ),
+        # q=0 means not acceptable; a malformed q counts as 0
+        ("application/openmetrics-text;q=0,text/plain;q=0.1", "text"),
+        ("application/openmetrics-text;q=high", "text"),
+        # Unsupported types and versions fall back to text
+        ("application/json", "text"),
+        ("application/openmetrics-text;version=2.0.0", "text"),
+        ("text/plain;version=1.0.0", "text"),
+        ("application/vnd.google.protobuf;encoding=text", "text"),
+        (
+            "application/vnd.google.protobuf;"
+            "proto=io.prometheus.client.MetricFamily;encoding=compact-text",
+            "text",
+        ),
+    ],
+)
+def test_negotiate_format(accept, expected):
+    assert negotiate_format(accept) == expected
+
+
+def test_negotiate_format_only_picks_offered_formats():
+    assert negotiate_format(PROMETHEUS_ACCEPT, ("openmetrics", "text")) == "text"
+    assert negotiate_format(OPENMETRICS_ACCEPT, ("text",)) == "text"
+
+
+def delimited_messages(body: bytes):
+    """The MetricFamily messages of a length-delimited protobuf body."""
+    messages, pos = [], 0
+    while pos < len(body):
+        length, pos = decode_varint(body, pos)
+        messages.append(body[pos : pos + length])
+        pos += length
+    assert pos == len(body)
+    return messages
+
+
+def test_metrics_negotiates_every_format(serve):
+    with serve() as client:
+        client.portal.call(main.exporter.scheduler.stop)
+
+        response = client.get("/metrics", headers={"Accept": OPENMETRICS_ACCEPT})
+        assert response.headers["content-type"] == CONTENT_TYPES["openmetrics"]
+        assert response.text.endswith("\n# EOF\n")
+        families = {f.name: f for f in openmetrics_families(response.text) if f.samples}
+        assert families["http_requests"].type == "counter"
+        assert {s.name for s in families["http_requests"].samples} == {
+            "http_requests_total",
+            "http_requests_created",
+        }
+
+        response = client.get("/metrics", headers={"Accept": PROMETHEUS_ACCEPT})
+        assert response.headers["content-type"] == CONTENT_TYPES["protobuf"]
+        metrics = {}
+        for message in delimited_messages(response.content):
+            fields = list(iter_fields(message))
+            (name,) = [bytes(value).decode() for f, _, value in fields if f == 1]
+            (kind,) = [value for f, _, value in fields if f == 3] or [0]
+            metrics[name] = (kind, sum(1 for f, _, _ in fields if f == 4))
+        assert metrics["http_requests_total"] == (PROTO_TYPES["counter"], 2)
+        assert metrics["http_request_duration_seconds"] == (
+            PROTO_TYPES["histogram"],
+            2,
+        )
+        assert metrics["node_memory_usage_percent"] == (PROTO_TYPES["gauge"], 3)
+
+        response = client.get("/metrics", headers={"Accept": "application/json"})
+        assert response.headers["content-type"] == CONTENT_TYPES["text"]
+        assert "# EOF" not in response.text
+        assert response.headers["vary"] == "Accept, Accept-Encoding"
+
+
+def decode(data: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+@pytest.mark.parametrize("encoding", SUPPORTED_ENCODINGS)
+@pytest.mark.parametrize("fmt", ["text", "openmetrics", "protobuf"])
+def test_streamed_snapshot_matches_the_whole_body(fmt, encoding):
+    snapshot = ExpositionCache(small_store(), registry=CollectorRegistry()).render(fmt)
+    for chunk_size in (1, 7, 100, snapshot.size, snapshot.size + 1):
+        chunks = list(snapshot.chunks(chunk_size))
+        assert b"".join(chunks) == snapshot.body
+        assert all(len(chunk) == chunk_size for chunk in chunks[:-1])
+
+    # The first reader compresses, the ones behind it (or after it) replay
+    readers = [snapshot.stream(encoding) for _ in range(3)]
+    streamed = [[] for _ in readers]
+    for chunks in zip(*readers):
+        for received, chunk in zip(streamed, chunks):
+            received.append(chunk)
+    streamed.append(list(snapshot.stream(encoding)))
+    for chunks in streamed:
+        assert decode(b"".join(chunks), encoding) == snapshot.body
+    assert decode(snapshot.encoded(encoding), encoding) == snapshot.body
+
+
+@pytest.mark.parametrize("encoding", SUPPORTED_ENCODINGS)
+@pytest.mark.parametrize(
+    "accept",
+    [PROMETHEUS_ACCEPT, OPENMETRICS_ACCEPT, None],
+    ids=["protobuf", "openmetrics", "text"],
+)
+def test_streamed_metrics_match_the_whole_response(
+    serve, monkeypatch, accept, encoding
+):
+    headers = {"Accept-Encoding": encoding}
+    if accept is not None:
+        headers["Accept"] = accept
+    with serve() as client:
+        client.portal.call(main.exporter.scheduler.stop)
+        responses = []
+        for threshold in (1 << 62, 0):
+            monkeypatch.setattr(exposition, "STREAM_THRESHOLD", threshold)
+            with client.stream("GET", "/metrics", headers=headers) as response:
+                assert response.status_code == 200
+                responses.append((response.headers, b"".join(response.iter_raw())))
+        (whole_headers, whole), (streamed_headers, streamed) = responses
+
+    assert "content-length" in whole_headers
+    assert "content-length" not in streamed_headers
+    for name in ("content-type", "etag", "vary"):
+        assert streamed_headers[name] == whole_headers[name]
+    if encoding == "identity":
+        assert "content-encoding" not in streamed_headers
+        assert streamed == whole
+    else:
+        assert streamed_headers["content-encoding"] == encoding
+        assert decode(streamed, encoding) == decode(whole, encoding)
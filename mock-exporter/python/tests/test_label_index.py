@@ -0,0 +1,171 @@
+"""Tests for series selectors, views and label postings (label_index.py)."""
+
+import numpy as np
+import pytest
+
+from label_index import LabelIndex, SelectorError, View, format_selector, parse_selector
+
+
+def triples(selector):
+    return [(m.name, m.op, m.value) for m in selector]
+
+
+def test_parse_selector_with_a_metric_name_and_every_operator():
+    selector = parse_selector(
+        'http_requests_total{region="us-east-1", status=~"5..",path!="/",method!~"GET|HEAD"}'
+    )
+    assert triples(selector) == [
+        ("__name__", "=", "http_requests_total"),
+        ("region", "=", "us-east-1"),
+        ("status", "=~", "5.."),
+        ("path", "!=", "/"),
+        ("method", "!~", "GET|HEAD"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "text, value",
+    [
+        (r'{a="x\"y"}', 'x"y'),
+        (r'{a="line\nbreak"}', "line\nbreak"),
+        (r"{a='single'}", "single"),
+        (r"{a=`raw\n`}", r"raw\n"),
+        (r'{a="back\\slash"}', "back\\slash"),
+    ],
+)
+def test_parse_selector_quoting_and_escapes(text, value):
+    assert triples(parse_selector(text)) == [("a", "=", value)]
+
+
+def test_parse_selector_name_only_and_trailing_comma():
+    assert triples(parse_selector("  up ")) == [("__name__", "=", "up")]
+    assert triples(parse_selector('{job = "api",}')) == [("job", "=", "api")]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '{a="x"',
+        '{a="x"} extra',
+        '{a="unterminated}',
+        "{a=x}",
+        '{a~"x"}',
+        '{1a="x"}',
+        '{a=~"("}',
+        "{a=",
+        "up{",
+    ],
+)
+def test_parse_selector_rejects_malformed_text(text):
+    with pytest.raises(SelectorError):
+        parse_selector(text)
+
+
+def test_format_selector_round_trips():
+    selector = parse_selector('{a="q\\"uote",b!~"x|y",c="new\\nline"}')
+    assert triples(parse_selector(format_selector(selector))) == triples(selector)
+
+
+def test_view_from_query_ands_labels_into_every_selector():
+    view = View.from_query(
+        [
+            ("match[]", '{status=~"5.."}'),
+            ("match[]", "up"),
+            ("region", "eu-west-1"),
+        ]
+    )
+    assert [triples(selector) for selector in view.selectors] == [
+        [("__name__", "=", "up"), ("region", "=", "eu-west-1")],
+        [("region", "=", "eu-west-1"), ("status", "=~", "5..")],
+    ]
+
+
+def test_view_from_query_ors_repeated_label_values():
+    view = View.from_query([("region", "us-east-1"), ("region", "eu.west")])
+    (matcher,) = view.selectors[0]
+    assert (matcher.name, matcher.op) == ("region", "=~")
+    assert matcher.matches("eu.west") and matcher.matches("us-east-1")
+    assert not matcher.matches("euxwest")
+
+
+def test_view_from_query_without_filters_is_none():
+    assert View.from_query([]) is None
+
+
+def test_view_rejects_selectors_matching_everything_and_bad_names():
+    with pytest.raises(SelectorError):
+        View.from_query([("match[]", '{a=~".*"}')])
+    with pytest.raises(SelectorError):
+        View.from_query([("bad-name", "x")])
+
+
+def test_view_key_is_canonical_and_round_trips():
+    first = View.from_query([("match[]", '{b="2",a="1"}'), ("match[]", "up")])
+    second = View.from_query([("match[]", "up"), ("match[]", '{a="1", b="2"}')])
+    assert first.key == second.key
+    assert View.from_key(first.key).key == first.key
+
+
+@pytest.fixture
+def index():
+    label_values = [
+        ("us-east-1", "200"),
+        ("eu-west-1", "500"),
+        ("us-east-1", "503"),
+        ("ap-south-1", "200"),
+    ]
+    return LabelIndex(["http_requests_total"], ["region", "code"], label_values)
+
+
+def select(index, text):
+    rows = index.select(parse_selector(text))
+    return None if rows is None else rows.tolist()
+
+
+def test_postings_are_built_on_first_use(index):
+    assert index._postings is None
+    assert select(index, '{region="us-east-1"}') == [0, 2]
+    assert index.postings["code"]["200"].tolist() == [0, 3]
+
+
+def test_select_intersects_matchers(index):
+    assert select(index, '{region=~"us-.*|eu-.*",code=~"5.."}') == [1, 2]
+    assert select(index, '{region!="us-east-1"}') == [1, 3]
+    assert select(index, '{code!~"2.."}') == [1, 2]
+    assert select(index, '{region="nowhere"}') == []
+
+
+def test_select_all_rows_is_none(index):
+    assert select(index, '{region=~".+"}') is None
+    assert select(index, 'http_requests_total{code=~".*",region!=""}') is None
+
+
+def test_select_by_metric_name_and_absent_labels(index):
+    assert select(index, 'other_metric{region="us-east-1"}') == []
+    assert select(index, '{pod=""}') is None
+    assert select(index, '{pod="x"}') == []
+
+
+def test_view_rows_unions_selectors(index):
+    view = View.from_query(
+        [("match[]", '{code="500"}'), ("match[]", '{region="ap-south-1"}')]
+    )
+    rows = view.rows(index)
+    assert isinstance(rows, np.ndarray) and rows.tolist() == [1, 3]
+    everything = View.from_query(
+        [("match[]", '{code="500"}'), ("match[]", "http_requests_total")]
+    )
+    assert everything.rows(index) is None
+
+
+def test_view_matches_samples_by_any_name():
+    view = View.from_query(
+        [("match[]", 'http_request_duration_seconds_bucket{le="1"}')]
+    )
+    names = (
+        "http_request_duration_seconds_bucket",
+        "http_request_duration_seconds_count",
+    )
+    assert view.matches(names, {"le": "1"})
+    assert not view.matches(names, {"le": "2"})
+    assert not view.matches(("other",), {"le": "1"})
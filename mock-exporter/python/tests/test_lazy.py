@@ -0,0 +1,102 @@
+"""Tests for scrape-time evaluation against the tick updaters (lazy.py)."""
+
+import os
+
+import numpy as np
+import pytest
+import yaml
+
+from compiler import compile_config
+from series_store import UPDATE_INTERVALS, SeriesFamily, SimulatedClock
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config.yml")
+# A UTC midnight
+MIDNIGHT = 1_699_920_000.0
+SEED = 3
+# Multiples of every mean update interval (2 s, 3 s and 3.5 s)
+CHECKPOINTS = (420.0, 840.0, 1260.0)
+# Largest relative difference per series, at 360 to 630 updates
+TOLERANCE = {"counter": 0.08, "histogram": 0.08, "gauge": 0.12}
+
+
+def compiled_config(workload: bool):
+    """config.yml, with its workload minus bursts and incidents or without one."""
+    with open(CONFIG_PATH, encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    if workload:
+        config["workload"]["bursts"]["per_hour"] = 0
+        config["workload"]["incidents"]["per_day"] = 0
+    else:
+        del config["workload"]
+    return compile_config(config)
+
+
+def side_by_side(compiled, family_config, start: float):
+    """(eager, lazy) (values, bucket counts) of one family at every checkpoint.
+
+    The eager family ticks at its type's mean update interval, the lazy one
+    is evaluated at the same timestamps.
+    """
+    clock = SimulatedClock(start)
+    eager = SeriesFamily(family_config, SEED, clock, compiled.workload)
+    lazy = SeriesFamily(family_config, SEED, SimulatedClock(start), compiled.workload)
+    lazy.evaluate_lazily(1.0, start)
+    step = sum(UPDATE_INTERVALS[eager.type]) / 2
+    updates = 0
+    for checkpoint in CHECKPOINTS:
+        while (updates + 1) * step <= checkpoint:
+            updates += 1
+            clock.now = start + updates * step
+            getattr(eager, f"update_{eager.type}")(None)
+        lazy.advance(start + checkpoint)
+        _, values, counts = eager.read()
+        yield (values, counts), lazy.sample()
+
+
+def relative(lazy: np.ndarray, eager: np.ndarray) -> np.ndarray:
+    return np.abs(lazy - eager) / np.maximum(np.abs(eager), 1e-9)
+
+
+def compared(family: SeriesFamily, workload: bool) -> dict:
+    """{quantity: series mask} of what scrape-time evaluation reproduces.
+
+    Under a workload, error series count at the load rate and latency does
+    not scale observed values (see lazy.py).
+    """
+    everything = np.ones(family.size, dtype=bool)
+    if family.type != "histogram":
+        quantities = {"values": everything}
+    else:
+        quantities = {"counts": everything, "sums": everything}
+    if not workload or family.type == "gauge":
+        return quantities
+    if family.compiled.model == "errors":
+        return {}
+    errors = family.model.scopes.errors
+    if errors is not None:
+        quantities = {name: ~errors for name in quantities}
+    if family.compiled.model == "latency":
+        del quantities["sums"]
+    return quantities
+
+
+@pytest.mark.parametrize("workload", [False, True], ids=["noise", "workload"])
+@pytest.mark.parametrize("hour", [2, 9, 14, 20])
+def test_lazy_values_match_the_tick_path(workload, hour):
+    compiled = compiled_config(workload)
+    start = MIDNIGHT + hour * 3600.0
+    for family_config in compiled.families:
+        points = list(side_by_side(compiled, family_config, start))
+        family = SeriesFamily(family_config, SEED, workload=compiled.workload)
+        tolerance = TOLERANCE[family.type]
+        for checkpoint, ((values, counts), (lazy_values, lazy_counts)) in zip(
+            CHECKPOINTS, points
+        ):
+            where = family_config.key, checkpoint
+            for quantity, mask in compared(family, workload).items():
+                if quantity == "counts":
+                    eager, lazy = counts.sum(axis=1), lazy_counts.sum(axis=1)
+                else:
+                    eager, lazy = values, lazy_values
+                worst = relative(lazy[mask], eager[mask]).max()
+                assert worst <= tolerance, (where, quantity, worst)
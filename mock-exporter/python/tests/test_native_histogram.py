@@ -0,0 +1,128 @@
+"""Tests for native histogram buckets and their protobuf encoding (native_histogram.py)."""
+
+import math
+
+import pytest
+
+from native_histogram import (
+    ZERO_THRESHOLD,
+    bucket_index,
+    encode_row,
+    exposition_histogram,
+    first_index,
+    native_bounds,
+    remote_write_histogram,
+)
+from protowire import decode_varint, iter_fields
+
+
+def unzigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def decode(message: bytes) -> dict:
+    """field -> list of values of a message."""
+    fields: dict = {}
+    for field, _, value in iter_fields(message):
+        fields.setdefault(field, []).append(value)
+    return fields
+
+
+def decode_spans(spans) -> list:
+    decoded = []
+    for span in spans:
+        fields = decode(span)
+        decoded.append((unzigzag(fields[1][0]), fields[2][0]))
+    return decoded
+
+
+def decode_packed_sint(data: bytes) -> list:
+    values, pos = [], 0
+    while pos < len(data):
+        value, pos = decode_varint(data, pos)
+        values.append(unzigzag(value))
+    return values
+
+
+@pytest.mark.parametrize(
+    "value, schema, index",
+    [
+        (1.0, 0, 0),
+        (1.5, 0, 1),
+        (2.0, 0, 1),
+        (2.5, 0, 2),
+        (0.5, 0, -1),
+        (2.0, 3, 8),
+        (1.1, 3, 2),
+    ],
+)
+def test_bucket_index_uses_upper_inclusive_bounds(value, schema, index):
+    assert bucket_index(value, schema) == index
+    scale = 2.0**-schema
+    assert 2.0 ** ((index - 1) * scale) < value <= 2.0 ** (index * scale)
+
+
+@pytest.mark.parametrize("schema", [-4, 0, 3, 8])
+def test_native_bounds_cover_the_range(schema):
+    low, high = 0.003, 12.0
+    bounds = native_bounds(low, high, schema)
+    assert bounds[0] == ZERO_THRESHOLD
+    assert bounds[1] >= low and bounds[-1] >= high
+    assert bounds[-2] < high
+    growth = 2.0 ** (2.0**-schema)
+    for lower, upper in zip(bounds[1:], bounds[2:]):
+        assert math.isclose(upper / lower, growth)
+    assert first_index(bounds, schema) == bucket_index(low, schema)
+
+
+def test_native_bounds_of_a_single_value():
+    bounds = native_bounds(0.25, 0.25, 3)
+    assert bounds == (ZERO_THRESHOLD, 0.25)
+
+
+def test_encode_row_builds_spans_and_deltas():
+    # Zero bucket, then native buckets 10..15
+    row = [2, 0, 3, 5, 0, 0, 1]
+    count, zero_count, spans, deltas = encode_row(row, 10)
+    assert (count, zero_count) == (11, 2)
+    # Buckets 11-12, then a gap of two, then bucket 15
+    assert spans == [(11, 2), (2, 1)]
+    assert deltas == [3, 2, -4]
+
+
+def test_encode_row_of_an_empty_histogram():
+    assert encode_row([0, 0, 0], -5) == (0, 0, [], [])
+
+
+def test_encode_row_with_a_negative_first_index():
+    assert encode_row([0, 4, 4], -3)[2:] == ([(-3, 2)], [4, 0])
+
+
+def test_remote_write_histogram_fields():
+    row = encode_row([1, 2, 0, 3], 4)
+    fields = decode(remote_write_histogram(row, 12.5, 3, 1_700_000_000_000))
+    assert fields[1] == [6]
+    assert fields[3] == [12.5]
+    assert unzigzag(fields[4][0]) == 3
+    assert fields[5] == [ZERO_THRESHOLD]
+    assert fields[6] == [1]
+    assert decode_spans(fields[11]) == [(4, 1), (1, 1)]
+    assert decode_packed_sint(fields[12][0]) == [2, 1]
+    assert fields[15] == [1_700_000_000_000]
+
+
+def test_exposition_histogram_fields():
+    row = encode_row([0, 0, 7], -2)
+    fields = decode(exposition_histogram(row, 3.0, -1))
+    assert fields[1] == [7]
+    assert fields[2] == [3.0]
+    assert unzigzag(fields[5][0]) == -1
+    assert fields[7] == [0]
+    assert decode_spans(fields[12]) == [(-1, 1)]
+    assert decode_packed_sint(fields[13][0]) == [7]
+
+
+def test_empty_exposition_histogram_has_a_no_op_span():
+    fields = decode(exposition_histogram(encode_row([0, 0], 0), 0.0, 3))
+    assert decode_spans(fields[12]) == [(0, 0)]
+    assert 13 not in fields
@@ -0,0 +1,93 @@
+"""Tests for the hand-rolled protobuf wire encoding (protowire.py)."""
+
+import struct
+
+import pytest
+
+from protowire import (
+    WIRE_I64,
+    WIRE_LEN,
+    WIRE_VARINT,
+    decode_varint,
+    encode_labels,
+    encode_signed_varint,
+    encode_varint,
+    field_bytes,
+    field_double,
+    field_packed_sint,
+    field_sint,
+    field_string,
+    field_varint,
+    iter_fields,
+    tag,
+    zigzag,
+)
+
+
+@pytest.mark.parametrize(
+    "value, encoded",
+    [
+        (0, b"\x00"),
+        (1, b"\x01"),
+        (127, b"\x7f"),
+        (128, b"\x80\x01"),
+        (300, b"\xac\x02"),
+        (2**63, b"\x80\x80\x80\x80\x80\x80\x80\x80\x80\x01"),
+    ],
+)
+def test_encode_varint(value, encoded):
+    assert encode_varint(value) == encoded
+    assert decode_varint(encoded, 0) == (value, len(encoded))
+
+
+def test_decode_varint_from_an_offset():
+    data = b"\xff" + encode_varint(1 << 35) + b"\x05"
+    value, pos = decode_varint(data, 1)
+    assert value == 1 << 35
+    assert decode_varint(data, pos) == (5, len(data))
+
+
+def test_negative_int64_is_ten_bytes_of_twos_complement():
+    assert encode_signed_varint(-1) == b"\xff" * 9 + b"\x01"
+    assert decode_varint(encode_signed_varint(-2), 0)[0] == (1 << 64) - 2
+
+
+@pytest.mark.parametrize(
+    "value, encoded", [(0, 0), (-1, 1), (1, 2), (-2, 3), (2**31 - 1, 2**32 - 2)]
+)
+def test_zigzag(value, encoded):
+    assert zigzag(value) == encoded
+
+
+def test_field_encodings():
+    assert tag(1, WIRE_LEN) == b"\x0a"
+    assert tag(16, WIRE_VARINT) == b"\x80\x01"
+    assert field_string(2, "é") == b"\x12\x02\xc3\xa9"
+    assert field_bytes(1, b"x" * 200)[:3] == b"\x0a\xc8\x01"
+    assert field_double(1, 1.5) == b"\x09" + struct.pack("<d", 1.5)
+    assert field_varint(3, 150) == b"\x18\x96\x01"
+    assert field_sint(4, -3) == b"\x20\x05"
+    assert field_packed_sint(5, [1, -1, 0]) == b"\x2a\x03\x02\x01\x00"
+
+
+def test_iter_fields_decodes_every_wire_type():
+    message = field_varint(1, 7) + field_double(2, -0.25) + field_string(3, "hi")
+    assert list(iter_fields(message)) == [
+        (1, WIRE_VARINT, 7),
+        (2, WIRE_I64, -0.25),
+        (3, WIRE_LEN, b"hi"),
+    ]
+
+
+def test_iter_fields_rejects_unsupported_wire_types():
+    with pytest.raises(ValueError):
+        list(iter_fields(tag(1, 5) + b"\x00\x00\x00\x00"))
+
+
+def test_encode_labels_sorts_by_name():
+    encoded = encode_labels([("job", "api"), ("__name__", "up")])
+    labels = []
+    for field, wire_type, label in iter_fields(encoded):
+        assert (field, wire_type) == (1, WIRE_LEN)
+        labels.append(tuple(value.decode() for _, _, value in iter_fields(label)))
+    assert labels == [("__name__", "up"), ("job", "api")]
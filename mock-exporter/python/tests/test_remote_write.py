@@ -0,0 +1,321 @@
+"""Tests for remote-write pushes against an in-process receiver (remote_write.py)."""
+
+import asyncio
+import http.server
+import threading
+import time
+from collections import deque
+
+import cramjam
+import pytest
+from conftest import BUCKETS, SMALL_CONFIG
+
+import remote_write
+from compiler import compile_config
+from protowire import encode_labels, iter_fields
+from remote_write import (
+    DurableRemoteWriter,
+    RemoteWriteSender,
+    Shard,
+    ShardedEndpoint,
+    backoff_delay,
+    create_remote_writer,
+    wrap_timeseries,
+)
+from series_store import SeriesStore
+
+
+class Receiver(http.server.ThreadingHTTPServer):
+    """Remote-write stand-in that records every request.
+
+    Answers with the queued statuses first, then 204.
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), ReceiverHandler)
+        self.url = f"http://127.0.0.1:{self.server_address[1]}/api/v1/write"
+        self.requests = []
+        self.statuses = deque()
+        self.lock = threading.Lock()
+
+
+class ReceiverHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        with server.lock:
+            status = server.statuses.popleft() if server.statuses else 204
+            server.requests.append((status, dict(self.headers), body))
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def receiver():
+    server = Receiver()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def decode_write_request(body: bytes):
+    """(labels, [(value, timestamp ms)]) of every TimeSeries in a snappy body."""
+    series = []
+    for field, _, timeseries in iter_fields(bytes(cramjam.snappy.decompress_raw(body))):
+        assert field == 1
+        labels, samples = {}, []
+        for ts_field, _, value in iter_fields(bytes(timeseries)):
+            if ts_field == 1:
+                label = {f: v.decode() for f, _, v in iter_fields(value)}
+                labels[label[1]] = label[2]
+            elif ts_field == 2:
+                sample = {f: v for f, _, v in iter_fields(value)}
+                samples.append((sample.get(1, 0.0), sample.get(2, 0)))
+        series.append((labels, samples))
+    return series
+
+
+def family_named(store: SeriesStore, name: str):
+    (family,) = [f for f in store.families.values() if f.name == name]
+    return family
+
+
+def ticked_store(types=("counter", "gauge", "histogram")) -> SeriesStore:
+    store = SeriesStore(seed=7)
+    for compiled in compile_config(SMALL_CONFIG).families:
+        family = store.add_family(compiled)
+        if family.type in types:
+            getattr(family, f"update_{family.type}")(store.rng)
+    return store
+
+
+async def wait_for(condition, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+async def push_once(sender: RemoteWriteSender, receiver: Receiver, requests: int = 1):
+    task = asyncio.create_task(sender.run())
+    try:
+        await wait_for(
+            lambda: len(receiver.requests) >= requests
+            and not any(e.pending() for e in sender.endpoints)
+        )
+        # The last response has to reach the shard before it is counted
+        await wait_for(
+            lambda: all(
+                e.samples_out + e.dropped >= e.samples_in for e in sender.endpoints
+            )
+        )
+    finally:
+        task.cancel()
+        await sender.stop()
+
+
+def test_sender_pushes_every_series_of_the_store(receiver):
+    store = ticked_store()
+    sender = RemoteWriteSender(
+        store, [receiver.url], interval=60, external_labels={"job": "mock"}
+    )
+    before = int(time.time() * 1000)
+    asyncio.run(push_once(sender, receiver))
+    after = int(time.time() * 1000)
+
+    assert len(receiver.requests) == 1
+    status, headers, body = receiver.requests[0]
+    assert headers["Content-Encoding"] == "snappy"
+    assert headers["Content-Type"] == "application/x-protobuf"
+    assert headers["X-Prometheus-Remote-Write-Version"] == "0.1.0"
+
+    series = decode_write_request(body)
+    timestamps = {ts for _, samples in series for _, ts in samples}
+    assert len(timestamps) == 1 and before <= timestamps.pop() <= after
+    assert all(len(samples) == 1 for _, samples in series)
+    assert all(labels["job"] == "mock" for labels, _ in series)
+    by_name = {}
+    for labels, samples in series:
+        by_name.setdefault(labels["__name__"], []).append((labels, samples[0][0]))
+
+    counters = family_named(store, "http_requests_total")
+    assert sorted(by_name["http_requests_total"], key=lambda s: s[0]["region"]) == [
+        (
+            {
+                "__name__": "http_requests_total",
+                "job": "mock",
+                "region": region,
+                "service": "web",
+                "status_code": "200",
+            },
+            value,
+        )
+        for region, value in sorted(
+            zip((v[0] for v in counters.label_values), counters.values.tolist())
+        )
+    ]
+    assert len(by_name["node_memory_usage_percent"]) == 3
+
+    name = "http_request_duration_seconds"
+    assert len(by_name[f"{name}_bucket"]) == 2 * (len(BUCKETS) + 1)
+    histogram = family_named(store, name)
+    for labels, total in by_name[f"{name}_count"]:
+        buckets = {
+            float(b["le"]): value
+            for b, value in by_name[f"{name}_bucket"]
+            if b["region"] == labels["region"]
+        }
+        assert list(buckets.values()) == sorted(buckets.values())
+        assert buckets[float("inf")] == total == 1.0
+        (row,) = [
+            i
+            for i, values in enumerate(histogram.label_values)
+            if labels["region"] in values
+        ]
+        (sum_value,) = [
+            value
+            for s, value in by_name[f"{name}_sum"]
+            if s["region"] == labels["region"]
+        ]
+        assert sum_value == histogram.values[row] > 0
+
+    endpoint = sender.endpoints[0].stats()
+    assert endpoint["samples_out"] == len(series) and endpoint["dropped"] == 0
+
+
+def test_sender_leaves_out_families_that_have_not_ticked(receiver):
+    store = ticked_store(types=("counter",))
+    sender = RemoteWriteSender(store, [receiver.url], interval=60)
+    asyncio.run(push_once(sender, receiver))
+    series = decode_write_request(receiver.requests[0][2])
+    assert {labels["__name__"] for labels, _ in series} == {"http_requests_total"}
+
+
+def test_sender_retries_5xx_and_429_with_backoff(receiver, monkeypatch):
+    attempts = []
+
+    def no_wait(attempt, base, cap):
+        attempts.append(attempt)
+        return 0.0
+
+    monkeypatch.setattr(remote_write, "backoff_delay", no_wait)
+    receiver.statuses.extend([503, 429])
+    sender = RemoteWriteSender(ticked_store(), [receiver.url], interval=60)
+    asyncio.run(push_once(sender, receiver, requests=3))
+
+    assert [status for status, _, _ in receiver.requests] == [503, 429, 204]
+    assert len({body for _, _, body in receiver.requests}) == 1
+    assert attempts == [0, 1]
+    stats = sender.endpoints[0].stats()
+    assert stats["failed_sends"] == 2 and stats["dropped"] == 0
+    assert stats["samples_out"] == stats["samples_in"]
+
+
+def test_sender_drops_batches_the_receiver_rejects(receiver):
+    receiver.statuses.append(400)
+    sender = RemoteWriteSender(ticked_store(), [receiver.url], interval=60)
+    asyncio.run(push_once(sender, receiver))
+
+    assert len(receiver.requests) == 1
+    stats = sender.endpoints[0].stats()
+    assert stats["failed_sends"] == 0 and stats["samples_out"] == 0
+    assert stats["dropped"] == stats["samples_in"] > 0
+
+
+@pytest.mark.parametrize("attempt", range(8))
+def test_backoff_delay_has_full_jitter_below_the_cap(attempt):
+    delays = [backoff_delay(attempt, 0.5, 10.0) for _ in range(200)]
+    assert 0 <= min(delays) and max(delays) <= min(10.0, 0.5 * 2**attempt)
+
+
+def test_durable_writer_delivers_every_tick_in_order(receiver, tmp_path, monkeypatch):
+    monkeypatch.setenv("REMOTE_WRITE_URL", receiver.url)
+    monkeypatch.setenv("REMOTE_WRITE_WAL_DIR", str(tmp_path))
+    monkeypatch.setenv("REMOTE_WRITE_LABELS", "job=wal")
+    monkeypatch.setenv("REMOTE_WRITE_BACKOFF_MAX", "0.01")
+    store = ticked_store(types=())
+    writer = create_remote_writer(store, wal_subdir="shard-0")
+    assert isinstance(writer, DurableRemoteWriter)
+    assert writer.queue.directory == str(tmp_path / "shard-0")
+    counters = family_named(store, "http_requests_total")
+    receiver.statuses.append(500)
+
+    async def run():
+        task = asyncio.create_task(writer.run())
+        try:
+            values = []
+            for _ in range(2):
+                counters.update_counter(store.rng)
+                values.append(counters.values.tolist())
+                writer.on_tick()
+                await asyncio.sleep(0.01)
+            await wait_for(lambda: len(receiver.requests) == 3)
+            await wait_for(lambda: writer.stats()["endpoints"][0]["pending_bytes"] == 0)
+            return values
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await writer.stop()
+
+    values = asyncio.run(run())
+
+    # The refused record is sent again before the next one
+    assert [status for status, _, _ in receiver.requests] == [500, 204, 204]
+    assert receiver.requests[0][2] == receiver.requests[1][2]
+    assert receiver.requests[0][1]["X-Prometheus-Remote-Write-Version"] == "0.1.0"
+    pushed = [decode_write_request(body) for _, _, body in receiver.requests[1:]]
+    timestamps = []
+    for series, expected in zip(pushed, values):
+        # Only the family that ticked is appended
+        assert {labels["__name__"] for labels, _ in series} == {"http_requests_total"}
+        assert all(labels["job"] == "wal" for labels, _ in series)
+        assert [samples[0][0] for _, samples in series] == expected
+        (timestamp,) = {samples[0][1] for _, samples in series}
+        timestamps.append(timestamp)
+    assert timestamps[0] < timestamps[1]
+    assert all(later >= earlier for earlier, later in zip(*values))
+    endpoint = writer.stats()["endpoints"][0]
+    assert endpoint["retries"] == 1 and endpoint["requests"] == 2
+
+
+def test_reshard_never_closes_a_shard_a_route_is_offering_to(receiver, monkeypatch):
+    endpoint = ShardedEndpoint(receiver.url, min_shards=2, reshard_interval=3600)
+    entries = [
+        (i, wrap_timeseries(encode_labels([("__name__", "x"), ("i", str(i))])))
+        for i in range(100)
+    ]
+    routing = threading.Event()
+    offer = Shard.offer
+
+    def slow_offer(shard, entry):
+        if not routing.is_set():
+            # Give the reshard below its chance while the route is under way
+            routing.set()
+            time.sleep(0.2)
+        return offer(shard, entry)
+
+    monkeypatch.setattr(Shard, "offer", slow_offer)
+
+    async def run():
+        endpoint.start()
+        route = asyncio.create_task(asyncio.to_thread(endpoint.route, entries))
+        await asyncio.to_thread(routing.wait)
+        endpoint.reshard(3)
+        await route
+        try:
+            await wait_for(
+                lambda: endpoint.samples_out + endpoint.dropped == endpoint.samples_in
+            )
+        finally:
+            await endpoint.stop()
+
+    asyncio.run(run())
+    assert endpoint.samples_out == len(entries) and endpoint.dropped == 0
+    received = sum(len(decode_write_request(body)) for _, _, body in receiver.requests)
+    assert received == len(entries)
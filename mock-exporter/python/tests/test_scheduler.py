@@ -0,0 +1,187 @@
+"""Tests for the deadline-heap tick scheduler (scheduler.py)."""
+
+import asyncio
+import time
+
+import pytest
+
+import scheduler
+from scheduler import TickScheduler
+
+
+class FakeClock:
+    """Stands in for the time module: monotonic() only moves when told to."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(scheduler, "time", fake)
+    return fake
+
+
+def recorder(calls, name):
+    return lambda: calls.append(name)
+
+
+def test_due_jobs_run_in_deadline_order(clock):
+    sched = TickScheduler()
+    calls = []
+    for name, delay in (("a", 3.0), ("b", 1.0), ("c", 2.0)):
+        sched.add_job(name, recorder(calls, name), 10, 10, delay=delay)
+
+    assert sched.run_due(clock.now + 0.5) == 0
+    assert sched.run_due(clock.now + 1.0) == 1
+    assert calls == ["b"]
+    assert sched.run_due(clock.now + 3.0) == 2
+    assert calls == ["b", "c", "a"]
+    assert sched.stats()["ticks"] == 2 and sched.stats()["jobs_run"] == 3
+
+
+def test_jobs_due_within_the_resolution_share_a_batch(clock):
+    sched = TickScheduler(resolution=0.05)
+    calls = []
+    batches = []
+    sched.add_batch_hook(lambda: batches.append(list(calls)))
+    for name, delay in (("a", 1.0), ("b", 1.04), ("c", 1.06)):
+        sched.add_job(name, recorder(calls, name), 10, 10, delay=delay)
+
+    assert sched.run_due(clock.now + 1.0) == 2
+    assert batches == [["a", "b"]]
+    assert sched.run_due(clock.now + 1.01) == 1
+    assert batches == [["a", "b"], ["a", "b", "c"]]
+
+
+def test_lag_is_measured_from_the_earliest_deadline(clock):
+    sched = TickScheduler(lag_warn_seconds=0.5)
+    lags = []
+    sched.add_lag_observer(lags.append)
+    sched.add_job("a", lambda: None, 10, 10, delay=1.0)
+    sched.add_job("b", lambda: None, 10, 10, delay=1.2)
+
+    sched.run_due(clock.now + 1.8)
+    assert lags == [pytest.approx(0.8)]
+    sched.add_job("c", lambda: None, 10, 10, delay=2.0)
+    sched.run_due(clock.now + 2.1)
+    assert lags == [pytest.approx(0.8), pytest.approx(0.1)]
+
+    stats = sched.stats()
+    assert stats["last_lag_seconds"] == pytest.approx(0.1)
+    assert stats["max_lag_seconds"] == pytest.approx(0.8)
+    assert stats["lagging_ticks"] == 1
+
+
+def test_job_observers_see_every_run(clock):
+    sched = TickScheduler()
+    runs = []
+    sched.add_job_observer(lambda name, seconds: runs.append((name, seconds)))
+    sched.add_job("a", lambda: None, 10, 10, delay=0)
+    sched.add_job("b", lambda: None, 10, 10, delay=0)
+    sched.run_due(clock.now)
+    assert runs == [("a", 0.0), ("b", 0.0)]
+
+
+def test_jobs_are_rescheduled_from_when_the_batch_finished(clock):
+    sched = TickScheduler()
+    calls = []
+
+    def slow():
+        calls.append(clock.now)
+        clock.now += 0.3
+
+    job = sched.add_job("a", slow, 2, 2, delay=0)
+    start = clock.now
+    sched.run_due(start)
+    # Due again 2s after the batch finished, not after it started
+    assert sched.run_due(start + 2.2) == 0
+    assert sched.run_due(start + 2.3) == 1
+    assert job.runs == 2 and calls == [start, start + 0.3]
+
+
+def test_cadences_stay_within_their_range(clock):
+    sched = TickScheduler(seed=1)
+    job = sched.add_job("a", lambda: None, 1, 3)
+    intervals = [job.next_interval() for _ in range(200)]
+    assert 1 <= min(intervals) and max(intervals) <= 3
+    assert len(set(intervals)) > 100
+
+
+def test_seeded_cadences_repeat_per_job_name(clock):
+    def intervals(seed, name):
+        job = TickScheduler(seed=seed).add_job(name, lambda: None, 1, 3)
+        return [job.next_interval() for _ in range(5)]
+
+    assert intervals(5, "a") == intervals(5, "a")
+    assert intervals(5, "a") != intervals(5, "b")
+    assert intervals(5, "a") != intervals(6, "a")
+
+
+def test_removed_jobs_stop_running(clock):
+    sched = TickScheduler()
+    calls = []
+    for name in ("a", "b", "c"):
+        sched.add_job(name, recorder(calls, name), 1, 1, delay=0)
+
+    assert sched.remove_job("b") is True
+    assert sched.remove_job("b") is False
+    assert sched.stats()["jobs"] == 2
+    sched.run_due(clock.now)
+    sched.run_due(clock.now + 1)
+    assert calls == ["a", "c", "a", "c"]
+
+
+def test_a_removed_job_can_be_scheduled_again(clock):
+    sched = TickScheduler()
+    calls = []
+    sched.add_job("a", recorder(calls, "old"), 1, 1, delay=0)
+    sched.remove_job("a")
+    sched.add_job("a", recorder(calls, "new"), 5, 5, delay=0.5)
+
+    assert sched.run_due(clock.now) == 0
+    sched.run_due(clock.now + 0.5)
+    assert calls == ["new"]
+    assert sched.run_due(clock.now + 1.5) == 0
+
+
+def test_a_failing_job_does_not_stop_the_batch(clock):
+    sched = TickScheduler()
+    calls = []
+
+    def broken():
+        raise RuntimeError("boom")
+
+    sched.add_job("broken", broken, 1, 1, delay=0)
+    sched.add_job("ok", recorder(calls, "ok"), 1, 1, delay=0)
+    sched.add_batch_hook(lambda: calls.append("hook"))
+    assert sched.run_due(clock.now) == 2
+    assert calls == ["ok", "hook"]
+    # The failed job stays scheduled
+    assert sched.run_due(clock.now + 1) == 2
+
+
+def test_run_wakes_up_for_jobs_added_while_running():
+    sched = TickScheduler(resolution=0.001)
+    runs = []
+
+    async def main():
+        task = asyncio.create_task(sched.run())
+        await asyncio.sleep(0.01)
+        # The loop is waiting with an empty heap; adding a job wakes it
+        sched.add_job("a", lambda: runs.append(time.monotonic()), 0.01, 0.01, 0)
+        while len(runs) < 3:
+            await asyncio.sleep(0.005)
+        sched.stop()
+        await asyncio.wait_for(task, 1)
+
+    asyncio.run(main())
+    assert all(later - earlier >= 0.009 for earlier, later in zip(runs, runs[1:]))
+    assert sched.stats()["jobs_run"] >= 3 and not sched.running
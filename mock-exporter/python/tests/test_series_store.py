@@ -0,0 +1,257 @@
+"""Tests for the array-backed series state store (series_store.py)."""
+
+import copy
+import os
+
+import numpy as np
+import pytest
+import yaml
+from conftest import SMALL_CONFIG
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+
+from compiler import ConfigDiff, compile_config
+from series_store import SeriesStore
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config.yml")
+
+REFERENCE_BUCKETS = [0.1, 0.25, 0.5, 1, 2.5]
+
+# One family per update rule of the original per-child updaters
+REFERENCE_CONFIG = {
+    "http_metrics": [
+        {
+            "name": "http_requests_total",
+            "type": "counter",
+            "value": value,
+            "labels": {"service": service, "region": "us-east-1"},
+        }
+        for service, value in (("web", 1000), ("api", 50))
+    ]
+    + [
+        {
+            "name": "http_request_duration_seconds",
+            "type": "histogram",
+            "value": value,
+            "labels": {"service": service},
+            "buckets": REFERENCE_BUCKETS,
+        }
+        for service, value in (("web", 0.3), ("api", 0.9))
+    ],
+    "node_metrics": [
+        {
+            "name": name,
+            "type": "gauge",
+            "value": value,
+            "labels": {"instance": "node-1"},
+        }
+        for name, value in (
+            ("node_memory_usage_percent", 60),
+            ("node_cpu_usage_percent", 85),
+            ("node_load1", 2),
+        )
+    ],
+}
+
+
+def random_delta(base_value: float, variation: float, draw: float) -> float:
+    """The original _random_delta, given its 1 + uniform(-variation, variation)."""
+    assert 1 - variation <= draw <= 1 + variation
+    return base_value * draw
+
+
+class PerChildReference:
+    """The updaters as they were before the series store, one child at a time.
+
+    Fed the same uniform draws as the store, so both must agree.
+    """
+
+    def __init__(self, config):
+        self.registry = CollectorRegistry()
+        self.metrics = {}
+        self.configs = {}
+        self.current = {}
+        for section in config.values():
+            for entry in section:
+                key = (entry["name"], entry["type"])
+                self.configs.setdefault(key, []).append(entry)
+        for (name, metric_type), entries in self.configs.items():
+            labelnames = list(entries[0]["labels"])
+            if metric_type == "counter":
+                metric = Counter(name, name, labelnames, registry=self.registry)
+            elif metric_type == "gauge":
+                metric = Gauge(name, name, labelnames, registry=self.registry)
+                for entry in entries:
+                    self.current[name, self._key(entry)] = entry["value"]
+            else:
+                metric = Histogram(
+                    name,
+                    name,
+                    labelnames,
+                    buckets=entries[0]["buckets"],
+                    registry=self.registry,
+                )
+            self.metrics[name, metric_type] = metric
+
+    @staticmethod
+    def _key(entry):
+        return hash(str(sorted(entry["labels"].items())))
+
+    def update(self, name: str, metric_type: str, uniforms):
+        metric = self.metrics[name, metric_type]
+        for entry, u in zip(self.configs[name, metric_type], uniforms):
+            base, labels = entry["value"], entry["labels"]
+            child = metric.labels(**labels)
+            if metric_type == "counter":
+                child.inc(random_delta(base * 0.1, 0.5, u))
+            elif metric_type == "histogram":
+                child.observe(random_delta(base, 0.2, u))
+            else:
+                key = name, self._key(entry)
+                self.current[key] += random_delta(base * 0.05, 0.3, u)
+                if "memory" in name or "disk" in name:
+                    self.current[key] = max(0, min(self.current[key], base * 1.5))
+                elif "cpu" in name:
+                    self.current[key] = max(0, min(self.current[key], 100))
+                child.set(self.current[key])
+
+    def samples(self):
+        return samples_of(self.registry.collect())
+
+
+def samples_of(families):
+    """{(sample name, sorted labels): value}, without _created samples."""
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in families
+        for sample in family.samples
+        if not sample.name.endswith("_created")
+    }
+
+
+# (low, high) of the uniform each type draws per update
+DRAW_RANGES = {"counter": (0.5, 1.5), "histogram": (0.8, 1.2), "gauge": (0.7, 1.3)}
+
+
+def test_updates_match_the_per_child_updaters():
+    store = SeriesStore(seed=11)
+    families = [
+        store.add_family(compiled)
+        for compiled in compile_config(REFERENCE_CONFIG).families
+    ]
+    reference = PerChildReference(REFERENCE_CONFIG)
+
+    for _ in range(40):
+        for family in families:
+            # A seeded family's draws for the next update, as it will take them
+            uniforms = family._uniform(None, *DRAW_RANGES[family.type])
+            reference.update(family.name, family.type, uniforms.tolist())
+            getattr(family, f"update_{family.type}")(store.rng)
+
+    expected = reference.samples()
+    actual = samples_of(store.collect())
+    assert actual.keys() == expected.keys()
+    for key, value in expected.items():
+        assert actual[key] == pytest.approx(value, rel=1e-12), key
+    # The clamps took effect within those 40 updates
+    memory = ("node_memory_usage_percent", (("instance", "node-1"),))
+    cpu = ("node_cpu_usage_percent", (("instance", "node-1"),))
+    assert actual[memory] == 90.0 and actual[cpu] == 100.0
+
+
+@pytest.fixture(scope="module")
+def config():
+    with open(CONFIG_PATH, encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+@pytest.mark.parametrize("workload", [True, False], ids=["workload", "independent"])
+@pytest.mark.parametrize("seed", [None, 3], ids=["shared", "seeded"])
+def test_invariants_hold_over_many_updates(config, workload, seed):
+    if not workload:
+        config = {k: v for k, v in config.items() if k != "workload"}
+    compiled = compile_config(config)
+    store = SeriesStore(seed, compiled.workload)
+    for family in compiled.families:
+        store.add_family(family)
+
+    previous = {}
+    for _ in range(30):
+        for key, family in store.families.items():
+            getattr(family, f"update_{family.type}")(store.rng)
+            if family.type == "counter":
+                assert np.all(family.values >= previous.get(key, 0.0)), key
+                previous[key] = family.values.copy()
+            elif family.type == "gauge":
+                assert np.all(family.values >= family.lower), key
+                assert np.all(family.values <= family.upper), key
+            else:
+                assert_histogram_consistent(family)
+
+
+def assert_histogram_consistent(family):
+    """_count equals the +Inf bucket, and _sum lies within the bucket bounds."""
+    counts = family.bucket_counts
+    cumulative = family.classic_counts().cumsum(axis=1)
+    total = counts.sum(axis=1)
+    assert np.array_equal(cumulative[:, -1], total), family.name
+    assert np.all(np.diff(cumulative, axis=1) >= 0), family.name
+    assert np.all(counts == np.round(counts)), family.name
+
+    lower = np.concatenate(([0.0], family.bucket_bounds[:-1]))
+    finite = np.isfinite(family.bucket_bounds)
+    upper_sum = counts[:, finite] @ family.bucket_bounds[finite]
+    tolerance = 1e-9 * np.maximum(1.0, family.values)
+    assert np.all(family.values >= counts @ lower - tolerance), family.name
+    # Only series with nothing in the +Inf bucket have a finite upper bound
+    bounded = counts[:, ~finite].sum(axis=1) == 0
+    assert np.all(
+        family.values[bounded] <= upper_sum[bounded] + tolerance[bounded]
+    ), family.name
+    assert np.all((total > 0) | (family.values == 0)), family.name
+
+
+def test_reload_keeps_counters_and_restarts_rebucketed_histograms():
+    old_config = compile_config(SMALL_CONFIG)
+    store = SeriesStore(seed=2)
+    for compiled in old_config.families:
+        store.add_family(compiled)
+    for _ in range(5):
+        for family in store.families.values():
+            getattr(family, f"update_{family.type}")(store.rng)
+    counters = store.families["http_requests_total_counter"]
+    before = dict(zip(counters.label_values, counters.values.tolist()))
+
+    config = copy.deepcopy(SMALL_CONFIG)
+    # A counter series more, new histogram buckets, a new gauge base
+    added = copy.deepcopy(config["http_metrics"][0])
+    added["labels"]["status_code"] = "500"
+    config["http_metrics"].append(added)
+    for entry in config["http_metrics"]:
+        if entry["type"] == "histogram":
+            entry["buckets"] = [0.1, 0.3, 1]
+    for entry in config["node_metrics"]:
+        entry["value"] = 70
+    new_config = compile_config(config)
+    diff = ConfigDiff(old_config, new_config)
+    assert set(diff.reshaped) == {
+        "http_requests_total_counter",
+        "http_request_duration_seconds_histogram",
+    }
+    assert diff.updated == ("node_memory_usage_percent_gauge",)
+
+    stats = store.reload(new_config.families, diff.unchanged, new_config.workload)
+    assert stats == {"kept": 5, "added": 3, "removed": 2}
+
+    counters = store.families["http_requests_total_counter"]
+    after = dict(zip(counters.label_values, counters.values.tolist()))
+    assert {labels: after[labels] for labels in before} == before
+    assert sorted(after.values())[0] == 0.0
+
+    histogram = store.families["http_request_duration_seconds_histogram"]
+    assert histogram.bucket_counts.shape == (2, 4)
+    assert not histogram.values.any() and not histogram.bucket_counts.any()
+    for _ in range(5):
+        histogram.update_histogram(store.rng)
+        counters.update_counter(store.rng)
+        assert_histogram_consistent(histogram)
+        assert np.all(counters.values >= list(after.values()))
@@ -0,0 +1,172 @@
+"""Tests for the loop lag probe and scrape admission (serving.py)."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from conftest import wait_until
+from prometheus_client.parser import text_string_to_metric_families
+
+import main
+from instrumentation import EVENT_LOOP_LAG, SELF_REGISTRY
+from serving import LoopLagProbe, ScrapeAdmission
+
+
+def lag_samples(text: str):
+    """{sample name: value} of the event-loop lag histogram."""
+    (family,) = [
+        f
+        for f in text_string_to_metric_families(text)
+        if f.name == "mock_exporter_event_loop_lag_seconds"
+    ]
+    return {
+        (s.name, s.labels.get("le")): s.value
+        for s in family.samples
+        if not s.name.endswith("_created")
+    }
+
+
+def recorded_lag():
+    """(count, sum) of EVENT_LOOP_LAG in this process."""
+    (family,) = EVENT_LOOP_LAG.collect()
+    values = {s.name: s.value for s in family.samples}
+    return (
+        values["mock_exporter_event_loop_lag_seconds_count"],
+        values["mock_exporter_event_loop_lag_seconds_sum"],
+    )
+
+
+def probes_served(client) -> float:
+    text = client.get("/internal/metrics").text
+    return lag_samples(text)["mock_exporter_event_loop_lag_seconds_count", None]
+
+
+def test_probe_records_a_blocked_loop():
+    count, total = recorded_lag()
+
+    async def main():
+        probe = LoopLagProbe(interval=0.01)
+        probe.start()
+        await asyncio.sleep(0.05)
+        time.sleep(0.3)
+        await asyncio.sleep(0.05)
+        await probe.stop()
+        return probe
+
+    probe = asyncio.run(main())
+    assert probe.max >= 0.25
+    after = recorded_lag()
+    assert after[0] > count and after[1] - total >= 0.25
+
+
+@pytest.mark.parametrize("evaluation", ["ticks", "lazy"])
+def test_internal_metrics_show_event_loop_lag(serve, evaluation):
+    # Observations of earlier tests in this process stay in the histogram
+    before = recorded_lag()[0]
+    # Scrape-time evaluation runs no scheduler; the probe runs regardless
+    with serve(EXPORTER_EVALUATION=evaluation, EXPORTER_SEED="1") as client:
+        wait_until(lambda: probes_served(client) > before)
+        samples = lag_samples(client.get("/internal/metrics").text)
+        assert samples["mock_exporter_event_loop_lag_seconds_bucket", "+Inf"] == (
+            samples["mock_exporter_event_loop_lag_seconds_count", None]
+        )
+
+
+def rejected(reason: str) -> float:
+    value = SELF_REGISTRY.get_sample_value(
+        "mock_exporter_scrapes_rejected_total", {"reason": reason}
+    )
+    return value or 0.0
+
+
+class LaggingProbe:
+    def __init__(self, lag: float):
+        self.last = lag
+
+    def lag(self) -> float:
+        return self.last
+
+
+def test_admission_queues_in_order_and_sheds_the_excess():
+    before = {reason: rejected(reason) for reason in ("queue_full", "queue_timeout")}
+
+    async def scenario():
+        admission = ScrapeAdmission(max_inflight=2, max_queued=2, queue_timeout=0.1)
+        assert await admission.acquire() is None
+        assert await admission.acquire() is None
+        admitted = []
+
+        async def scrape(name):
+            admitted.append((name, await admission.acquire()))
+
+        queued = [asyncio.create_task(scrape(name)) for name in ("a", "b")]
+        await asyncio.sleep(0)
+        assert admission.stats()["queued"] == 2
+        assert await admission.acquire() == "queue_full"
+
+        # Freed slots go to the queued scrapes in arrival order
+        admission.release()
+        await asyncio.sleep(0.01)
+        assert admitted == [("a", None)]
+        await asyncio.gather(*queued)
+        assert admitted == [("a", None), ("b", "queue_timeout")]
+        return admission.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["inflight"] == 2 and stats["queued"] == 0
+    assert stats["admitted"] == 3 and stats["queued_total"] == 2
+    assert stats["rejected"] == {"loop_lag": 0, "queue_full": 1, "queue_timeout": 1}
+    for reason, count in before.items():
+        assert rejected(reason) == count + 1
+
+
+def test_admission_rejects_while_the_loop_lags():
+    before = rejected("loop_lag")
+    probe = LaggingProbe(1.0)
+    admission = ScrapeAdmission(max_loop_lag=0.5, probe=probe)
+    assert asyncio.run(admission.acquire()) == "loop_lag"
+    assert rejected("loop_lag") == before + 1
+    probe.last = 0.1
+    assert asyncio.run(admission.acquire()) is None
+    assert admission.inflight == 1
+
+
+def test_overloaded_metrics_answer_503_with_retry_after(serve):
+    with serve(
+        METRICS_MAX_INFLIGHT="1",
+        METRICS_MAX_QUEUED="1",
+        METRICS_QUEUE_TIMEOUT="30",
+        METRICS_RETRY_AFTER="7",
+    ) as client:
+        before = rejected("queue_full")
+        # Hold the only slot, as a slow scrape would
+        assert client.portal.call(main.admission.acquire) is None
+        responses = []
+        waiting = threading.Thread(
+            target=lambda: responses.append(client.get("/metrics"))
+        )
+        waiting.start()
+        wait_until(
+            lambda: client.get("/healthz").json()["serving"]["admission"]["queued"]
+        )
+
+        response = client.get("/metrics")
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "7"
+        assert "queue_full" in response.text
+        assert rejected("queue_full") == before + 1
+        internal = client.get("/internal/metrics").text
+        assert (
+            f'mock_exporter_scrapes_rejected_total{{reason="queue_full"}} {before + 1}'
+            in internal
+        )
+
+        # The freed slot goes to the queued scrape
+        client.portal.call(main.admission.release)
+        waiting.join(timeout=10)
+        assert [r.status_code for r in responses] == [200]
+        admission = client.get("/healthz").json()["serving"]["admission"]
+        assert admission["inflight"] == 0 and admission["queued"] == 0
+        assert admission["rejected"]["queue_full"] == 1
+        assert client.get("/metrics").status_code == 200
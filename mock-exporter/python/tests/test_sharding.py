@@ -0,0 +1,119 @@
+"""Tests for the multi-process sharded exporter (sharding.py)."""
+
+import os
+
+import pytest
+import yaml
+from conftest import wait_until
+from prometheus_client import CollectorRegistry
+from prometheus_client.parser import text_string_to_metric_families
+
+import main
+from compiler import compile_config
+from exposition import ExpositionCache
+from label_index import View
+from series_store import SeriesFamily, SeriesStore, SimulatedClock
+from sharding import ShardedExposition, ShardPublisher, ShardSnapshot, snapshot_file
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config.yml")
+START = 1_700_000_000.0
+SEED = 4
+
+
+class InProcessPool:
+    """Stands in for ShardPool: the shards publish in this process."""
+
+    def __init__(self, publishers):
+        self.publishers = publishers
+
+    def render(self, fmt, view=None):
+        snapshots = []
+        for publisher in self.publishers:
+            publisher.publish(fmt, view)
+            path = snapshot_file(publisher.path, fmt, view)
+            snapshots.append(ShardSnapshot(path))
+        return snapshots
+
+
+def ticked_store(compiled, updates: int = 4) -> SeriesStore:
+    """A seeded store of compiled, updated on a simulated clock."""
+    clock = SimulatedClock(START)
+    store = SeriesStore(SEED, compiled.workload)
+    for family in compiled.families:
+        store.families[family.key] = SeriesFamily(
+            family, SEED, clock, compiled.workload
+        )
+    for update in range(updates):
+        clock.now = START + 2.0 * (update + 1)
+        for family in store.families.values():
+            getattr(family, f"update_{family.type}")(store.rng)
+    return store
+
+
+@pytest.mark.parametrize("shards", [2, 3])
+@pytest.mark.parametrize("fmt", ["text", "openmetrics", "protobuf"])
+def test_stitched_shards_match_a_single_process(tmp_path, shards, fmt):
+    with open(CONFIG_PATH, encoding="utf-8") as f:
+        compiled = compile_config(yaml.safe_load(f))
+    single = ExpositionCache(ticked_store(compiled), registry=CollectorRegistry())
+    pool = InProcessPool(
+        [
+            ShardPublisher(
+                ticked_store(compiled.shard(index, shards)),
+                str(tmp_path / f"shard-{index}.snap"),
+            )
+            for index in range(shards)
+        ]
+    )
+    stitched = ShardedExposition(pool, compiled.families, registry=CollectorRegistry())
+    assert stitched.render(fmt).body == single.render(fmt).body
+
+    view = View.from_query([("region", "us-east-1")])
+    assert (
+        stitched.filtered(view).render(fmt).body
+        == single.filtered(view).render(fmt).body
+    )
+
+
+def exposed_series(text: str):
+    """{family: (type, help, series label sets)} of a text exposition."""
+    return {
+        family.name: (
+            family.type,
+            family.documentation,
+            sorted(
+                (sample.name, tuple(sorted(sample.labels.items())))
+                for sample in family.samples
+            ),
+        )
+        for family in text_string_to_metric_families(text)
+    }
+
+
+def test_sharded_app_serves_the_single_process_series(serve):
+    with serve() as client:
+        single = exposed_series(client.get("/metrics").text)
+    with serve(EXPORTER_SHARDS="2") as client:
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert exposed_series(response.text) == single
+        shards = client.get("/healthz").json()["shards"]
+        assert [shard["state"] for shard in shards] == ["ready", "ready"]
+
+
+def test_a_dead_shard_is_restarted_and_scrapes_get_503_meanwhile(serve):
+    with serve(EXPORTER_SHARDS="2") as client:
+        assert client.get("/metrics").status_code == 200
+        pool = main.exporter.shard_pool
+        pool.processes[1].kill()
+        pool.processes[1].join()
+
+        response = client.get("/metrics")
+        assert response.status_code == 503
+        assert response.headers["retry-after"]
+        assert client.get("/healthz").json()["ready"] is False
+
+        wait_until(lambda: client.get("/metrics").status_code == 200, timeout=30)
+        shards = client.get("/healthz").json()["shards"]
+        assert [shard["restarts"] for shard in shards] == [0, 1]
+        assert all(shard["state"] == "ready" for shard in shards)
@@ -0,0 +1,76 @@
+"""Tests for startup readiness and the compiled config cache, through the app."""
+
+import threading
+
+import yaml
+from conftest import SMALL_CONFIG, wait_until
+
+import main
+
+
+def test_healthz_reaches_ready_with_a_cache_miss_then_a_hit(serve):
+    with serve() as client:
+        health = client.get("/healthz").json()
+        assert health["status"] == "ok" and health["ready"] is True
+        startup = health["startup"]
+        assert startup["phase"] == "ready"
+        assert set(startup["seconds"]) == {"loading", "registering", "total"}
+        assert startup["config"]["cache"] == "miss"
+        assert {"read", "parse", "compile", "cache_write"} <= set(
+            startup["config"]["seconds"]
+        )
+        assert health["metrics_count"] == 3
+        assert health["series"]["count"] == 7
+        assert client.get("/metrics").status_code == 200
+
+    with serve() as client:
+        config = client.get("/healthz").json()["startup"]["config"]
+        assert config["cache"] == "hit"
+        assert set(config["seconds"]) == {"read"}
+        assert b"http_requests_total{" in client.get("/metrics").content
+
+
+def test_healthz_without_a_config_cache(serve):
+    with serve(CONFIG_CACHE_DIR="") as client:
+        config = client.get("/healthz").json()["startup"]["config"]
+        assert config["cache"] == "disabled" and "key" not in config
+
+
+def test_metrics_answers_503_until_registered(serve, monkeypatch):
+    registering = threading.Event()
+    release = threading.Event()
+    register_metrics = main.MockExporter.register_metrics
+
+    def slow_register_metrics(self):
+        registering.set()
+        release.wait(10)
+        register_metrics(self)
+
+    monkeypatch.setattr(main.MockExporter, "register_metrics", slow_register_metrics)
+    with serve(ready=False) as client:
+        assert registering.wait(10)
+        health = client.get("/healthz").json()
+        assert health["status"] == "starting" and health["ready"] is False
+        assert health["startup"]["phase"] == "registering"
+        response = client.get("/metrics")
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+
+        release.set()
+        wait_until(lambda: client.get("/healthz").json()["ready"])
+        assert client.get("/metrics").status_code == 200
+
+
+def test_config_watch_runs_without_a_sighup_handler(serve, config_path):
+    # TestClient runs the app off the main thread, where SIGHUP cannot be
+    # installed; the file watch must start all the same
+    with serve(CONFIG_WATCH_INTERVAL="0.05") as client:
+        config = dict(SMALL_CONFIG)
+        config["node_metrics"] = SMALL_CONFIG["node_metrics"][:1]
+        with open(config_path, "w", encoding="utf-8") as f:
+            yaml.safe_dump(config, f)
+
+        reload = wait_until(lambda: client.get("/healthz").json()["reload"])
+        assert reload["status"] == "ok"
+        assert reload["series"]["removed"] == 2
+        assert client.get("/healthz").json()["series"]["count"] == 5
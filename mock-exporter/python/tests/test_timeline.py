@@ -0,0 +1,135 @@
+"""Tests for seeded streams and precomputed timelines (timeline.py)."""
+
+import hashlib
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+import yaml
+
+from compiler import compile_config
+from series_store import SeriesFamily, SimulatedClock
+from timeline import Timeline, build_timeline, default_step
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(__file__))
+CONFIG_PATH = os.path.join(PACKAGE_DIR, "config.yml")
+START = 1_700_000_000.0
+
+
+def compiled_config():
+    with open(CONFIG_PATH, encoding="utf-8") as f:
+        return compile_config(yaml.safe_load(f))
+
+
+def run(seed: int, updates: int = 12, reverse: bool = False):
+    """{family key: state bytes after each update} of a seeded run.
+
+    Families update in config order, or in reverse order to stand in for a
+    different scheduling of the same ticks.
+    """
+    compiled = compiled_config()
+    families = [
+        (SeriesFamily(family, seed, clock, compiled.workload), clock)
+        for family, clock in (
+            (family, SimulatedClock(START)) for family in compiled.families
+        )
+    ]
+    if reverse:
+        families.reverse()
+    states = {family.compiled.key: [] for family, _ in families}
+    for update in range(updates):
+        for family, clock in families:
+            clock.now = START + (update + 1) * default_step(family.type)
+            getattr(family, f"update_{family.type}")(None)
+            state = family.values.tobytes()
+            if family.type == "histogram":
+                state += family.bucket_counts.tobytes()
+            states[family.compiled.key].append(state)
+    return states
+
+
+def digest(seed: int) -> str:
+    sha = hashlib.sha256()
+    for key, states in sorted(run(seed).items()):
+        sha.update(key.encode())
+        for state in states:
+            sha.update(state)
+    return sha.hexdigest()
+
+
+def test_same_seed_gives_identical_streams_in_any_update_order():
+    first = run(42)
+    assert run(42) == first
+    assert run(42, reverse=True) == first
+    other = run(43)
+    # Constant gauges (targets, capacities) draw nothing
+    changed = {key for key, states in first.items() if other[key] != states}
+    assert {key for key in first if not key.endswith("_gauge")} <= changed
+
+
+def test_same_seed_gives_identical_streams_across_processes():
+    # A fresh interpreter, with its own hash seed, reproduces this run's bytes
+    script = "from test_timeline import digest; print(digest(42))"
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=PACKAGE_DIR,
+        env=dict(
+            os.environ,
+            PYTHONHASHSEED="12345",
+            PYTHONPATH=os.pathsep.join(
+                [PACKAGE_DIR, os.path.join(PACKAGE_DIR, "tests")]
+            ),
+        ),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == digest(42)
+
+
+@pytest.fixture(scope="module")
+def recorded(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("timeline") / "run.mxt")
+    build_timeline(compiled_config(), path, seed=9, duration=30)
+    return Timeline(path)
+
+
+def test_replay_reproduces_the_recorded_values(recorded):
+    compiled = compiled_config()
+    assert recorded.seed == 9
+    for family_config in compiled.families:
+        track = recorded.track(family_config)
+        assert track.frames == int(np.ceil(30 / track.step))
+        clock = SimulatedClock(recorded.created)
+        generated = SeriesFamily(family_config, 9, clock, compiled.workload)
+        replayed = SeriesFamily(family_config, 9, workload=compiled.workload)
+        replayed.timeline = track
+        for frame in range(track.frames):
+            clock.now = recorded.created + (frame + 1) * track.step
+            getattr(generated, f"update_{generated.type}")(None)
+            replayed.replay()
+            assert np.array_equal(replayed.values, generated.values), (
+                family_config.key,
+                frame,
+            )
+            if generated.type == "histogram":
+                assert np.array_equal(
+                    replayed.bucket_counts, generated.bucket_counts
+                ), (family_config.key, frame)
+        assert replayed.version == replayed.updates == track.frames
+
+
+def test_replay_restarts_when_the_timeline_wraps(recorded):
+    compiled = compiled_config()
+    (family_config,) = [
+        f for f in compiled.families if f.type == "histogram" and f.rates is None
+    ][:1]
+    track = recorded.track(family_config)
+    replayed = SeriesFamily(family_config, 9)
+    replayed.timeline = track
+    for _ in range(track.frames + 1):
+        replayed.replay()
+    assert np.array_equal(replayed.values, track.values[0])
+    assert replayed.bucket_counts.sum() == replayed.size
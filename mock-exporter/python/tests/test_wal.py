@@ -0,0 +1,201 @@
+"""Tests for the segmented write-ahead queue (wal.py)."""
+
+import json
+import os
+
+import pytest
+
+from wal import RECORD_HEADER, Segment, WriteAheadQueue
+
+SEGMENT_BYTES = 256
+# 62 bytes framed: four records fill a segment
+PAYLOAD_BYTES = 50
+
+
+def payload(i: int) -> bytes:
+    return bytes([i % 256]) * PAYLOAD_BYTES
+
+
+def drain(queue: WriteAheadQueue, consumer: str):
+    """Read and commit everything queued for a consumer."""
+    records = []
+    while True:
+        record = queue.read(consumer)
+        if record is None:
+            return records
+        data, series, position = record
+        records.append((data, series))
+        queue.commit(consumer, position)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = WriteAheadQueue(
+        str(tmp_path), segment_bytes=SEGMENT_BYTES, max_bytes=4 * SEGMENT_BYTES
+    )
+    yield q
+    q.close()
+
+
+def reopen(queue: WriteAheadQueue, max_segments: int = 4) -> WriteAheadQueue:
+    queue.close()
+    return WriteAheadQueue(
+        queue.directory,
+        segment_bytes=SEGMENT_BYTES,
+        max_bytes=max_segments * SEGMENT_BYTES,
+    )
+
+
+def test_records_survive_a_restart(queue):
+    for i in range(6):
+        queue.append(payload(i), series=i)
+    queue = reopen(queue)
+    queue.add_consumer("a")
+    assert drain(queue, "a") == [(payload(i), i) for i in range(6)]
+    queue.close()
+
+
+def test_rescan_stops_at_a_crc_corrupt_record(queue):
+    for i in range(3):
+        queue.append(payload(i))
+    # Flip a payload byte of the third record
+    offset = 2 * (RECORD_HEADER.size + PAYLOAD_BYTES) + RECORD_HEADER.size
+    queue.head.mm[offset] ^= 0xFF
+    queue = reopen(queue)
+
+    assert queue.head.records == 2
+    assert queue.head.write_offset == 2 * (RECORD_HEADER.size + PAYLOAD_BYTES)
+    queue.append(payload(9))
+    queue.add_consumer("a")
+    assert [data for data, _ in drain(queue, "a")] == [
+        payload(0),
+        payload(1),
+        payload(9),
+    ]
+    queue.close()
+
+
+def test_rescan_stops_at_a_torn_record(tmp_path):
+    path = str(tmp_path / "00000000.seg")
+    segment = Segment(path, 0, SEGMENT_BYTES)
+    segment.append(payload(0), 0)
+    # A header claiming more bytes than the segment holds, as a torn write could leave
+    RECORD_HEADER.pack_into(segment.mm, segment.write_offset, SEGMENT_BYTES, 0, 0)
+    end = segment.write_offset
+    segment.close()
+
+    segment = Segment(path, 0, SEGMENT_BYTES)
+    assert (segment.write_offset, segment.records) == (end, 1)
+    assert segment.append(payload(1), 0)
+    segment.close()
+    assert Segment(path, 0, SEGMENT_BYTES).records == 2
+
+
+def test_full_queue_drops_the_oldest_segment_and_counts_unread_records(tmp_path):
+    queue = WriteAheadQueue(
+        str(tmp_path), segment_bytes=SEGMENT_BYTES, max_bytes=2 * SEGMENT_BYTES
+    )
+    queue.add_consumer("slow")
+    queue.add_consumer("fast")
+    for i in range(4):
+        queue.append(payload(i))
+    # "slow" stops inside the oldest segment after one of its four records
+    _, _, position = queue.read("slow")
+    queue.commit("slow", position)
+    drain(queue, "fast")
+
+    for i in range(4, 9):
+        queue.append(payload(i))
+
+    assert min(queue.segments) == 1
+    assert queue.dropped_records == 3
+    assert queue.cursors["slow"] == [1, 0]
+    assert [data for data, _ in drain(queue, "slow")] == [
+        payload(i) for i in range(4, 9)
+    ]
+    queue.close()
+
+
+def test_full_queue_drops_nothing_for_a_consumer_past_the_oldest_segment(tmp_path):
+    queue = WriteAheadQueue(
+        str(tmp_path), segment_bytes=SEGMENT_BYTES, max_bytes=2 * SEGMENT_BYTES
+    )
+    queue.add_consumer("a")
+    for i in range(5):
+        queue.append(payload(i))
+    drain(queue, "a")
+    for i in range(5, 9):
+        queue.append(payload(i))
+    assert queue.dropped_records == 0
+    assert [data for data, _ in drain(queue, "a")] == [payload(i) for i in range(5, 9)]
+    queue.close()
+
+
+def test_add_consumer_restores_a_persisted_cursor(queue):
+    queue.add_consumer("a")
+    for i in range(6):
+        queue.append(payload(i))
+    for _ in range(5):
+        _, _, position = queue.read("a")
+        queue.commit("a", position)
+    queue = reopen(queue)
+    queue.add_consumer("a")
+    assert queue.cursors["a"] == list(position)
+    assert [data for data, _ in drain(queue, "a")] == [payload(5)]
+    queue.close()
+
+
+def test_add_consumer_clamps_a_cursor_past_the_last_intact_record(queue):
+    for i in range(2):
+        queue.append(payload(i))
+    with open(queue._cursor_path("a"), "w", encoding="utf-8") as f:
+        json.dump({"segment": 0, "offset": SEGMENT_BYTES}, f)
+    queue.add_consumer("a")
+    assert queue.cursors["a"] == [0, queue.head.write_offset]
+    queue.append(payload(2))
+    assert [data for data, _ in drain(queue, "a")] == [payload(2)]
+
+
+def test_add_consumer_resets_a_cursor_in_a_deleted_segment(queue):
+    for i in range(9):
+        queue.append(payload(i))
+    os.remove(queue.segments.pop(0).path)
+    with open(queue._cursor_path("a"), "w", encoding="utf-8") as f:
+        json.dump({"segment": 0, "offset": 124}, f)
+    queue.add_consumer("a")
+    assert queue.cursors["a"] == [1, 0]
+
+
+def test_add_consumer_ignores_an_unreadable_cursor(queue):
+    with open(queue._cursor_path("a"), "w", encoding="utf-8") as f:
+        f.write("{not json")
+    queue.add_consumer("a")
+    assert queue.cursors["a"] == [0, 0]
+
+
+def test_collect_garbage_deletes_segments_every_consumer_passed(queue):
+    queue.add_consumer("a")
+    queue.add_consumer("b")
+    for i in range(12):
+        queue.append(payload(i))
+    assert sorted(queue.segments) == [0, 1, 2]
+    drain(queue, "a")
+    assert sorted(queue.segments) == [0, 1, 2]
+    drain(queue, "b")
+    assert sorted(queue.segments) == [2]
+    assert os.listdir(queue.directory).count("00000000.seg") == 0
+
+
+def test_collect_garbage_keeps_the_head_segment(queue):
+    for i in range(6):
+        queue.append(payload(i))
+    # A cursor restored from a run whose segments are gone points past the head
+    with open(queue._cursor_path("a"), "w", encoding="utf-8") as f:
+        json.dump({"segment": 7, "offset": 0}, f)
+    queue.add_consumer("a")
+    queue.commit("a", (7, 0))
+
+    assert list(queue.segments) == [1]
+    assert os.path.exists(queue.head.path)
+    queue.append(payload(6))
+    assert queue.read("a")[0] == payload(4)
@@ -0,0 +1,125 @@
+"""Tests for the correlated workload models (workload.py)."""
+
+import numpy as np
+
+from compiler import compile_config
+from series_store import SeriesFamily, SimulatedClock
+
+# A UTC midnight
+MIDNIGHT = 1_699_920_000.0
+HOUR = 3600.0
+OFFSETS = {"prod-us": -5, "prod-eu": 0, "prod-apac": 8}
+# No offset configured: the cluster runs on UTC
+CLUSTERS = [*OFFSETS, "prod-moon"]
+
+
+def workload_config(incidents_per_day: float = 0.0):
+    """Requests and errors per cluster, driven by diurnal load only."""
+    return {
+        "http_metrics": [
+            {
+                "name": "http_requests_total",
+                "type": "counter",
+                "value": 100,
+                "labels": {
+                    "cluster": cluster,
+                    "service": "web",
+                    "status_code": status_code,
+                },
+            }
+            for cluster in CLUSTERS
+            for status_code in ("200", "503")
+        ],
+        "workload": {
+            "seed": 5,
+            "utc_offsets": OFFSETS,
+            "diurnal": {"amplitude": 0.4, "peak_hour": 14},
+            "bursts": {"per_hour": 0},
+            "incidents": {"per_day": incidents_per_day, "latency_factor": 4},
+            "saturation": 0.5,
+            "error_elasticity": 2,
+            "error_series": {"status_code": "5.."},
+        },
+    }
+
+
+def requests_family(incidents_per_day: float = 0.0):
+    compiled = compile_config(workload_config(incidents_per_day))
+    (family,) = compiled.families
+    clock = SimulatedClock(MIDNIGHT)
+    return SeriesFamily(family, 5, clock, compiled.workload), clock
+
+
+def rows(family: SeriesFamily, cluster: str, status_code: str) -> int:
+    labelnames = family.compiled.labelnames
+    (row,) = [
+        i
+        for i, values in enumerate(family.compiled.label_values)
+        if values[labelnames.index("cluster")] == cluster
+        and values[labelnames.index("status_code")] == status_code
+    ]
+    return row
+
+
+def counted(family: SeriesFamily, clock: SimulatedClock, start: float, hours: float):
+    """Per-series increments of updates every minute from start for hours."""
+    before = family.values.copy()
+    for minute in range(int(hours * 60)):
+        clock.now = start + 60.0 * (minute + 1)
+        family.update_counter(None)
+    return family.values - before
+
+
+def test_load_peaks_at_the_same_local_hour_in_every_timezone():
+    family, _ = requests_family()
+    for cluster in CLUSTERS:
+        row = rows(family, cluster, "200")
+        hourly = [
+            float(family.model.rates(MIDNIGHT + hour * HOUR)[row]) for hour in range(24)
+        ]
+        peak = (14 - OFFSETS.get(cluster, 0)) % 24
+        assert int(np.argmax(hourly)) == peak, cluster
+        assert int(np.argmin(hourly)) == (peak + 12) % 24, cluster
+        assert np.isclose(max(hourly), 1.4) and np.isclose(min(hourly), 0.6)
+
+
+def test_counts_follow_each_clusters_local_day():
+    family, clock = requests_family()
+    # Six hours centered on 14:00 UTC: prod-eu's peak, prod-us' morning
+    # and prod-apac's night
+    counts = counted(family, clock, MIDNIGHT + 11 * HOUR, 6)
+    eu = counts[rows(family, "prod-eu", "200")]
+    assert eu > 1.5 * counts[rows(family, "prod-apac", "200")]
+    assert eu > counts[rows(family, "prod-us", "200")]
+    # Without an offset, a cluster keeps UTC
+    assert np.isclose(counts[rows(family, "prod-moon", "200")], eu, rtol=0.1)
+
+
+def test_error_series_follow_the_request_rate():
+    family, clock = requests_family()
+    for cluster in CLUSTERS:
+        ok, failed = rows(family, cluster, "200"), rows(family, cluster, "503")
+        for hour in range(24):
+            now = MIDNIGHT + hour * HOUR
+            load = family.model.rates(now)[ok]
+            # errors = latency ** 2, latency = 1 + 0.5 x load above baseline
+            errors = (1 + 0.5 * max(load - 1, 0)) ** 2
+            assert np.isclose(family.model.rates(now)[failed], load * errors)
+
+    # Errors rise and fall with requests, faster than them at the peak
+    peak = counted(family, clock, MIDNIGHT + 11 * HOUR, 6)
+    trough = counted(family, clock, MIDNIGHT + 23 * HOUR, 6)
+    ok, failed = rows(family, "prod-eu", "200"), rows(family, "prod-eu", "503")
+    assert peak[ok] > 1.5 * trough[ok]
+    assert peak[failed] / trough[failed] > 1.2 * peak[ok] / trough[ok]
+
+
+def test_incidents_raise_errors_but_not_requests():
+    calm, _ = requests_family()
+    # Every incident slot has one
+    failing, _ = requests_family(incidents_per_day=100)
+    now = MIDNIGHT + 10 * HOUR
+    for cluster in CLUSTERS:
+        ok, failed = rows(calm, cluster, "200"), rows(calm, cluster, "503")
+        assert np.isclose(failing.model.rates(now)[ok], calm.model.rates(now)[ok])
+        assert failing.model.rates(now)[failed] > calm.model.rates(now)[failed]
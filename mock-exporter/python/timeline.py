@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Precomputed Value Timelines
+
+Generates a seeded run of a config ahead of time and stores every family's
+state after each update in one memory-mapped file. An exporter started with
+EXPORTER_TIMELINE replays the frames instead of generating values: an update
+becomes pointing the family at the next mapped frame (plus one bucket
+increment per histogram series), so generation cost drops out of
+measurements and every run - against any Prometheus or VictoriaMetrics
+setup - sees exactly the same values per update.
+
+    [magic "MXT1"][index length u32][index JSON][padding][arrays...]
+
+The index records the seed, and per family its key, type, full size, step
+(seconds between updates), frame count, bucket bounds and the byte offsets of:
+
+- values:  float64 [frames, size] - counter totals, gauge values or
+           histogram observation sums after each update
+- buckets: uint8/uint16 [frames, size] - bucket index hit at each update
+           (histograms only); uint32 [frames, size, buckets] - new
+           observations per bucket for histograms with a `rate`
+
+Frames span every series of the family, so one timeline serves any
+EXPORTER_SHARDS count: a shard maps just its columns. Frame n is generated at
+a simulated time of creation + (n + 1) x step, so the workload models'
+diurnal cycles and incidents (see workload.py) follow the recording clock. Size is about
+frames x series x 8 bytes (9 for histograms, 8 + 4 x buckets with a rate).
+
+    uv run timeline.py --config config.yml --seed 42 --duration 1h --output timeline.mxt
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import struct
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from compiler import (
+    DEFAULT_BUCKETS,
+    CompiledConfig,
+    CompiledFamily,
+    ConfigError,
+    compile_config,
+)
+from series_store import UPDATE_INTERVALS, SeriesFamily, SimulatedClock
+
+logger = logging.getLogger(__name__)
+
+TIMELINE_MAGIC = b"MXT1"
+TIMELINE_HEADER = struct.Struct("<4sI")
+ARRAY_ALIGNMENT = 64
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class TimelineError(ValueError):
+    """A timeline file is unreadable or does not match the config."""
+
+
+def default_step(metric_type: str) -> float:
+    """Midpoint of the live update cadence of a metric type."""
+    min_interval, max_interval = UPDATE_INTERVALS[metric_type]
+    return (min_interval + max_interval) / 2
+
+
+def parse_duration(text: str) -> float:
+    """Parse '3600', '90s', '30m' or '1h' into seconds."""
+    text = text.strip().lower()
+    if text and text[-1] in DURATION_UNITS:
+        return float(text[:-1]) * DURATION_UNITS[text[-1]]
+    return float(text)
+
+
+def bucket_bounds(family: CompiledFamily) -> List[float]:
+    """Upper bounds a histogram family's state uses, +Inf included."""
+    bounds = sorted(family.buckets or DEFAULT_BUCKETS)
+    if bounds[-1] != math.inf:
+        bounds.append(math.inf)
+    return bounds
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+
+
+class TimelineTrack:
+    """One family's frames, restricted to the rows a (sharded) family owns."""
+
+    __slots__ = ("key", "step", "frames", "values", "buckets")
+
+    def __init__(
+        self, key: str, step: float, values: np.ndarray, buckets: Optional[np.ndarray]
+    ):
+        self.key = key
+        self.step = step
+        self.frames = len(values)
+        self.values = values
+        self.buckets = buckets
+
+
+class Timeline:
+    """A mapped timeline file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            self.data = np.memmap(path, dtype=np.uint8, mode="r")
+            magic, index_size = TIMELINE_HEADER.unpack_from(self.data, 0)
+            if magic != TIMELINE_MAGIC:
+                raise TimelineError(f"{path} is not a timeline file")
+            start = TIMELINE_HEADER.size
+            index = json.loads(bytes(self.data[start : start + index_size]))
+        except (OSError, struct.error, ValueError) as e:
+            if isinstance(e, TimelineError):
+                raise
+            raise TimelineError(f"Cannot read timeline {path}: {e}") from e
+        self.seed: int = index["seed"]
+        self.created: float = index["created"]
+        self.entries: Dict[str, Dict[str, Any]] = {
+            entry["key"]: entry for entry in index["families"]
+        }
+
+    def _array(
+        self, offset: int, dtype: str, frames: int, size: int, width: int = 0
+    ) -> np.ndarray:
+        shape = (frames, size, width) if width else (frames, size)
+        count = math.prod(shape) * np.dtype(dtype).itemsize
+        return self.data[offset : offset + count].view(dtype).reshape(shape)
+
+    def track(self, compiled: CompiledFamily) -> TimelineTrack:
+        """Frames for a compiled family, checked against what was recorded."""
+        entry = self.entries.get(compiled.key)
+        where = f"timeline {self.path}, family {compiled.key}"
+        if entry is None:
+            raise TimelineError(f"{where}: not recorded")
+        if entry["type"] != compiled.type:
+            raise TimelineError(
+                f"{where}: recorded as {entry['type']}, config has {compiled.type}"
+            )
+        stop = compiled.offset + compiled.size
+        if stop > entry["size"]:
+            raise TimelineError(
+                f"{where}: {entry['size']} series recorded, config needs {stop}"
+            )
+
+        values = self._array(entry["values"], "float64", entry["frames"], entry["size"])
+        buckets = None
+        if compiled.type == "histogram":
+            if entry["bucket_bounds"] != bucket_bounds(compiled):
+                raise TimelineError(
+                    f"{where}: recorded with different histogram buckets"
+                )
+            width = entry.get("bucket_width", 0)
+            if bool(width) != (compiled.rates is not None):
+                raise TimelineError(
+                    f"{where}: recorded with a different observation model (rate)"
+                )
+            buckets = self._array(
+                entry["buckets"],
+                entry["bucket_dtype"],
+                entry["frames"],
+                entry["size"],
+                width,
+            )
+            buckets = buckets[:, compiled.offset : stop]
+        return TimelineTrack(
+            compiled.key, entry["step"], values[:, compiled.offset : stop], buckets
+        )
+
+
+def build_timeline(
+    compiled: CompiledConfig,
+    path: str,
+    seed: int,
+    duration: float,
+    step: Optional[float] = None,
+) -> int:
+    """Run every family's seeded updates for `duration` seconds into a timeline file.
+
+    Returns the file size in bytes. Frames are written through a memory map
+    one update at a time, so timelines larger than RAM can be built.
+    """
+    rng = np.random.default_rng(seed)
+    started_at = time.time()
+    families = []
+    for family in compiled.families:
+        family_step = step or default_step(family.type)
+        families.append(
+            (family, family_step, max(1, math.ceil(duration / family_step)))
+        )
+
+    # Lay out the index first: array offsets depend on its length
+    entries: List[Dict[str, Any]] = []
+    for family, family_step, frames in families:
+        entry: Dict[str, Any] = {
+            "key": family.key,
+            "type": family.type,
+            "size": family.size,
+            "step": family_step,
+            "frames": frames,
+        }
+        if family.type == "histogram":
+            bounds = bucket_bounds(family)
+            entry["bucket_bounds"] = bounds
+            if family.rates is None:
+                entry["bucket_dtype"] = "uint8" if len(bounds) <= 256 else "uint16"
+            else:
+                # Batched updates hit every bucket; record the counts
+                entry.update(bucket_dtype="uint32", bucket_width=len(bounds))
+        entries.append(entry)
+
+    def layout(data_start: int) -> int:
+        offset = data_start
+        for entry in entries:
+            entry["values"] = offset
+            offset = _align(offset + entry["frames"] * entry["size"] * 8)
+            if entry["type"] == "histogram":
+                entry["buckets"] = offset
+                itemsize = np.dtype(entry["bucket_dtype"]).itemsize * entry.get(
+                    "bucket_width", 1
+                )
+                offset = _align(offset + entry["frames"] * entry["size"] * itemsize)
+        return offset
+
+    index = {"seed": seed, "created": started_at, "families": entries}
+    # Offsets are stored in the index, so iterate until its length settles
+    data_start = 0
+    while True:
+        total = layout(data_start)
+        index_bytes = json.dumps(index).encode("utf-8")
+        needed = _align(TIMELINE_HEADER.size + len(index_bytes))
+        if needed <= data_start:
+            break
+        data_start = needed
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(TIMELINE_HEADER.pack(TIMELINE_MAGIC, len(index_bytes)))
+        f.write(index_bytes)
+        f.truncate(total)
+
+    for (family, family_step, frames), entry in zip(families, entries):
+        clock = SimulatedClock(started_at)
+        state = SeriesFamily(family, seed, clock, compiled.workload)
+        values = np.memmap(
+            tmp_path,
+            dtype=np.float64,
+            mode="r+",
+            offset=entry["values"],
+            shape=(frames, family.size),
+        )
+        buckets = None
+        if family.type == "histogram":
+            shape = (frames, family.size) + (
+                (entry["bucket_width"],) if "bucket_width" in entry else ()
+            )
+            buckets = np.memmap(
+                tmp_path,
+                dtype=entry["bucket_dtype"],
+                mode="r+",
+                offset=entry["buckets"],
+                shape=shape,
+            )
+        update = getattr(state, f"update_{family.type}")
+        started = time.perf_counter()
+        for frame in range(frames):
+            clock.now = started_at + (frame + 1) * family_step
+            hits = update(rng)
+            values[frame] = state.values
+            if buckets is not None:
+                buckets[frame] = hits
+        values.flush()
+        if buckets is not None:
+            buckets.flush()
+        del values, buckets
+        logger.info(
+            f"{family.key}: {frames} frames x {family.size} series "
+            f"every {family_step}s in {time.perf_counter() - started:.1f}s"
+        )
+
+    os.replace(tmp_path, path)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--config", default="config.yml", help="Exporter config to record"
+    )
+    parser.add_argument(
+        "--seed", type=int, required=True, help="Seed of the per-series streams"
+    )
+    parser.add_argument(
+        "--duration", default="1h", help="Recorded time span (s/m/h/d suffixes)"
+    )
+    parser.add_argument(
+        "--step",
+        type=float,
+        help="Seconds between frames (default: per-type cadence midpoint)",
+    )
+    parser.add_argument(
+        "--output", default="timeline.mxt", help="Timeline file to write"
+    )
+    options = parser.parse_args()
+
+    # Only the command line parses YAML; the exporter maps timelines without it
+    import yaml
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    try:
+        with open(options.config, "r", encoding="utf-8") as f:
+            compiled = compile_config(yaml.safe_load(f))
+    except (OSError, ConfigError) as e:
+        logger.error(f"Cannot load config {options.config}: {e}")
+        sys.exit(1)
+
+    size = build_timeline(
+        compiled,
+        options.output,
+        options.seed,
+        parse_duration(options.duration),
+        options.step,
+    )
+    logger.info(f"Wrote {options.output} ({size / 2**20:.1f} MiB, seed {options.seed})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Segmented Write-Ahead Queue
+
+A bounded, on-disk FIFO of opaque records (snappy-compressed remote-write
+requests) backed by memory-mapped segment files:
+
+- Segments are preallocated files of a fixed size, written through mmap.
+  Each record is framed as [length u32][crc32 u32][series u32][payload]; a
+  zero length marks the end of written data, so a restart rescans each
+  segment and resumes appending after the last intact record.
+- Each consumer (one per remote-write endpoint) has its own cursor
+  (segment, offset), persisted to a small JSON file after every commit, so
+  delivery resumes where it left off after a restart.
+- Total size is bounded: when the queue is full the oldest segment is dropped
+  and any cursor still inside it skips ahead, counting the lost records.
+- Segments every cursor has moved past are deleted.
+
+Only the page cache holds queued data, so exporter memory stays flat no
+matter how far a consumer falls behind.
+"""
+
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct("<III")
+SEGMENT_PATTERN = re.compile(r"^(\d{8})\.seg$")
+
+
+class Segment:
+    """One preallocated, memory-mapped segment file."""
+
+    def __init__(self, path: str, index: int, size: int):
+        self.path = path
+        self.index = index
+        exists = os.path.exists(path)
+        self._file = open(path, "r+b" if exists else "w+b")
+        if not exists or os.path.getsize(path) < size:
+            self._file.truncate(size)
+        self.size = os.path.getsize(path)
+        self.mm = mmap.mmap(self._file.fileno(), self.size)
+        self.write_offset, self.records = self._scan()
+
+    def _scan(self) -> Tuple[int, int]:
+        """Find the end of the last intact record."""
+        offset = 0
+        records = 0
+        while offset + RECORD_HEADER.size <= self.size:
+            length, crc, _ = RECORD_HEADER.unpack_from(self.mm, offset)
+            end = offset + RECORD_HEADER.size + length
+            if length == 0 or end > self.size:
+                break
+            if zlib.crc32(self.mm[offset + RECORD_HEADER.size : end]) != crc:
+                logger.warning(
+                    f"Truncating corrupt record in {self.path} at offset {offset}"
+                )
+                break
+            offset = end
+            records += 1
+        return offset, records
+
+    def append(self, payload: bytes, series: int) -> bool:
+        """Write one record; returns False if the segment is full."""
+        offset = self.write_offset
+        start = offset + RECORD_HEADER.size
+        end = start + len(payload)
+        if end > self.size:
+            return False
+        self.mm[start:end] = payload
+        if end + RECORD_HEADER.size <= self.size:
+            # Terminate so a rescan stops here even if the file held old data
+            self.mm[end : end + RECORD_HEADER.size] = b"\x00" * RECORD_HEADER.size
+        # Header last: a torn write leaves a zero length or a bad CRC
+        RECORD_HEADER.pack_into(
+            self.mm, offset, len(payload), zlib.crc32(payload), series
+        )
+        self.write_offset = end
+        self.records += 1
+        return True
+
+    def read(self, offset: int) -> Optional[Tuple[bytes, int, int]]:
+        """Return (payload, series, next_offset) at offset, or None at the end."""
+        if offset + RECORD_HEADER.size > self.write_offset:
+            return None
+        length, _, series = RECORD_HEADER.unpack_from(self.mm, offset)
+        start = offset + RECORD_HEADER.size
+        return self.mm[start : start + length], series, start + length
+
+    def flush(self):
+        self.mm.flush()
+
+    def close(self):
+        self.mm.flush()
+        self.mm.close()
+        self._file.close()
+
+
+class WriteAheadQueue:
+    """Bounded segmented queue with independent per-consumer cursors."""
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 16 << 20,
+        max_bytes: int = 512 << 20,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max(2, max_bytes // segment_bytes)
+        self.segments: Dict[int, Segment] = {}
+        self.cursors: Dict[str, List[int]] = {}
+        self.appended = 0
+        self.dropped_records = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        for name in sorted(os.listdir(directory)):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                index = int(match.group(1))
+                self.segments[index] = Segment(
+                    os.path.join(directory, name), index, segment_bytes
+                )
+        if not self.segments:
+            self._new_segment(0)
+
+        pending = sum(segment.records for segment in self.segments.values())
+        logger.info(
+            f"Opened write-ahead queue {directory}: {len(self.segments)} segments, "
+            f"{pending} records on disk"
+        )
+
+    @property
+    def head(self) -> Segment:
+        return self.segments[max(self.segments)]
+
+    def _segment_path(self, index: int) -> str:
+        return os.path.join(self.directory, f"{index:08d}.seg")
+
+    def _cursor_path(self, consumer: str) -> str:
+        return os.path.join(self.directory, f"cursor-{consumer}.json")
+
+    def _new_segment(self, index: int, size: Optional[int] = None) -> Segment:
+        segment = Segment(self._segment_path(index), index, size or self.segment_bytes)
+        self.segments[index] = segment
+        return segment
+
+    def add_consumer(self, consumer: str):
+        """Register a consumer, restoring its persisted cursor if any."""
+        with self._lock:
+            cursor = [min(self.segments), 0]
+            try:
+                with open(self._cursor_path(consumer), "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                cursor = [int(saved["segment"]), int(saved["offset"])]
+            except FileNotFoundError:
+                pass
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable cursor for {consumer}: {e}")
+            if cursor[0] < min(self.segments):
+                cursor = [min(self.segments), 0]
+            elif cursor[0] in self.segments:
+                # Records past the last intact one were lost in a crash
+                cursor[1] = min(cursor[1], self.segments[cursor[0]].write_offset)
+            self.cursors[consumer] = cursor
+
+    def append(self, payload: bytes, series: int = 0):
+        """Append one record, rolling and trimming segments as needed."""
+        with self._lock:
+            if not self.head.append(payload, series):
+                self.head.flush()
+                size = max(self.segment_bytes, len(payload) + 2 * RECORD_HEADER.size)
+                self._new_segment(self.head.index + 1, size).append(payload, series)
+                self._enforce_bound()
+            self.appended += 1
+
+    def _enforce_bound(self):
+        while len(self.segments) > self.max_segments:
+            oldest = self.segments.pop(min(self.segments))
+            next_index = min(self.segments)
+            for consumer, cursor in self.cursors.items():
+                if cursor[0] <= oldest.index:
+                    lost = oldest.records
+                    if cursor[0] == oldest.index:
+                        lost -= self._records_before(oldest, cursor[1])
+                    self.dropped_records += lost
+                    cursor[0], cursor[1] = next_index, 0
+                    logger.warning(
+                        f"Write-ahead queue full, dropped {lost} records "
+                        f"pending for {consumer}"
+                    )
+            oldest.close()
+            os.remove(oldest.path)
+
+    @staticmethod
+    def _records_before(segment: Segment, offset: int) -> int:
+        count = 0
+        position = 0
+        while position < offset:
+            record = segment.read(position)
+            if record is None:
+                break
+            position = record[2]
+            count += 1
+        return count
+
+    def read(self, consumer: str) -> Optional[Tuple[bytes, int, Tuple[int, int]]]:
+        """Return (payload, series, position after it) for a consumer, or None."""
+        with self._lock:
+            cursor = self.cursors[consumer]
+            while True:
+                segment = self.segments.get(cursor[0])
+                if segment is None:
+                    cursor[0], cursor[1] = min(self.segments), 0
+                    continue
+                record = segment.read(cursor[1])
+                if record is not None:
+                    payload, series, next_offset = record
+                    return bytes(payload), series, (segment.index, next_offset)
+                if segment is self.head:
+                    return None
+                cursor[0], cursor[1] = (
+                    min(i for i in self.segments if i > segment.index),
+                    0,
+                )
+
+    def commit(self, consumer: str, position: Tuple[int, int]):
+        """Advance a consumer past a delivered record and persist its cursor."""
+        with self._lock:
+            self.cursors[consumer] = [position[0], position[1]]
+            tmp_path = self._cursor_path(consumer) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"segment": position[0], "offset": position[1]}, f)
+            os.replace(tmp_path, self._cursor_path(consumer))
+            self._collect_garbage()
+
+    def _collect_garbage(self):
+        """Delete sealed segments every consumer has moved past."""
+        if not self.cursors:
+            return
+        oldest_needed = min(cursor[0] for cursor in self.cursors.values())
+        for index in sorted(self.segments):
+            if index >= oldest_needed or self.segments[index] is self.head:
+                break
+            segment = self.segments.pop(index)
+            segment.close()
+            os.remove(segment.path)
+
+    def pending_bytes(self, consumer: str) -> int:
+        """Approximate bytes queued for a consumer."""
+        with self._lock:
+            segment_index, offset = self.cursors[consumer]
+            total = 0
+            for index, segment in self.segments.items():
+                if index == segment_index:
+                    total += segment.write_offset - offset
+                elif index > segment_index:
+                    total += segment.write_offset
+            return total
+
+    def close(self):
+        """Flush and unmap every segment."""
+        with self._lock:
+            for segment in self.segments.values():
+                segment.close()
+            self.segments.clear()
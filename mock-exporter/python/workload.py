@@ -0,0 +1,483 @@
+"""
+Correlated Workload Models
+
+Without a `workload` section every series drifts on its own uniform noise
+(see series_store.py). With one, families are driven by shared signals, so
+related series move together the way a real service's do:
+
+- load: a diurnal cycle peaking at `peak_hour` local time (the UTC offset of
+  the series' timezone label value), times traffic bursts;
+- latency: rises with load above its baseline (`saturation`, queueing) and
+  during incidents, by up to `latency_factor`;
+- errors: latency ** error_elasticity, so error series rise whenever latency
+  does, and error budgets burn down with them.
+
+Bursts and incidents are scheduled per scope - the values of the `scope`
+labels, (cluster, service) by default. Time is cut into event-long slots
+(staggered per scope) and each slot is an event with probability
+rate x duration, decided by a counter-based hash of (seed, scope, slot). The
+schedule is a pure function of time: every family, shard, backfill worker
+and restart sees the same incident at the same moment without sharing state.
+
+Each family is bound to one model (by metric name in `models`, otherwise by
+type, see compiler.DEFAULT_MODELS):
+
+- noise:       the store's independent drift, unchanged
+- traffic:     counter increments and batched histograms' observation
+               counts follow load (the others observe once per update);
+               error series (`error_series` label patterns) follow
+               load x errors
+- errors:      every series follows load x errors
+- latency:     like traffic, and observed values scale with latency
+- utilization: gauges revert towards base x load ** elasticity; counters
+               follow load ** elasticity
+- budget:      error budget gauges burn at budget_burn x errors per window
+               and recover as the rolling window moves on
+- constant:    gauges keep their configured value
+
+Signals are evaluated once per scope and update, then gathered to the series
+of a family with one indexed read, so a tick stays a handful of vectorized
+operations whatever the model.
+
+Scrape-time evaluation (see lazy.py) asks each model for closed forms
+instead: rate_integral() integrates the diurnal load to first order in the
+elasticity, and gauge_at() gives a gauge's level at one instant from the
+full signals. Bursts, incidents and the error signal therefore show in
+gauges there but not in counts: the events would need every past slot, and
+errors (a power of the clipped load) have no closed-form integral.
+"""
+
+import math
+import re
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from compiler import CompiledFamily, CompiledWorkload
+from synthetic import SyntheticLabels, splitmix64, unit_floats
+
+# Fraction of the distance to its target a utilization gauge closes per update
+GAUGE_REVERSION = 0.3
+# Relative noise of utilization gauges, per unit of the store's U(0.7, 1.3) draw
+GAUGE_NOISE = 0.05
+# Mean rise of a noise gauge per update, relative to its base
+GAUGE_DRIFT = 0.05
+BUDGET_MAX = 100.0
+
+_SLOT_KEY = np.uint64(0xD1B54A32D192ED03)
+_EVENT_KINDS = {"burst": 0x42, "incident": 0x1C}
+
+
+def _label_column(
+    labelnames: Sequence[str], label_values, name: str
+) -> Optional[Tuple[np.ndarray, List[str]]]:
+    """(value code per series, values) of one label; None if the family lacks it.
+
+    Synthetic families use their dimension value tables without churn
+    generations, so a series keeps its scope while its labels churn.
+    """
+    if name not in labelnames:
+        return None
+    d = labelnames.index(name)
+    if isinstance(label_values, SyntheticLabels):
+        return label_values.column(d), list(label_values.dimensions[d].values)
+    codes: Dict[str, int] = {}
+    column = np.array(
+        [codes.setdefault(values[d], len(codes)) for values in label_values],
+        dtype=np.intp,
+    )
+    return column, list(codes)
+
+
+class Scopes:
+    """The signal streams of one family's series.
+
+    ids maps every series to its scope (None when the whole family shares
+    one); errors marks the series the error signal drives (None for none).
+    Signals are evaluated per scope and cached for the last timestamp, so the
+    models of one update share a single evaluation.
+    """
+
+    def __init__(
+        self,
+        workload: CompiledWorkload,
+        seed: int,
+        labelnames: Sequence[str],
+        label_values,
+    ):
+        self.workload = workload
+        size = len(label_values)
+        labels = list(workload.scope)
+        if workload.timezone_label not in labels:
+            labels.append(workload.timezone_label)
+
+        keys = np.zeros(size, dtype=np.int64)
+        columns = []
+        for label in labels:
+            column = _label_column(labelnames, label_values, label)
+            columns.append(column)
+            if column is not None and len(column[1]) > 1:
+                keys = keys * len(column[1]) + column[0]
+        first, inverse = np.unique(keys, return_index=True, return_inverse=True)[1:]
+        self.ids: Optional[np.ndarray] = (
+            inverse.astype(np.int32) if len(first) > 1 else None
+        )
+
+        # Label values of every scope, from its first series
+        scope_values = [
+            [
+                "" if column is None else column[1][int(column[0][row])]
+                for column in columns
+            ]
+            for row in first.tolist()
+        ]
+        seed_key = np.uint64((seed * int(_SLOT_KEY)) & 0xFFFFFFFFFFFFFFFF)
+        self.keys = (
+            np.array(
+                [
+                    zlib.crc32(
+                        "\x1f".join(values[: len(workload.scope)]).encode("utf-8")
+                    )
+                    for values in scope_values
+                ],
+                dtype=np.uint64,
+            )
+            ^ seed_key
+        )
+        offsets = dict(workload.utc_offsets)
+        timezone = labels.index(workload.timezone_label)
+        self.utc_offsets = np.array(
+            [offsets.get(values[timezone], 0.0) for values in scope_values]
+        )
+
+        self.errors: Optional[np.ndarray] = None
+        for label, pattern in workload.error_series:
+            column = _label_column(labelnames, label_values, label)
+            if column is None:
+                continue
+            regex = re.compile(pattern)
+            matching = [
+                k for k, value in enumerate(column[1]) if regex.fullmatch(value)
+            ]
+            if matching:
+                mask = np.isin(column[0], matching)
+                self.errors = mask if self.errors is None else self.errors | mask
+        if self.errors is not None and not self.errors.any():
+            self.errors = None
+
+        # Per event kind: (scope keys, slot offset per scope, duration,
+        # probability), and the slots and active flags last drawn, redrawn
+        # only when a slot ends
+        self._events = {
+            "burst": self._event_kind(
+                "burst", workload.burst_rate / 3600.0, workload.burst_duration
+            ),
+            "incident": self._event_kind(
+                "incident", workload.incident_rate / 86400.0, workload.incident_duration
+            ),
+        }
+        self._slots: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._time: Optional[float] = None
+        self._signals: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+
+    def _event_kind(
+        self, kind: str, rate: float, duration: float
+    ) -> Tuple[np.ndarray, np.ndarray, float, float]:
+        key = self.keys ^ np.uint64(_EVENT_KINDS[kind] << 56)
+        stagger = unit_floats(splitmix64(key.copy()))
+        return key, stagger, duration, min(1.0, rate * duration)
+
+    def per_series(self, values: np.ndarray, rows: Optional[np.ndarray] = None):
+        """Per-scope values gathered to the series or rows (scalar for one scope)."""
+        if self.ids is None:
+            return values[0]
+        return values[self.ids] if rows is None else values[self.ids[rows]]
+
+    def load_integral(
+        self, start, now: float, elasticity: float, rows: Optional[np.ndarray] = None
+    ):
+        """Integral of load ** elasticity from start to now, per series or rows.
+
+        To first order in the diurnal amplitude, which keeps it closed-form:
+        1 + elasticity x amplitude x cos(phase); bursts are not integrated.
+        """
+        w = self.workload
+        offsets = self.per_series(self.utc_offsets, rows)
+        omega = 2 * math.pi / 86400.0
+        shift = (offsets - w.peak_hour) * (2 * math.pi / 24)
+        swing = np.sin(now * omega + shift) - np.sin(np.multiply(start, omega) + shift)
+        return (now - np.asarray(start)) + (
+            elasticity * w.diurnal_amplitude / omega
+        ) * swing
+
+    def _active(self, kind: str, now: float) -> Tuple[np.ndarray, np.ndarray]:
+        """(active, phase in [0, 1)) of the event slot every scope is in."""
+        key, stagger, duration, probability = self._events[kind]
+        position = now / duration + stagger
+        slot = np.floor(position)
+        cached = self._slots.get(kind)
+        if cached is None or not np.array_equal(cached[0], slot):
+            draws = unit_floats(splitmix64(key + slot.astype(np.uint64) * _SLOT_KEY))
+            cached = self._slots[kind] = (slot, draws < probability)
+        return cached[1], position - slot
+
+    def signals(self, now: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(load, latency, errors) multipliers per scope at `now`, 1 at baseline."""
+        if now == self._time:
+            return self._signals
+        w = self.workload
+        load = np.cos(
+            (now / 3600.0 - w.peak_hour + self.utc_offsets) * (2 * math.pi / 24)
+        )
+        load *= w.diurnal_amplitude
+        load += 1.0
+
+        bursting, phase = self._active("burst", now)
+        if bursting.any():
+            load *= np.where(
+                bursting, 1.0 + (w.burst_factor - 1.0) * np.sin(math.pi * phase), 1.0
+            )
+
+        latency = np.maximum(load - 1.0, 0.0)
+        latency *= w.saturation
+        latency += 1.0
+        failing, phase = self._active("incident", now)
+        if failing.any():
+            # Incidents hit fast and recover over their second half
+            severity = np.minimum(1.0, 10 * phase) * np.minimum(1.0, 2 * (1.0 - phase))
+            latency *= np.where(failing, 1.0 + (w.latency_factor - 1.0) * severity, 1.0)
+        errors = latency**w.error_elasticity
+        self._time, self._signals = now, (load, latency, errors)
+        return self._signals
+
+
+class Model:
+    """noise: the store's independent drift; every multiplier is 1."""
+
+    def __init__(self, scopes: Optional[Scopes], elasticity: float):
+        self.scopes = scopes
+        self.elasticity = elasticity
+
+    def rates(self, now: float) -> Optional[Any]:
+        """Multiplier of counter increments and histogram observation counts."""
+        return None
+
+    def levels(self, now: float) -> Optional[np.ndarray]:
+        """Per-scope multiplier of observed histogram values."""
+        return None
+
+    def gauge(
+        self,
+        values: np.ndarray,
+        bases: np.ndarray,
+        draws: np.ndarray,
+        dt: float,
+        now: float,
+    ):
+        """Step gauge values in place from U(0.7, 1.3) draws and dt seconds."""
+        draws *= bases
+        draws *= GAUGE_DRIFT
+        values += draws
+
+    def rate_integral(
+        self, start, now: float, rows: Optional[np.ndarray]
+    ) -> Optional[Any]:
+        """Integral of the rates() multiplier from start to now (None: now - start)."""
+        return None
+
+    def min_rate(self) -> float:
+        """Lower bound of the rate_integral() integrand."""
+        return 1.0
+
+    def gauge_at(
+        self,
+        carry: np.ndarray,
+        bases: np.ndarray,
+        noise: np.ndarray,
+        elapsed: np.ndarray,
+        updates: np.ndarray,
+        now: float,
+        rows: Optional[np.ndarray],
+    ) -> np.ndarray:
+        """Gauge level at now from noise in [-1, 1].
+
+        carry is the value elapsed seconds ago, updates the tick updater's
+        mean number of updates since.
+        """
+        # The tick path's mean drift, give or take one update
+        return carry + bases * (GAUGE_DRIFT * updates + GAUGE_NOISE * noise)
+
+
+class TrafficModel(Model):
+    """traffic: counts follow load, error series load x errors."""
+
+    # Exponent of load in the counts; errors are 1 at baseline
+    load_elasticity = 1.0
+
+    def rates(self, now: float) -> Optional[Any]:
+        load, _, errors = self.scopes.signals(now)
+        if self.scopes.errors is None:
+            return self.scopes.per_series(load)
+        return self.scopes.per_series(load) * np.where(
+            self.scopes.errors, self.scopes.per_series(errors), 1.0
+        )
+
+    def rate_integral(
+        self, start, now: float, rows: Optional[np.ndarray]
+    ) -> Optional[Any]:
+        return self.scopes.load_integral(start, now, self.load_elasticity, rows)
+
+    def min_rate(self) -> float:
+        return max(
+            0.0,
+            1.0 - abs(self.load_elasticity) * self.scopes.workload.diurnal_amplitude,
+        )
+
+
+class ErrorsModel(TrafficModel):
+    """errors: every series counts load x errors."""
+
+    def rates(self, now: float) -> Optional[Any]:
+        load, _, errors = self.scopes.signals(now)
+        return self.scopes.per_series(load * errors)
+
+
+class LatencyModel(TrafficModel):
+    """latency: traffic counts, values scaled by latency."""
+
+    def levels(self, now: float) -> Optional[np.ndarray]:
+        return self.scopes.signals(now)[1]
+
+
+class UtilizationModel(TrafficModel):
+    """utilization: gauges revert towards base x load ** elasticity."""
+
+    @property
+    def load_elasticity(self) -> float:
+        return self.elasticity
+
+    def rates(self, now: float) -> Optional[Any]:
+        return self.scopes.per_series(self.scopes.signals(now)[0] ** self.elasticity)
+
+    def gauge(
+        self,
+        values: np.ndarray,
+        bases: np.ndarray,
+        draws: np.ndarray,
+        dt: float,
+        now: float,
+    ):
+        target = bases * self.rates(now)
+        target -= values
+        target *= GAUGE_REVERSION
+        values += target
+        draws -= 1.0
+        draws *= bases
+        draws *= GAUGE_NOISE
+        values += draws
+
+    def gauge_at(
+        self,
+        carry: np.ndarray,
+        bases: np.ndarray,
+        noise: np.ndarray,
+        elapsed: np.ndarray,
+        updates: np.ndarray,
+        now: float,
+        rows: Optional[np.ndarray],
+    ) -> np.ndarray:
+        load = self.scopes.per_series(
+            self.scopes.signals(now)[0] ** self.elasticity, rows
+        )
+        return bases * load * (1.0 + GAUGE_NOISE * noise)
+
+
+class BudgetModel(Model):
+    """budget: remaining percent burns with errors, recovers with the window."""
+
+    def gauge(
+        self,
+        values: np.ndarray,
+        bases: np.ndarray,
+        draws: np.ndarray,
+        dt: float,
+        now: float,
+    ):
+        w = self.scopes.workload
+        burn = w.budget_burn * self.scopes.per_series(self.scopes.signals(now)[2])
+        values += (1.0 - burn) * (BUDGET_MAX * dt / w.budget_window)
+        np.clip(values, 0.0, BUDGET_MAX, out=values)
+
+    def gauge_at(
+        self,
+        carry: np.ndarray,
+        bases: np.ndarray,
+        noise: np.ndarray,
+        elapsed: np.ndarray,
+        updates: np.ndarray,
+        now: float,
+        rows: Optional[np.ndarray],
+    ) -> np.ndarray:
+        # At the baseline error rate: incidents are not integrated
+        w = self.scopes.workload
+        return np.clip(
+            carry + (1.0 - w.budget_burn) * (BUDGET_MAX / w.budget_window) * elapsed,
+            0.0,
+            BUDGET_MAX,
+        )
+
+
+class ConstantModel(Model):
+    """constant: gauges keep their configured value."""
+
+    def gauge(
+        self,
+        values: np.ndarray,
+        bases: np.ndarray,
+        draws: np.ndarray,
+        dt: float,
+        now: float,
+    ):
+        pass
+
+    def gauge_at(
+        self,
+        carry: np.ndarray,
+        bases: np.ndarray,
+        noise: np.ndarray,
+        elapsed: np.ndarray,
+        updates: np.ndarray,
+        now: float,
+        rows: Optional[np.ndarray],
+    ) -> np.ndarray:
+        return bases.copy()
+
+
+# Model classes by the names config.yml uses (see compiler.WORKLOAD_MODELS)
+MODELS = {
+    "noise": Model,
+    "traffic": TrafficModel,
+    "errors": ErrorsModel,
+    "latency": LatencyModel,
+    "utilization": UtilizationModel,
+    "budget": BudgetModel,
+    "constant": ConstantModel,
+}
+
+
+def bind_model(
+    compiled: CompiledFamily,
+    label_values,
+    workload: Optional[CompiledWorkload],
+    seed: Optional[int],
+) -> Model:
+    """The model instance driving one family's series."""
+    model = MODELS[compiled.model]
+    if workload is None or model is Model:
+        return Model(None, compiled.elasticity)
+    # The workload's own seed wins, so the schedule can be pinned across seeds
+    seed = workload.seed if workload.seed is not None else (seed or 0)
+    return model(
+        Scopes(workload, seed, compiled.labelnames, label_values), compiled.elasticity
+    )